@@ -1,7 +1,7 @@
 import os
 import sys
 import traceback
-from flask import Flask, request, jsonify, current_app, send_from_directory, after_this_request
+from flask import Flask, request, jsonify, current_app, send_from_directory, after_this_request, Response, stream_with_context, has_request_context
 import logging
 import atexit
 import uuid
@@ -29,6 +29,10 @@ import qa_generator
 SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
 if SERVER_DIR not in sys.path:
     sys.path.insert(0, SERVER_DIR)
+# Shared modules used by more than one service (server/services)
+SERVICES_DIR = os.path.join(os.path.dirname(SERVER_DIR), 'services')
+if SERVICES_DIR not in sys.path:
+    sys.path.append(SERVICES_DIR)
 
 import config
 config.setup_logging()
@@ -36,6 +40,9 @@ config.setup_logging()
 # --- Import configurations and services ---
 try:
     from vector_db_service import VectorDBService
+    import curriculum_retrieval
+    import deletion_jobs
+    import collection_snapshot
     import ai_core
     import neo4j_handler
     from neo4j import exceptions as neo4j_exceptions
@@ -43,6 +50,10 @@ try:
     import document_generator
     import podcast_generator
     import google.generativeai as genai
+    import llm_client_pool
+    import llm_response_cache
+    from singleflight import SingleFlight
+    import llm_rate_limiter
     from prompts import CODE_ANALYSIS_PROMPT_TEMPLATE, TEST_CASE_GENERATION_PROMPT_TEMPLATE, EXPLAIN_ERROR_PROMPT_TEMPLATE, QUIZ_GENERATION_PROMPT_TEMPLATE
     import quiz_utils
     from academic_search import search_all_apis as academic_search
@@ -57,46 +68,55 @@ try:
         except Exception as e:
             logging.getLogger(__name__).warning(f"Could not list available models: {e}")
         
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        LLM_MODEL = genai.GenerativeModel(config.GEMINI_MODEL_NAME, safety_settings=safety_settings)
+        LLM_MODEL = genai.GenerativeModel(config.GEMINI_MODEL_NAME, safety_settings=llm_client_pool.SAFETY_SETTINGS)
     else:
         LLM_MODEL = None
         logging.getLogger(__name__).error("GEMINI_API_KEY not found, AI features will fail.")
 
-    def llm_wrapper(prompt, api_key=None):
+    def _llm_cache_allowed():
+        """Per-request opt-out: `Cache-Control: no-cache` or `"no_cache": true` in the JSON body."""
+        if not has_request_context():
+            return True
+        if 'no-cache' in (request.headers.get('Cache-Control') or '').lower():
+            return False
+        body = request.get_json(silent=True)
+        return not (isinstance(body, dict) and body.get('no_cache'))
+
+    def _generate_with_retries(prompt, key_to_use, priority="interactive"):
+        # Admission, 429 backoff and retries are shared with every other caller of this key
+        def generate():
+            with llm_client_pool.pooled_model(key_to_use) as model_instance:
+                return model_instance.generate_content(prompt)
+
+        response = llm_rate_limiter.get_rate_limiter().call(
+            key_to_use, generate, priority=priority, retryable=llm_rate_limiter.is_retryable_error
+        )
+        if response.parts:
+            return "".join(part.text for part in response.parts if hasattr(part, 'text'))
+        elif response.prompt_feedback and response.prompt_feedback.block_reason:
+             raise ValueError(f"Prompt blocked by API. Reason: {response.prompt_feedback.block_reason_message}")
+        logger.warning("LLM returned empty response without explicit block reason.")
+        return ""
+
+    # Identical concurrent prompts wait for one generation, whoever's key runs it. The response
+    # does not depend on the key, but errors can (quota, invalid key), so those are not shared.
+    llm_flights = SingleFlight("llm", config.SINGLEFLIGHT_LLM_TIMEOUT_SECONDS, share_errors=False)
+
+    def llm_wrapper(prompt, api_key=None, use_cache=None, priority="interactive"):
         key_to_use = api_key or config.GEMINI_API_KEY
         if not key_to_use:
             raise ConnectionError("Gemini API Key is not configured for this request.")
-
-        genai.configure(api_key=key_to_use)
-        
-        safety_settings = [
-            {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-            {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-        ]
-        model_instance = genai.GenerativeModel(config.GEMINI_MODEL_NAME, safety_settings=safety_settings)
-
-        for attempt in range(3):
-            try:
-                response = model_instance.generate_content(prompt)
-                if response.parts:
-                    return "".join(part.text for part in response.parts if hasattr(part, 'text'))
-                elif response.prompt_feedback and response.prompt_feedback.block_reason:
-                     raise ValueError(f"Prompt blocked by API. Reason: {response.prompt_feedback.block_reason_message}")
-                else:
-                    logger.warning("LLM returned empty response without explicit block reason.")
-                    return ""
-            except Exception as e:
-                logger.warning(f"LLM generation attempt {attempt + 1} failed: {e}")
-                if attempt == 2: raise
-        return ""
+        if use_cache is None:
+            use_cache = _llm_cache_allowed()
+
+        params = {"safety_settings": llm_client_pool.SAFETY_SETTINGS}
+        flight_key = (llm_response_cache.cache_key(config.GEMINI_MODEL_NAME, prompt, params), use_cache)
+        return llm_flights.do(flight_key, lambda: llm_response_cache.cached_generate(
+            config.GEMINI_MODEL_NAME, prompt,
+            lambda: _generate_with_retries(prompt, key_to_use, priority),
+            params=params,
+            use_cache=use_cache
+        ))
 
 except ImportError as e:
     print(f"CRITICAL IMPORT ERROR: {e}.")
@@ -156,6 +176,7 @@ try:
 except Exception as e:
     logger.critical(f"Neo4j driver failed to initialize: {e}.")
 atexit.register(neo4j_handler.close_driver)
+atexit.register(llm_client_pool.close_pool)
 
 initialize_tts()
 
@@ -409,7 +430,7 @@ def generate_quiz_route():
         )
         
         logger.info(f"Quiz Gen: Sending prompt to LLM for {num_questions} questions.")
-        response_text = llm_wrapper(prompt, api_key)
+        response_text = llm_wrapper(prompt, api_key, priority="batch")
         
         json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
         if not json_match:
@@ -438,9 +459,18 @@ def search_qdrant_documents():
     user_id = data.get('user_id')
     document_context_name = data.get('documentContextName')
     use_kg = data.get('use_kg_critical_thinking', False) 
+    # Optional curriculum-aware mode: rank by distance from the learner's current topic
+    course_name = data.get('course')
+    current_topic_id = data.get('current_topic_id')
     
     if not query_text or not user_id:
         return create_error_response("Missing 'query' or 'user_id'", 400)
+    module_radius = data.get('module_radius')
+    if module_radius is not None:
+        try:
+            module_radius = max(0, int(module_radius))
+        except (TypeError, ValueError):
+            return create_error_response("'module_radius' must be an integer", 400)
 
     try:
         k = data.get('k', 5)
@@ -466,9 +496,16 @@ def search_qdrant_documents():
         
         qdrant_filters = qdrant_models.Filter(must=must_conditions) if must_conditions else None
         
-        retrieved_docs, snippet_from_vector, docs_map = vector_service.search_documents(
-            query=query_text, k=k, filter_conditions=qdrant_filters
-        )
+        curriculum_info = None
+        if course_name and current_topic_id:
+            retrieved_docs, snippet_from_vector, docs_map, curriculum_info = curriculum_retrieval.search_with_curriculum(
+                vector_service, query_text, course_name, current_topic_id,
+                k=k, base_filter=qdrant_filters, module_radius=module_radius
+            )
+        else:
+            retrieved_docs, snippet_from_vector, docs_map = vector_service.search_documents(
+                query=query_text, k=k, filter_conditions=qdrant_filters
+            )
         
         final_snippet = ""
         if facts_from_kg and "No specific facts were found" not in facts_from_kg:
@@ -481,6 +518,8 @@ def search_qdrant_documents():
             "formatted_context_snippet": final_snippet.strip(), 
             "retrieved_documents_map": docs_map,
         }
+        if curriculum_info:
+            response_payload["curriculum_retrieval"] = curriculum_info
         
         current_app.logger.info(f"RAG+KG search successful. Returning {len(retrieved_docs)} documents.")
         return jsonify(response_payload), 200
@@ -508,6 +547,12 @@ def health_check():
         status_details["neo4j_service"], status_details["neo4j_connection"] = "initialized_via_handler", "connected"
     else:
         status_details["neo4j_service"], status_details["neo4j_connection"] = "initialization_failed_or_handler_error", neo4j_conn_status
+    status_details["llm_client_pool"] = llm_client_pool.pool_stats()
+    status_details["llm_response_cache"] = llm_response_cache.cache_stats()
+    status_details["llm_rate_limiter"] = llm_rate_limiter.get_rate_limiter().stats()
+    status_details["singleflight"] = {"llm": llm_flights.stats()}
+    if vector_service:
+        status_details["singleflight"]["vector_search"] = vector_service.search_flights.stats()
     
     if status_details["qdrant_service"] == "initialized" and status_details.get("qdrant_collection_status") == "exists_and_accessible" and neo4j_ok:
         status_details["status"], http_status_code = "ok", 200
@@ -546,6 +591,14 @@ def finetune_route():
     logger.info(f"Accepted fine-tuning job {job_id} for model {model_tag}. Background thread started.")
     return jsonify({"message": "Fine-tuning job started in background", "jobId": job_id}), 202
 
+def _invalidate_document_counts():
+    """Drop cached views built from per-course document counts after documents are added or deleted."""
+    # A document may be linked to any course, so every course's view goes
+    if course_pipeline:
+        course_pipeline.invalidate_visualization()
+    knowledge_bridge.invalidate_alignment()
+
+
 @app.route('/add_document', methods=['POST'])
 def add_document_qdrant():
     data = request.get_json()
@@ -583,7 +636,9 @@ def add_document_qdrant():
     num_added, status = 0, "processed_no_content"
     if processed_chunks:
         num_added = app.vector_service.add_processed_chunks(processed_chunks)
-        if num_added > 0: status = "added_to_qdrant"
+        if num_added > 0:
+            status = "added_to_qdrant"
+            _invalidate_document_counts()
     
     return jsonify({
         "message": "Document processed.",
@@ -651,7 +706,7 @@ def export_podcast_route():
             source_document_text, 
             analysis_content,
             podcast_options,
-            lambda p: llm_wrapper(p, api_key)
+            lambda p: llm_wrapper(p, api_key, priority="batch")
         )
 
         # 2. Synthesize the script into a high-quality, dual-speaker MP3
@@ -695,17 +750,119 @@ def delete_qdrant_data_route():
     if not user_id or not document_name: return create_error_response("Missing fields", 400)
     try:
         result = vector_service.delete_document_vectors(user_id, document_name)
+        _invalidate_document_counts()
         return jsonify(result), 200
     except Exception as e: return create_error_response(f"Deletion failed: {str(e)}", 500)
 
+@app.route('/delete_qdrant_documents_bulk', methods=['POST'])
+def delete_qdrant_documents_bulk_route():
+    """
+    Queue deletion of many documents (Qdrant points, KG nodes, caches).
+
+    Expected JSON:
+    - documents: List of {"user_id": ..., "document_name": ...}
+    - delete_kg: Also delete each document's knowledge graph (default: true)
+
+    Returns 202 with a job_id; poll /delete_qdrant_documents_bulk/<job_id> for progress.
+    """
+    data = request.get_json()
+    if not data: return create_error_response("Request must be JSON", 400)
+    documents = data.get('documents')
+    if not isinstance(documents, list) or not documents:
+        return create_error_response("'documents' must be a non-empty list", 400)
+    if not vector_service:
+        return create_error_response("Vector service not available", 503)
+    try:
+        job_id = deletion_jobs.start_bulk_deletion(vector_service, documents, delete_kg=data.get('delete_kg', True),
+                                                   on_finished=_invalidate_document_counts)
+        # Report the job's count: entries are normalized and de-duplicated before queuing
+        job = deletion_jobs.get_job(job_id)
+        return jsonify({"message": "Bulk deletion started", "job_id": job_id, "total_documents": job["total_documents"]}), 202
+    except ValueError as e:
+        return create_error_response(str(e), 400)
+    except Exception as e: return create_error_response(f"Bulk deletion failed to start: {str(e)}", 500)
+
+@app.route('/delete_qdrant_documents_bulk/<job_id>', methods=['GET'])
+def get_bulk_deletion_job_route(job_id):
+    job = deletion_jobs.get_job(job_id)
+    if job is None:
+        return create_error_response("Deletion job not found", 404)
+    return jsonify(job), 200
+
+@app.route('/snapshot/export', methods=['POST'])
+def export_snapshot_route():
+    """
+    Export one course's points (vectors + payload) to SNAPSHOT_DIR/<snapshot_id>.imsnap.
+
+    Expected JSON:
+    - course: Course name (omit to export the whole collection)
+    """
+    data = request.get_json() or {}
+    if not vector_service:
+        return create_error_response("Vector service not available", 503)
+    course = (data.get('course') or '').strip() or None
+    snapshot_id = collection_snapshot.snapshot_id_for(course)
+    try:
+        output_path = collection_snapshot.resolve_snapshot_path(snapshot_id)
+        result = collection_snapshot.export_course_snapshot(
+            vector_service.client, vector_service.collection_name, course, output_path
+        )
+        result["snapshot_id"] = snapshot_id
+        return jsonify(result), 200
+    except ValueError as e:
+        return create_error_response(str(e), 400)
+    except Exception as e:
+        logger.error(f"Snapshot export failed: {e}", exc_info=True)
+        return create_error_response(f"Snapshot export failed: {str(e)}", 500)
+
+@app.route('/snapshot/import', methods=['POST'])
+def import_snapshot_route():
+    """
+    Stream a snapshot from SNAPSHOT_DIR into the service collection.
+
+    Expected JSON:
+    - snapshot_id: ID returned by /snapshot/export
+    """
+    data = request.get_json()
+    if not data: return create_error_response("Request must be JSON", 400)
+    snapshot_id = data.get('snapshot_id')
+    if not snapshot_id or not isinstance(snapshot_id, str):
+        return create_error_response("Missing 'snapshot_id'", 400)
+    try:
+        snapshot_path = collection_snapshot.resolve_snapshot_path(snapshot_id)
+    except ValueError as e:
+        return create_error_response(str(e), 400)
+    if not os.path.isfile(snapshot_path):
+        return create_error_response(f"Snapshot '{snapshot_id}' not found", 404)
+    if not vector_service:
+        return create_error_response("Vector service not available", 503)
+    try:
+        result = collection_snapshot.import_snapshot(
+            vector_service.client, vector_service.collection_name, snapshot_path
+        )
+        if vector_service.l1_cache:
+            vector_service.l1_cache.invalidate()
+        _invalidate_document_counts()
+        return jsonify(result), 201
+    except ValueError as e:
+        return create_error_response(str(e), 400)
+    except Exception as e:
+        logger.error(f"Snapshot import failed: {e}", exc_info=True)
+        return create_error_response(f"Snapshot import failed: {str(e)}", 500)
+
 @app.route('/kg', methods=['POST'])
 def add_or_update_kg_route():
     data = request.get_json()
     if not data: return create_error_response("Request must be JSON", 400)
     user_id, original_name, nodes, edges = data.get('userId'), data.get('originalName'), data.get('nodes'), data.get('edges')
     if not all([user_id, original_name, isinstance(nodes, list), isinstance(edges, list)]): return create_error_response("Missing fields", 400)
+    mode = data.get('mode') or config.KG_INGEST_MODE
+    if mode not in ('merge', 'incremental'): return create_error_response("'mode' must be 'merge' or 'incremental'", 400)
     try:
-        result = neo4j_handler.ingest_knowledge_graph(user_id, original_name, nodes, edges)
+        if mode == 'incremental':
+            result = neo4j_handler.sync_knowledge_graph(user_id, original_name, nodes, edges)
+        else:
+            result = neo4j_handler.ingest_knowledge_graph(user_id, original_name, nodes, edges)
         return jsonify({"message": "KG ingested", "status": "completed", **result}), 201
     except Exception as e: return create_error_response(f"KG ingestion failed: {str(e)}", 500)
 
@@ -746,7 +903,7 @@ def query_kg_route():
 
     try:
         # Call the Neo4j handler to search the KG
-        facts_from_kg = neo4j_handler.search_knowledge_graph(user_id, document_name, query_text)
+        facts_from_kg = neo4j_handler.search_knowledge_graph(user_id, document_name, query_text, hops=data.get('hops'))
         
         return jsonify({"success": True, "facts": facts_from_kg}), 200
     except neo4j_exceptions.ClientError as e:
@@ -831,7 +988,7 @@ def generate_document_route():
         return create_error_response("Missing required fields", 400)
         
     try:
-        expanded_content = document_generator.expand_content_with_llm(outline, source_text, doc_type, lambda p: llm_wrapper(p, api_key))
+        expanded_content = document_generator.expand_content_with_llm(outline, source_text, doc_type, lambda p: llm_wrapper(p, api_key, priority="batch"))
         
         parsed_data = []
         if doc_type == 'pptx':
@@ -877,7 +1034,7 @@ def generate_document_from_topic_route():
         return create_error_response("Missing 'topic', 'docType', or 'api_key'", 400)
 
     try:
-        generated_content = document_generator.generate_content_from_topic(topic, doc_type, lambda p: llm_wrapper(p, api_key))
+        generated_content = document_generator.generate_content_from_topic(topic, doc_type, lambda p: llm_wrapper(p, api_key, priority="batch"))
 
         parsed_data = []
         if doc_type == 'pptx':
@@ -1078,6 +1235,8 @@ def upload_curriculum_route():
     Expected form data:
     - file: Single CSV file
     - courseName: Name of the course
+    - mode: "sync" (default) applies only the differences to the existing
+      course in one transaction; "replace" deletes and rebuilds it
     """
     current_app.logger.info("--- /curriculum/upload Request (Single CSV Ingestion) ---")
     
@@ -1099,6 +1258,10 @@ def upload_curriculum_route():
     if not file.filename.lower().endswith('.csv'):
         return create_error_response("Only CSV files are supported", 400)
     
+    mode = request.form.get('mode', 'sync').strip().lower()
+    if mode not in ('sync', 'replace'):
+        return create_error_response("mode must be 'sync' or 'replace'", 400)
+    
     temp_dir = tempfile.mkdtemp()
     try:
         filename = werkzeug_utils.secure_filename(file.filename)
@@ -1107,20 +1270,24 @@ def upload_curriculum_route():
         
         logger.info(f"Curriculum upload: Processing '{filename}' for course '{course_name}'")
         
-        # Delete existing curriculum data for this course first
-        try:
-            delete_result = curriculum_graph_handler.delete_course_curriculum(course_name)
-            if delete_result.get('deleted_count', 0) > 0:
-                logger.info(f"Deleted {delete_result['deleted_count']} existing nodes for course '{course_name}'")
-        except Exception as delete_error:
-            logger.warning(f"Could not delete existing curriculum (may not exist): {delete_error}")
-        
-        # Use unified CSV parser to create new curriculum
-        result = curriculum_graph_handler.ingest_from_unified_csv(course_name, file_path)
+        if mode == 'replace':
+            # Delete existing curriculum data for this course first
+            try:
+                delete_result = curriculum_graph_handler.delete_course_curriculum(course_name)
+                if delete_result.get('deleted_count', 0) > 0:
+                    logger.info(f"Deleted {delete_result['deleted_count']} existing nodes for course '{course_name}'")
+            except Exception as delete_error:
+                logger.warning(f"Could not delete existing curriculum (may not exist): {delete_error}")
+            
+            # Use unified CSV parser to create new curriculum
+            result = curriculum_graph_handler.ingest_from_unified_csv(course_name, file_path)
+        else:
+            # Diff against the stored course and apply only the changes, atomically
+            result = curriculum_graph_handler.sync_from_unified_csv(course_name, file_path)
         
         return jsonify({
             "success": True,
-            "message": f"Curriculum graph created for '{course_name}'",
+            "message": f"Curriculum graph {'created' if mode == 'replace' else 'synced'} for '{course_name}'",
             **result
         }), 201
         
@@ -1252,6 +1419,36 @@ def get_learning_path_route(course, topic_id):
         return create_error_response(f"Failed to get learning path: {str(e)}", 500)
 
 
+@app.route('/curriculum/<course>/paths', methods=['POST'])
+def get_learning_paths_route(course):
+    """
+    Get learning paths for several target topics in one request.
+
+    Expected JSON:
+    - topic_ids: List of target topic IDs
+    - combined: Also return one merged, de-duplicated path (default: false)
+    """
+    if not curriculum_graph_handler:
+        return create_error_response("Curriculum graph handler not available", 503)
+
+    data = request.get_json()
+    if not data:
+        return create_error_response("Request must be JSON", 400)
+
+    topic_ids = data.get('topic_ids')
+    if not isinstance(topic_ids, list) or not topic_ids:
+        return create_error_response("'topic_ids' must be a non-empty list", 400)
+
+    try:
+        result = curriculum_graph_handler.get_learning_paths(
+            course, topic_ids, combined=bool(data.get('combined', False))
+        )
+        return jsonify({"course": course, **result}), 200
+    except Exception as e:
+        logger.error(f"Error getting learning paths: {e}", exc_info=True)
+        return create_error_response(f"Failed to get learning paths: {str(e)}", 500)
+
+
 @app.route('/curriculum/<course>/next-module/<module_id>', methods=['GET'])
 def get_next_module_route(course, module_id):
     """
@@ -1280,6 +1477,7 @@ def detect_missing_prerequisites_route(course):
     Expected JSON:
     - topic_id: Target topic ID
     - completed_subtopics: List of completed subtopic IDs
+    - transitive: Include prerequisites from preceding modules (default: false)
     """
     if not curriculum_graph_handler:
         return create_error_response("Curriculum graph handler not available", 503)
@@ -1296,7 +1494,7 @@ def detect_missing_prerequisites_route(course):
     
     try:
         missing = curriculum_graph_handler.detect_missing_prerequisites(
-            course, topic_id, completed
+            course, topic_id, completed, transitive=bool(data.get('transitive', False))
         )
         return jsonify({
             "course": course,
@@ -1308,6 +1506,107 @@ def detect_missing_prerequisites_route(course):
         return create_error_response(f"Failed to detect missing prerequisites: {str(e)}", 500)
 
 
+@app.route('/curriculum/<course>/missing-prerequisites/batch', methods=['POST'])
+def detect_missing_prerequisites_batch_route(course):
+    """
+    Detect missing prerequisites for many topics against one learner state.
+    
+    Expected JSON:
+    - topic_ids: List of topic IDs to evaluate
+    - completed_subtopics: List of completed subtopic IDs
+    - completed_topics: List of completed topic IDs
+    - transitive: Include prerequisites from preceding modules (default: true)
+    """
+    if not curriculum_graph_handler:
+        return create_error_response("Curriculum graph handler not available", 503)
+    
+    data = request.get_json()
+    if not data:
+        return create_error_response("Request must be JSON", 400)
+    
+    topic_ids = data.get('topic_ids')
+    if not isinstance(topic_ids, list) or not topic_ids:
+        return create_error_response("'topic_ids' must be a non-empty list", 400)
+    
+    try:
+        results = curriculum_graph_handler.detect_missing_prerequisites_batch(
+            course,
+            topic_ids,
+            completed_subtopic_ids=data.get('completed_subtopics', []),
+            completed_topic_ids=data.get('completed_topics', []),
+            transitive=bool(data.get('transitive', True))
+        )
+        return jsonify({
+            "course": course,
+            "results": {
+                topic_id: {
+                    "found": missing is not None,
+                    "missing_prerequisites": missing or [],
+                    "has_missing": bool(missing)
+                }
+                for topic_id, missing in results.items()
+            }
+        }), 200
+    except Exception as e:
+        logger.error(f"Error detecting missing prerequisites (batch): {e}", exc_info=True)
+        return create_error_response(f"Failed to detect missing prerequisites: {str(e)}", 500)
+
+
+@app.route('/curriculum/<course>/cohort-gaps', methods=['POST'])
+def cohort_gaps_route(course):
+    """
+    Missing prerequisites for a whole cohort, streamed as NDJSON.
+    
+    Expected JSON:
+    - topic_ids: Target topic IDs evaluated for every learner
+    - learners: List of {learner_id, completed_subtopics, completed_topics}
+    - transitive: Include prerequisites from preceding modules (default: true)
+    
+    Response: one JSON object per line, one per learner in input order,
+    followed by a final {"type": "summary"} line.
+    """
+    if not curriculum_graph_handler:
+        return create_error_response("Curriculum graph handler not available", 503)
+    
+    data = request.get_json()
+    if not data:
+        return create_error_response("Request must be JSON", 400)
+    
+    topic_ids = data.get('topic_ids')
+    learners = data.get('learners')
+    if not isinstance(topic_ids, list) or not topic_ids:
+        return create_error_response("'topic_ids' must be a non-empty list", 400)
+    if not isinstance(learners, list):
+        return create_error_response("'learners' must be a list", 400)
+    
+    try:
+        rows = curriculum_graph_handler.analyze_cohort_gaps(
+            course,
+            [
+                {
+                    "learner_id": learner.get('learner_id'),
+                    "completed_subtopic_ids": learner.get('completed_subtopics', []),
+                    "completed_topic_ids": learner.get('completed_topics', []),
+                }
+                for learner in learners if isinstance(learner, dict)
+            ],
+            topic_ids,
+            transitive=bool(data.get('transitive', True))
+        )
+        # Pull the first row eagerly so graph/model errors become a normal error response
+        first = next(rows)
+    except Exception as e:
+        logger.error(f"Error analyzing cohort gaps: {e}", exc_info=True)
+        return create_error_response(f"Failed to analyze cohort gaps: {str(e)}", 500)
+    
+    def generate():
+        yield json.dumps(first) + "\n"
+        for row in rows:
+            yield json.dumps(row) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.route('/curriculum/<course>', methods=['DELETE'])
 def delete_curriculum_route(course):
     """
@@ -1617,6 +1916,7 @@ def detect_missing_prerequisites_tutor_route(course, topic_id):
     
     Expected JSON:
     - completed_subtopics: List of subtopic IDs the student has completed
+    - transitive: Include prerequisites from preceding modules (default: false)
     """
     if not course_pipeline:
         return create_error_response("Course pipeline not available", 503)
@@ -1626,7 +1926,7 @@ def detect_missing_prerequisites_tutor_route(course, topic_id):
     
     try:
         missing = course_pipeline.detect_missing_prerequisites(
-            course, topic_id, completed_subtopics
+            course, topic_id, completed_subtopics, transitive=bool(data.get('transitive', False))
         )
         return jsonify({
             "course": course,
@@ -1643,84 +1943,24 @@ def detect_missing_prerequisites_tutor_route(course, topic_id):
 def get_curriculum_visualization_route(course):
     """
     Get curriculum data formatted for visualization.
-    Returns nodes and edges for graph display in admin.
-    Uses the new normalized curriculum graph handler.
+    Returns nodes and edges for graph display in admin, with per-topic
+    `qdrant_doc_count`.
+    
+    The serialized payload is cached per course version and served with an
+    ETag; requests carrying a matching If-None-Match get 304 Not Modified.
     """
-    if not curriculum_graph_handler:
+    if not course_pipeline or not curriculum_graph_handler:
         return create_error_response("Curriculum graph handler not available", 503)
     
     try:
-        # Get curriculum structure from the NEW normalized schema
-        curriculum = curriculum_graph_handler.traverse_curriculum(course)
-        
-        nodes = []
-        edges = []
-        
-        # Build visualization data from curriculum structure
-        modules = curriculum.get('modules', [])
-        
-        for i, module in enumerate(modules):
-            module_id = module.get('id')
-            nodes.append({
-                "id": module_id,
-                "label": module.get('name'),
-                "type": "module",
-                "order": module.get('order', i + 1)
-            })
-            
-            # Add PRECEDES edges between modules
-            if i > 0:
-                prev_module = modules[i - 1]
-                edges.append({
-                    "from": prev_module.get('id'),
-                    "to": module_id,
-                    "type": "PRECEDES"
-                })
-            
-            # Add topics for this module
-            for topic in module.get('topics', []):
-                topic_id = topic.get('id')
-                nodes.append({
-                    "id": topic_id,
-                    "label": topic.get('name'),
-                    "type": "topic",
-                    "module_id": module_id
-                })
-                
-                # Add HAS_TOPIC edge from module to topic
-                edges.append({
-                    "from": module_id,
-                    "to": topic_id,
-                    "type": "HAS_TOPIC"
-                })
-                
-                # Add subtopics (prerequisites) for this topic
-                for subtopic in topic.get('subtopics', []):
-                    subtopic_id = subtopic.get('id')
-                    
-                    # Add subtopic node if not already present
-                    if not any(n['id'] == subtopic_id for n in nodes):
-                        nodes.append({
-                            "id": subtopic_id,
-                            "label": subtopic.get('name'),
-                            "type": "subtopic",
-                            "topic_id": topic_id
-                        })
-                    
-                    # Add PREREQUISITE_OF edge from subtopic to topic
-                    edges.append({
-                        "from": subtopic_id,
-                        "to": topic_id,
-                        "type": "PREREQUISITE_OF"
-                    })
-        
-        logger.info(f"Visualization for '{course}': {len(nodes)} nodes, {len(edges)} edges")
-        
-        return jsonify({
-            "course": course,
-            "nodes": nodes,
-            "edges": edges
-        }), 200
+        body, etag = course_pipeline.get_curriculum_visualization_blob(course, vector_service)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype='application/json')
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
         
     except Exception as e:
         logger.error(f"Error getting visualization: {e}", exc_info=True)
@@ -1800,7 +2040,7 @@ if __name__ == '__main__':
             return create_error_response(f"Failed to process URL: {str(e)}", 500)
 
 # Initialize Knowledge Bridge
-knowledge_bridge = create_knowledge_bridge()
+knowledge_bridge = create_knowledge_bridge(vector_service)
 
 @app.route('/curriculum/alignment', methods=['POST'])
 async def curriculum_alignment_route():
@@ -1809,7 +2049,8 @@ async def curriculum_alignment_route():
         return create_error_response("Missing 'subject'", 400)
     
     subject = data['subject']
-    existing_counts = data.get('existing_counts', {})
+    # Omitted counts return the materialized report without touching it
+    existing_counts = data.get('existing_counts')
     
     try:
         report = await knowledge_bridge.assess_data_alignment(subject, existing_counts)
@@ -1846,6 +2087,9 @@ def augment_data_route():
         "augmented_data": augmented_results
     }), 200
 
+
+if __name__ == '__main__':
     logger.info(f"--- Starting RAG & Knowledge API Service on port {config.API_PORT} ---")
-    # Using threaded=False for stability with external processes like ffmpeg/tesseract
-    app.run(host='0.0.0.0', port=config.API_PORT, debug=False, threaded=False)
\ No newline at end of file
+    # Threaded: concurrent requests are what singleflight coalesces and the LLM rate limiter
+    # orders by priority. ffmpeg/tesseract run as subprocesses, which is safe per thread.
+    app.run(host='0.0.0.0', port=config.API_PORT, debug=False, threaded=True)
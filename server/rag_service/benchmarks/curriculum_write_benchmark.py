@@ -0,0 +1,106 @@
+# server/rag_service/benchmarks/curriculum_write_benchmark.py
+"""
+Curriculum Graph Write Benchmark
+
+Times build_curriculum_graph (UNWIND batches of CURRICULUM_WRITE_BATCH_SIZE)
+against the previous one-statement-per-row writes on a synthetic curriculum,
+and reports ingest time per 1k rows. Needs a reachable Neo4j (NEO4J_URI);
+the benchmark course is deleted afterwards.
+
+Usage:
+    python benchmarks/curriculum_write_benchmark.py --modules 10 --topics-per-module 4 --subtopics-per-topic 10
+    python benchmarks/curriculum_write_benchmark.py --batch-sizes 100,500,2000 --skip-per-row
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+
+RAG_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAG_SERVICE_DIR not in sys.path:
+    sys.path.insert(0, RAG_SERVICE_DIR)
+
+import config
+import curriculum_graph_handler as cgh
+from neo4j_handler import get_driver_instance
+
+
+def synthetic_curriculum(n_modules: int, topics_per_module: int, subtopics_per_topic: int):
+    modules, topics, subtopics = [], [], []
+    for m in range(1, n_modules + 1):
+        module_id = f"module_{m}"
+        modules.append({'id': module_id, 'name': f"Module {m}", 'order': m})
+        for t in range(1, topics_per_module + 1):
+            topic_id = f"topic_{m}_{t}"
+            topics.append({'id': topic_id, 'name': f"Topic {m}.{t}", 'module_id': module_id,
+                           'lecture_number': (m - 1) * topics_per_module + t})
+            for s in range(1, subtopics_per_topic + 1):
+                subtopics.append({'id': f"subtopic_{m}_{t}_{s}", 'name': f"Subtopic {m}.{t}.{s}", 'topic_id': topic_id})
+    return modules, topics, subtopics
+
+
+def _per_row_write(tx, course, modules, topics, subtopics):
+    """The pre-UNWIND write pattern: one MERGE per node and per relationship."""
+    for m in modules:
+        tx.run("MERGE (m:Module {id: $id, course_key: $course_key}) SET m.name = $name, m.order = $order",
+               id=m['id'], course=course, name=m['name'], order=m['order']).consume()
+    for a, b in zip(modules, modules[1:]):
+        tx.run("MATCH (m1:Module {id: $a, course_key: $course_key}) MATCH (m2:Module {id: $b, course_key: $course_key}) "
+               "MERGE (m1)-[:PRECEDES]->(m2)", a=a['id'], b=b['id'], course_key=cgh.course_key(course)).consume()
+    for t in topics:
+        tx.run("MERGE (t:Topic {id: $id, course_key: $course_key}) SET t.name = $name, t.module_id = $module_id",
+               id=t['id'], course=course, name=t['name'], module_id=t['module_id']).consume()
+        tx.run("MATCH (m:Module {id: $module_id, course_key: $course_key}) MATCH (t:Topic {id: $id, course_key: $course_key}) "
+               "MERGE (m)-[:HAS_TOPIC]->(t)", module_id=t['module_id'], id=t['id'], course_key=cgh.course_key(course)).consume()
+    for s in subtopics:
+        tx.run("MERGE (s:Subtopic {id: $id, course_key: $course_key}) SET s.name = $name, s.topic_id = $topic_id",
+               id=s['id'], course=course, name=s['name'], topic_id=s['topic_id']).consume()
+        tx.run("MATCH (s:Subtopic {id: $id, course_key: $course_key}) MATCH (t:Topic {id: $topic_id, course_key: $course_key}) "
+               "MERGE (s)-[:PREREQUISITE_OF]->(t)", id=s['id'], topic_id=s['topic_id'], course_key=cgh.course_key(course)).consume()
+
+
+def _report(label: str, seconds: float, rows: int) -> None:
+    print(f"{label:<22} {seconds * 1000:>10.1f} ms total {seconds * 1000 * 1000 / rows:>10.1f} ms / 1k rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark curriculum graph writes against Neo4j.")
+    parser.add_argument("--modules", type=int, default=10)
+    parser.add_argument("--topics-per-module", type=int, default=4)
+    parser.add_argument("--subtopics-per-topic", type=int, default=10)
+    parser.add_argument("--batch-sizes", type=lambda v: [int(x) for x in v.split(",")],
+                        default=[config.CURRICULUM_WRITE_BATCH_SIZE])
+    parser.add_argument("--skip-per-row", action="store_true", help="Do not time the one-statement-per-row baseline")
+    args = parser.parse_args()
+
+    modules, topics, subtopics = synthetic_curriculum(args.modules, args.topics_per_module, args.subtopics_per_topic)
+    rows = len(modules) + len(topics) + len(subtopics)
+    print(f"Synthetic curriculum: {len(modules)} modules, {len(topics)} topics, {len(subtopics)} subtopics "
+          f"({rows} rows) -> {config.NEO4J_URI}\n")
+
+    driver = get_driver_instance()
+    if not args.skip_per_row:
+        course = f"bench_curriculum_{uuid.uuid4().hex[:8]}"
+        started = time.perf_counter()
+        with driver.session(database=config.NEO4J_DATABASE) as session:
+            session.execute_write(_per_row_write, course, modules, topics, subtopics)
+        _report("per-row statements", time.perf_counter() - started, rows)
+        cgh.delete_course_curriculum(course)
+
+    original_batch_size = config.CURRICULUM_WRITE_BATCH_SIZE
+    try:
+        for batch_size in args.batch_sizes:
+            config.CURRICULUM_WRITE_BATCH_SIZE = batch_size
+            course = f"bench_curriculum_{uuid.uuid4().hex[:8]}"
+            started = time.perf_counter()
+            cgh.build_curriculum_graph(course, modules, topics, subtopics)
+            _report(f"UNWIND batch={batch_size}", time.perf_counter() - started, rows)
+            cgh.delete_course_curriculum(course)
+    finally:
+        config.CURRICULUM_WRITE_BATCH_SIZE = original_batch_size
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+# server/rag_service/benchmarks/matryoshka_benchmark.py
+"""
+Matryoshka Two-Stage Retrieval Benchmark
+
+Reports the latency/recall trade-off of searching a short Matryoshka prefix
+and rescoring with the full vector, against an exact full-vector search.
+
+Recall@k is measured against the exact full-vector top-k. Run it on real
+embeddings (--source collection scrolls them from QDRANT_COLLECTION_NAME);
+the synthetic source only imitates Matryoshka energy decay and is meant for
+smoke-testing the harness.
+
+Usage:
+    python benchmarks/matryoshka_benchmark.py --source collection --points 20000 --dims 128,256,512
+    python benchmarks/matryoshka_benchmark.py --source synthetic --backend local --multipliers 4,8,16
+"""
+
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+RAG_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if RAG_SERVICE_DIR not in sys.path:
+    sys.path.insert(0, RAG_SERVICE_DIR)
+
+from qdrant_client import models
+
+import config
+import matryoshka
+from local_vector_store import LocalVectorStore, create_vector_store_client
+
+logger = logging.getLogger(__name__)
+
+_BENCH_COLLECTION_PREFIX = "bench_matryoshka"
+
+
+def load_collection_vectors(max_points: int) -> np.ndarray:
+    client = create_vector_store_client()
+    vectors, offset = [], None
+    while len(vectors) < max_points:
+        records, offset = client.scroll(
+            collection_name=config.QDRANT_COLLECTION_NAME,
+            limit=min(1000, max_points - len(vectors)),
+            offset=offset,
+            with_payload=False,
+            with_vectors=True
+        )
+        vectors.extend(matryoshka.full_vector(r.vector) for r in records)
+        if offset is None:
+            break
+    if not vectors:
+        raise SystemExit(f"Collection '{config.QDRANT_COLLECTION_NAME}' has no vectors to benchmark.")
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(n: int, dim: int, seed: int) -> np.ndarray:
+    # Clustered data whose variance decays along the dimensions, so prefixes carry most of the signal
+    rng = np.random.default_rng(seed)
+    decay = np.exp(-np.arange(dim) / (dim / 4))
+    centres = rng.standard_normal((max(8, n // 200), dim)) * decay
+    assignments = rng.integers(0, centres.shape[0], n)
+    return (centres[assignments] + 0.5 * rng.standard_normal((n, dim)) * decay).astype(np.float32)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def _load_collection(client, name: str, corpus: np.ndarray, short_dim: int = None, batch_size: int = 500) -> None:
+    if short_dim:
+        vectors_config = {
+            config.MATRYOSHKA_FULL_VECTOR_NAME: models.VectorParams(size=corpus.shape[1], distance=models.Distance.COSINE),
+            config.MATRYOSHKA_SHORT_VECTOR_NAME: models.VectorParams(size=short_dim, distance=models.Distance.COSINE),
+        }
+    else:
+        vectors_config = models.VectorParams(size=corpus.shape[1], distance=models.Distance.COSINE)
+    client.recreate_collection(collection_name=name, vectors_config=vectors_config)
+    for start in range(0, corpus.shape[0], batch_size):
+        batch = corpus[start:start + batch_size]
+        points = []
+        for offset, row in enumerate(batch.tolist()):
+            if short_dim:
+                vector = {config.MATRYOSHKA_FULL_VECTOR_NAME: row, config.MATRYOSHKA_SHORT_VECTOR_NAME: row[:short_dim]}
+            else:
+                vector = row
+            points.append(models.PointStruct(id=start + offset, vector=vector, payload={}))
+        client.upsert(collection_name=name, points=points, wait=True)
+
+
+def _percentiles(latencies_ms):
+    return float(np.percentile(latencies_ms, 50)), float(np.percentile(latencies_ms, 95))
+
+
+def run_benchmark(args) -> None:
+    if args.source == "collection":
+        vectors = load_collection_vectors(args.points + args.queries)
+    else:
+        vectors = synthetic_vectors(args.points + args.queries, args.full_dim, args.seed)
+    vectors = _normalize(vectors)
+
+    rng = np.random.default_rng(args.seed)
+    order = rng.permutation(vectors.shape[0])
+    queries, corpus = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    k = args.k
+    print(f"Corpus: {corpus.shape[0]} x {corpus.shape[1]} ({args.source}), queries: {queries.shape[0]}, k={k}, "
+          f"backend={args.backend}")
+
+    truth = np.argsort(-(queries @ corpus.T), axis=1)[:, :k]
+    client = LocalVectorStore(path=None) if args.backend == "local" else create_vector_store_client()
+
+    baseline_name = f"{_BENCH_COLLECTION_PREFIX}_full"
+    _load_collection(client, baseline_name, corpus)
+    latencies = []
+    for query in queries.tolist():
+        started = time.perf_counter()
+        client.search(collection_name=baseline_name, query_vector=query, limit=k, with_payload=True)
+        latencies.append((time.perf_counter() - started) * 1000)
+    base_p50, base_p95 = _percentiles(latencies)
+
+    rows = [("full", "-", 1.0, base_p50, base_p95, 1.0)]
+    created = [baseline_name]
+    for dim in args.dims:
+        if dim >= corpus.shape[1]:
+            continue
+        name = f"{_BENCH_COLLECTION_PREFIX}_{dim}"
+        _load_collection(client, name, corpus, short_dim=dim)
+        created.append(name)
+        for multiplier in args.multipliers:
+            latencies, hits = [], 0
+            for qi, query in enumerate(queries.tolist()):
+                started = time.perf_counter()
+                results = matryoshka.two_stage_search(
+                    client, name, query, None, limit=k, candidate_limit=k * multiplier, short_dim=dim
+                )
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += len({int(p.id) for p in results} & set(truth[qi].tolist()))
+            p50, p95 = _percentiles(latencies)
+            rows.append((dim, multiplier, hits / (k * queries.shape[0]), p50, p95, base_p50 / p50 if p50 else 0.0))
+
+    print(f"\n{'short dim':>9} {'x cand':>7} {'recall@' + str(k):>10} {'p50 ms':>8} {'p95 ms':>8} {'speedup':>8}")
+    for dim, multiplier, recall, p50, p95, speedup in rows:
+        print(f"{dim!s:>9} {multiplier!s:>7} {recall:>10.3f} {p50:>8.2f} {p95:>8.2f} {speedup:>7.2f}x")
+    print(f"\nConfigured: MATRYOSHKA_DIM={config.MATRYOSHKA_DIM}, "
+          f"MATRYOSHKA_CANDIDATE_MULTIPLIER={config.MATRYOSHKA_CANDIDATE_MULTIPLIER}")
+
+    if not args.keep_collections:
+        for name in created:
+            client.delete_collection(collection_name=name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Matryoshka two-stage retrieval (latency vs recall).")
+    parser.add_argument("--source", choices=["collection", "synthetic"], default="collection")
+    parser.add_argument("--backend", choices=["local", "configured"], default="local",
+                        help="'local' runs in-memory; 'configured' uses VECTOR_STORE_BACKEND (temporary collections)")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.QDRANT_DEFAULT_SEARCH_K)
+    parser.add_argument("--dims", type=lambda v: [int(x) for x in v.split(",")], default=[64, 128, 256, 512])
+    parser.add_argument("--multipliers", type=lambda v: [int(x) for x in v.split(",")], default=[2, 4, 8, 16])
+    parser.add_argument("--full-dim", type=int, default=config.QDRANT_COLLECTION_VECTOR_DIM,
+                        help="Vector size for --source synthetic")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--keep-collections", action="store_true")
+    run_benchmark(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# server/rag_service/collection_migration.py
+"""
+Collection Layout Migration
+
+Changing MATRYOSHKA_ENABLED changes the collection's vector layout (one
+unnamed vector vs. named full + short vectors). VectorDBService refuses to
+start against a collection in the other layout rather than dropping it, so
+switching modes is this explicit, opt-in step:
+
+1. Copy every point into a new collection with the configured layout. The
+   stored full embeddings are reused (the layout change does not alter
+   them), so nothing has to be re-embedded.
+2. Verify the copy's point count against the source
+3. Point the service name (QDRANT_COLLECTION_NAME) at the copy via an alias
+
+If the service name is already an alias, the swap is atomic and the old
+collection is kept for rollback. The first migration of a plain collection
+has to drop it to free its name for the alias, which requires drop_source.
+
+Requires a Qdrant server; the local backend has no aliases.
+
+CLI:
+    python collection_migration.py --drop-source      # first migration
+    python collection_migration.py                    # name is already an alias
+"""
+
+import json
+import time
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+from qdrant_client import models
+
+import config
+import matryoshka
+
+logger = logging.getLogger(__name__)
+
+
+def _alias_target(client, alias_name: str) -> Optional[str]:
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == alias_name:
+            return alias.collection_name
+    return None
+
+
+def _full_vector_size(vectors: Any) -> int:
+    if isinstance(vectors, dict):
+        params = vectors.get(config.MATRYOSHKA_FULL_VECTOR_NAME) or next(iter(vectors.values()))
+        return params.size
+    return vectors.size
+
+
+def migrate_collection_layout(
+    client,
+    name: Optional[str] = None,
+    target_collection: Optional[str] = None,
+    batch_size: int = 500,
+    drop_source: bool = False
+) -> Dict[str, Any]:
+    """
+    Copy the collection behind `name` into the configured layout and point
+    `name` at the copy.
+
+    Args:
+        client: QdrantClient
+        name: Alias or collection the service uses (default: QDRANT_COLLECTION_NAME)
+        target_collection: New collection name (default: <name>_v<unix time>)
+        batch_size: Points per scroll page / upsert
+        drop_source: Allow dropping a plain (non-alias) source collection so
+            its name can become an alias. Only happens after the copy is verified.
+
+    Returns:
+        Migration summary
+    """
+    name = name or config.QDRANT_COLLECTION_NAME
+    source = _alias_target(client, name)
+    is_alias = source is not None
+    if not is_alias:
+        if not client.collection_exists(name):
+            raise ValueError(f"No collection or alias named '{name}'")
+        if not drop_source:
+            raise ValueError(
+                f"'{name}' is a collection, not an alias. Pass drop_source=True (--drop-source) to replace it "
+                f"with an alias to the migrated copy; it is only dropped after the copy is verified."
+            )
+        source = name
+
+    source_vectors = client.get_collection(source).config.params.vectors
+    if matryoshka.layout_matches(source_vectors):
+        return {"success": True, "migrated": False, "collection": source,
+                "message": f"'{source}' already has the configured layout"}
+
+    target = target_collection or f"{name}_v{int(time.time())}"
+    started = time.time()
+    client.create_collection(target, vectors_config=matryoshka.vectors_config(_full_vector_size(source_vectors)))
+    logger.info(f"Layout migration: copying '{source}' -> '{target}' (MATRYOSHKA_ENABLED={config.MATRYOSHKA_ENABLED})")
+
+    copied = 0
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=source, limit=batch_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        if records:
+            client.upsert(collection_name=target, wait=True, points=[
+                models.PointStruct(id=r.id, vector=matryoshka.point_vector(matryoshka.full_vector(r.vector)),
+                                   payload=r.payload)
+                for r in records
+            ])
+            copied += len(records)
+            logger.info(f"Layout migration: {copied} points copied")
+        if offset is None:
+            break
+
+    source_count = client.count(source, exact=True).count
+    target_count = client.count(target, exact=True).count
+    if target_count != source_count:
+        raise RuntimeError(
+            f"Layout migration: '{target}' has {target_count} points but '{source}' has {source_count}. "
+            f"'{name}' was left unchanged."
+        )
+
+    operations: List[Any] = []
+    if is_alias:
+        operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=name)))
+    else:
+        client.delete_collection(source)
+        logger.warning(f"Layout migration: dropped source collection '{source}' to free its name for the alias")
+    operations.append(models.CreateAliasOperation(
+        create_alias=models.CreateAlias(collection_name=target, alias_name=name)
+    ))
+    client.update_collection_aliases(change_aliases_operations=operations)
+
+    summary = {
+        "success": True,
+        "migrated": True,
+        "alias": name,
+        "source_collection": source,
+        "source_kept": is_alias,
+        "collection": target,
+        "points": target_count,
+        "seconds": round(time.time() - started, 2),
+    }
+    logger.info(f"Layout migration complete: {summary}")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from local_vector_store import create_vector_store_client
+
+    parser = argparse.ArgumentParser(description="Migrate the collection to the configured Matryoshka layout.")
+    parser.add_argument("--name", default=config.QDRANT_COLLECTION_NAME, help="Alias or collection the service uses")
+    parser.add_argument("--target", help="New collection name (default: <name>_v<unix time>)")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--drop-source", action="store_true",
+                        help="Allow dropping a plain source collection so its name can become an alias")
+    args = parser.parse_args(argv)
+    result = migrate_collection_layout(
+        create_vector_store_client(), args.name, args.target, args.batch_size, args.drop_source
+    )
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
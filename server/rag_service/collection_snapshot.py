@@ -0,0 +1,359 @@
+# server/rag_service/collection_snapshot.py
+"""
+Collection Snapshot Export/Import
+
+Bootstraps a course's vectors into another environment without re-running
+course_pipeline.ingest_course (parsing, OCR, embedding):
+1. export_course_snapshot: scroll one course's points (vectors + payload)
+   into a compact, chunked binary file
+2. import_snapshot: stream such a file into any collection with pipelined
+   upserts
+
+File layout (all integers little-endian):
+    MAGIC
+    u32 header_len | header JSON
+    repeated:  b"CHNK" | u32 n_points | u32 ids_len | u32 vectors_len | u32 payload_len
+               | ids (compressed JSON) | vectors (raw float16, n_points x dim)
+               | payloads (compressed JSON)
+    b"END!" | u64 total_points
+
+Only the full embedding is stored; named Matryoshka prefixes are rebuilt on
+import when the target collection uses them.
+
+Payload/ID blocks use zstd when the `zstandard` package is installed and
+fall back to zlib otherwise; the header records which one was used.
+
+CLI:
+    python collection_snapshot.py export --course "Machine Learning" --out ml.imsnap
+    python collection_snapshot.py import --in ml.imsnap [--collection other_collection]
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import struct
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from qdrant_client import models
+
+import config
+import matryoshka
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"IMSNAP1\n"
+SNAPSHOT_EXTENSION = ".imsnap"
+FORMAT_VERSION = 1
+_CHUNK_TAG = b"CHNK"
+_END_TAG = b"END!"
+_CHUNK_HEADER = struct.Struct("<IIII")
+
+
+# ============================================================================
+# COMPRESSION
+# ============================================================================
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=config.SNAPSHOT_ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Snapshot is zstd-compressed but the 'zstandard' package is not installed.")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _encode_json(value: Any, codec: str) -> bytes:
+    return _compress(json.dumps(value, separators=(",", ":")).encode("utf-8"), codec)
+
+
+def _decode_json(data: bytes, codec: str) -> Any:
+    return json.loads(_decompress(data, codec).decode("utf-8"))
+
+
+def snapshot_id_for(course: Optional[str]) -> str:
+    """Filesystem-safe snapshot ID for a course (or the whole collection)."""
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", course or "collection").strip("_") or "collection"
+
+
+def resolve_snapshot_path(snapshot_id: str) -> str:
+    """
+    Path of a snapshot inside SNAPSHOT_DIR. The ID is sanitized, and a path
+    that still resolves outside SNAPSHOT_DIR raises ValueError.
+    """
+    name = snapshot_id[:-len(SNAPSHOT_EXTENSION)] if snapshot_id.endswith(SNAPSHOT_EXTENSION) else snapshot_id
+    if not name or snapshot_id_for(name) != name:
+        raise ValueError(f"Invalid snapshot ID: '{snapshot_id}'")
+    root = os.path.realpath(config.SNAPSHOT_DIR)
+    path = os.path.realpath(os.path.join(root, name + SNAPSHOT_EXTENSION))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"Snapshot ID '{snapshot_id}' resolves outside the snapshot directory")
+    return path
+
+
+def course_filter(course: str) -> models.Filter:
+    """Points linked to a course by either the syllabus linker or course_pipeline."""
+    return models.Filter(should=[
+        models.FieldCondition(key="syllabus_course", match=models.MatchValue(value=course)),
+        models.FieldCondition(key="course_name", match=models.MatchValue(value=course)),
+    ])
+
+
+# ============================================================================
+# EXPORT
+# ============================================================================
+
+def export_course_snapshot(
+    client,
+    collection_name: str,
+    course: Optional[str],
+    output_path: str,
+    chunk_size: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Write one course's points (or the whole collection if course is None)
+    to a snapshot file.
+
+    Args:
+        client: QdrantClient or LocalVectorStore
+        collection_name: Source collection
+        course: Course name to export, or None for every point
+        output_path: Destination file (parent directories are created)
+        chunk_size: Points per chunk / scroll page
+
+    Returns:
+        Export summary with point, chunk and byte counts
+    """
+    chunk_size = chunk_size or config.SNAPSHOT_CHUNK_SIZE
+    codec = "zstd" if zstandard is not None else "zlib"
+    started = time.time()
+    scroll_filter = course_filter(course) if course else None
+
+    vector_dim = None
+    total_points = 0
+    chunks = 0
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = output_path + ".part"
+
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        header_pos = f.tell()
+        # Header is rewritten at the end once vector_dim is known; reserve space for it
+        header_reserved = 4096
+        f.write(b"\0" * header_reserved)
+
+        offset = None
+        while True:
+            records, offset = client.scroll(
+                collection_name=collection_name,
+                scroll_filter=scroll_filter,
+                limit=chunk_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True
+            )
+            if records:
+                vectors = np.asarray([matryoshka.full_vector(r.vector) for r in records], dtype=np.float16)
+                if vector_dim is None:
+                    vector_dim = int(vectors.shape[1])
+                ids_block = _encode_json([r.id for r in records], codec)
+                vectors_block = vectors.tobytes()
+                payload_block = _encode_json([r.payload or {} for r in records], codec)
+                f.write(_CHUNK_TAG)
+                f.write(_CHUNK_HEADER.pack(len(records), len(ids_block), len(vectors_block), len(payload_block)))
+                f.write(ids_block)
+                f.write(vectors_block)
+                f.write(payload_block)
+                total_points += len(records)
+                chunks += 1
+                logger.info(f"Snapshot export: {total_points} points written ({chunks} chunks)")
+            if offset is None:
+                break
+
+        f.write(_END_TAG)
+        f.write(struct.pack("<Q", total_points))
+
+        header = json.dumps({
+            "format_version": FORMAT_VERSION,
+            "course": course,
+            "source_collection": collection_name,
+            "vector_dim": vector_dim,
+            "vector_dtype": "float16",
+            "compression": codec,
+            "chunk_size": chunk_size,
+            "total_points": total_points,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }).encode("utf-8")
+        if len(header) + 4 > header_reserved:
+            raise ValueError("Snapshot header too large")
+        f.seek(header_pos)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+
+    os.replace(tmp_path, output_path)
+    summary = {
+        "success": True,
+        "course": course,
+        "snapshot_path": output_path,
+        "points": total_points,
+        "chunks": chunks,
+        "vector_dim": vector_dim,
+        "compression": codec,
+        "bytes": os.path.getsize(output_path),
+        "seconds": round(time.time() - started, 2),
+    }
+    logger.info(f"Snapshot export complete: {summary}")
+    return summary
+
+
+# ============================================================================
+# IMPORT
+# ============================================================================
+
+def read_snapshot_header(f) -> Dict[str, Any]:
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not an iMentor collection snapshot (bad magic)")
+    start = f.tell()
+    (header_len,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(header_len).decode("utf-8"))
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {header.get('format_version')}")
+    f.seek(start + 4096)
+    return header
+
+
+def iter_snapshot_chunks(f, header: Dict[str, Any]) -> Iterator[Tuple[List[Any], np.ndarray, List[Dict]]]:
+    """Yield (ids, vectors, payloads) per chunk from an open snapshot file."""
+    codec = header["compression"]
+    dim = header["vector_dim"]
+    while True:
+        tag = f.read(4)
+        if tag == _END_TAG:
+            return
+        if tag != _CHUNK_TAG:
+            raise ValueError("Corrupt snapshot: expected chunk marker")
+        n_points, ids_len, vectors_len, payload_len = _CHUNK_HEADER.unpack(f.read(_CHUNK_HEADER.size))
+        ids = _decode_json(f.read(ids_len), codec)
+        vectors = np.frombuffer(f.read(vectors_len), dtype=np.float16).reshape(n_points, dim)
+        payloads = _decode_json(f.read(payload_len), codec)
+        yield ids, vectors, payloads
+
+
+def import_snapshot(
+    client,
+    collection_name: str,
+    input_path: str,
+    max_in_flight: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Stream a snapshot file into a collection.
+
+    Chunks are decoded while earlier upserts are still in flight (up to
+    max_in_flight at once, each with wait=False). Once all are acknowledged
+    the final chunk is re-sent with wait=True; Qdrant applies updates in
+    order, so its completion means every point is searchable.
+
+    Args:
+        client: QdrantClient or LocalVectorStore
+        collection_name: Target collection (must already exist)
+        input_path: Snapshot file
+        max_in_flight: Concurrent upsert requests
+
+    Returns:
+        Import summary with point and chunk counts
+    """
+    max_in_flight = max_in_flight or config.SNAPSHOT_IMPORT_MAX_IN_FLIGHT
+    started = time.time()
+    total_points = 0
+    chunks = 0
+    last_points = None
+    named = isinstance(client.get_collection(collection_name).config.params.vectors, dict)
+
+    with open(input_path, "rb") as f:
+        header = read_snapshot_header(f)
+        logger.info(f"Snapshot import: '{input_path}' -> '{collection_name}' ({header.get('total_points')} points, "
+                    f"course={header.get('course')})")
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            in_flight = deque()
+            for ids, vectors, payloads in iter_snapshot_chunks(f, header):
+                points = [
+                    models.PointStruct(id=pid, vector=matryoshka.point_vector(vec.astype(np.float32).tolist(), named),
+                                       payload=payload)
+                    for pid, vec, payload in zip(ids, vectors, payloads)
+                ]
+                if len(in_flight) >= max_in_flight:
+                    in_flight.popleft().result()
+                in_flight.append(executor.submit(
+                    client.upsert, collection_name=collection_name, points=points, wait=False
+                ))
+                total_points += len(points)
+                chunks += 1
+                last_points = points
+            while in_flight:
+                in_flight.popleft().result()
+
+    if last_points:
+        client.upsert(collection_name=collection_name, points=last_points, wait=True)
+
+    summary = {
+        "success": True,
+        "course": header.get("course"),
+        "collection": collection_name,
+        "points": total_points,
+        "chunks": chunks,
+        "seconds": round(time.time() - started, 2),
+    }
+    logger.info(f"Snapshot import complete: {summary}")
+    return summary
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from local_vector_store import create_vector_store_client
+
+    parser = argparse.ArgumentParser(description="Export/import course vectors as a snapshot file.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = sub.add_parser("export", help="Export a course's points to a snapshot file")
+    export_parser.add_argument("--course", help="Course name (omit to export the whole collection)")
+    export_parser.add_argument("--out", required=True, help="Output snapshot path")
+    export_parser.add_argument("--collection", default=config.QDRANT_COLLECTION_NAME)
+    export_parser.add_argument("--chunk-size", type=int, default=config.SNAPSHOT_CHUNK_SIZE)
+
+    import_parser = sub.add_parser("import", help="Import a snapshot file into a collection")
+    import_parser.add_argument("--in", dest="input_path", required=True, help="Snapshot path")
+    import_parser.add_argument("--collection", default=config.QDRANT_COLLECTION_NAME)
+    import_parser.add_argument("--max-in-flight", type=int, default=config.SNAPSHOT_IMPORT_MAX_IN_FLIGHT)
+
+    args = parser.parse_args(argv)
+    client = create_vector_store_client()
+    if args.command == "export":
+        result = export_course_snapshot(client, args.collection, args.course, args.out, args.chunk_size)
+    else:
+        result = import_snapshot(client, args.collection, args.input_path, args.max_in_flight)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
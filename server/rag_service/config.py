@@ -87,6 +87,11 @@ LOGGING_FORMAT     = '%(asctime)s - %(levelname)s - [%(name)s:%(lineno)d] - %(me
 # --- API Keys and Service URLs ---
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 GEMINI_MODEL_NAME = os.getenv('GEMINI_MODEL_NAME', "gemini-flash-latest")
+# Pooled Gemini clients keyed by (api_key, model) (llm_client_pool.py).
+LLM_CLIENT_POOL_MAX_SIZE = int(os.getenv("LLM_CLIENT_POOL_MAX_SIZE", 64))
+LLM_CLIENT_TRANSPORT = os.getenv("LLM_CLIENT_TRANSPORT", "grpc")
+# Distinct API-key fingerprints labelled on LLM metrics; further keys are reported as "other".
+LLM_METRICS_MAX_KEY_LABELS = int(os.getenv("LLM_METRICS_MAX_KEY_LABELS", 20))
 SENTRY_DSN = os.getenv('SENTRY_DSN')
 TURNITIN_API_URL = os.getenv('TURNITIN_API_URL')
 TURNITIN_API_KEY = os.getenv('TURNITIN_API_KEY')
@@ -96,6 +101,32 @@ NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
 NEO4J_USERNAME = os.getenv("NEO4J_USERNAME", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password")
 NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+# Connection pool shared by the sync and async Neo4j drivers (neo4j_handler).
+NEO4J_MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", 50))
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", 30.0))
+NEO4J_MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", 3600))
+# Rows per inner transaction (CALL { ... } IN TRANSACTIONS) when deleting courses or document KGs.
+NEO4J_DELETE_BATCH_SIZE = int(os.getenv("NEO4J_DELETE_BATCH_SIZE", 1000))
+# Rows per UNWIND statement (and transaction) when writing curriculum graphs.
+CURRICULUM_WRITE_BATCH_SIZE = int(os.getenv("CURRICULUM_WRITE_BATCH_SIZE", 500))
+# Max age of the in-process curriculum model cache (0 = only invalidate on upload/delete).
+CURRICULUM_CACHE_TTL_SECONDS = int(os.getenv("CURRICULUM_CACHE_TTL_SECONDS", 300))
+# Default /kg POST mode: "merge" upserts the posted graph; "incremental" also removes
+# nodes/edges missing from it and only writes changed ones (see neo4j_handler.sync_knowledge_graph).
+KG_INGEST_MODE = os.getenv("KG_INGEST_MODE", "merge").lower()
+# Rows per UNWIND transaction when bulk-loading document knowledge graphs.
+KG_WRITE_BATCH_SIZE = int(os.getenv("KG_WRITE_BATCH_SIZE", 1000))
+# Re-runs of a failed KG batch on transient Neo4j errors (exponential backoff from the base delay).
+KG_WRITE_MAX_RETRIES = int(os.getenv("KG_WRITE_MAX_RETRIES", 3))
+KG_WRITE_RETRY_BACKOFF_SECONDS = float(os.getenv("KG_WRITE_RETRY_BACKOFF_SECONDS", 0.5))
+# KG search: fulltext seed nodes, RELATED_TO expansion depth (1-2) and result budgets.
+KG_SEARCH_SEED_LIMIT = int(os.getenv("KG_SEARCH_SEED_LIMIT", 5))
+KG_SEARCH_HOPS = int(os.getenv("KG_SEARCH_HOPS", 1))
+KG_SEARCH_MAX_NODES = int(os.getenv("KG_SEARCH_MAX_NODES", 25))
+KG_SEARCH_MAX_EDGES = int(os.getenv("KG_SEARCH_MAX_EDGES", 50))
+# Cached KG search results per (user, document, normalized query); 0 disables the cache.
+KG_SEARCH_CACHE_SIZE = int(os.getenv("KG_SEARCH_CACHE_SIZE", 512))
+KG_SEARCH_CACHE_TTL_SECONDS = int(os.getenv("KG_SEARCH_CACHE_TTL_SECONDS", 300))
 
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", 2003))
@@ -103,6 +134,17 @@ QDRANT_COLLECTION_NAME = os.getenv("QDRANT_COLLECTION_NAME", "my_qdrant_rag_coll
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
 QDRANT_URL = os.getenv("QDRANT_URL", None)
 
+# --- Vector Store Backend ---
+# "qdrant" uses the Qdrant server above; "local" keeps vectors in a memory-mapped
+# matrix under LOCAL_VECTOR_STORE_PATH (CI, benchmarks, single-node dev).
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "qdrant").strip().lower()
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", os.path.join(os.path.dirname(__file__), 'local_vector_store'))
+LOCAL_VECTOR_STORE_DTYPE = os.getenv("LOCAL_VECTOR_STORE_DTYPE", "float32")
+# In-memory L1 cache for searches scoped to a single document (0 disables).
+VECTOR_L1_CACHE_MAX_DOCS = int(os.getenv("VECTOR_L1_CACHE_MAX_DOCS", 0))
+VECTOR_L1_CACHE_MAX_POINTS = int(os.getenv("VECTOR_L1_CACHE_MAX_POINTS", 5000))
+VECTOR_L1_CACHE_TTL_SECONDS = int(os.getenv("VECTOR_L1_CACHE_TTL_SECONDS", 300))
+
 # --- Embedding Model Configuration ---
 DEFAULT_DOC_EMBED_MODEL = 'mixedbread-ai/mxbai-embed-large-v1'
 DOCUMENT_EMBEDDING_MODEL_NAME = os.getenv('DOCUMENT_EMBEDDING_MODEL_NAME', DEFAULT_DOC_EMBED_MODEL)
@@ -123,12 +165,58 @@ QUERY_VECTOR_DIMENSION = int(os.getenv("QUERY_VECTOR_DIMENSION", _MODEL_TO_DIM_M
 if QUERY_VECTOR_DIMENSION != QDRANT_COLLECTION_VECTOR_DIM:
     logger.warning(f"[Config Warning] Query vector dim ({QUERY_VECTOR_DIMENSION}) != Qdrant dim ({QDRANT_COLLECTION_VECTOR_DIM})")
 
+# --- Matryoshka Two-Stage Retrieval ---
+# Stores a short prefix of each embedding as a second named vector and searches
+# it first, rescoring the candidates with the full vector. Toggling this changes
+# the collection layout: the vector service refuses to start against a collection
+# in the other layout until it is migrated with collection_migration.py.
+MATRYOSHKA_ENABLED = os.getenv("MATRYOSHKA_ENABLED", "false").lower() == "true"
+MATRYOSHKA_DIM = int(os.getenv("MATRYOSHKA_DIM", 256))
+# Short-vector candidates fetched per requested result before full-vector rescoring.
+MATRYOSHKA_CANDIDATE_MULTIPLIER = int(os.getenv("MATRYOSHKA_CANDIDATE_MULTIPLIER", 8))
+MATRYOSHKA_FULL_VECTOR_NAME = os.getenv("MATRYOSHKA_FULL_VECTOR_NAME", "full")
+MATRYOSHKA_SHORT_VECTOR_NAME = os.getenv("MATRYOSHKA_SHORT_VECTOR_NAME", "short")
+
+if MATRYOSHKA_ENABLED and not 0 < MATRYOSHKA_DIM < QDRANT_COLLECTION_VECTOR_DIM:
+    logger.warning(f"[Config Warning] MATRYOSHKA_DIM ({MATRYOSHKA_DIM}) must be below the collection dim "
+                   f"({QDRANT_COLLECTION_VECTOR_DIM}). Disabling two-stage retrieval.")
+    MATRYOSHKA_ENABLED = False
+
 # --- AI Core & Search Configuration ---
 AI_CORE_CHUNK_SIZE = int(os.getenv("AI_CORE_CHUNK_SIZE", 512))
 AI_CORE_CHUNK_OVERLAP = int(os.getenv("AI_CORE_CHUNK_OVERLAP", 100))
 MAX_TEXT_LENGTH_FOR_NER = int(os.getenv("MAX_TEXT_LENGTH_FOR_NER", 500000))
 QDRANT_DEFAULT_SEARCH_K = int(os.getenv("QDRANT_DEFAULT_SEARCH_K", 5))
 QDRANT_SEARCH_MIN_RELEVANCE_SCORE = float(os.getenv("QDRANT_SEARCH_MIN_RELEVANCE_SCORE", 0.1))
+QDRANT_DELETE_BATCH_SIZE = int(os.getenv("QDRANT_DELETE_BATCH_SIZE", 1000))
+
+# --- Collection Snapshots ---
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(__file__), 'snapshots'))
+SNAPSHOT_CHUNK_SIZE = int(os.getenv("SNAPSHOT_CHUNK_SIZE", 1000))
+SNAPSHOT_ZSTD_LEVEL = int(os.getenv("SNAPSHOT_ZSTD_LEVEL", 9))
+SNAPSHOT_IMPORT_MAX_IN_FLIGHT = int(os.getenv("SNAPSHOT_IMPORT_MAX_IN_FLIGHT", 4))
+
+# --- LLM Response Cache ---
+# Content-addressed llm_wrapper responses in a SQLite file shared by every worker on the host.
+LLM_RESPONSE_CACHE_ENABLED = os.getenv("LLM_RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+LLM_RESPONSE_CACHE_PATH = os.getenv("LLM_RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(__file__), 'llm_cache', 'responses.sqlite3'))
+LLM_RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("LLM_RESPONSE_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+LLM_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("LLM_RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+# --- Request Coalescing (singleflight.py) ---
+# How long a caller waits on an identical in-flight call before running its own.
+SINGLEFLIGHT_LLM_TIMEOUT_SECONDS = float(os.getenv("SINGLEFLIGHT_LLM_TIMEOUT_SECONDS", 120))
+SINGLEFLIGHT_SEARCH_TIMEOUT_SECONDS = float(os.getenv("SINGLEFLIGHT_SEARCH_TIMEOUT_SECONDS", 10))
+
+# --- Curriculum-Aware Retrieval ---
+# Modules on either side of the learner's current module that stay in the candidate set.
+CURRICULUM_RETRIEVAL_MODULE_RADIUS = int(os.getenv("CURRICULUM_RETRIEVAL_MODULE_RADIUS", 1))
+# Candidates fetched per requested result before curriculum rescoring.
+CURRICULUM_RETRIEVAL_OVERFETCH = int(os.getenv("CURRICULUM_RETRIEVAL_OVERFETCH", 3))
+# Score subtracted per topic step between a chunk and the current topic.
+CURRICULUM_DISTANCE_PENALTY = float(os.getenv("CURRICULUM_DISTANCE_PENALTY", 0.02))
+# Topics ahead of the current one count this many steps each (prerequisites are preferred).
+CURRICULUM_FORWARD_DISTANCE_WEIGHT = float(os.getenv("CURRICULUM_FORWARD_DISTANCE_WEIGHT", 2.0))
 
 # --- SpaCy Configuration ---
 SPACY_MODEL_NAME = os.getenv('SPACY_MODEL_NAME', 'en_core_web_sm')
@@ -9,10 +9,16 @@ Orchestrates:
 """
 
 import os
+import json
+import hashlib
 import logging
-from typing import Dict, List, Optional, Any
+import threading
+from typing import Dict, List, Optional, Any, Tuple
+
+from qdrant_client import models
 
 import config
+from collection_snapshot import course_filter
 
 logger = logging.getLogger(__name__)
 
@@ -209,6 +215,7 @@ def ingest_course(
         result["errors"].append(f"Qdrant ingestion failed: {str(e)}")
     
     result["success"] = True
+    invalidate_visualization(course_name)
     logger.info(f"[Course Pipeline] Ingestion complete for '{course_name}'")
     return result
 
@@ -238,31 +245,23 @@ def get_topic_context(course: str, topic_id: str) -> Dict[str, Any]:
         return result
     
     try:
-        # Get topic info from curriculum
-        prerequisites = curriculum_graph_handler.get_topic_prerequisites(course, topic_id)
-        result["prerequisites"] = prerequisites
+        # All lookups come from the cached in-memory curriculum model
+        model = curriculum_graph_handler.get_curriculum_model(course)
+        normalized_topic_id = curriculum_graph_handler.normalize_id(topic_id)
+        result["prerequisites"] = model.prerequisites(normalized_topic_id)
         
-        # Get next topic in learning path
-        learning_path = curriculum_graph_handler.get_learning_path(course, topic_id)
-        if learning_path:
-            # Find current topic and get next
-            for i, item in enumerate(learning_path):
-                if item.get('id') == topic_id and i + 1 < len(learning_path):
-                    result["next_topic"] = learning_path[i + 1]
-                    break
+        # Next topic in curriculum order
+        result["next_topic"] = model.next_topic(normalized_topic_id)
         
         # Get topic name from curriculum
-        curriculum = curriculum_graph_handler.traverse_curriculum(course)
-        for module in curriculum.get('modules', []):
-            for topic in module.get('topics', []):
-                if topic.get('id') == topic_id:
-                    result["topic"] = {
-                        "id": topic_id,
-                        "name": topic.get('name'),
-                        "module_id": module.get('id'),
-                        "module_name": module.get('name')
-                    }
-                    break
+        topic = model.topic(normalized_topic_id)
+        if topic:
+            result["topic"] = {
+                "id": topic_id,
+                "name": topic.get('name'),
+                "module_id": topic.get('module_id'),
+                "module_name": topic.get('module_name')
+            }
         
     except Exception as e:
         logger.error(f"[Course Pipeline] Error getting topic context: {e}", exc_info=True)
@@ -304,42 +303,20 @@ def get_next_curriculum_item(course: str, current_topic_id: str) -> Optional[Dic
         return None
     
     try:
-        curriculum = curriculum_graph_handler.traverse_curriculum(course)
-        modules = curriculum.get('modules', [])
-        
-        # Find current topic and return next
-        found_current = False
-        for module in modules:
-            for topic in module.get('topics', []):
-                if found_current:
-                    # This is the next topic
-                    return {
-                        "type": "topic",
-                        "id": topic.get('id'),
-                        "name": topic.get('name'),
-                        "module_id": module.get('id'),
-                        "module_name": module.get('name')
-                    }
-                if topic.get('id') == current_topic_id:
-                    found_current = True
-            
-            # If we found current topic but no more topics in this module,
-            # move to next module's first topic
-            if found_current and module != modules[-1]:
-                next_module_idx = modules.index(module) + 1
-                next_module = modules[next_module_idx]
-                if next_module.get('topics'):
-                    first_topic = next_module['topics'][0]
-                    return {
-                        "type": "topic",
-                        "id": first_topic.get('id'),
-                        "name": first_topic.get('name'),
-                        "module_id": next_module.get('id'),
-                        "module_name": next_module.get('name')
-                    }
+        model = curriculum_graph_handler.get_curriculum_model(course)
+        next_topic = model.next_topic(curriculum_graph_handler.normalize_id(current_topic_id))
         
         # Course complete
-        return None
+        if not next_topic:
+            return None
+        
+        return {
+            "type": "topic",
+            "id": next_topic.get('id'),
+            "name": next_topic.get('name'),
+            "module_id": next_topic.get('module_id'),
+            "module_name": next_topic.get('module_name')
+        }
         
     except Exception as e:
         logger.error(f"[Course Pipeline] Error getting next curriculum item: {e}", exc_info=True)
@@ -349,7 +326,8 @@ def get_next_curriculum_item(course: str, current_topic_id: str) -> Optional[Dic
 def detect_missing_prerequisites(
     course: str,
     topic_id: str,
-    completed_subtopics: List[str]
+    completed_subtopics: List[str],
+    transitive: bool = False
 ) -> List[Dict[str, Any]]:
     """
     Check if student lacks prerequisites for a topic.
@@ -358,6 +336,7 @@ def detect_missing_prerequisites(
         course: Course name
         topic_id: Current topic ID
         completed_subtopics: List of subtopic IDs the student has completed
+        transitive: Include prerequisites inherited from preceding modules
     
     Returns:
         List of missing prerequisite subtopics to traverse back to
@@ -366,117 +345,178 @@ def detect_missing_prerequisites(
         return []
     
     try:
-        # Get all prerequisites for this topic
-        prerequisites = curriculum_graph_handler.get_topic_prerequisites(course, topic_id)
-        
-        # Find which ones are missing
-        completed_set = set(completed_subtopics)
-        missing = [
-            prereq for prereq in prerequisites
-            if prereq.get('id') not in completed_set
-        ]
-        
-        return missing
+        return curriculum_graph_handler.detect_missing_prerequisites(
+            course, topic_id, completed_subtopics, transitive=transitive
+        )
         
     except Exception as e:
         logger.error(f"[Course Pipeline] Error detecting missing prerequisites: {e}", exc_info=True)
         return []
 
 
-def get_curriculum_visualization(course: str) -> Dict[str, Any]:
+def build_visualization_payload(model) -> Dict[str, Any]:
     """
-    Get curriculum data formatted for visualization.
-    Returns nodes and edges for graph display.
+    Nodes and edges for a curriculum model.
     
-    Used by admin to visualize the curriculum graph with Qdrant connections.
+    Each module, topic and subtopic becomes one node (subtopics shared by
+    several topics are emitted once, tracked in a set), with PRECEDES,
+    HAS_TOPIC and PREREQUISITE_OF edges.
     """
-    if not curriculum_graph_handler:
-        return {"nodes": [], "edges": [], "error": "curriculum_graph_handler not available"}
+    nodes = []
+    edges = []
+    seen_subtopics = set()
+    previous_module_id = None
     
-    try:
-        # Get curriculum structure
-        curriculum = curriculum_graph_handler.traverse_curriculum(course)
+    for i, module in enumerate(model.modules):
+        module_id = module['id']
+        nodes.append({
+            "id": module_id,
+            "label": module.get('name'),
+            "type": "module",
+            "order": module.get('order') if module.get('order') is not None else i + 1
+        })
+        if previous_module_id is not None:
+            edges.append({"from": previous_module_id, "to": module_id, "type": "PRECEDES"})
+        previous_module_id = module_id
         
-        nodes = []
-        edges = []
-        
-        # Add module nodes
-        modules = curriculum.get('modules', [])
-        for i, module in enumerate(modules):
-            module_id = module.get('id')
+        for topic_id in model.module_topics.get(module_id, []):
             nodes.append({
-                "id": module_id,
-                "label": module.get('name'),
-                "type": "module",
-                "order": module.get('order', i)
+                "id": topic_id,
+                "label": model.topics[topic_id].get('name'),
+                "type": "topic",
+                "module_id": module_id
             })
+            edges.append({"from": module_id, "to": topic_id, "type": "HAS_TOPIC"})
             
-            # Add PRECEDES edges between modules
-            if i > 0:
-                prev_module = modules[i - 1]
-                edges.append({
-                    "from": prev_module.get('id'),
-                    "to": module_id,
-                    "type": "PRECEDES"
-                })
-            
-            # Add topic nodes
-            for topic in module.get('topics', []):
-                topic_id = topic.get('id')
-                nodes.append({
-                    "id": topic_id,
-                    "label": topic.get('name'),
-                    "type": "topic",
-                    "module_id": module_id
-                })
-                
-                # Add HAS_TOPIC edge
-                edges.append({
-                    "from": module_id,
-                    "to": topic_id,
-                    "type": "HAS_TOPIC"
-                })
-                
-                # Add prerequisite nodes and edges
-                for prereq in topic.get('prerequisites', []):
-                    prereq_id = prereq.get('id')
-                    # Check if node already exists
-                    if not any(n['id'] == prereq_id for n in nodes):
-                        nodes.append({
-                            "id": prereq_id,
-                            "label": prereq.get('name'),
-                            "type": "subtopic",
-                            "topic_id": topic_id
-                        })
-                    
-                    edges.append({
-                        "from": prereq_id,
-                        "to": topic_id,
-                        "type": "PREREQUISITE_OF"
+            for subtopic_id in model.topic_prerequisites.get(topic_id, []):
+                if subtopic_id not in seen_subtopics:
+                    seen_subtopics.add(subtopic_id)
+                    nodes.append({
+                        "id": subtopic_id,
+                        "label": model.subtopics[subtopic_id].get('name'),
+                        "type": "subtopic",
+                        "topic_id": topic_id
                     })
-        
-        # Add Qdrant document counts per topic (if available)
-        if vector_db_service:
-            for node in nodes:
-                if node['type'] == 'topic':
-                    try:
-                        # Count documents linked to this topic
-                        # This is a simplified check - in production you'd query by metadata filter
-                        node['qdrant_doc_count'] = 0  # Placeholder
-                    except:
-                        pass
-        
-        return {
-            "course": course,
-            "nodes": nodes,
-            "edges": edges,
-            "stats": {
-                "total_modules": len([n for n in nodes if n['type'] == 'module']),
-                "total_topics": len([n for n in nodes if n['type'] == 'topic']),
-                "total_subtopics": len([n for n in nodes if n['type'] == 'subtopic']),
-                "total_edges": len(edges)
-            }
+                edges.append({"from": subtopic_id, "to": topic_id, "type": "PREREQUISITE_OF"})
+    
+    return {
+        "course": model.course,
+        "nodes": nodes,
+        "edges": edges,
+        "stats": {
+            "total_modules": len(model.modules),
+            "total_topics": len(model.topic_order),
+            "total_subtopics": len(seen_subtopics),
+            "total_edges": len(edges)
         }
+    }
+
+
+def count_topic_documents(vector_service, course: str, topic_names: List[str]) -> Dict[str, int]:
+    """
+    Qdrant point counts per syllabus topic for a course.
+    
+    Chunks are linked to topics by the syllabus linker's `syllabus_topic`
+    payload. One exact facet over `syllabus_topic` (restricted to the course
+    and the requested names) returns every count in a single request.
+    """
+    names = list(dict.fromkeys(name for name in topic_names if name))
+    if not names:
+        return {}
+    response = vector_service.client.facet(
+        collection_name=vector_service.collection_name,
+        key="syllabus_topic",
+        facet_filter=models.Filter(must=[
+            course_filter(course),
+            models.FieldCondition(key="syllabus_topic", match=models.MatchAny(any=names))
+        ]),
+        limit=len(names),
+        exact=True
+    )
+    counts = {hit.value: hit.count for hit in response.hits}
+    return {name: counts.get(name, 0) for name in names}
+
+
+# Per-course visualization blobs: course_key -> {"model", "body", "etag"}
+_visualization_cache: Dict[str, Dict[str, Any]] = {}
+_visualization_cache_lock = threading.Lock()
+
+
+def invalidate_visualization(course: Optional[str] = None) -> None:
+    """Drop the cached visualization of one course (or all courses)."""
+    with _visualization_cache_lock:
+        if course is None:
+            _visualization_cache.clear()
+        elif curriculum_graph_handler:
+            _visualization_cache.pop(curriculum_graph_handler.course_key(course), None)
+
+
+def get_curriculum_visualization_blob(course: str, vector_service=None) -> Tuple[bytes, str]:
+    """
+    Serialized visualization JSON for a course and its ETag.
+    
+    The blob is rebuilt only when the cached curriculum model behind it is
+    replaced (course rebuilt/deleted, or the model's TTL expired) or after
+    invalidate_visualization(), which runs whenever documents are added or
+    deleted. A blob whose topic counts failed is served but not cached.
+    
+    Args:
+        course: Course name
+        vector_service: Initialized VectorDBService for per-topic
+            `qdrant_doc_count` (omitted when None)
+    
+    Returns:
+        (JSON bytes, ETag)
+    """
+    if not curriculum_graph_handler:
+        raise RuntimeError("curriculum_graph_handler not available")
+    
+    model = curriculum_graph_handler.get_curriculum_model(course)
+    key = curriculum_graph_handler.course_key(course)
+    cached = _visualization_cache.get(key)
+    if cached is not None and cached["model"] is model:
+        return cached["body"], cached["etag"]
+    
+    payload = build_visualization_payload(model)
+    payload["course"] = course
+    payload["version"] = model.version
+    counts_ok = True
+    if vector_service is not None:
+        try:
+            counts = count_topic_documents(
+                vector_service, course, [model.topics[tid].get('name') for tid in model.topic_order]
+            )
+            for node in payload["nodes"]:
+                if node["type"] == "topic":
+                    node["qdrant_doc_count"] = counts.get(node["label"], 0)
+        except Exception as e:
+            # Serve the graph without counts, but don't cache it: the next request retries the counts
+            counts_ok = False
+            logger.error(f"[Course Pipeline] Error counting topic documents for '{course}': {e}", exc_info=True)
+    
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    etag = hashlib.sha1(body).hexdigest()
+    if counts_ok:
+        with _visualization_cache_lock:
+            _visualization_cache[key] = {"model": model, "body": body, "etag": etag}
+    logger.info(f"[Course Pipeline] Built visualization for '{course}': "
+                f"{len(payload['nodes'])} nodes, {len(payload['edges'])} edges")
+    return body, etag
+
+
+def get_curriculum_visualization(course: str, vector_service=None) -> Dict[str, Any]:
+    """
+    Get curriculum data formatted for visualization.
+    Returns nodes and edges for graph display.
+    
+    Used by admin to visualize the curriculum graph with Qdrant connections.
+    """
+    if not curriculum_graph_handler:
+        return {"nodes": [], "edges": [], "error": "curriculum_graph_handler not available"}
+    
+    try:
+        body, _ = get_curriculum_visualization_blob(course, vector_service)
+        return json.loads(body)
         
     except Exception as e:
         logger.error(f"[Course Pipeline] Error getting curriculum visualization: {e}", exc_info=True)
@@ -11,18 +11,26 @@ This module replaces the flat :Concept node structure from syllabus_graph_handle
 """
 
 import csv
+import time
 import logging
-from typing import List, Dict, Optional, Tuple
+import threading
+from collections import Counter
+from typing import Any, Iterator, List, Dict, Optional, Tuple
 import config
+from curriculum_model import CurriculumModel
 
 logger = logging.getLogger(__name__)
 
+CURRICULUM_LABELS = ("Module", "Topic", "Subtopic")
+
 # Import Neo4j driver management from existing handler
 try:
-    from neo4j_handler import get_driver_instance
+    from neo4j_handler import get_driver_instance, delete_nodes_in_batches, run_read, async_read, course_search_scope
 except ImportError:
     logger.error("Failed to import Neo4j driver from neo4j_handler")
     get_driver_instance = None
+    delete_nodes_in_batches = None
+    run_read = async_read = course_search_scope = None
 
 
 # ============================================================================
@@ -39,6 +47,48 @@ def normalize_id(raw_id: str) -> str:
     return raw_id.strip().lower().replace(" ", "_").replace("-", "_")
 
 
+def course_key(course: str) -> str:
+    """
+    Case-insensitive key for a course name.
+    Stored on every Module/Topic/Subtopic as `course_key`, which (with `id`)
+    is the indexed identity used by all curriculum reads and MERGEs.
+    """
+    return (course or "").strip().lower()
+
+
+# ============================================================================
+# COURSE VERSIONING
+# ============================================================================
+
+# Bumped whenever a course's curriculum is rebuilt or deleted, so in-process
+# caches derived from the graph can tell when they are stale.
+_course_versions: Dict[str, int] = {}
+_course_versions_lock = threading.Lock()
+
+
+def get_course_version(course: str) -> int:
+    """Current in-process version of a course's curriculum graph."""
+    return _course_versions.get(course_key(course), 0)
+
+
+def _bump_course_version(course: str) -> int:
+    with _course_versions_lock:
+        key = course_key(course)
+        _course_versions[key] = _course_versions.get(key, 0) + 1
+        _curriculum_models.pop(key, None)
+        return _course_versions[key]
+
+
+# Per-course CurriculumModel cache (see get_curriculum_model)
+_curriculum_models: Dict[str, CurriculumModel] = {}
+_curriculum_models_lock = threading.Lock()
+
+
+def _model_is_fresh(model: CurriculumModel) -> bool:
+    ttl = config.CURRICULUM_CACHE_TTL_SECONDS
+    return ttl <= 0 or time.time() - model.loaded_at < ttl
+
+
 # ============================================================================
 # CSV PARSING
 # ============================================================================
@@ -316,116 +366,96 @@ def ingest_from_unified_csv(course: str, file_path: str) -> Dict:
 # NEO4J GRAPH BUILDING - TRANSACTIONAL FUNCTIONS
 # ============================================================================
 
+def _batched(rows: List[Dict], batch_size: int):
+    """Yield successive slices of rows, each written in its own transaction."""
+    batch_size = max(1, batch_size)
+    for i in range(0, len(rows), batch_size):
+        yield rows[i:i + batch_size]
+
+
 def _build_modules_transactional(tx, course: str, modules: List[Dict]) -> int:
     """
-    Create Module nodes and PRECEDES relationships.
-    
-    Each module gets a sequential PRECEDES relationship based on order.
-    """
-    nodes_created = 0
-    
-    # Create all module nodes
-    for module in modules:
-        create_query = """
-        MERGE (m:Module {id: $id, course: $course})
-        ON CREATE SET 
-            m.name = $name,
-            m.order = $order,
-            m.createdAt = datetime()
-        ON MATCH SET
-            m.name = $name,
-            m.order = $order,
-            m.updatedAt = datetime()
-        RETURN m
-        """
-        result = tx.run(
-            create_query,
-            id=module['id'],
-            course=course,
-            name=module['name'],
-            order=module['order']
-        )
-        if result.single():
-            nodes_created += 1
-    
-    # Create PRECEDES relationships based on order
-    for i in range(len(modules) - 1):
-        current_module = modules[i]
-        next_module = modules[i + 1]
-        
-        precedes_query = """
-        MATCH (m1:Module {id: $current_id, course: $course})
-        MATCH (m2:Module {id: $next_id, course: $course})
-        MERGE (m1)-[r:PRECEDES]->(m2)
-        RETURN r
-        """
-        tx.run(
-            precedes_query,
-            current_id=current_module['id'],
-            next_id=next_module['id'],
-            course=course
-        )
-    
-    return nodes_created
+    Create a batch of Module nodes with one UNWIND statement.
+    """
+    query = """
+    UNWIND $rows AS row
+    MERGE (m:Module {id: row.id, course_key: $course_key})
+    ON CREATE SET 
+        m.course = $course,
+        m.name = row.name,
+        m.order = row.order,
+        m.createdAt = datetime()
+    ON MATCH SET
+        m.course = $course,
+        m.name = row.name,
+        m.order = row.order,
+        m.updatedAt = datetime()
+    RETURN count(m) AS nodes
+    """
+    rows = [{'id': m['id'], 'name': m['name'], 'order': m['order']} for m in modules]
+    return tx.run(query, rows=rows, course=course, course_key=course_key(course)).single()['nodes']
+
+
+def _build_precedes_transactional(tx, course: str, pairs: List[Dict]) -> int:
+    """
+    Create a batch of sequential (Module)-[:PRECEDES]->(Module) relationships.
+    """
+    query = """
+    UNWIND $rows AS row
+    MATCH (m1:Module {id: row.current_id, course_key: $course_key})
+    MATCH (m2:Module {id: row.next_id, course_key: $course_key})
+    MERGE (m1)-[r:PRECEDES]->(m2)
+    RETURN count(r) AS rels
+    """
+    return tx.run(query, rows=pairs, course_key=course_key(course)).single()['rels']
 
 
 def _build_topics_transactional(tx, course: str, topics: List[Dict]) -> Tuple[int, int]:
     """
-    Create Topic nodes and HAS_TOPIC relationships from Module to Topic.
+    Create a batch of Topic nodes and their HAS_TOPIC relationships from Module.
     
     Returns:
         Tuple of (nodes_created, relationships_created)
     """
-    nodes_created = 0
-    rels_created = 0
-    
-    for topic in topics:
-        # Create topic node
-        create_query = """
-        MERGE (t:Topic {id: $id, course: $course})
-        ON CREATE SET 
-            t.name = $name,
-            t.module_id = $module_id,
-            t.createdAt = datetime()
-        ON MATCH SET
-            t.name = $name,
-            t.module_id = $module_id,
-            t.updatedAt = datetime()
-        RETURN t
-        """
-        result = tx.run(
-            create_query,
-            id=topic['id'],
-            course=course,
-            name=topic['name'],
-            module_id=topic['module_id']
-        )
-        if result.single():
-            nodes_created += 1
-        
-        # Create HAS_TOPIC relationship from Module to Topic
-        if topic['module_id']:
-            rel_query = """
-            MATCH (m:Module {id: $module_id, course: $course})
-            MATCH (t:Topic {id: $topic_id, course: $course})
-            MERGE (m)-[r:HAS_TOPIC]->(t)
-            RETURN r
-            """
-            result = tx.run(
-                rel_query,
-                module_id=topic['module_id'],
-                topic_id=topic['id'],
-                course=course
-            )
-            if result.single():
-                rels_created += 1
-    
-    return nodes_created, rels_created
+    query = """
+    UNWIND $rows AS row
+    MERGE (t:Topic {id: row.id, course_key: $course_key})
+    ON CREATE SET 
+        t.course = $course,
+        t.name = row.name,
+        t.module_id = row.module_id,
+        t.lecture_number = row.lecture_number,
+        t.search_scope = $search_scope,
+        t.createdAt = datetime()
+    ON MATCH SET
+        t.course = $course,
+        t.name = row.name,
+        t.module_id = row.module_id,
+        t.lecture_number = row.lecture_number,
+        t.search_scope = $search_scope,
+        t.updatedAt = datetime()
+    WITH t, row
+    OPTIONAL MATCH (m:Module {id: row.module_id, course_key: $course_key})
+    FOREACH (_ IN CASE WHEN m IS NULL THEN [] ELSE [1] END | MERGE (m)-[:HAS_TOPIC]->(t))
+    RETURN count(t) AS nodes, count(m) AS rels
+    """
+    rows = [
+        {
+            'id': t['id'],
+            'name': t['name'],
+            'module_id': t['module_id'] or None,
+            'lecture_number': t.get('lecture_number')
+        }
+        for t in topics
+    ]
+    record = tx.run(query, rows=rows, course=course, course_key=course_key(course),
+                    search_scope=course_search_scope(course)).single()
+    return record['nodes'], record['rels']
 
 
 def _build_subtopics_transactional(tx, course: str, subtopics: List[Dict]) -> Tuple[int, int]:
     """
-    Create Subtopic nodes and PREREQUISITE_OF relationships to Topic.
+    Create a batch of Subtopic nodes and their PREREQUISITE_OF relationships to Topic.
     
     The relationship direction is: (Subtopic)-[:PREREQUISITE_OF]->(Topic)
     Meaning: You must learn the subtopic before you can master the topic.
@@ -433,51 +463,33 @@ def _build_subtopics_transactional(tx, course: str, subtopics: List[Dict]) -> Tu
     Returns:
         Tuple of (nodes_created, relationships_created)
     """
-    nodes_created = 0
-    rels_created = 0
-    
-    for subtopic in subtopics:
-        # Create subtopic node
-        create_query = """
-        MERGE (s:Subtopic {id: $id, course: $course})
-        ON CREATE SET 
-            s.name = $name,
-            s.topic_id = $topic_id,
-            s.createdAt = datetime()
-        ON MATCH SET
-            s.name = $name,
-            s.topic_id = $topic_id,
-            s.updatedAt = datetime()
-        RETURN s
-        """
-        result = tx.run(
-            create_query,
-            id=subtopic['id'],
-            course=course,
-            name=subtopic['name'],
-            topic_id=subtopic['topic_id']
-        )
-        if result.single():
-            nodes_created += 1
-        
-        # Create PREREQUISITE_OF relationship from Subtopic to Topic
-        if subtopic['topic_id']:
-            rel_query = """
-            MATCH (s:Subtopic {id: $subtopic_id, course: $course})
-            MATCH (t:Topic {id: $topic_id, course: $course})
-            MERGE (s)-[r:PREREQUISITE_OF]->(t)
-            RETURN r
-            """
-            result = tx.run(
-                rel_query,
-                subtopic_id=subtopic['id'],
-                topic_id=subtopic['topic_id'],
-                course=course
-            )
-            if result.single():
-                rels_created += 1
-    
-    return nodes_created, rels_created
+    query = """
+    UNWIND $rows AS row
+    MERGE (s:Subtopic {id: row.id, course_key: $course_key})
+    ON CREATE SET 
+        s.course = $course,
+        s.name = row.name,
+        s.topic_id = row.topic_id,
+        s.search_scope = $search_scope,
+        s.createdAt = datetime()
+    ON MATCH SET
+        s.course = $course,
+        s.name = row.name,
+        s.topic_id = row.topic_id,
+        s.search_scope = $search_scope,
+        s.updatedAt = datetime()
+    WITH s, row
+    OPTIONAL MATCH (t:Topic {id: row.topic_id, course_key: $course_key})
+    FOREACH (_ IN CASE WHEN t IS NULL THEN [] ELSE [1] END | MERGE (s)-[:PREREQUISITE_OF]->(t))
+    RETURN count(s) AS nodes, count(t) AS rels
+    """
+    rows = [
+        {'id': st['id'], 'name': st['name'], 'topic_id': st['topic_id'] or None}
+        for st in subtopics
+    ]
+    record = tx.run(query, rows=rows, course=course, course_key=course_key(course),
+                    search_scope=course_search_scope(course)).single()
+    return record['nodes'], record['rels']
 
 
 # ============================================================================
@@ -513,21 +525,35 @@ def build_curriculum_graph(
     try:
         driver = get_driver_instance()
         
+        batch_size = config.CURRICULUM_WRITE_BATCH_SIZE
+        precedes_pairs = [
+            {'current_id': modules[i]['id'], 'next_id': modules[i + 1]['id']}
+            for i in range(len(modules) - 1)
+        ]
+        module_count = precedes_count = 0
+        topic_count = has_topic_count = 0
+        subtopic_count = prereq_count = 0
+        
+        # One UNWIND statement per batch; each batch commits in its own
+        # transaction so very large curricula stay within transaction memory.
         with driver.session(database=config.NEO4J_DATABASE) as session:
             # Build modules and PRECEDES relationships
-            module_count = session.execute_write(
-                _build_modules_transactional, course, modules
-            )
+            for batch in _batched(modules, batch_size):
+                module_count += session.execute_write(_build_modules_transactional, course, batch)
+            for batch in _batched(precedes_pairs, batch_size):
+                precedes_count += session.execute_write(_build_precedes_transactional, course, batch)
             
             # Build topics and HAS_TOPIC relationships
-            topic_count, has_topic_count = session.execute_write(
-                _build_topics_transactional, course, topics
-            )
+            for batch in _batched(topics, batch_size):
+                nodes, rels = session.execute_write(_build_topics_transactional, course, batch)
+                topic_count += nodes
+                has_topic_count += rels
             
             # Build subtopics and PREREQUISITE_OF relationships
-            subtopic_count, prereq_count = session.execute_write(
-                _build_subtopics_transactional, course, subtopics
-            )
+            for batch in _batched(subtopics, batch_size):
+                nodes, rels = session.execute_write(_build_subtopics_transactional, course, batch)
+                subtopic_count += nodes
+                prereq_count += rels
         
         result = {
             'success': True,
@@ -535,11 +561,12 @@ def build_curriculum_graph(
             'modules_created': module_count,
             'topics_created': topic_count,
             'subtopics_created': subtopic_count,
-            'precedes_relationships': len(modules) - 1 if len(modules) > 1 else 0,
+            'precedes_relationships': precedes_count,
             'has_topic_relationships': has_topic_count,
             'prerequisite_of_relationships': prereq_count
         }
         
+        _bump_course_version(course)
         logger.info(
             f"Curriculum graph built for '{course}': "
             f"{module_count} modules, {topic_count} topics, {subtopic_count} subtopics"
@@ -552,6 +579,195 @@ def build_curriculum_graph(
         raise
 
 
+def _read_course_state_transactional(tx, course: str) -> Dict[str, Dict]:
+    """
+    Every curriculum node of a course with the relationships that define its
+    place (module of a topic, topics of a subtopic), plus PRECEDES pairs.
+    Reads labels directly so orphaned nodes are seen too.
+    """
+    key = course_key(course)
+    modules = {
+        r['id']: {'name': r['name'], 'order': r['order']}
+        for r in tx.run("MATCH (m:Module {course_key: $course_key}) RETURN m.id AS id, m.name AS name, m.order AS order",
+                        course_key=key)
+    }
+    topics = {
+        r['id']: {'name': r['name'], 'lecture_number': r['lecture_number'], 'modules': sorted(r['modules'])}
+        for r in tx.run(
+            "MATCH (t:Topic {course_key: $course_key}) "
+            "OPTIONAL MATCH (m:Module {course_key: $course_key})-[:HAS_TOPIC]->(t) "
+            "RETURN t.id AS id, t.name AS name, t.lecture_number AS lecture_number, collect(m.id) AS modules",
+            course_key=key)
+    }
+    subtopics = {
+        r['id']: {'name': r['name'], 'topics': sorted(r['topics'])}
+        for r in tx.run(
+            "MATCH (s:Subtopic {course_key: $course_key}) "
+            "OPTIONAL MATCH (s)-[:PREREQUISITE_OF]->(t:Topic {course_key: $course_key}) "
+            "RETURN s.id AS id, s.name AS name, collect(t.id) AS topics",
+            course_key=key)
+    }
+    precedes = {
+        (r['from'], r['to'])
+        for r in tx.run(
+            "MATCH (a:Module {course_key: $course_key})-[:PRECEDES]->(b:Module {course_key: $course_key}) "
+            "RETURN a.id AS from, b.id AS to",
+            course_key=key)
+    }
+    return {'modules': modules, 'topics': topics, 'subtopics': subtopics, 'precedes': precedes}
+
+
+def _diff_nodes(current: Dict[str, Dict], desired: Dict[str, Dict]) -> Tuple[List[str], List[str], List[str]]:
+    """(added, changed, removed) IDs between two id -> comparable-state maps."""
+    added = [node_id for node_id in desired if node_id not in current]
+    changed = [node_id for node_id in desired if node_id in current and current[node_id] != desired[node_id]]
+    removed = [node_id for node_id in current if node_id not in desired]
+    return added, changed, removed
+
+
+def _sync_curriculum_transactional(
+    tx,
+    course: str,
+    modules: List[Dict],
+    topics: List[Dict],
+    subtopics: List[Dict]
+) -> Dict[str, Dict[str, int]]:
+    """
+    Diff the stored course against the parsed rows and apply only the
+    differences, all inside this one transaction.
+    """
+    key = course_key(course)
+    current = _read_course_state_transactional(tx, course)
+    
+    module_rows = {m['id']: m for m in modules}
+    topic_rows = {t['id']: t for t in topics}
+    subtopic_rows = {st['id']: st for st in subtopics}
+    desired_modules = {m['id']: {'name': m['name'], 'order': m['order']} for m in modules}
+    desired_topics = {
+        t['id']: {
+            'name': t['name'],
+            'lecture_number': t.get('lecture_number'),
+            'modules': [t['module_id']] if t.get('module_id') in module_rows else []
+        }
+        for t in topics
+    }
+    desired_subtopics = {
+        st['id']: {'name': st['name'], 'topics': [st['topic_id']] if st.get('topic_id') in topic_rows else []}
+        for st in subtopics
+    }
+    ordered = sorted(modules, key=lambda m: m['order'])
+    desired_precedes = {(ordered[i]['id'], ordered[i + 1]['id']) for i in range(len(ordered) - 1)}
+    
+    module_diff = _diff_nodes(current['modules'], desired_modules)
+    topic_diff = _diff_nodes(current['topics'], desired_topics)
+    subtopic_diff = _diff_nodes(current['subtopics'], desired_subtopics)
+    precedes_added = [{'current_id': a, 'next_id': b} for a, b in sorted(desired_precedes - current['precedes'])]
+    precedes_removed = [{'from': a, 'to': b} for a, b in sorted(current['precedes'] - desired_precedes)]
+    
+    # 1. Removals (children first)
+    for label, removed in (('Subtopic', subtopic_diff[2]), ('Topic', topic_diff[2]), ('Module', module_diff[2])):
+        if removed:
+            tx.run(f"UNWIND $ids AS id MATCH (n:{label} {{id: id, course_key: $course_key}}) DETACH DELETE n",
+                   ids=removed, course_key=key).consume()
+    if precedes_removed:
+        tx.run("UNWIND $rows AS row "
+               "MATCH (:Module {id: row.from, course_key: $course_key})-[r:PRECEDES]->(:Module {id: row.to, course_key: $course_key}) "
+               "DELETE r", rows=precedes_removed, course_key=key).consume()
+    
+    # 2. Changed topics/subtopics may have moved: drop their placement edges before re-MERGE
+    if topic_diff[1]:
+        tx.run("UNWIND $ids AS id MATCH (:Module)-[r:HAS_TOPIC]->(t:Topic {id: id, course_key: $course_key}) DELETE r",
+               ids=topic_diff[1], course_key=key).consume()
+    if subtopic_diff[1]:
+        tx.run("UNWIND $ids AS id MATCH (s:Subtopic {id: id, course_key: $course_key})-[r:PREREQUISITE_OF]->(:Topic) DELETE r",
+               ids=subtopic_diff[1], course_key=key).consume()
+    
+    # 3. Additions and updates, reusing the UNWIND builders
+    upsert_modules = [module_rows[i] for i in module_diff[0] + module_diff[1]]
+    upsert_topics = [topic_rows[i] for i in topic_diff[0] + topic_diff[1]]
+    upsert_subtopics = [subtopic_rows[i] for i in subtopic_diff[0] + subtopic_diff[1]]
+    if upsert_modules:
+        _build_modules_transactional(tx, course, upsert_modules)
+    if precedes_added:
+        _build_precedes_transactional(tx, course, precedes_added)
+    if upsert_topics:
+        _build_topics_transactional(tx, course, upsert_topics)
+    if upsert_subtopics:
+        _build_subtopics_transactional(tx, course, upsert_subtopics)
+    
+    def summary(diff, total):
+        added, changed, removed = diff
+        return {'added': len(added), 'changed': len(changed), 'removed': len(removed),
+                'unchanged': total - len(added) - len(changed)}
+    
+    return {
+        'modules': summary(module_diff, len(desired_modules)),
+        'topics': summary(topic_diff, len(desired_topics)),
+        'subtopics': summary(subtopic_diff, len(desired_subtopics)),
+        'precedes': {'added': len(precedes_added), 'removed': len(precedes_removed)},
+    }
+
+
+def sync_curriculum_graph(
+    course: str,
+    modules: List[Dict],
+    topics: List[Dict],
+    subtopics: List[Dict]
+) -> Dict:
+    """
+    Update a course's curriculum graph in place to match parsed CSV rows.
+    
+    Unlike delete + build_curriculum_graph, only added, changed and removed
+    modules/topics/subtopics (and PRECEDES links) are written, and the diff
+    and every write run in a single transaction, so concurrent readers see
+    either the old or the new curriculum, never an empty or partial one.
+    
+    Args:
+        course: Course name/identifier
+        modules: List of module dicts from a parser
+        topics: List of topic dicts from a parser
+        subtopics: List of subtopic dicts from a parser
+    
+    Returns:
+        Result dictionary with added/changed/removed/unchanged counts per kind
+    """
+    if not get_driver_instance:
+        raise ConnectionError("Neo4j driver not available")
+    
+    try:
+        driver = get_driver_instance()
+        with driver.session(database=config.NEO4J_DATABASE) as session:
+            changes = session.execute_write(_sync_curriculum_transactional, course, modules, topics, subtopics)
+        
+        changed = any(
+            counts.get('added') or counts.get('changed') or counts.get('removed')
+            for counts in changes.values()
+        )
+        if changed:
+            _bump_course_version(course)
+        logger.info(f"Curriculum graph synced for '{course}': {changes}")
+        return {
+            'success': True,
+            'course': course,
+            'mode': 'sync',
+            'changed': changed,
+            'changes': changes,
+            'modules_total': len(modules),
+            'topics_total': len(topics),
+            'subtopics_total': len(subtopics)
+        }
+        
+    except Exception as e:
+        logger.error(f"Error syncing curriculum graph: {e}", exc_info=True)
+        raise
+
+
+def sync_from_unified_csv(course: str, file_path: str) -> Dict:
+    """Parse a unified CSV and sync the course graph to it (see sync_curriculum_graph)."""
+    modules, topics, subtopics = parse_unified_csv(file_path)
+    return sync_curriculum_graph(course, modules, topics, subtopics)
+
+
 def ingest_curriculum_from_csvs(
     course: str,
     modules_csv: str,
@@ -581,37 +797,123 @@ def ingest_curriculum_from_csvs(
 # PUBLIC API - QUERY FUNCTIONS
 # ============================================================================
 
+_CURRICULUM_TRAVERSAL_QUERY = """
+MATCH (m:Module {course_key: $course_key})
+OPTIONAL MATCH (m)-[:HAS_TOPIC]->(t:Topic)
+OPTIONAL MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t)
+WITH m, t, COLLECT(DISTINCT {id: s.id, name: s.name}) AS subtopics
+WITH m, COLLECT(DISTINCT {
+    id: t.id, 
+    name: t.name, 
+    lecture_number: t.lecture_number,
+    subtopics: subtopics
+}) AS topics
+RETURN m.id AS module_id, m.name AS module_name, m.order AS module_order, topics
+ORDER BY m.order
+"""
+
+
+def _model_from_records(course: str, version: int, records: List[Dict]) -> CurriculumModel:
+    modules = []
+    for record in records:
+        # Filter out null topics (when there are no topics for a module)
+        topics = [t for t in record['topics'] if t.get('id')]
+        # Filter out null subtopics
+        for topic in topics:
+            topic['subtopics'] = [p for p in topic['subtopics'] if p.get('id')]
+        # Keep lecture order within the module (unnumbered topics last)
+        topics.sort(key=lambda t: (t.get('lecture_number') is None, t.get('lecture_number') or 0))
+        
+        modules.append({
+            'id': record['module_id'],
+            'name': record['module_name'],
+            'order': record['module_order'],
+            'topics': topics
+        })
+    
+    model = CurriculumModel.from_traversal(course, version, modules)
+    model._ensure_closure()
+    logger.info(
+        f"Loaded curriculum model for '{course}' (v{version}): "
+        f"{len(model.modules)} modules, {len(model.topics)} topics, {len(model.subtopics)} subtopics"
+    )
+    return model
+
+
+def _load_curriculum_model(course: str, version: int) -> CurriculumModel:
+    """Load a course's full Module → Topic → Subtopic structure in one query (shared async driver)."""
+    records = run_read(_CURRICULUM_TRAVERSAL_QUERY, course_key=course_key(course))
+    return _model_from_records(course, version, records)
+
+
+def _cached_model(course: str) -> Tuple[Optional[CurriculumModel], int]:
+    version = get_course_version(course)
+    model = _curriculum_models.get(course_key(course))
+    if model is not None and model.version == version and _model_is_fresh(model):
+        return model, version
+    return None, version
+
+
+def get_curriculum_model(course: str) -> CurriculumModel:
+    """
+    Get the cached in-memory model of a course's curriculum.
+    
+    Loaded once from Neo4j and reused until the course is rebuilt or deleted
+    in this process, or CURRICULUM_CACHE_TTL_SECONDS pass (which covers
+    uploads handled by other worker processes).
+    """
+    if not get_driver_instance:
+        raise ConnectionError("Neo4j driver not available")
+    
+    model, version = _cached_model(course)
+    if model is not None:
+        return model
+    
+    with _curriculum_models_lock:
+        model, version = _cached_model(course)
+        if model is None:
+            model = _load_curriculum_model(course, version)
+            _curriculum_models[course_key(course)] = model
+    return model
+
+
+async def get_curriculum_model_async(course: str) -> CurriculumModel:
+    """
+    Async variant of get_curriculum_model for event-loop callers: a cache
+    miss is loaded through neo4j_handler.async_read without blocking the loop.
+    """
+    if not async_read:
+        raise ConnectionError("Neo4j driver not available")
+    
+    model, version = _cached_model(course)
+    if model is not None:
+        return model
+    
+    records = await async_read(_CURRICULUM_TRAVERSAL_QUERY, course_key=course_key(course))
+    model = _model_from_records(course, version, records)
+    with _curriculum_models_lock:
+        # Keep a newer model if another caller stored one meanwhile
+        current, _ = _cached_model(course)
+        if current is None and get_course_version(course) == version:
+            _curriculum_models[course_key(course)] = model
+    return model
+
+
 def get_topic_prerequisites(course: str, topic_id: str) -> List[Dict]:
     """
     Get all subtopics that are prerequisites for a given topic.
     
-    Query direction: (Subtopic)-[:PREREQUISITE_OF]->(Topic)
+    Relationship direction: (Subtopic)-[:PREREQUISITE_OF]->(Topic)
     
     Args:
         course: Course name
         topic_id: Topic identifier
     
     Returns:
-        List of prerequisite subtopic dictionaries
-    """
-    if not get_driver_instance:
-        raise ConnectionError("Neo4j driver not available")
-    
-    normalized_topic_id = normalize_id(topic_id)
-    
-    query = """
-    MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t:Topic {id: $topic_id})
-    WHERE toLower(t.course) = toLower($course)
-    RETURN s.id AS id, s.name AS name
-    ORDER BY s.name
+        List of prerequisite subtopic dictionaries, sorted by name
     """
-    
     try:
-        driver = get_driver_instance()
-        with driver.session(database=config.NEO4J_DATABASE) as session:
-            result = session.run(query, topic_id=normalized_topic_id, course=course)
-            prerequisites = [dict(record) for record in result]
-        
+        prerequisites = get_curriculum_model(course).prerequisites(normalize_id(topic_id))
         logger.info(f"Found {len(prerequisites)} prerequisites for topic '{topic_id}'")
         return prerequisites
         
@@ -622,9 +924,7 @@ def get_topic_prerequisites(course: str, topic_id: str) -> List[Dict]:
 
 def get_next_module(course: str, module_id: str) -> Optional[Dict]:
     """
-    Get the next module in sequence.
-    
-    Query: (current_module)-[:PRECEDES]->(next_module)
+    Get the next module in sequence: (current_module)-[:PRECEDES]->(next_module)
     
     Args:
         course: Course name
@@ -633,27 +933,8 @@ def get_next_module(course: str, module_id: str) -> Optional[Dict]:
     Returns:
         Next module dictionary or None if no next module
     """
-    if not get_driver_instance:
-        raise ConnectionError("Neo4j driver not available")
-    
-    normalized_module_id = normalize_id(module_id)
-    
-    query = """
-    MATCH (m1:Module {id: $module_id})-[:PRECEDES]->(m2:Module)
-    WHERE toLower(m1.course) = toLower($course)
-    RETURN m2.id AS id, m2.name AS name, m2.order AS order
-    LIMIT 1
-    """
-    
     try:
-        driver = get_driver_instance()
-        with driver.session(database=config.NEO4J_DATABASE) as session:
-            result = session.run(query, module_id=normalized_module_id, course=course)
-            record = result.single()
-            
-            if record:
-                return dict(record)
-            return None
+        return get_curriculum_model(course).next_module(normalize_id(module_id))
         
     except Exception as e:
         logger.error(f"Error getting next module: {e}", exc_info=True)
@@ -672,49 +953,11 @@ def traverse_curriculum(course: str) -> Dict:
     Returns:
         Dictionary with modules, topics, and their relationships
     """
-    if not get_driver_instance:
-        raise ConnectionError("Neo4j driver not available")
-    
-    query = """
-    MATCH (m:Module)
-    WHERE toLower(m.course) = toLower($course)
-    OPTIONAL MATCH (m)-[:HAS_TOPIC]->(t:Topic)
-    OPTIONAL MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t)
-    WITH m, t, COLLECT(DISTINCT {id: s.id, name: s.name}) AS subtopics
-    WITH m, COLLECT(DISTINCT {
-        id: t.id, 
-        name: t.name, 
-        subtopics: subtopics
-    }) AS topics
-    RETURN m.id AS module_id, m.name AS module_name, m.order AS module_order, topics
-    ORDER BY m.order
-    """
-    
     try:
-        driver = get_driver_instance()
-        with driver.session(database=config.NEO4J_DATABASE) as session:
-            result = session.run(query, course=course)
-            
-            modules = []
-            for record in result:
-                # Filter out null topics (when there are no topics for a module)
-                topics = [t for t in record['topics'] if t.get('id')]
-                # Filter out null subtopics
-                for topic in topics:
-                    topic['subtopics'] = [p for p in topic['subtopics'] if p.get('id')]
-                
-                modules.append({
-                    'id': record['module_id'],
-                    'name': record['module_name'],
-                    'order': record['module_order'],
-                    'topics': topics
-                })
-        
-        logger.info(f"Traversed curriculum for '{course}': {len(modules)} modules")
-        return {
-            'course': course,
-            'modules': modules
-        }
+        curriculum = get_curriculum_model(course).traversal()
+        curriculum['course'] = course
+        logger.info(f"Traversed curriculum for '{course}': {len(curriculum['modules'])} modules")
+        return curriculum
         
     except Exception as e:
         logger.error(f"Error traversing curriculum: {e}", exc_info=True)
@@ -734,90 +977,11 @@ def get_learning_path(course: str, target_topic_id: str) -> List[Dict]:
     Returns:
         Ordered list of items to learn (modules, subtopics, then topic)
     """
-    if not get_driver_instance:
-        raise ConnectionError("Neo4j driver not available")
-    
-    normalized_topic_id = normalize_id(target_topic_id)
-    
-    # Get the topic and its module
-    topic_query = """
-    MATCH (m:Module)-[:HAS_TOPIC]->(t:Topic {id: $topic_id})
-    WHERE toLower(m.course) = toLower($course) AND toLower(t.course) = toLower($course)
-    RETURN t.id AS topic_id, t.name AS topic_name, m.id AS module_id, m.name AS module_name, m.order AS module_order
-    """
-    
-    # Get all prerequisite subtopics
-    prereq_query = """
-    MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t:Topic {id: $topic_id})
-    WHERE toLower(t.course) = toLower($course)
-    RETURN s.id AS id, s.name AS name
-    ORDER BY s.name
-    """
-    
-    # Get preceding modules
-    preceding_query = """
-    MATCH path = (m1:Module)-[:PRECEDES*]->(m2:Module {id: $module_id})
-    WHERE toLower(m1.course) = toLower($course) AND toLower(m2.course) = toLower($course)
-    WITH nodes(path) AS modules
-    UNWIND modules AS m
-    WITH DISTINCT m
-    WHERE m.id <> $module_id
-    RETURN m.id AS id, m.name AS name, m.order AS order
-    ORDER BY m.order
-    """
-    
     try:
-        driver = get_driver_instance()
-        learning_path = []
-        
-        with driver.session(database=config.NEO4J_DATABASE) as session:
-            # Get topic info
-            topic_result = session.run(topic_query, topic_id=normalized_topic_id, course=course)
-            topic_record = topic_result.single()
-            
-            if not topic_record:
-                logger.warning(f"Topic '{target_topic_id}' not found in course '{course}'")
-                return []
-            
-            module_id = topic_record['module_id']
-            
-            # Get preceding modules
-            preceding_result = session.run(
-                preceding_query, 
-                module_id=module_id, 
-                course=course
-            )
-            for record in preceding_result:
-                learning_path.append({
-                    'type': 'module',
-                    'id': record['id'],
-                    'name': record['name'],
-                    'order': record['order']
-                })
-            
-            # Add current module
-            learning_path.append({
-                'type': 'module',
-                'id': module_id,
-                'name': topic_record['module_name'],
-                'order': topic_record['module_order']
-            })
-            
-            # Get prerequisites
-            prereq_result = session.run(prereq_query, topic_id=normalized_topic_id, course=course)
-            for record in prereq_result:
-                learning_path.append({
-                    'type': 'subtopic',
-                    'id': record['id'],
-                    'name': record['name']
-                })
-            
-            # Add target topic
-            learning_path.append({
-                'type': 'topic',
-                'id': topic_record['topic_id'],
-                'name': topic_record['topic_name']
-            })
+        learning_path = get_curriculum_model(course).learning_path(normalize_id(target_topic_id))
+        if not learning_path:
+            logger.warning(f"Topic '{target_topic_id}' not found in course '{course}'")
+            return []
         
         logger.info(f"Built learning path to '{target_topic_id}': {len(learning_path)} steps")
         return learning_path
@@ -827,10 +991,44 @@ def get_learning_path(course: str, target_topic_id: str) -> List[Dict]:
         raise
 
 
+def get_learning_paths(course: str, target_topic_ids: List[str], combined: bool = False) -> Dict[str, Any]:
+    """
+    Build learning paths for several target topics from one model lookup.
+
+    Paths are derived from the cached course structure using stored module
+    order, so no PRECEDES* path expansion runs regardless of chain length.
+
+    Args:
+        course: Course name
+        target_topic_ids: Target topic identifiers
+        combined: Also return one de-duplicated path covering every target
+
+    Returns:
+        {"paths": {topic_id: [...] (empty if unknown)}, "unknown_topics": [...],
+         "combined_path": [...] (only when combined)}
+    """
+    try:
+        model = get_curriculum_model(course)
+        topic_ids = list(dict.fromkeys(normalize_id(tid) for tid in target_topic_ids))
+        result = {
+            'paths': {tid: model.learning_path(tid) for tid in topic_ids},
+            'unknown_topics': [tid for tid in topic_ids if tid not in model.topics],
+        }
+        if combined:
+            result['combined_path'] = model.combined_learning_path(topic_ids)
+        logger.info(f"Built {len(topic_ids)} learning paths for '{course}' ({len(result['unknown_topics'])} unknown)")
+        return result
+
+    except Exception as e:
+        logger.error(f"Error building learning paths: {e}", exc_info=True)
+        raise
+
+
 def detect_missing_prerequisites(
     course: str, 
     topic_id: str, 
-    completed_subtopic_ids: List[str]
+    completed_subtopic_ids: List[str],
+    transitive: bool = False
 ) -> List[Dict]:
     """
     Detect which prerequisites are missing for a topic.
@@ -839,35 +1037,142 @@ def detect_missing_prerequisites(
         course: Course name
         topic_id: Target topic identifier
         completed_subtopic_ids: List of subtopic IDs the learner has completed
+        transitive: Also include topics/subtopics of all preceding modules
     
     Returns:
-        List of missing prerequisite subtopics
+        List of missing prerequisite items
     """
-    all_prerequisites = get_topic_prerequisites(course, topic_id)
-    completed_set = {normalize_id(sid) for sid in completed_subtopic_ids}
+    normalized_topic_id = normalize_id(topic_id)
+    missing = detect_missing_prerequisites_batch(
+        course, [normalized_topic_id], completed_subtopic_ids, transitive=transitive
+    )[normalized_topic_id] or []
     
-    missing = [p for p in all_prerequisites if p['id'] not in completed_set]
+    logger.info(f"Topic '{topic_id}': {len(missing)} missing prerequisites (transitive={transitive})")
     
-    logger.info(
-        f"Topic '{topic_id}': {len(all_prerequisites)} total prerequisites, "
-        f"{len(missing)} missing"
+    return missing
+
+
+def detect_missing_prerequisites_batch(
+    course: str,
+    topic_ids: List[str],
+    completed_subtopic_ids: List[str] = (),
+    completed_topic_ids: List[str] = (),
+    transitive: bool = True
+) -> Dict[str, Optional[List[Dict]]]:
+    """
+    Evaluate missing prerequisites for many topics against one learner state.
+    
+    Uses the precomputed bitset closure of the cached curriculum model: the
+    learner's completed items become one bitmask, and each topic's gap set is
+    `closure[topic] & ~completed`.
+    
+    Args:
+        course: Course name
+        topic_ids: Topics to check
+        completed_subtopic_ids: Subtopic IDs the learner has completed
+        completed_topic_ids: Topic IDs the learner has completed
+        transitive: Include prerequisites inherited along the module PRECEDES chain
+    
+    Returns:
+        Dictionary of normalized topic ID -> missing items (None for unknown topics)
+    """
+    model = get_curriculum_model(course)
+    completed = model.completed_mask(
+        (normalize_id(sid) for sid in completed_subtopic_ids),
+        (normalize_id(tid) for tid in completed_topic_ids)
+    )
+    return model.missing_prerequisites(
+        [normalize_id(tid) for tid in topic_ids], completed, transitive=transitive
     )
+
+
+def analyze_cohort_gaps(
+    course: str,
+    learners: List[Dict[str, Any]],
+    topic_ids: List[str],
+    transitive: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """
+    Missing prerequisites for a whole cohort against the same target topics.
     
-    return missing
+    The cached curriculum model's closures become one (topics x items)
+    matrix and learners are evaluated in vectorized blocks, so a cohort costs
+    one model lookup plus a few array operations per block.
+    
+    Args:
+        course: Course name
+        learners: [{"learner_id", "completed_subtopic_ids", "completed_topic_ids"}, ...]
+        topic_ids: Target topics shared by every learner
+        transitive: Include prerequisites inherited along the module PRECEDES chain
+    
+    Yields:
+        One {"type": "learner", learner_id, gaps, missing_count} per learner in
+        input order, then a final {"type": "summary", ...} with per-topic
+        learner counts and the most frequently missing items. Unknown topic
+        IDs are listed in the summary and skipped.
+    """
+    model = get_curriculum_model(course)
+    model._ensure_closure()
+    normalized = list(dict.fromkeys(normalize_id(tid) for tid in topic_ids))
+    known = [tid for tid in normalized if tid in model.topics]
+    unknown = [tid for tid in normalized if tid not in model.topics]
+
+    prepared = [
+        (
+            learner.get('learner_id'),
+            model.item_indices(
+                (normalize_id(sid) for sid in learner.get('completed_subtopic_ids') or []),
+                (normalize_id(tid) for tid in learner.get('completed_topic_ids') or [])
+            )
+        )
+        for learner in learners
+    ]
+
+    started = time.time()
+    learners_with_gaps = Counter()
+    missing_items = Counter()
+    learners_blocked = 0
+    for row in model.cohort_gaps(known, prepared, transitive=transitive):
+        if row['gaps']:
+            learners_blocked += 1
+        learners_with_gaps.update(row['gaps'].keys())
+        for items in row['gaps'].values():
+            missing_items.update(items)
+        yield {'type': 'learner', **row}
+
+    elapsed_ms = round((time.time() - started) * 1000, 2)
+    logger.info(f"Cohort gap analysis for '{course}': {len(prepared)} learners x {len(known)} topics in {elapsed_ms} ms")
+    yield {
+        'type': 'summary',
+        'course': course,
+        'learners': len(prepared),
+        'learners_with_gaps': learners_blocked,
+        'topics': known,
+        'unknown_topics': unknown,
+        'learners_missing_by_topic': {tid: learners_with_gaps.get(tid, 0) for tid in known},
+        'most_missed_items': [
+            {'id': item_id, 'learners': count} for item_id, count in missing_items.most_common(20)
+        ],
+        'transitive': transitive,
+        'elapsed_ms': elapsed_ms,
+    }
 
 
 # ============================================================================
 # COURSE MANAGEMENT
 # ============================================================================
 
-def delete_course_curriculum(course: str) -> Dict:
+def delete_course_curriculum(course: str, progress=None) -> Dict:
     """
     Delete all curriculum data for a course.
     
-    Removes all Module, Topic, and Subtopic nodes and their relationships.
+    Removes all Module, Topic, and Subtopic nodes and their relationships,
+    label by label through the course_key indexes, in batched transactions
+    (NEO4J_DELETE_BATCH_SIZE rows each).
     
     Args:
         course: Course name to delete
+        progress: Optional callback(label, deleted_so_far) after each round
     
     Returns:
         Result dictionary with deletion counts
@@ -875,25 +1180,21 @@ def delete_course_curriculum(course: str) -> Dict:
     if not get_driver_instance:
         raise ConnectionError("Neo4j driver not available")
     
-    query = """
-    MATCH (n)
-    WHERE (n:Module OR n:Topic OR n:Subtopic) AND toLower(n.course) = toLower($course)
-    DETACH DELETE n
-    RETURN count(n) AS deleted_count
-    """
-    
     try:
-        driver = get_driver_instance()
-        with driver.session(database=config.NEO4J_DATABASE) as session:
-            result = session.run(query, course=course)
-            record = result.single()
-            deleted_count = record['deleted_count'] if record else 0
+        deleted_by_label = {}
+        for label in CURRICULUM_LABELS:
+            deleted_by_label[label] = delete_nodes_in_batches(
+                label, {"course_key": course_key(course)}, progress=progress
+            )
+        deleted_count = sum(deleted_by_label.values())
         
-        logger.info(f"Deleted {deleted_count} nodes for course '{course}'")
+        _bump_course_version(course)
+        logger.info(f"Deleted {deleted_count} nodes for course '{course}' ({deleted_by_label})")
         return {
             'success': True,
             'course': course,
-            'deleted_count': deleted_count
+            'deleted_count': deleted_count,
+            'deleted_by_label': deleted_by_label
         }
         
     except Exception as e:
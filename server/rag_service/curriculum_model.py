@@ -0,0 +1,314 @@
+# server/rag_service/curriculum_model.py
+"""
+In-Memory Curriculum Model
+
+A course's Module → Topic → Subtopic graph held as plain dictionaries and
+order indexes, so curriculum reads (prerequisites, learning paths, next
+topic/module, full traversal) are lookups instead of Neo4j queries.
+
+Transitive prerequisite closures are precomputed per model as bitsets
+(Python ints) over a shared topic/subtopic index, so gap detection for a
+learner is a couple of bitwise operations per topic.
+
+Models are built from one traversal query and cached per course by
+curriculum_graph_handler, which drops them whenever the course is rebuilt
+or deleted.
+"""
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+@dataclass
+class CurriculumModel:
+    """
+    Indexes over one course's curriculum.
+
+    - modules: module dicts (id, name, order) in course order
+    - topics: topic_id -> topic dict (id, name, lecture_number, module_id)
+    - subtopics: subtopic_id -> subtopic dict (id, name)
+    - module_topics: module_id -> topic IDs in lecture order
+    - topic_prerequisites: topic_id -> subtopic IDs, sorted by name
+    - topic_order: every topic ID in curriculum order
+    """
+    course: str
+    version: int
+    loaded_at: float = field(default_factory=time.time)
+    modules: List[Dict[str, Any]] = field(default_factory=list)
+    module_position: Dict[str, int] = field(default_factory=dict)
+    topics: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    subtopics: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    module_topics: Dict[str, List[str]] = field(default_factory=dict)
+    topic_prerequisites: Dict[str, List[str]] = field(default_factory=dict)
+    topic_order: List[str] = field(default_factory=list)
+    topic_position: Dict[str, int] = field(default_factory=dict)
+    # Bitset closure state, built on first use (see _ensure_closure)
+    items: List[Dict[str, Any]] = field(default_factory=list, repr=False)
+    item_index: Dict[Tuple[str, str], int] = field(default_factory=dict, repr=False)
+    direct_closure: Dict[str, int] = field(default_factory=dict, repr=False)
+    transitive_closure: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    @classmethod
+    def from_traversal(cls, course: str, version: int, module_records: List[Dict[str, Any]]) -> "CurriculumModel":
+        """
+        Build the model from traversal rows: one per module, ordered by
+        module order, each with its topics and their subtopics.
+        """
+        model = cls(course=course, version=version)
+        for module in module_records:
+            module_id = module['id']
+            model.module_position[module_id] = len(model.modules)
+            model.modules.append({'id': module_id, 'name': module.get('name'), 'order': module.get('order')})
+            topic_ids = model.module_topics.setdefault(module_id, [])
+            for topic in module.get('topics', []):
+                topic_id = topic['id']
+                if topic_id in model.topics:
+                    continue
+                model.topics[topic_id] = {
+                    'id': topic_id,
+                    'name': topic.get('name'),
+                    'lecture_number': topic.get('lecture_number'),
+                    'module_id': module_id,
+                }
+                topic_ids.append(topic_id)
+                prerequisites = []
+                for subtopic in topic.get('subtopics', []):
+                    model.subtopics.setdefault(subtopic['id'], {'id': subtopic['id'], 'name': subtopic.get('name')})
+                    prerequisites.append(subtopic['id'])
+                prerequisites.sort(key=lambda sid: model.subtopics[sid].get('name') or '')
+                model.topic_prerequisites[topic_id] = prerequisites
+            model.topic_order.extend(topic_ids)
+        model.topic_position = {topic_id: i for i, topic_id in enumerate(model.topic_order)}
+        return model
+
+    # --- lookups -----------------------------------------------------------
+
+    def topic(self, topic_id: str) -> Optional[Dict[str, Any]]:
+        """Topic dict with its module's name, or None if unknown."""
+        topic = self.topics.get(topic_id)
+        if topic is None:
+            return None
+        module = self.modules[self.module_position[topic['module_id']]]
+        return {**topic, 'module_name': module['name']}
+
+    def prerequisites(self, topic_id: str) -> List[Dict[str, Any]]:
+        return [dict(self.subtopics[sid]) for sid in self.topic_prerequisites.get(topic_id, [])]
+
+    def next_module(self, module_id: str) -> Optional[Dict[str, Any]]:
+        position = self.module_position.get(module_id)
+        if position is None or position + 1 >= len(self.modules):
+            return None
+        return dict(self.modules[position + 1])
+
+    def next_topic(self, topic_id: str) -> Optional[Dict[str, Any]]:
+        """The topic after this one in curriculum order (across modules), or None at the end."""
+        position = self.topic_position.get(topic_id)
+        if position is None or position + 1 >= len(self.topic_order):
+            return None
+        return self.topic(self.topic_order[position + 1])
+
+    def learning_path(self, topic_id: str) -> List[Dict[str, Any]]:
+        """Preceding modules, the topic's module, its prerequisite subtopics, then the topic."""
+        topic = self.topics.get(topic_id)
+        if topic is None:
+            return []
+        position = self.module_position[topic['module_id']]
+        path = [{'type': 'module', **module} for module in self.modules[:position + 1]]
+        path.extend({'type': 'subtopic', **subtopic} for subtopic in self.prerequisites(topic_id))
+        path.append({'type': 'topic', 'id': topic['id'], 'name': topic['name']})
+        return path
+
+    def combined_learning_path(self, topic_ids: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        One de-duplicated path covering several targets: modules up to the
+        furthest target's module, then each target (in curriculum order) with
+        its not-yet-listed prerequisite subtopics. Unknown topics are skipped.
+        """
+        targets = sorted(
+            {tid for tid in topic_ids if tid in self.topics},
+            key=lambda tid: self.topic_position[tid]
+        )
+        if not targets:
+            return []
+        last = max(self.module_position[self.topics[tid]['module_id']] for tid in targets)
+        path = [{'type': 'module', **module} for module in self.modules[:last + 1]]
+        seen = set()
+        for topic_id in targets:
+            for subtopic in self.prerequisites(topic_id):
+                if subtopic['id'] not in seen:
+                    seen.add(subtopic['id'])
+                    path.append({'type': 'subtopic', **subtopic})
+            path.append({'type': 'topic', 'id': topic_id, 'name': self.topics[topic_id]['name']})
+        return path
+
+    def traversal(self) -> Dict[str, Any]:
+        """The nested structure returned by curriculum_graph_handler.traverse_curriculum."""
+        return {
+            'course': self.course,
+            'modules': [
+                {
+                    **module,
+                    'topics': [
+                        {
+                            'id': topic_id,
+                            'name': self.topics[topic_id]['name'],
+                            'lecture_number': self.topics[topic_id]['lecture_number'],
+                            'subtopics': self.prerequisites(topic_id),
+                        }
+                        for topic_id in self.module_topics.get(module['id'], [])
+                    ]
+                }
+                for module in self.modules
+            ]
+        }
+
+    # --- prerequisite closure ----------------------------------------------
+
+    def _ensure_closure(self) -> None:
+        """
+        Index every topic and subtopic as a bit, then precompute per topic:
+        - direct: its PREREQUISITE_OF subtopics
+        - transitive: direct, plus every topic and subtopic of the modules
+          that precede its module along the PRECEDES chain
+        """
+        if self.transitive_closure or not self.topics:
+            return
+        with _closure_lock:
+            if self.transitive_closure:
+                return
+            items, item_index = [], {}
+            for topic_id in self.topic_order:
+                item_index[('topic', topic_id)] = len(items)
+                items.append({'type': 'topic', **self.topics[topic_id]})
+            for topic_id in self.topic_order:
+                for subtopic_id in self.topic_prerequisites.get(topic_id, []):
+                    if ('subtopic', subtopic_id) not in item_index:
+                        item_index[('subtopic', subtopic_id)] = len(items)
+                        items.append({'type': 'subtopic', **self.subtopics[subtopic_id]})
+
+            direct = {}
+            for topic_id in self.topic_order:
+                bits = 0
+                for subtopic_id in self.topic_prerequisites.get(topic_id, []):
+                    bits |= 1 << item_index[('subtopic', subtopic_id)]
+                direct[topic_id] = bits
+
+            transitive, preceding = {}, 0
+            for module in self.modules:
+                module_bits = 0
+                for topic_id in self.module_topics.get(module['id'], []):
+                    transitive[topic_id] = preceding | direct[topic_id]
+                    module_bits |= (1 << item_index[('topic', topic_id)]) | direct[topic_id]
+                preceding |= module_bits
+
+            self.items, self.item_index, self.direct_closure = items, item_index, direct
+            self.transitive_closure = transitive
+
+    def completed_mask(self, subtopic_ids: Iterable[str] = (), topic_ids: Iterable[str] = ()) -> int:
+        """Bitset of a learner's completed items (unknown IDs are ignored)."""
+        self._ensure_closure()
+        mask = 0
+        for kind, ids in (('subtopic', subtopic_ids), ('topic', topic_ids)):
+            for item_id in ids:
+                index = self.item_index.get((kind, item_id))
+                if index is not None:
+                    mask |= 1 << index
+        return mask
+
+    def _decode(self, bits: int) -> List[Dict[str, Any]]:
+        decoded = []
+        while bits:
+            low = bits & -bits
+            decoded.append(dict(self.items[low.bit_length() - 1]))
+            bits ^= low
+        return decoded
+
+    def missing_prerequisites(
+        self,
+        topic_ids: Iterable[str],
+        completed: int,
+        transitive: bool = True
+    ) -> Dict[str, Optional[List[Dict[str, Any]]]]:
+        """
+        Missing prerequisites per topic for a completed-items bitset.
+
+        Items come back in curriculum order (topics, then subtopics).
+        Unknown topics map to None.
+        """
+        self._ensure_closure()
+        closure = self.transitive_closure if transitive else self.direct_closure
+        result = {}
+        for topic_id in topic_ids:
+            required = closure.get(topic_id)
+            result[topic_id] = None if required is None else self._decode(required & ~completed)
+        return result
+
+    def _closure_matrix(self, topic_ids: List[str], transitive: bool) -> np.ndarray:
+        """Boolean (topics x items) matrix of required items; unknown topics get empty rows."""
+        closure = self.transitive_closure if transitive else self.direct_closure
+        n_items = len(self.items)
+        n_bytes = (n_items + 7) // 8
+        matrix = np.zeros((len(topic_ids), n_items), dtype=bool)
+        for row, topic_id in enumerate(topic_ids):
+            bits = closure.get(topic_id, 0)
+            if bits:
+                packed = np.frombuffer(bits.to_bytes(n_bytes, 'little'), dtype=np.uint8)
+                matrix[row] = np.unpackbits(packed, bitorder='little')[:n_items].astype(bool)
+        return matrix
+
+    def cohort_gaps(
+        self,
+        topic_ids: List[str],
+        learners: List[Tuple[str, List[int]]],
+        transitive: bool = True,
+        chunk_size: int = 256
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Missing prerequisites of many learners for many topics in one pass.
+
+        Args:
+            topic_ids: Target topic IDs (known to the model)
+            learners: (learner_id, completed item indices) pairs
+            transitive: Use the transitive rather than the direct closure
+            chunk_size: Learners evaluated per vectorized block
+
+        Yields:
+            One dict per learner: {learner_id, gaps: {topic_id: [item IDs]}, missing_count}
+        """
+        self._ensure_closure()
+        required = self._closure_matrix(topic_ids, transitive)       # T x N
+        n_items = len(self.items)
+        item_ids = np.array([item['id'] for item in self.items], dtype=object)
+
+        for start in range(0, len(learners), chunk_size):
+            block = learners[start:start + chunk_size]
+            completed = np.zeros((len(block), n_items), dtype=bool)  # L x N
+            for row, (_, indices) in enumerate(block):
+                completed[row, indices] = True
+            missing = required[None, :, :] & ~completed[:, None, :]  # L x T x N
+            counts = missing.sum(axis=2)
+            for row, (learner_id, _) in enumerate(block):
+                gaps = {
+                    topic_id: item_ids[missing[row, col]].tolist()
+                    for col, topic_id in enumerate(topic_ids)
+                    if counts[row, col]
+                }
+                yield {"learner_id": learner_id, "gaps": gaps, "missing_count": int(counts[row].sum())}
+
+    def item_indices(self, subtopic_ids: Iterable[str] = (), topic_ids: Iterable[str] = ()) -> List[int]:
+        """Item indices of completed subtopics/topics (unknown IDs are ignored)."""
+        self._ensure_closure()
+        indices = []
+        for kind, ids in (('subtopic', subtopic_ids), ('topic', topic_ids)):
+            for item_id in ids:
+                index = self.item_index.get((kind, item_id))
+                if index is not None:
+                    indices.append(index)
+        return indices
+
+
+_closure_lock = threading.Lock()
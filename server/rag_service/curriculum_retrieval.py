@@ -0,0 +1,327 @@
+# server/rag_service/curriculum_retrieval.py
+"""
+Curriculum-Aware Retrieval
+
+Ranks Qdrant chunks by where they sit in the course relative to the learner's
+current topic, instead of by cosine similarity alone:
+1. Prefilter the vector search to the module neighbourhood of the current topic
+2. Rescore candidates by prerequisite/sequence distance from the current topic
+3. Derive a per-course distance table from the cached CurriculumModel,
+   rebuilt when the model's version changes
+
+Chunks are matched to the curriculum through the syllabus metadata written by
+syllabus_qdrant_linker (syllabus_module, syllabus_topic, syllabus_course).
+"""
+
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from qdrant_client import models
+
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import curriculum_graph_handler
+    from curriculum_graph_handler import normalize_id
+except ImportError as e:
+    logger.warning(f"Failed to import curriculum_graph_handler: {e}")
+    curriculum_graph_handler = None
+
+
+# ============================================================================
+# DISTANCE TABLE
+# ============================================================================
+
+# A Subtopic is one PREREQUISITE_OF hop behind the Topic it feeds, which costs
+# the same as one step backwards along the sequence.
+PREREQUISITE_HOP_DISTANCE = 1.0
+
+
+@dataclass
+class CourseDistanceTable:
+    """
+    Sequence positions of every topic in a course, in curriculum order.
+
+    Distances are measured in topic steps along the module/lecture sequence.
+    Steps backwards (towards prerequisites) cost 1, steps forward cost
+    CURRICULUM_FORWARD_DISTANCE_WEIGHT, so earlier material outranks later
+    material at the same cosine score. A chunk that covers a PREREQUISITE_OF
+    subtopic of the current topic is PREREQUISITE_HOP_DISTANCE away, wherever
+    that subtopic's own topic sits in the sequence.
+
+    Topics, modules and subtopics are indexed by ID and by normalized name:
+    chunk metadata carries display names, while CSV curricula use explicit IDs.
+    """
+    course: str
+    version: int
+    topic_position: Dict[str, int] = field(default_factory=dict)
+    topic_module: Dict[str, str] = field(default_factory=dict)
+    module_rank: Dict[str, int] = field(default_factory=dict)
+    module_names: Dict[str, str] = field(default_factory=dict)
+    module_span: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    topic_prerequisites: Dict[str, Set[str]] = field(default_factory=dict)
+    subtopic_ids: Set[str] = field(default_factory=set)
+    topic_ids_by_name: Dict[str, str] = field(default_factory=dict)
+    module_ids_by_name: Dict[str, str] = field(default_factory=dict)
+    subtopic_ids_by_name: Dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_model(cls, model) -> "CourseDistanceTable":
+        """Build the table from a CurriculumModel (see curriculum_graph_handler.get_curriculum_model)."""
+        table = cls(course=model.course, version=model.version, topic_position=dict(model.topic_position))
+        for rank, module in enumerate(model.modules):
+            module_id = module['id']
+            table.module_rank[module_id] = rank
+            table.module_names[module_id] = module.get('name')
+            _index_name(table.module_ids_by_name, module.get('name'), module_id)
+            topic_ids = model.module_topics.get(module_id, [])
+            if topic_ids:
+                table.module_span[module_id] = (model.topic_position[topic_ids[0]], model.topic_position[topic_ids[-1]])
+        for topic_id, topic in model.topics.items():
+            table.topic_module[topic_id] = topic['module_id']
+            _index_name(table.topic_ids_by_name, topic.get('name'), topic_id)
+            table.topic_prerequisites[topic_id] = set(model.topic_prerequisites.get(topic_id, []))
+        for subtopic_id, subtopic in model.subtopics.items():
+            table.subtopic_ids.add(subtopic_id)
+            _index_name(table.subtopic_ids_by_name, subtopic.get('name'), subtopic_id)
+        return table
+
+    def _weighted(self, steps: int) -> float:
+        if steps <= 0:
+            return float(-steps)
+        return steps * config.CURRICULUM_FORWARD_DISTANCE_WEIGHT
+
+    @staticmethod
+    def _resolve(raw: Optional[str], ids, ids_by_name: Dict[str, str]) -> Optional[str]:
+        """ID for a raw ID or display name, or None if the course has no such item."""
+        key = normalize_id(raw or "")
+        if not key:
+            return None
+        return key if key in ids else ids_by_name.get(key)
+
+    def resolve_topic(self, raw: Optional[str]) -> Optional[str]:
+        return self._resolve(raw, self.topic_position, self.topic_ids_by_name)
+
+    def resolve_module(self, raw: Optional[str]) -> Optional[str]:
+        return self._resolve(raw, self.module_rank, self.module_ids_by_name)
+
+    def resolve_subtopic(self, raw: Optional[str]) -> Optional[str]:
+        return self._resolve(raw, self.subtopic_ids, self.subtopic_ids_by_name)
+
+    def topic_distance(self, from_topic_id: str, to_topic_id: str) -> Optional[float]:
+        start = self.topic_position.get(from_topic_id)
+        end = self.topic_position.get(to_topic_id)
+        if start is None or end is None:
+            return None
+        return self._weighted(end - start)
+
+    def module_distance(self, from_topic_id: str, module_id: str) -> Optional[float]:
+        """Distance from a topic to the closest topic of a module."""
+        start = self.topic_position.get(from_topic_id)
+        span = self.module_span.get(module_id)
+        if start is None or span is None:
+            return None
+        first, last = span
+        if first <= start <= last:
+            return 0.0
+        if last < start:
+            return self._weighted(last - start)
+        return self._weighted(first - start)
+
+    def prerequisite_distance(self, from_topic_id: str, metadata: Dict[str, Any]) -> Optional[float]:
+        """PREREQUISITE_HOP_DISTANCE if the chunk covers a prerequisite subtopic of the topic."""
+        prerequisites = self.topic_prerequisites.get(from_topic_id)
+        if not prerequisites:
+            return None
+        names = metadata.get('syllabus_subtopics') or []
+        if isinstance(names, str):
+            names = names.split(',')
+        names = [*names, metadata.get('syllabus_topic')]
+        if any(self.resolve_subtopic(name) in prerequisites for name in names):
+            return PREREQUISITE_HOP_DISTANCE
+        return None
+
+    def chunk_distance(self, from_topic_id: str, metadata: Dict[str, Any]) -> Optional[float]:
+        """Shortest sequence or prerequisite distance from the current topic to a chunk."""
+        distance = None
+        topic_id = self.resolve_topic(metadata.get('syllabus_topic'))
+        if topic_id is not None:
+            distance = self.topic_distance(from_topic_id, topic_id)
+        else:
+            module_id = self.resolve_module(metadata.get('syllabus_module'))
+            if module_id is not None:
+                distance = self.module_distance(from_topic_id, module_id)
+        hop = self.prerequisite_distance(from_topic_id, metadata)
+        if hop is not None and (distance is None or hop < distance):
+            return hop
+        return distance
+
+    def neighbourhood_modules(self, topic_id: str, radius: int) -> List[str]:
+        """Display names of the modules within `radius` of the topic's module."""
+        module_id = self.topic_module.get(topic_id)
+        if module_id is None:
+            return []
+        centre = self.module_rank[module_id]
+        return [
+            self.module_names[mid]
+            for mid, rank in self.module_rank.items()
+            if abs(rank - centre) <= radius and self.module_names.get(mid)
+        ]
+
+
+def _index_name(index: Dict[str, str], name: Optional[str], item_id: str) -> None:
+    key = normalize_id(name or "")
+    if key:
+        index.setdefault(key, item_id)
+
+
+_distance_tables: Dict[str, CourseDistanceTable] = {}
+_distance_tables_lock = threading.Lock()
+
+
+def get_distance_table(course: str) -> Optional[CourseDistanceTable]:
+    """
+    Distance table for a course, derived from its cached CurriculumModel and
+    rebuilt only when the model's version changes (re-upload or deletion).
+    """
+    if not curriculum_graph_handler:
+        return None
+
+    model = curriculum_graph_handler.get_curriculum_model(course)
+    key = curriculum_graph_handler.course_key(course)
+    table = _distance_tables.get(key)
+    if table is not None and table.version == model.version:
+        return table
+
+    with _distance_tables_lock:
+        table = _distance_tables.get(key)
+        if table is None or table.version != model.version:
+            table = CourseDistanceTable.from_model(model)
+            _distance_tables[key] = table
+            logger.info(
+                f"Built curriculum distance table for '{course}' (v{model.version}): "
+                f"{len(table.module_rank)} modules, {len(table.topic_position)} topics"
+            )
+    return table
+
+
+# ============================================================================
+# CURRICULUM-AWARE SEARCH
+# ============================================================================
+
+def _neighbourhood_filter(
+    course: str,
+    module_names: List[str],
+    base_filter: Optional[models.Filter]
+) -> models.Filter:
+    must = list(base_filter.must or []) if base_filter else []
+    must.append(models.FieldCondition(
+        key="syllabus_module",
+        match=models.MatchAny(any=module_names)
+    ))
+    # Module names ("Module 1", ...) repeat across courses, so pin the course too.
+    should = [
+        models.FieldCondition(key="syllabus_course", match=models.MatchValue(value=course)),
+        models.FieldCondition(key="course_name", match=models.MatchValue(value=course)),
+    ]
+    return models.Filter(
+        must=must,
+        should=should,
+        must_not=list(base_filter.must_not or []) if base_filter else None
+    )
+
+
+def search_with_curriculum(
+    vector_service,
+    query: str,
+    course: str,
+    topic_id: str,
+    k: int = -1,
+    base_filter: Optional[models.Filter] = None,
+    module_radius: Optional[int] = None
+) -> Tuple[list, str, Dict, Dict[str, Any]]:
+    """
+    Search Qdrant within the curriculum neighbourhood of the learner's current topic.
+
+    Falls back to a plain cosine search when the course or topic is unknown,
+    or when the neighbourhood holds no matching chunks.
+
+    Args:
+        vector_service: Initialized VectorDBService
+        query: Search query
+        course: Course name
+        topic_id: Learner's current topic ID
+        k: Number of results (defaults to QDRANT_DEFAULT_SEARCH_K)
+        base_filter: Extra conditions (e.g. document filter) to keep
+        module_radius: Modules on either side of the current one to search
+
+    Returns:
+        (documents, formatted_context, documents_map, retrieval_info)
+    """
+    k_to_use = k if k > 0 else config.QDRANT_DEFAULT_SEARCH_K
+    radius = max(0, int(config.CURRICULUM_RETRIEVAL_MODULE_RADIUS if module_radius is None else module_radius))
+    normalized_topic_id = normalize_id(topic_id) if curriculum_graph_handler else topic_id
+    info = {
+        "mode": "cosine",
+        "course": course,
+        "topic_id": normalized_topic_id,
+        "modules": [],
+        "candidates": 0,
+    }
+
+    table = None
+    try:
+        table = get_distance_table(course)
+    except Exception as e:
+        logger.error(f"[Curriculum Retrieval] Could not load distance table for '{course}': {e}", exc_info=True)
+
+    if table is not None:
+        # Accept the topic's display name as well as its ID
+        normalized_topic_id = table.resolve_topic(topic_id) or normalized_topic_id
+        info["topic_id"] = normalized_topic_id
+
+    module_names = table.neighbourhood_modules(normalized_topic_id, radius) if table else []
+    if not module_names:
+        logger.info(f"[Curriculum Retrieval] Topic '{topic_id}' not found in '{course}'. Using cosine search.")
+        docs, snippet, docs_map = vector_service.search_documents(query=query, k=k_to_use, filter_conditions=base_filter)
+        return docs, snippet, docs_map, info
+
+    candidate_k = k_to_use * max(1, config.CURRICULUM_RETRIEVAL_OVERFETCH)
+    docs, _, _ = vector_service.search_documents(
+        query=query,
+        k=candidate_k,
+        filter_conditions=_neighbourhood_filter(course, module_names, base_filter)
+    )
+    info["modules"] = module_names
+    info["candidates"] = len(docs)
+
+    if not docs:
+        logger.info(f"[Curriculum Retrieval] No chunks in neighbourhood {module_names}. Using cosine search.")
+        docs, snippet, docs_map = vector_service.search_documents(query=query, k=k_to_use, filter_conditions=base_filter)
+        return docs, snippet, docs_map, info
+
+    # Chunks we cannot place in the sequence rank just outside the neighbourhood
+    unplaced_distance = (radius + 1) * config.CURRICULUM_FORWARD_DISTANCE_WEIGHT
+    for doc in docs:
+        distance = table.chunk_distance(normalized_topic_id, doc.metadata)
+        if distance is None:
+            distance = unplaced_distance
+        cosine = doc.metadata.get("score", 0.0)
+        doc.metadata["cosine_score"] = cosine
+        doc.metadata["curriculum_distance"] = distance
+        doc.metadata["score"] = cosine - config.CURRICULUM_DISTANCE_PENALTY * distance
+
+    docs.sort(key=lambda d: d.metadata["score"], reverse=True)
+    docs = docs[:k_to_use]
+    info["mode"] = "curriculum"
+
+    snippet, docs_map = vector_service.format_search_results(docs)
+    logger.info(
+        f"[Curriculum Retrieval] '{course}' / '{normalized_topic_id}': "
+        f"{info['candidates']} candidates from {len(module_names)} modules -> {len(docs)} results"
+    )
+    return docs, snippet, docs_map, info
@@ -0,0 +1,203 @@
+# server/rag_service/deletion_jobs.py
+"""
+Bulk Document Deletion Jobs
+
+Removes many (user_id, document_name) documents in one background job:
+1. Collect the exact point IDs of every document (scroll, no payloads)
+2. Delete them from Qdrant in ID batches, waiting only on the last batch
+3. Delete each document's knowledge graph from Neo4j (skipped for documents
+   whose points could not be collected, which stay in Qdrant)
+4. Drop any cached search data for the documents, then run the caller's
+   on_finished hook (e.g. to drop per-course views built from counts)
+
+Jobs run in a daemon thread and are tracked in process by job ID. Only
+finished jobs are evicted to stay within _MAX_TRACKED_JOBS; queued and
+running ones are always kept.
+"""
+
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import neo4j_handler
+except ImportError as e:
+    logger.warning(f"Failed to import neo4j_handler: {e}")
+    neo4j_handler = None
+
+_MAX_TRACKED_JOBS = 200
+_TERMINAL_STATUSES = ("completed", "completed_with_errors", "failed")
+
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _update_job(job: Dict[str, Any], **fields) -> None:
+    # Updates the worker's own dict, which stays valid even if the job is no longer in _jobs
+    with _jobs_lock:
+        job.update(fields)
+
+
+def _evict_finished_locked() -> None:
+    """Drop the oldest finished jobs beyond _MAX_TRACKED_JOBS."""
+    excess = len(_jobs) - _MAX_TRACKED_JOBS
+    if excess <= 0:
+        return
+    for job_id in [j for j, job in _jobs.items() if job["status"] in _TERMINAL_STATUSES][:excess]:
+        del _jobs[job_id]
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Snapshot of a job's status, or None if unknown (or already evicted)."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is None:
+            return None
+        snapshot = dict(job)
+        snapshot["documents"] = [dict(d) for d in job["documents"]]
+        return snapshot
+
+
+def _normalize_documents(documents: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    pairs, seen = [], set()
+    for doc in documents:
+        if not isinstance(doc, dict):
+            raise ValueError(f"Each document must be an object with 'user_id' and 'document_name': {doc!r}")
+        user_id = str(doc.get("user_id") or "").strip()
+        document_name = str(doc.get("document_name") or "").strip()
+        if not user_id or not document_name:
+            raise ValueError(f"Each document needs 'user_id' and 'document_name': {doc}")
+        if (user_id, document_name) not in seen:
+            seen.add((user_id, document_name))
+            pairs.append((user_id, document_name))
+    return pairs
+
+
+def start_bulk_deletion(
+    vector_service,
+    documents: List[Dict[str, Any]],
+    delete_kg: bool = True,
+    on_finished: Optional[Callable[[], None]] = None
+) -> str:
+    """
+    Queue deletion of many documents and return the job ID immediately.
+
+    Args:
+        vector_service: Initialized VectorDBService
+        documents: List of {"user_id": ..., "document_name": ...}
+        delete_kg: Also delete each document's knowledge graph from Neo4j
+        on_finished: Called from the job thread once the job stops, whatever its status
+
+    Raises:
+        ValueError: If a document entry is not a dict or is missing user_id or document_name
+    """
+    pairs = _normalize_documents(documents)
+    job_id = str(uuid.uuid4())
+    job = {
+        "job_id": job_id,
+        "status": "queued",
+        "created_at": _now(),
+        "started_at": None,
+        "finished_at": None,
+        "total_documents": len(pairs),
+        "processed_documents": 0,
+        "qdrant_points_deleted": 0,
+        "kg_documents_deleted": 0,
+        "documents": [
+            {"user_id": u, "document_name": d, "qdrant_points": None, "kg_deleted": None, "error": None}
+            for u, d in pairs
+        ],
+        "error": None,
+    }
+    with _jobs_lock:
+        _jobs[job_id] = job
+        _evict_finished_locked()
+
+    thread = threading.Thread(
+        target=_run_bulk_deletion,
+        args=(job, vector_service, pairs, delete_kg, on_finished),
+        name=f"bulk-delete-{job_id[:8]}"
+    )
+    thread.daemon = True
+    thread.start()
+    logger.info(f"Bulk deletion job {job_id} queued for {len(pairs)} documents (delete_kg={delete_kg}).")
+    return job_id
+
+
+def _run_bulk_deletion(
+    job: Dict[str, Any],
+    vector_service,
+    pairs: List[Tuple[str, str]],
+    delete_kg: bool,
+    on_finished: Optional[Callable[[], None]] = None
+) -> None:
+    job_id = job["job_id"]
+    _update_job(job, status="running", started_at=_now())
+    entries = job["documents"]
+    has_errors = False
+
+    try:
+        # Phase 1: exact point IDs per document
+        all_point_ids = []
+        for entry, (user_id, document_name) in zip(entries, pairs):
+            try:
+                point_ids = vector_service.get_document_point_ids(user_id, document_name)
+                all_point_ids.extend(point_ids)
+                with _jobs_lock:
+                    entry["qdrant_points"] = len(point_ids)
+            except Exception as e:
+                has_errors = True
+                logger.error(f"Bulk deletion {job_id}: could not collect points for '{document_name}': {e}", exc_info=True)
+                with _jobs_lock:
+                    entry["error"] = f"Qdrant scroll failed: {e}"
+
+        # Phase 2: batched Qdrant deletes
+        if all_point_ids:
+            deleted = vector_service.delete_points_batched(all_point_ids, batch_size=config.QDRANT_DELETE_BATCH_SIZE)
+            _update_job(job, qdrant_points_deleted=deleted)
+        logger.info(f"Bulk deletion {job_id}: removed {len(all_point_ids)} Qdrant points for {len(pairs)} documents.")
+
+        # Phase 3 + 4: knowledge graphs and caches
+        for entry, (user_id, document_name) in zip(entries, pairs):
+            if vector_service.l1_cache:
+                vector_service.l1_cache.invalidate(document_name)
+            # A document whose points could not be collected is still in Qdrant, so keep its graph too
+            if delete_kg and neo4j_handler and entry["error"] is None:
+                try:
+                    neo4j_handler.delete_knowledge_graph(user_id, document_name)
+                    with _jobs_lock:
+                        entry["kg_deleted"] = True
+                        job["kg_documents_deleted"] += 1
+                except Exception as e:
+                    has_errors = True
+                    logger.error(f"Bulk deletion {job_id}: KG deletion failed for '{document_name}': {e}", exc_info=True)
+                    with _jobs_lock:
+                        entry["kg_deleted"] = False
+                        entry["error"] = f"KG deletion failed: {e}"
+            with _jobs_lock:
+                job["processed_documents"] += 1
+
+        _update_job(job, status="completed_with_errors" if has_errors else "completed", finished_at=_now())
+        logger.info(f"Bulk deletion job {job_id} finished (errors={has_errors}).")
+
+    except Exception as e:
+        logger.error(f"Bulk deletion job {job_id} failed: {e}", exc_info=True)
+        _update_job(job, status="failed", error=str(e), finished_at=_now())
+    finally:
+        # Even a failed job may have removed some points
+        if on_finished:
+            try:
+                on_finished()
+            except Exception as e:
+                logger.error(f"Bulk deletion job {job_id}: on_finished hook failed: {e}", exc_info=True)
@@ -0,0 +1,222 @@
+# server/rag_service/llm_client_pool.py
+"""
+Gemini Client Pool
+
+`genai.configure(api_key=...)` swaps a process-wide default client, so
+configuring a user's key per request races with concurrent requests that
+carry other keys, and building a GenerativeModel per call throws away its
+transport (and the HTTP/2 connection behind it) every time.
+
+This pool keeps one GenerativeModel per (api_key, model) with its own
+GenerativeServiceClient bound to that key:
+- Clients are never shared across keys, and nothing touches genai's globals
+- Transports are reused, so connections stay open between calls
+- Least recently used entries beyond LLM_CLIENT_POOL_MAX_SIZE are closed
+
+Binding the client relies on GenerativeModel's `_client` attribute, which
+the SDK exposes no public setter for. google-generativeai is pinned to the
+0.8 series in requirements.txt for that reason, and _create_entry fails
+loudly if the attribute ever disappears.
+
+In-flight and latency metrics are labelled with a short fingerprint of the
+key, never the key itself. Only the first LLM_METRICS_MAX_KEY_LABELS
+fingerprints get their own series; later keys share the "other" label so
+user-supplied keys cannot grow the series count without bound.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+import google.generativeai as genai
+from google.ai import generativelanguage as glm
+
+import config
+
+logger = logging.getLogger(__name__)
+
+SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+# --- Per-key metrics (exported on /metrics via the default Prometheus registry) ---
+try:
+    from prometheus_client import Gauge, Histogram
+    _IN_FLIGHT = Gauge("llm_requests_in_flight", "LLM calls currently running", ["key", "model"])
+    _LATENCY_SECONDS = Histogram(
+        "llm_request_latency_seconds", "Wall time of one LLM call", ["key", "model", "outcome"],
+        buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120))
+except ImportError:
+    _IN_FLIGHT = _LATENCY_SECONDS = None
+
+
+def key_fingerprint(api_key: str) -> str:
+    """
+    Stable, non-reversible label for an API key. Same scheme as
+    services/llm_rate_limiter.key_fingerprint, so pool metrics and rate
+    limiter state line up per key without importing from services/.
+    """
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+_OTHER_KEY_LABEL = "other"
+_key_labels: set = set()
+_key_labels_lock = threading.Lock()
+
+
+def _metric_key_label(fingerprint: str) -> str:
+    """The fingerprint while fewer than LLM_METRICS_MAX_KEY_LABELS keys have been seen, else "other"."""
+    with _key_labels_lock:
+        if fingerprint in _key_labels:
+            return fingerprint
+        if len(_key_labels) < config.LLM_METRICS_MAX_KEY_LABELS:
+            _key_labels.add(fingerprint)
+            return fingerprint
+    return _OTHER_KEY_LABEL
+
+
+class _PoolEntry:
+    __slots__ = ("model", "client", "fingerprint", "key_label", "model_name", "in_flight", "calls", "errors",
+                 "total_seconds")
+
+    def __init__(self, model, client, fingerprint: str, model_name: str):
+        self.model = model
+        self.client = client
+        self.fingerprint = fingerprint
+        self.key_label = _metric_key_label(fingerprint)
+        self.model_name = model_name
+        self.in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+
+_pool: "OrderedDict[Tuple[str, str], _PoolEntry]" = OrderedDict()
+_pool_lock = threading.Lock()
+
+
+def _create_entry(api_key: str, model_name: str) -> _PoolEntry:
+    client = glm.GenerativeServiceClient(
+        transport=config.LLM_CLIENT_TRANSPORT,
+        client_options={"api_key": api_key}
+    )
+    model = genai.GenerativeModel(model_name, safety_settings=SAFETY_SETTINGS)
+    # GenerativeModel only falls back to genai's global client while _client is unset.
+    # There is no public setter; the SDK is pinned (requirements.txt) to a series that has it.
+    if not hasattr(model, "_client"):
+        raise RuntimeError(
+            "google.generativeai.GenerativeModel has no _client attribute; this SDK version is not "
+            "supported by llm_client_pool (see the google-generativeai pin in requirements.txt)"
+        )
+    model._client = client
+    return _PoolEntry(model, client, key_fingerprint(api_key), model_name)
+
+
+def _close_entry(entry: _PoolEntry):
+    try:
+        entry.client.transport.close()
+    except Exception as e:
+        logger.warning(f"LLM pool: error closing client for key {entry.fingerprint}: {e}")
+
+
+def _evict_idle_locked(keep=None) -> list:
+    """Pop least recently used idle entries until the pool fits; busy ones wait for a later pass."""
+    evicted = []
+    for other_key in list(_pool):
+        if len(_pool) <= max(1, config.LLM_CLIENT_POOL_MAX_SIZE):
+            break
+        if other_key != keep and _pool[other_key].in_flight == 0:
+            evicted.append(_pool.pop(other_key))
+    return evicted
+
+
+def _acquire(api_key: str, model_name: str) -> _PoolEntry:
+    pool_key = (api_key, model_name)
+    with _pool_lock:
+        entry = _pool.get(pool_key)
+        if entry is not None:
+            _pool.move_to_end(pool_key)
+            entry.in_flight += 1
+            return entry
+
+    created = _create_entry(api_key, model_name)
+    evicted = []
+    with _pool_lock:
+        entry = _pool.get(pool_key)
+        if entry is None:
+            entry = _pool[pool_key] = created
+            created = None
+            evicted = _evict_idle_locked(keep=pool_key)
+        entry.in_flight += 1
+    for stale in evicted + ([created] if created is not None else []):
+        _close_entry(stale)
+    return entry
+
+
+@contextmanager
+def pooled_model(api_key: str, model_name: Optional[str] = None):
+    """
+    Yield the pooled GenerativeModel for (api_key, model_name), tracking the
+    call's in-flight count and latency for that key.
+    """
+    model_name = model_name or config.GEMINI_MODEL_NAME
+    entry = _acquire(api_key, model_name)
+    if _IN_FLIGHT is not None:
+        _IN_FLIGHT.labels(key=entry.key_label, model=model_name).inc()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield entry.model
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        with _pool_lock:
+            entry.in_flight -= 1
+            entry.calls += 1
+            entry.total_seconds += elapsed
+            if outcome == "error":
+                entry.errors += 1
+            evicted = _evict_idle_locked()
+        for stale in evicted:
+            _close_entry(stale)
+        if _IN_FLIGHT is not None:
+            _IN_FLIGHT.labels(key=entry.key_label, model=model_name).dec()
+            _LATENCY_SECONDS.labels(key=entry.key_label, model=model_name, outcome=outcome).observe(elapsed)
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Per-key snapshot of the pool: in-flight calls, call/error counts and mean latency."""
+    with _pool_lock:
+        return {
+            "size": len(_pool),
+            "max_size": config.LLM_CLIENT_POOL_MAX_SIZE,
+            "clients": [
+                {
+                    "key": entry.fingerprint,
+                    "model": entry.model_name,
+                    "in_flight": entry.in_flight,
+                    "calls": entry.calls,
+                    "errors": entry.errors,
+                    "avg_latency_seconds": round(entry.total_seconds / entry.calls, 4) if entry.calls else None,
+                }
+                for entry in _pool.values()
+            ],
+        }
+
+
+def close_pool():
+    """Close every pooled client (registered with atexit by app.py)."""
+    with _pool_lock:
+        entries = list(_pool.values())
+        _pool.clear()
+    for entry in entries:
+        _close_entry(entry)
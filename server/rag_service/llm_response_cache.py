@@ -0,0 +1,190 @@
+# server/rag_service/llm_response_cache.py
+"""
+LLM Response Cache
+
+Generation routes (code analysis, test cases, quizzes, Q&A, documents,
+podcasts) see the same prompts over and over, e.g. a whole class analyzing
+the same starter code. Responses are cached by content:
+
+    key = sha256(model, sha256(prompt), generation params)
+
+The API key is not part of the key, so one user's generation serves the
+next. Entries live in a SQLite file (WAL mode) so every worker process on
+the host shares them; they expire after LLM_RESPONSE_CACHE_TTL_SECONDS and
+the least recently used ones are evicted once the file holds more than
+LLM_RESPONSE_CACHE_MAX_BYTES of responses.
+
+Each entry remembers how long the original generation took, so a hit
+reports the latency it saved.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# --- Cache metrics (exported on /metrics via the default Prometheus registry) ---
+try:
+    from prometheus_client import Counter
+    _REQUESTS = Counter("llm_cache_requests_total", "LLM response cache lookups", ["result"])
+    _SAVED_SECONDS = Counter("llm_cache_saved_seconds_total", "Generation time saved by LLM response cache hits")
+except ImportError:
+    _REQUESTS = _SAVED_SECONDS = None
+
+# Size-based eviction runs after this many writes from one process
+_EVICT_EVERY_WRITES = 32
+
+_local = threading.local()
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "saved_seconds": 0.0}
+_stats_lock = threading.Lock()
+_writes_since_evict = 0
+
+
+def cache_key(model_name: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+    """Content address of one generation request."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    material = json.dumps({"model": model_name, "prompt": prompt_hash, "params": params or {}}, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _connection() -> sqlite3.Connection:
+    # sqlite3 connections are per thread; each worker process opens its own
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "path", None) != config.LLM_RESPONSE_CACHE_PATH:
+        os.makedirs(os.path.dirname(config.LLM_RESPONSE_CACHE_PATH), exist_ok=True)
+        conn = sqlite3.connect(config.LLM_RESPONSE_CACHE_PATH, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL,"
+            " size INTEGER NOT NULL, latency REAL NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        _local.conn, _local.path = conn, config.LLM_RESPONSE_CACHE_PATH
+    return conn
+
+
+def _record(result: str, saved_seconds: float = 0.0):
+    with _stats_lock:
+        _stats[{"hit": "hits", "miss": "misses", "bypass": "bypassed"}[result]] += 1
+        _stats["saved_seconds"] += saved_seconds
+    if _REQUESTS is not None:
+        _REQUESTS.labels(result=result).inc()
+        if saved_seconds:
+            _SAVED_SECONDS.inc(saved_seconds)
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    """The cached {response, latency} for a key, or None if missing or expired."""
+    conn = _connection()
+    row = conn.execute("SELECT response, latency, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    now = time.time()
+    if now - row[2] > config.LLM_RESPONSE_CACHE_TTL_SECONDS:
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        return None
+    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+    return {"response": row[0], "latency": row[1]}
+
+
+def put(key: str, model_name: str, response: str, latency_seconds: float):
+    global _writes_since_evict
+    now = time.time()
+    size = len(response.encode("utf-8"))
+    _connection().execute(
+        "INSERT OR REPLACE INTO responses (key, model, response, size, latency, created_at, last_access) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (key, model_name, response, size, latency_seconds, now, now)
+    )
+    with _stats_lock:
+        _writes_since_evict += 1
+        due = _writes_since_evict >= _EVICT_EVERY_WRITES
+        if due:
+            _writes_since_evict = 0
+    if due:
+        evict()
+
+
+def evict() -> int:
+    """Drop expired entries, then least recently used ones until under the size budget."""
+    conn = _connection()
+    removed = conn.execute(
+        "DELETE FROM responses WHERE created_at < ?", (time.time() - config.LLM_RESPONSE_CACHE_TTL_SECONDS,)
+    ).rowcount
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    excess = total - config.LLM_RESPONSE_CACHE_MAX_BYTES
+    if excess > 0:
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        removed += len(victims)
+    if removed:
+        logger.info(f"LLM response cache: evicted {removed} entries")
+    return removed
+
+
+def cached_generate(
+    model_name: str,
+    prompt: str,
+    generate: Callable[[], str],
+    params: Optional[Dict[str, Any]] = None,
+    use_cache: bool = True
+) -> str:
+    """
+    Return the cached response for (model, prompt, params), or call
+    `generate()` and cache its non-empty result. Cache errors never fail
+    the generation; `use_cache=False` skips both lookup and store.
+    """
+    if not config.LLM_RESPONSE_CACHE_ENABLED or not use_cache:
+        _record("bypass")
+        return generate()
+
+    key = cache_key(model_name, prompt, params)
+    try:
+        cached = get(key)
+    except sqlite3.Error as e:
+        logger.warning(f"LLM response cache lookup failed: {e}")
+        cached = None
+    if cached is not None:
+        _record("hit", cached["latency"])
+        return cached["response"]
+
+    _record("miss")
+    started = time.perf_counter()
+    response = generate()
+    if response:
+        try:
+            put(key, model_name, response, time.perf_counter() - started)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM response cache store failed: {e}")
+    return response
+
+
+def cache_stats() -> Dict[str, Any]:
+    """This process's hit/miss counts and saved latency, plus the shared store's size."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["saved_seconds"] = round(stats["saved_seconds"], 3)
+    if config.LLM_RESPONSE_CACHE_ENABLED:
+        try:
+            entries, size = _connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            stats.update(entries=entries, bytes=size, max_bytes=config.LLM_RESPONSE_CACHE_MAX_BYTES)
+        except sqlite3.Error as e:
+            stats["error"] = str(e)
+    return stats
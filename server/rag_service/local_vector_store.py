@@ -0,0 +1,887 @@
+# server/rag_service/local_vector_store.py
+"""
+Local Vector Store - In-process stand-in for Qdrant
+
+VectorDBService talks to its vector store through a small subset of the
+QdrantClient API (VectorStoreBackend below). This module provides:
+1. VectorStoreBackend: the methods a backend must implement
+2. LocalVectorStore: a brute-force NumPy implementation of that surface
+   - vectors in a memory-mapped float32/float16 matrix per collection
+     (one matrix per named vector)
+   - payloads in a columnar JSON sidecar plus an append-only log of the
+     writes since; the sidecar is rewritten (and deleted rows compacted
+     away) only once the log outgrows it, so writes cost O(batch)
+   - vectorized top-k with Qdrant-style payload filters
+3. create_vector_store_client(): picks the backend from config
+
+With path=None the store lives purely in memory, which is what the
+VectorDBService L1 cache uses for hot per-document searches.
+"""
+
+import os
+import abc
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+import config
+import matryoshka
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+_INITIAL_CAPACITY = 1024
+_META_FILE = "meta.json"
+_VECTORS_FILE = "vectors.bin"
+_UNNAMED = ""
+_PAYLOAD_FILE = "payload.json"
+_PAYLOAD_LOG_FILE = "payload.log"
+# The sidecar is rewritten once the log grows past it (and at least this size)
+_COMPACT_MIN_LOG_BYTES = 1 << 20
+# Deleted rows are dropped from the matrices once they are this share of the rows (and at least this many)
+_COMPACT_DEAD_FRACTION = 0.5
+_COMPACT_MIN_DEAD_ROWS = 1024
+
+
+class VectorStoreBackend(abc.ABC):
+    """
+    The QdrantClient methods VectorDBService relies on.
+
+    QdrantClient satisfies this interface as-is (it is registered as a
+    virtual subclass below); alternative backends subclass it, implement the
+    same signatures and return the same qdrant `models` types.
+    """
+
+    @abc.abstractmethod
+    def get_collection(self, collection_name: str):
+        ...
+
+    @abc.abstractmethod
+    def recreate_collection(self, collection_name: str, vectors_config, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def upsert(self, collection_name: str, points: Sequence[models.PointStruct], wait: bool = True, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def search(self, collection_name: str, query_vector, query_filter: Optional[models.Filter] = None,
+               limit: int = 10, with_payload: bool = True, with_vectors=False,
+               score_threshold: Optional[float] = None, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def count(self, collection_name: str, count_filter: Optional[models.Filter] = None, exact: bool = True, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def scroll(self, collection_name: str, scroll_filter: Optional[models.Filter] = None, limit: int = 10,
+               offset=None, with_payload: bool = True, with_vectors=False, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def facet(self, collection_name: str, key: str, facet_filter: Optional[models.Filter] = None,
+              limit: int = 10, exact: bool = False, **kwargs):
+        ...
+
+    @abc.abstractmethod
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        ...
+
+
+VectorStoreBackend.register(QdrantClient)
+
+
+# ============================================================================
+# FILTER EVALUATION
+# ============================================================================
+
+def _value_matches(stored: Any, expected: Any) -> bool:
+    # Qdrant matches array payloads when any element matches
+    if isinstance(stored, list):
+        return expected in stored
+    return stored == expected
+
+
+def _value_in(stored: Any, candidates: set) -> bool:
+    if isinstance(stored, list):
+        return any(_hashable(v) in candidates for v in stored)
+    return _hashable(stored) in candidates
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if not isinstance(value, datetime):
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _in_range(stored: Any, rng) -> bool:
+    if isinstance(stored, list):
+        return any(_in_range(v, rng) for v in stored)
+    if isinstance(rng, models.DatetimeRange):
+        stored = _as_datetime(stored)
+        if stored is None:
+            return False
+        rng = SimpleNamespace(**{bound: _as_datetime(getattr(rng, bound)) for bound in ("gt", "gte", "lt", "lte")})
+    elif not isinstance(stored, (int, float)) or isinstance(stored, bool):
+        return False
+    if rng.gt is not None and not stored > rng.gt: return False
+    if rng.gte is not None and not stored >= rng.gte: return False
+    if rng.lt is not None and not stored < rng.lt: return False
+    if rng.lte is not None and not stored <= rng.lte: return False
+    return True
+
+
+def _text_matches(stored: Any, text: str) -> bool:
+    if isinstance(stored, list):
+        return any(_text_matches(v, text) for v in stored)
+    return isinstance(stored, str) and text in stored
+
+
+def _values_count(stored: Any) -> int:
+    if stored is None:
+        return 0
+    return len(stored) if isinstance(stored, list) else 1
+
+
+def _lookup(value: Any, path: List[str]) -> Any:
+    """Value at a nested payload path; arrays of objects fan out like in Qdrant ("a[].b" or "a.b")."""
+    for part in path:
+        part = part[:-2] if part.endswith("[]") else part
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list):
+            found = [v.get(part) for v in value if isinstance(v, dict)]
+            value = [x for v in found for x in (v if isinstance(v, list) else [v]) if x is not None] or None
+        else:
+            return None
+    return value
+
+
+_vec_matches = np.frompyfunc(_value_matches, 2, 1)
+_vec_in = np.frompyfunc(_value_in, 2, 1)
+_vec_in_range = np.frompyfunc(_in_range, 2, 1)
+_vec_text = np.frompyfunc(_text_matches, 2, 1)
+
+
+class _LocalCollection:
+    """One collection: a vector matrix per vector name plus columnar payload storage."""
+
+    def __init__(self, name: str, sizes: Dict[str, int], dtype: np.dtype, directory: Optional[str]):
+        self.name = name
+        self.sizes = dict(sizes)            # vector name -> dim ("" for a single unnamed vector)
+        self.dtype = np.dtype(dtype)
+        self.directory = directory
+        self.count = 0                      # rows used (including deleted rows)
+        self.ids: List[Any] = []
+        self.seqs: List[int] = []           # insertion sequence per row; scroll offsets survive compaction
+        self.next_seq = 0
+        self.id_to_row: Dict[Any, int] = {}
+        self.columns: Dict[str, List[Any]] = {}
+        self._column_cache: Dict[str, np.ndarray] = {}
+        self.matrices = {vector_name: self._allocate(vector_name, _INITIAL_CAPACITY) for vector_name in self.sizes}
+        self.alive = np.zeros(_INITIAL_CAPACITY, dtype=bool)
+        self.generation = 0                 # bumped by compaction; log entries of older generations are stale
+        self._pending: List[Dict[str, Any]] = []   # log entries not yet persisted
+        self._base_bytes = 0
+        self._log_bytes = 0
+
+    @property
+    def named(self) -> bool:
+        return _UNNAMED not in self.sizes
+
+    @property
+    def capacity(self) -> int:
+        return self.alive.shape[0]
+
+    # --- storage -----------------------------------------------------------
+
+    @staticmethod
+    def _vectors_file(vector_name: str) -> str:
+        return _VECTORS_FILE if vector_name == _UNNAMED else f"vectors.{vector_name}.bin"
+
+    def _allocate(self, vector_name: str, capacity: int, existing: Optional[np.ndarray] = None) -> np.ndarray:
+        size = self.sizes[vector_name]
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, self._vectors_file(vector_name))
+            tmp_path = path + ".tmp"
+            matrix = np.memmap(tmp_path if existing is not None else path, dtype=self.dtype,
+                               mode='w+', shape=(capacity, size))
+            if existing is not None:
+                matrix[:existing.shape[0]] = existing
+                matrix.flush()
+                del existing
+                os.replace(tmp_path, path)
+                matrix = np.memmap(path, dtype=self.dtype, mode='r+', shape=(capacity, size))
+            return matrix
+        matrix = np.zeros((capacity, size), dtype=self.dtype)
+        if existing is not None:
+            matrix[:existing.shape[0]] = existing
+        return matrix
+
+    def _ensure_capacity(self, rows_needed: int) -> None:
+        capacity = self.capacity
+        if rows_needed <= capacity:
+            return
+        new_capacity = capacity
+        while new_capacity < rows_needed:
+            new_capacity *= 2
+        for vector_name, matrix in list(self.matrices.items()):
+            self.matrices[vector_name] = self._allocate(vector_name, new_capacity, existing=matrix)
+        alive = np.zeros(new_capacity, dtype=bool)
+        alive[:capacity] = self.alive
+        self.alive = alive
+
+    def vector_files(self) -> List[str]:
+        return [self._vectors_file(vector_name) for vector_name in self.sizes]
+
+    def _write_json(self, filename: str, content: Any) -> int:
+        path = os.path.join(self.directory, filename)
+        with open(path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(content, f)
+            size = f.tell()
+        os.replace(path + ".tmp", path)
+        return size
+
+    def _write_meta(self) -> None:
+        self._write_json(_META_FILE, {"vectors": self.sizes, "dtype": self.dtype.name, "count": self.count,
+                                      "capacity": int(self.capacity), "generation": self.generation})
+
+    def _write_base(self) -> None:
+        """Rewrite the payload sidecar from memory and start an empty log."""
+        self._base_bytes = self._write_json(_PAYLOAD_FILE, {
+            "generation": self.generation, "ids": self.ids, "seqs": self.seqs, "next_seq": self.next_seq,
+            "alive": self.alive[:self.count].tolist(), "columns": self.columns,
+        })
+        with open(os.path.join(self.directory, _PAYLOAD_LOG_FILE), 'w', encoding='utf-8'):
+            pass
+        self._log_bytes = 0
+        self._pending.clear()
+
+    def persist(self) -> None:
+        """Flush vectors and append this batch's payload changes to the log (O(batch), not O(collection))."""
+        dead = self.count - int(self.alive[:self.count].sum())
+        if dead >= max(_COMPACT_MIN_DEAD_ROWS, self.count * _COMPACT_DEAD_FRACTION):
+            self.compact()
+            return
+        if not self.directory:
+            self._pending.clear()
+            return
+        for matrix in self.matrices.values():
+            if isinstance(matrix, np.memmap):
+                matrix.flush()
+        self._write_meta()
+        if not self._base_bytes:
+            self._write_base()   # first persist of a new collection
+            return
+        if self._pending:
+            lines = "".join(json.dumps(entry, separators=(",", ":")) + "\n" for entry in self._pending)
+            with open(os.path.join(self.directory, _PAYLOAD_LOG_FILE), 'a', encoding='utf-8') as f:
+                f.write(lines)
+            self._log_bytes += len(lines.encode('utf-8'))
+            self._pending.clear()
+        if self._log_bytes > max(_COMPACT_MIN_LOG_BYTES, self._base_bytes):
+            self._write_base()
+
+    def compact(self) -> None:
+        """Drop deleted rows from the matrices and payload columns, then rewrite the sidecar."""
+        keep = np.flatnonzero(self.alive[:self.count])
+        capacity = _INITIAL_CAPACITY
+        while capacity < keep.size:
+            capacity *= 2
+        for vector_name, matrix in list(self.matrices.items()):
+            live = np.array(matrix[keep])
+            self.matrices[vector_name] = self._allocate(vector_name, capacity, existing=live)
+        rows = keep.tolist()
+        self.ids = [self.ids[row] for row in rows]
+        self.seqs = [self.seqs[row] for row in rows]
+        self.columns = {key: [values[row] for row in rows] for key, values in self.columns.items()}
+        self.columns = {key: values for key, values in self.columns.items() if any(v is not None for v in values)}
+        self.count = len(rows)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.alive[:self.count] = True
+        self.id_to_row = {pid: row for row, pid in enumerate(self.ids)}
+        self._column_cache.clear()
+        self.generation += 1
+        if self.directory:
+            self._write_meta()
+            self._write_base()
+        else:
+            self._pending.clear()
+        logger.info(f"LocalVectorStore: compacted '{self.name}' to {self.count} rows")
+
+    @classmethod
+    def load(cls, name: str, directory: str) -> "_LocalCollection":
+        with open(os.path.join(directory, _META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(os.path.join(directory, _PAYLOAD_FILE), 'r', encoding='utf-8') as f:
+            sidecar = json.load(f)
+        collection = cls.__new__(cls)
+        collection.name = name
+        collection.sizes = meta.get("vectors") or {_UNNAMED: meta["size"]}
+        collection.dtype = np.dtype(meta["dtype"])
+        collection.directory = directory
+        collection.generation = sidecar.get("generation", 0)
+        collection.ids = sidecar["ids"]
+        collection.count = len(collection.ids)
+        collection.seqs = sidecar.get("seqs") or list(range(collection.count))
+        collection.next_seq = sidecar.get("next_seq", collection.count)
+        collection.columns = sidecar["columns"]
+        collection._column_cache = {}
+        collection._pending = []
+        collection._base_bytes = os.path.getsize(os.path.join(directory, _PAYLOAD_FILE))
+        collection._log_bytes = 0
+        collection.matrices = {
+            vector_name: np.memmap(os.path.join(directory, cls._vectors_file(vector_name)), dtype=collection.dtype,
+                                   mode='r+', shape=(meta["capacity"], size))
+            for vector_name, size in collection.sizes.items()
+        }
+        collection.alive = np.zeros(meta["capacity"], dtype=bool)
+        collection.alive[:collection.count] = sidecar["alive"]
+        collection.id_to_row = {pid: row for row, pid in enumerate(collection.ids) if collection.alive[row]}
+        collection._replay_log()
+        return collection
+
+    def _replay_log(self) -> None:
+        path = os.path.join(self.directory, _PAYLOAD_LOG_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._log_bytes += len(line.encode('utf-8'))
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"LocalVectorStore: ignoring torn log entry in '{self.name}'")
+                    break
+                if entry.get("gen") != self.generation:
+                    continue   # written before the sidecar was rewritten by compaction
+                if entry["op"] == "upsert":
+                    for row, seq, pid, payload in entry["rows"]:
+                        if row == self.count:
+                            self._append_row(pid, seq)
+                        self.alive[row] = True
+                        self.id_to_row[pid] = row
+                        self._set_payload(row, payload)
+                else:
+                    self._delete_row_state(entry["rows"])
+
+    # --- writes ------------------------------------------------------------
+
+    def upsert(self, points: Sequence[models.PointStruct]) -> None:
+        new_rows = sum(1 for p in points if p.id not in self.id_to_row)
+        self._ensure_capacity(self.count + new_rows)
+        logged = []
+        for point in points:
+            vectors = point.vector if isinstance(point.vector, dict) else {_UNNAMED: point.vector}
+            if vectors.keys() != self.sizes.keys():
+                raise ValueError(f"Point vectors {sorted(vectors)} do not match collection vectors {sorted(self.sizes)}")
+            normalized = {}
+            for vector_name, values in vectors.items():
+                vector = np.asarray(values, dtype=np.float32)
+                if vector.shape != (self.sizes[vector_name],):
+                    raise ValueError(f"Vector dimension {vector.shape} does not match collection size "
+                                     f"{self.sizes[vector_name]}")
+                norm = np.linalg.norm(vector)
+                normalized[vector_name] = vector / norm if norm > 0 else vector
+            row = self.id_to_row.get(point.id)
+            if row is None:
+                row = self.count
+                self._append_row(point.id, self.next_seq)
+                self.id_to_row[point.id] = row
+            for vector_name, vector in normalized.items():
+                self.matrices[vector_name][row] = vector.astype(self.dtype)
+            self.alive[row] = True
+            payload = point.payload or {}
+            self._set_payload(row, payload)
+            logged.append([row, self.seqs[row], point.id, payload])
+        self._pending.append({"gen": self.generation, "op": "upsert", "rows": logged})
+        self._column_cache.clear()
+
+    def _append_row(self, pid: Any, seq: int) -> None:
+        self.count += 1
+        self.ids.append(pid)
+        self.seqs.append(seq)
+        self.next_seq = max(self.next_seq, seq + 1)
+        for column in self.columns.values():
+            column.append(None)
+
+    def _set_payload(self, row: int, payload: Dict[str, Any]) -> None:
+        for key in self.columns.keys() - payload.keys():
+            self.columns[key][row] = None
+        for key, value in payload.items():
+            if key not in self.columns:
+                self.columns[key] = [None] * self.count
+            self.columns[key][row] = value
+
+    def _delete_row_state(self, rows: List[int]) -> None:
+        for row in rows:
+            self.alive[row] = False
+            self.id_to_row.pop(self.ids[row], None)
+            for column in self.columns.values():
+                column[row] = None
+
+    def delete_rows(self, rows: np.ndarray) -> int:
+        rows = rows[self.alive[rows]].tolist()
+        self._delete_row_state(rows)
+        if rows:
+            self._pending.append({"gen": self.generation, "op": "delete", "rows": rows})
+        self._column_cache.clear()
+        return len(rows)
+
+    # --- reads -------------------------------------------------------------
+
+    def column(self, key: str) -> np.ndarray:
+        cached = self._column_cache.get(key)
+        if cached is None:
+            cached = np.empty(self.count, dtype=object)
+            values = self.columns.get(key)
+            if values is None and ("." in key or key.endswith("[]")):
+                head, *path = key.split(".")
+                top = self.columns.get(head[:-2] if head.endswith("[]") else head)
+                if top is not None:
+                    values = [_lookup(v, path) for v in top]
+            if values is not None:
+                cached[:] = values
+            self._column_cache[key] = cached
+        return cached
+
+    def seq_array(self) -> np.ndarray:
+        cached = self._column_cache.get("\0seq")
+        if cached is None:
+            cached = self._column_cache["\0seq"] = np.asarray(self.seqs, dtype=np.int64)
+        return cached
+
+    def _condition_mask(self, condition) -> np.ndarray:
+        if isinstance(condition, models.Filter):
+            return self.filter_mask(condition)
+        if isinstance(condition, models.HasIdCondition):
+            wanted = set(condition.has_id)
+            return np.fromiter((pid in wanted for pid in self.ids), dtype=bool, count=self.count)
+        if isinstance(condition, models.IsEmptyCondition):
+            column = self.column(condition.is_empty.key)
+            return np.fromiter((v is None or v == [] for v in column), dtype=bool, count=self.count)
+        if isinstance(condition, models.IsNullCondition):
+            # Absent keys are stored as None too, so they also count as null here
+            column = self.column(condition.is_null.key)
+            return np.fromiter((v is None for v in column), dtype=bool, count=self.count)
+        if isinstance(condition, models.FieldCondition):
+            column = self.column(condition.key)
+            mask = np.ones(self.count, dtype=bool)
+            match = condition.match
+            if isinstance(match, models.MatchValue):
+                mask &= _vec_matches(column, match.value).astype(bool)
+            elif isinstance(match, models.MatchAny):
+                mask &= _vec_in(column, {_hashable(v) for v in match.any}).astype(bool)
+            elif isinstance(match, models.MatchExcept):
+                present = np.fromiter((v is not None for v in column), dtype=bool, count=self.count)
+                excluded = _vec_in(column, {_hashable(v) for v in getattr(match, 'except_')}).astype(bool)
+                mask &= present & ~excluded
+            elif isinstance(match, models.MatchText):
+                mask &= _vec_text(column, match.text).astype(bool)
+            elif match is not None:
+                raise ValueError(f"LocalVectorStore does not support match type {type(match).__name__}")
+            if condition.range is not None:
+                mask &= _vec_in_range(column, condition.range).astype(bool)
+            if condition.values_count is not None:
+                counts = np.fromiter((_values_count(v) for v in column), dtype=np.int64, count=self.count)
+                mask &= _vec_in_range(counts.astype(object), condition.values_count).astype(bool)
+            if any(getattr(condition, geo, None) is not None for geo in ("geo_bounding_box", "geo_radius", "geo_polygon")):
+                raise ValueError("LocalVectorStore does not support geo filters")
+            return mask
+        raise ValueError(f"LocalVectorStore does not support filter condition {type(condition).__name__}")
+
+    def filter_mask(self, query_filter: Optional[models.Filter]) -> np.ndarray:
+        mask = self.alive[:self.count].copy()
+        if query_filter is None:
+            return mask
+        for condition in query_filter.must or []:
+            mask &= self._condition_mask(condition)
+        if query_filter.should:
+            any_should = np.zeros(self.count, dtype=bool)
+            for condition in query_filter.should:
+                any_should |= self._condition_mask(condition)
+            mask &= any_should
+        for condition in query_filter.must_not or []:
+            mask &= ~self._condition_mask(condition)
+        if query_filter.min_should is not None:
+            satisfied = np.zeros(self.count, dtype=np.int64)
+            for condition in query_filter.min_should.conditions:
+                satisfied += self._condition_mask(condition)
+            mask &= satisfied >= query_filter.min_should.min_count
+        return mask
+
+    def payload(self, row: int, with_payload) -> Optional[Dict[str, Any]]:
+        if not with_payload:
+            return None
+        keys = self.columns.keys() if with_payload is True else with_payload
+        return {k: self.columns[k][row] for k in keys if k in self.columns and self.columns[k][row] is not None}
+
+    def vector(self, row: int, with_vectors):
+        if not with_vectors:
+            return None
+        if not self.named:
+            return self.matrices[_UNNAMED][row].astype(np.float32).tolist()
+        names = self.sizes.keys() if with_vectors is True else with_vectors
+        return {n: self.matrices[n][row].astype(np.float32).tolist() for n in names if n in self.matrices}
+
+
+# ============================================================================
+# LOCAL BACKEND
+# ============================================================================
+
+class LocalVectorStore(VectorStoreBackend):
+    """
+    Brute-force vector store with QdrantClient-compatible methods.
+
+    Cosine distance only: vectors are L2-normalized on insert so a search is a
+    single matrix-vector product over the rows that pass the payload filter.
+
+    Usage:
+        store = LocalVectorStore(path="/data/vectors", dtype="float16")
+        store.recreate_collection("docs", models.VectorParams(size=1024, distance=models.Distance.COSINE))
+        store.upsert("docs", points)
+        hits = store.search("docs", query_vector=embedding, limit=5)
+    """
+
+    def __init__(self, path: Optional[str] = None, dtype: str = "float32"):
+        if np.dtype(dtype) not in (np.dtype(np.float32), np.dtype(np.float16)):
+            raise ValueError(f"Unsupported LocalVectorStore dtype '{dtype}'. Use float32 or float16.")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._collections: Dict[str, _LocalCollection] = {}
+        self._lock = threading.RLock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                directory = os.path.join(path, name)
+                if os.path.isfile(os.path.join(directory, _META_FILE)):
+                    try:
+                        self._collections[name] = _LocalCollection.load(name, directory)
+                    except Exception as e:
+                        logger.error(f"LocalVectorStore: could not load collection '{name}': {e}", exc_info=True)
+        logger.info(f"LocalVectorStore initialized (path={path or 'in-memory'}, dtype={self.dtype.name}, "
+                    f"collections={list(self._collections)})")
+
+    def _get(self, collection_name: str) -> _LocalCollection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            raise ValueError(f"Collection '{collection_name}' not found")
+        return collection
+
+    # --- collections -------------------------------------------------------
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections
+
+    def get_collection(self, collection_name: str):
+        collection = self._get(collection_name)
+        vectors = {n: models.VectorParams(size=size, distance=models.Distance.COSINE) for n, size in collection.sizes.items()}
+        if not collection.named:
+            vectors = vectors[_UNNAMED]
+        return SimpleNamespace(
+            status=models.CollectionStatus.GREEN,
+            points_count=int(collection.alive[:collection.count].sum()),
+            config=SimpleNamespace(params=SimpleNamespace(vectors=vectors)),
+        )
+
+    def create_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        params = vectors_config if isinstance(vectors_config, dict) else {_UNNAMED: vectors_config}
+        if any(p.distance != models.Distance.COSINE for p in params.values()):
+            raise ValueError("LocalVectorStore only supports cosine distance")
+        with self._lock:
+            directory = os.path.join(self.path, collection_name) if self.path else None
+            sizes = {vector_name: p.size for vector_name, p in params.items()}
+            collection = _LocalCollection(collection_name, sizes, self.dtype, directory)
+            collection.persist()
+            self._collections[collection_name] = collection
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+            if collection and collection.directory:
+                files = collection.vector_files() + [_META_FILE, _PAYLOAD_FILE, _PAYLOAD_LOG_FILE]
+                collection.matrices.clear()
+                for filename in files:
+                    try: os.remove(os.path.join(collection.directory, filename))
+                    except FileNotFoundError: pass
+        return collection is not None
+
+    def recreate_collection(self, collection_name: str, vectors_config, **kwargs) -> bool:
+        self.delete_collection(collection_name)
+        return self.create_collection(collection_name, vectors_config)
+
+    # --- points ------------------------------------------------------------
+
+    def upsert(self, collection_name: str, points: Sequence[models.PointStruct], wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            collection.upsert(points)
+            collection.persist()
+        return models.UpdateResult(operation_id=0, status=models.UpdateStatus.COMPLETED)
+
+    def delete(self, collection_name: str, points_selector, wait: bool = True, **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            if isinstance(points_selector, models.FilterSelector):
+                rows = np.flatnonzero(collection.filter_mask(points_selector.filter))
+            elif isinstance(points_selector, models.PointIdsList):
+                rows = np.array([collection.id_to_row[pid] for pid in points_selector.points
+                                 if pid in collection.id_to_row], dtype=np.int64)
+            elif isinstance(points_selector, models.Filter):
+                rows = np.flatnonzero(collection.filter_mask(points_selector))
+            else:
+                rows = np.array([collection.id_to_row[pid] for pid in points_selector
+                                 if pid in collection.id_to_row], dtype=np.int64)
+            collection.delete_rows(rows)
+            collection.persist()
+        return models.UpdateResult(operation_id=0, status=models.UpdateStatus.COMPLETED)
+
+    def count(self, collection_name: str, count_filter: Optional[models.Filter] = None, exact: bool = True, **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            return models.CountResult(count=int(collection.filter_mask(count_filter).sum()))
+
+    def facet(self, collection_name: str, key: str, facet_filter: Optional[models.Filter] = None,
+              limit: int = 10, exact: bool = False, **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            column = collection.column(key)[collection.filter_mask(facet_filter)]
+            counts: Dict[Any, int] = {}
+            for value in column.tolist():
+                # Like Qdrant: each distinct element of an array payload counts once per point
+                for item in set(map(_hashable, value)) if isinstance(value, list) else (value,):
+                    if isinstance(item, (str, int, bool)):
+                        counts[item] = counts.get(item, 0) + 1
+        hits = sorted(counts.items(), key=lambda hit: (-hit[1], str(hit[0])))[:limit]
+        return models.FacetResponse(hits=[models.FacetValueHit(value=value, count=count) for value, count in hits])
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema=None, **kwargs):
+        # Filters scan the in-memory payload columns; there is nothing to index
+        with self._lock:
+            self._get(collection_name)
+        return models.UpdateResult(operation_id=0, status=models.UpdateStatus.COMPLETED)
+
+    def scroll(self, collection_name: str, scroll_filter: Optional[models.Filter] = None, limit: int = 10,
+               offset=None, with_payload: bool = True, with_vectors=False, **kwargs):
+        with self._lock:
+            collection = self._get(collection_name)
+            rows = np.flatnonzero(collection.filter_mask(scroll_filter))
+            # Offsets are insertion sequence numbers, which compaction preserves (row numbers it does not)
+            seqs = collection.seq_array()
+            rows = rows[seqs[rows] >= int(offset or 0)]
+            page, rest = rows[:limit], rows[limit:]
+            records = [
+                models.Record(id=collection.ids[row], payload=collection.payload(row, with_payload),
+                              vector=collection.vector(row, with_vectors))
+                for row in page.tolist()
+            ]
+            next_offset = int(seqs[rest[0]]) if rest.size else None
+        return records, next_offset
+
+    def search(self, collection_name: str, query_vector, query_filter: Optional[models.Filter] = None,
+               limit: int = 10, with_payload: bool = True, with_vectors=False,
+               score_threshold: Optional[float] = None, **kwargs) -> List[models.ScoredPoint]:
+        vector_name = _UNNAMED
+        if isinstance(query_vector, tuple):                  # (vector_name, vector)
+            vector_name, query_vector = query_vector
+        elif hasattr(query_vector, 'name') and hasattr(query_vector, 'vector'):   # models.NamedVector
+            vector_name, query_vector = query_vector.name, query_vector.vector
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        with self._lock:
+            collection = self._get(collection_name)
+            matrix = collection.matrices.get(vector_name)
+            if matrix is None:
+                raise ValueError(f"Collection '{collection_name}' has no vector named '{vector_name}'")
+            rows = np.flatnonzero(collection.filter_mask(query_filter))
+            if rows.size == 0 or limit <= 0:
+                return []
+            scores = matrix[rows].astype(np.float32) @ query
+            if score_threshold is not None:
+                keep = scores >= score_threshold
+                rows, scores = rows[keep], scores[keep]
+            if rows.size > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+                rows, scores = rows[top], scores[top]
+            order = np.argsort(-scores, kind='stable')
+            return [
+                models.ScoredPoint(id=collection.ids[row], version=0, score=float(score),
+                                   payload=collection.payload(row, with_payload),
+                                   vector=collection.vector(row, with_vectors))
+                for row, score in zip(rows[order].tolist(), scores[order].tolist())
+            ]
+
+
+# ============================================================================
+# L1 CACHE FOR PER-DOCUMENT SEARCHES
+# ============================================================================
+
+class DocumentSearchCache:
+    """
+    Keeps the vectors of recently searched documents in an in-memory
+    LocalVectorStore, so repeated searches scoped to one document (the
+    /query documentContextName case) skip the round trip to Qdrant.
+
+    Entries expire after VECTOR_L1_CACHE_TTL_SECONDS and are evicted
+    least-recently-used beyond VECTOR_L1_CACHE_MAX_DOCS. Writers must call
+    invalidate() when a document's points change.
+
+    A miss scrolls Qdrant without holding the cache lock, so lookups for other
+    documents are not held up; concurrent misses on one document share a
+    single load.
+    """
+
+    def __init__(self, vector_dim: int, max_docs: int, max_points: int, ttl_seconds: int):
+        self.vector_dim = vector_dim
+        self.max_docs = max_docs
+        self.max_points = max_points
+        self.ttl_seconds = ttl_seconds
+        self._store = LocalVectorStore(path=None)
+        self._entries: "OrderedDict[str, float]" = OrderedDict()   # file_name -> loaded_at
+        self._oversized: Dict[str, float] = {}                      # file_name -> checked_at
+        self._invalidations: Dict[str, int] = {}                    # file_name -> invalidate() calls
+        self._invalidated_all = 0
+        self._loads = SingleFlight("l1_cache_load")
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def document_scope(query_filter: Optional[models.Filter]) -> Optional[str]:
+        """The file_name a filter is scoped to, if it is exactly a single-document filter."""
+        if query_filter is None or query_filter.should or query_filter.must_not:
+            return None
+        must = query_filter.must or []
+        if len(must) != 1:
+            return None
+        condition = must[0]
+        if (isinstance(condition, models.FieldCondition) and condition.key == "file_name"
+                and isinstance(condition.match, models.MatchValue)):
+            return condition.match.value
+        return None
+
+    def _collection(self, file_name: str) -> str:
+        return f"doc::{file_name}"
+
+    def _fresh(self, loaded_at: float) -> bool:
+        return time.time() - loaded_at < self.ttl_seconds
+
+    def _version(self, file_name: str) -> tuple:
+        return self._invalidated_all, self._invalidations.get(file_name, 0)
+
+    def _load(self, client, collection_name: str, file_name: str) -> bool:
+        with self._lock:
+            version = self._version(file_name)
+        scope = models.Filter(must=[models.FieldCondition(key="file_name", match=models.MatchValue(value=file_name))])
+        points, offset = [], None
+        while True:
+            records, offset = client.scroll(collection_name=collection_name, scroll_filter=scope, limit=256,
+                                            offset=offset, with_payload=True, with_vectors=True)
+            points.extend(models.PointStruct(id=r.id, vector=matryoshka.full_vector(r.vector), payload=r.payload or {})
+                          for r in records)
+            if len(points) > self.max_points:
+                with self._lock:
+                    if self._version(file_name) == version:
+                        self._oversized[file_name] = time.time()
+                return False
+            if offset is None:
+                break
+
+        with self._lock:
+            if self._version(file_name) != version:
+                return False   # invalidated while loading; the points may be stale
+            self._store.recreate_collection(self._collection(file_name),
+                                            models.VectorParams(size=self.vector_dim, distance=models.Distance.COSINE))
+            if points:
+                self._store.upsert(self._collection(file_name), points)
+            self._entries[file_name] = time.time()
+            self._entries.move_to_end(file_name)
+            while len(self._entries) > self.max_docs:
+                evicted, _ = self._entries.popitem(last=False)
+                self._store.delete_collection(self._collection(evicted))
+        logger.info(f"L1 vector cache: loaded {len(points)} points for '{file_name}'")
+        return True
+
+    def search(self, client, collection_name: str, file_name: str, query_vector, limit: int,
+               score_threshold: Optional[float]) -> Optional[List[models.ScoredPoint]]:
+        """Search one document from the cache, loading it on a miss. None means "not cacheable"."""
+        with self._lock:
+            checked_at = self._oversized.get(file_name)
+            if checked_at is not None and self._fresh(checked_at):
+                return None
+            loaded_at = self._entries.get(file_name)
+            hit = loaded_at is not None and self._fresh(loaded_at)
+            if hit:
+                self._entries.move_to_end(file_name)
+        if not hit and not self._loads.do(file_name, lambda: self._load(client, collection_name, file_name)):
+            return None
+        try:
+            return self._store.search(self._collection(file_name), query_vector=query_vector, limit=limit,
+                                      with_payload=True, score_threshold=score_threshold)
+        except ValueError:
+            return None   # evicted or invalidated since it was loaded
+
+    def invalidate(self, file_name: Optional[str] = None) -> None:
+        with self._lock:
+            if file_name is None:
+                self._invalidated_all += 1
+            else:
+                self._invalidations[file_name] = self._invalidations.get(file_name, 0) + 1
+            names = list(self._entries) if file_name is None else [file_name]
+            for name in names:
+                if self._entries.pop(name, None) is not None:
+                    self._store.delete_collection(self._collection(name))
+            if file_name is None:
+                self._oversized.clear()
+            else:
+                self._oversized.pop(file_name, None)
+
+
+# ============================================================================
+# BACKEND FACTORY
+# ============================================================================
+
+def create_vector_store_client():
+    """
+    Create the vector store client configured by VECTOR_STORE_BACKEND.
+
+    - "qdrant" (default): QdrantClient against QDRANT_URL or QDRANT_HOST/PORT
+    - "local": LocalVectorStore persisted under LOCAL_VECTOR_STORE_PATH
+    """
+    backend = config.VECTOR_STORE_BACKEND
+    if backend == "local":
+        return LocalVectorStore(path=config.LOCAL_VECTOR_STORE_PATH, dtype=config.LOCAL_VECTOR_STORE_DTYPE)
+    if backend != "qdrant":
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}'. Expected 'qdrant' or 'local'.")
+
+    from qdrant_client import QdrantClient
+    if config.QDRANT_URL:
+        return QdrantClient(url=config.QDRANT_URL, api_key=config.QDRANT_API_KEY, timeout=30)
+    return QdrantClient(host=config.QDRANT_HOST, port=config.QDRANT_PORT, api_key=config.QDRANT_API_KEY, timeout=30)
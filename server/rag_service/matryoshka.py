@@ -0,0 +1,124 @@
+# server/rag_service/matryoshka.py
+"""
+Matryoshka Two-Stage Retrieval
+
+mxbai-embed-large-v1 is trained with Matryoshka representation learning: the
+first N dimensions of an embedding are themselves a usable (coarser) embedding.
+With MATRYOSHKA_ENABLED the collection stores two named vectors per point:
+- MATRYOSHKA_FULL_VECTOR_NAME: the full document embedding
+- MATRYOSHKA_SHORT_VECTOR_NAME: its first MATRYOSHKA_DIM dimensions
+
+Searches then run in two stages:
+1. Pull limit * MATRYOSHKA_CANDIDATE_MULTIPLIER candidates with the short vector
+2. Rescore those candidates with the full vector and keep the top `limit`
+
+The helpers below are shared by VectorDBService, the snapshot import and
+the L1 cache so every writer produces the same point layout.
+"""
+
+import logging
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+from qdrant_client import models
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def vectors_config(full_dim: int) -> Union[models.VectorParams, Dict[str, models.VectorParams]]:
+    """Collection vector layout for the configured mode."""
+    if not config.MATRYOSHKA_ENABLED:
+        return models.VectorParams(size=full_dim, distance=models.Distance.COSINE)
+    return {
+        config.MATRYOSHKA_FULL_VECTOR_NAME: models.VectorParams(size=full_dim, distance=models.Distance.COSINE),
+        config.MATRYOSHKA_SHORT_VECTOR_NAME: models.VectorParams(size=config.MATRYOSHKA_DIM, distance=models.Distance.COSINE),
+    }
+
+
+def layout_matches(vectors: Any) -> bool:
+    """
+    Whether an existing collection's vector config has the named/unnamed
+    layout the configured mode expects. Sizes of the full vector are checked
+    separately by VectorDBService.setup_collection.
+    """
+    if not config.MATRYOSHKA_ENABLED:
+        return not isinstance(vectors, dict)
+    if not isinstance(vectors, dict) or config.MATRYOSHKA_FULL_VECTOR_NAME not in vectors:
+        return False
+    short = vectors.get(config.MATRYOSHKA_SHORT_VECTOR_NAME)
+    return short is not None and short.size == config.MATRYOSHKA_DIM
+
+
+def truncate(vector: List[float], dim: Optional[int] = None) -> List[float]:
+    """Matryoshka prefix of an embedding (cosine distance renormalizes it)."""
+    return list(vector[:dim or config.MATRYOSHKA_DIM])
+
+
+def point_vector(vector: List[float], named: Optional[bool] = None) -> Union[List[float], Dict[str, List[float]]]:
+    """The `vector` field of a PointStruct for a full embedding."""
+    if named is None:
+        named = config.MATRYOSHKA_ENABLED
+    if not named:
+        return vector
+    return {
+        config.MATRYOSHKA_FULL_VECTOR_NAME: vector,
+        config.MATRYOSHKA_SHORT_VECTOR_NAME: truncate(vector),
+    }
+
+
+def full_vector(stored: Any) -> Optional[List[float]]:
+    """The full embedding from a record's `vector` field, whichever layout it uses."""
+    if isinstance(stored, dict):
+        return stored.get(config.MATRYOSHKA_FULL_VECTOR_NAME)
+    return stored
+
+
+def two_stage_search(
+    client,
+    collection_name: str,
+    query_vector: List[float],
+    query_filter: Optional[models.Filter],
+    limit: int,
+    score_threshold: Optional[float] = None,
+    candidate_limit: Optional[int] = None,
+    short_dim: Optional[int] = None
+) -> List[models.ScoredPoint]:
+    """
+    Short-vector candidate search followed by full-vector rescoring.
+
+    The score threshold is applied to the rescored (full-vector) cosine, so
+    results are comparable with a plain single-stage search.
+    """
+    candidate_limit = candidate_limit or limit * max(1, config.MATRYOSHKA_CANDIDATE_MULTIPLIER)
+    candidates = client.search(
+        collection_name=collection_name,
+        query_vector=(config.MATRYOSHKA_SHORT_VECTOR_NAME, truncate(query_vector, short_dim)),
+        query_filter=query_filter,
+        limit=candidate_limit,
+        with_payload=True,
+        with_vectors=[config.MATRYOSHKA_FULL_VECTOR_NAME]
+    )
+    if not candidates:
+        return []
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    query /= np.linalg.norm(query) or 1.0
+    matrix = np.asarray([full_vector(p.vector) for p in candidates], dtype=np.float32)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    scores = matrix @ query
+
+    order = np.argsort(-scores, kind='stable')
+    results = []
+    for idx in order.tolist():
+        score = float(scores[idx])
+        if score_threshold is not None and score < score_threshold:
+            break
+        point = candidates[idx]
+        point.score = score
+        point.vector = None
+        results.append(point)
+        if len(results) == limit:
+            break
+    return results
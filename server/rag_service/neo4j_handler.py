@@ -1,12 +1,52 @@
 # server/rag_service/neo4j_handler.py
 
+import re
+import json
+import time
+import asyncio
+import hashlib
 import logging
-from neo4j import GraphDatabase, exceptions as neo4j_exceptions
+import threading
+from collections import OrderedDict
+from typing import Optional
+from neo4j import GraphDatabase, AsyncGraphDatabase, exceptions as neo4j_exceptions
 import config
 
 logger = logging.getLogger(__name__)
 
-# --- Neo4j Driver Management (No changes here) ---
+# --- Connection pool metrics (exported on /metrics via the default Prometheus registry) ---
+try:
+    from prometheus_client import Gauge, Histogram
+    _POOL_MAX_SIZE = Gauge("neo4j_pool_max_size", "Configured Neo4j connection pool size", ["driver"])
+    _POOL_IN_USE = Gauge("neo4j_pool_in_use", "Neo4j sessions currently holding or waiting for a connection", ["driver"])
+    _POOL_WAIT_SECONDS = Histogram(
+        "neo4j_pool_wait_seconds", "Time from opening a session until its transaction function starts "
+        "(connection acquisition and routing)", ["driver"],
+        buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+except ImportError:
+    _POOL_MAX_SIZE = _POOL_IN_USE = _POOL_WAIT_SECONDS = None
+
+
+def _pool_config():
+    """Connection pool settings shared by the sync and async drivers."""
+    return {
+        "max_connection_pool_size": config.NEO4J_MAX_CONNECTION_POOL_SIZE,
+        "connection_acquisition_timeout": config.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+        "max_connection_lifetime": config.NEO4J_MAX_CONNECTION_LIFETIME,
+    }
+
+
+def _track_in_use(driver_label, delta):
+    if _POOL_IN_USE is not None:
+        _POOL_IN_USE.labels(driver=driver_label).inc(delta)
+
+
+def _observe_wait(driver_label, started):
+    if _POOL_WAIT_SECONDS is not None:
+        _POOL_WAIT_SECONDS.labels(driver=driver_label).observe(time.perf_counter() - started)
+
+
+# --- Neo4j Driver Management ---
 _neo4j_driver = None
 def init_driver():
     global _neo4j_driver
@@ -16,6 +56,7 @@ def init_driver():
             try:
                 with _neo4j_driver.session(database=config.NEO4J_DATABASE) as session:
                     session.execute_write(_create_fulltext_index_if_not_exists)
+                _bootstrap_schema(_neo4j_driver)
             except Exception as e:
                 logger.warning(f"Neo4j: Could not execute index creation during init_driver (non-fatal if already exists): {e}")
             return # Driver already initialized and healthy, index check done
@@ -23,12 +64,15 @@ def init_driver():
             if _neo4j_driver: _neo4j_driver.close()
             _neo4j_driver = None # Reset if not healthy
     try:
-        _neo4j_driver = GraphDatabase.driver(config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD))
+        _neo4j_driver = GraphDatabase.driver(config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD), **_pool_config())
         _neo4j_driver.verify_connectivity()
+        if _POOL_MAX_SIZE is not None:
+            _POOL_MAX_SIZE.labels(driver="sync").set(config.NEO4J_MAX_CONNECTION_POOL_SIZE)
         logger.info(f"Neo4j driver initialized. Connected to: {config.NEO4J_URI}")
         
         with _neo4j_driver.session(database=config.NEO4J_DATABASE) as session:
             session.execute_write(_create_fulltext_index_if_not_exists)
+        _bootstrap_schema(_neo4j_driver)
 
     except Exception as e:
         logger.critical(f"Failed to initialize Neo4j driver: {e}", exc_info=True)
@@ -40,17 +84,115 @@ def get_driver_instance():
 def close_driver():
     global _neo4j_driver
     if _neo4j_driver: _neo4j_driver.close(); _neo4j_driver = None
+    close_async_driver()
 def check_neo4j_connectivity():
     try: get_driver_instance().verify_connectivity(); return True, "connected"
     except Exception as e: return False, f"disconnected: {e}"
+
+
+# --- Shared async driver ---
+# An AsyncDriver is bound to the event loop it runs on, while Flask runs each
+# async view on a fresh loop. The shared driver therefore lives on one
+# dedicated background loop; async_read() can be awaited from any loop and
+# run_read() is the blocking wrapper for sync code and Flask routes.
+_async_loop = None
+_async_driver = None
+_async_lock = threading.Lock()
+
+
+def _get_async_loop():
+    global _async_loop, _async_driver
+    with _async_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="neo4j-async-driver", daemon=True).start()
+
+            async def create():
+                return AsyncGraphDatabase.driver(config.NEO4J_URI, auth=(config.NEO4J_USERNAME, config.NEO4J_PASSWORD),
+                                                 **_pool_config())
+            _async_driver = asyncio.run_coroutine_threadsafe(create(), loop).result()
+            _async_loop = loop
+            if _POOL_MAX_SIZE is not None:
+                _POOL_MAX_SIZE.labels(driver="async").set(config.NEO4J_MAX_CONNECTION_POOL_SIZE)
+            logger.info(f"Neo4j async driver initialized for {config.NEO4J_URI}")
+        return _async_loop
+
+
+async def _read_on_async_driver(cypher, params):
+    started = time.perf_counter()
+
+    async def work(tx):
+        _observe_wait("async", started)
+        result = await tx.run(cypher, params)
+        return await result.data()
+
+    _track_in_use("async", 1)
+    try:
+        async with _async_driver.session(database=config.NEO4J_DATABASE) as session:
+            return await session.execute_read(work)
+    finally:
+        _track_in_use("async", -1)
+
+
+async def async_read(cypher, /, **params):
+    """Run a read query on the shared async driver from any event loop; returns records as dicts."""
+    future = asyncio.run_coroutine_threadsafe(_read_on_async_driver(cypher, params), _get_async_loop())
+    return await asyncio.wrap_future(future)
+
+
+def run_read(cypher, /, **params):
+    """Blocking wrapper around async_read for sync callers."""
+    future = asyncio.run_coroutine_threadsafe(_read_on_async_driver(cypher, params), _get_async_loop())
+    return future.result()
+
+
+def close_async_driver():
+    global _async_loop, _async_driver
+    with _async_lock:
+        if _async_loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(_async_driver.close(), _async_loop).result(timeout=10)
+        except Exception as e:
+            logger.warning(f"Neo4j: Error closing async driver: {e}")
+        _async_loop.call_soon_threadsafe(_async_loop.stop)
+        _async_loop = _async_driver = None
+
+
+def _instrumented(tx_function, started):
+    def run(tx, *args, **kwargs):
+        _observe_wait("sync", started)
+        return tx_function(tx, *args, **kwargs)
+    return run
+
+
 def _execute_read_tx(tx_function, *args, **kwargs):
-    with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
-        return session.execute_read(tx_function, *args, **kwargs)
+    started = time.perf_counter()
+    _track_in_use("sync", 1)
+    try:
+        with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
+            return session.execute_read(_instrumented(tx_function, started), *args, **kwargs)
+    finally:
+        _track_in_use("sync", -1)
 def _execute_write_tx(tx_function, *args, **kwargs):
-    with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
-        return session.execute_write(tx_function, *args, **kwargs)
+    started = time.perf_counter()
+    _track_in_use("sync", 1)
+    try:
+        with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
+            return session.execute_write(_instrumented(tx_function, started), *args, **kwargs)
+    finally:
+        _track_in_use("sync", -1)
+# Fulltext index used by KG search. `search_scope` is a single-token key per
+# (userId, document), so searches are restricted to one tenant's document
+# inside the Lucene query itself rather than filtered after the index LIMIT.
+KG_SEARCH_INDEX_NAME = "node_scoped_search_index"
+# Fulltext index over Topic/Subtopic names, scoped per course the same way
+# through a single-token `search_scope` (see course_search_scope).
+CURRICULUM_TOPIC_INDEX_NAME = "curriculum_topic_search_index"
+
+
 def _create_fulltext_index_if_not_exists(tx):
-    index_name = "node_search_index"
+    index_name = KG_SEARCH_INDEX_NAME
     
     result = tx.run(f"SHOW FULLTEXT INDEXES WHERE name = '{index_name}'")
     if result.single():
@@ -59,7 +201,7 @@ def _create_fulltext_index_if_not_exists(tx):
 
     create_query = (
         f"CREATE FULLTEXT INDEX {index_name} "
-        f"FOR (n:KnowledgeNode) ON EACH [n.nodeId, n.description] "
+        f"FOR (n:KnowledgeNode) ON EACH [n.nodeId, n.description, n.search_scope] "
         f"OPTIONS {{indexConfig: {{`fulltext.analyzer`: 'standard', `fulltext.eventually_consistent`: true}}}}"
     )
     try:
@@ -72,85 +214,448 @@ def _create_fulltext_index_if_not_exists(tx):
         else:
             logger.error(f"Neo4j: Failed to create full-text index '{index_name}': {e}", exc_info=True)
             raise #
-            
-def _delete_kg_transactional(tx, user_id, document_name):
-    query = "MATCH (n:KnowledgeNode {userId: $userId, documentName: $documentName}) DETACH DELETE n"
-    tx.run(query, userId=user_id, documentName=document_name)
-    return True
-def _add_nodes_transactional(tx, nodes_param, user_id, document_name):
-    processed_nodes = [
-        {"id": n["id"].strip(), "type": n.get("type", "concept"), "description": n.get("description", ""), "llm_parent_id": n.get("parent")}
-        for n in nodes_param if isinstance(n.get("id"), str) and n.get("id").strip()
+
+
+# --- Schema Bootstrap (constraints, range indexes, key migration) ---
+# Reads and MERGEs match on pre-normalized keys instead of toLower(...) so
+# Neo4j can answer them from these indexes:
+#   Module/Topic/Subtopic: course_key  = lower(trim(course))
+#   KnowledgeNode:         document_key = lower(trim(documentName))
+_SCHEMA_STATEMENTS = [
+    "CREATE CONSTRAINT module_id_course_key IF NOT EXISTS FOR (n:Module) REQUIRE (n.id, n.course_key) IS UNIQUE",
+    "CREATE CONSTRAINT topic_id_course_key IF NOT EXISTS FOR (n:Topic) REQUIRE (n.id, n.course_key) IS UNIQUE",
+    "CREATE CONSTRAINT subtopic_id_course_key IF NOT EXISTS FOR (n:Subtopic) REQUIRE (n.id, n.course_key) IS UNIQUE",
+    "CREATE CONSTRAINT knowledge_node_identity IF NOT EXISTS FOR (n:KnowledgeNode) REQUIRE (n.userId, n.document_key, n.nodeId) IS UNIQUE",
+    "CREATE INDEX module_course_key IF NOT EXISTS FOR (n:Module) ON (n.course_key)",
+    "CREATE INDEX topic_course_key IF NOT EXISTS FOR (n:Topic) ON (n.course_key)",
+    "CREATE INDEX subtopic_course_key IF NOT EXISTS FOR (n:Subtopic) ON (n.course_key)",
+    "CREATE INDEX knowledge_node_user_document_key IF NOT EXISTS FOR (n:KnowledgeNode) ON (n.userId, n.document_key)",
+    f"CREATE FULLTEXT INDEX {CURRICULUM_TOPIC_INDEX_NAME} IF NOT EXISTS FOR (n:Topic|Subtopic) ON EACH [n.name, n.search_scope] "
+    "OPTIONS {indexConfig: {`fulltext.analyzer`: 'standard', `fulltext.eventually_consistent`: true}}",
+]
+_KEY_MIGRATION_ID = "course_and_document_keys_v1"
+_KEY_MIGRATION_BATCH_SIZE = 10000
+_SCOPE_MIGRATION_ID = "kg_search_scope_v1"
+_COURSE_SCOPE_MIGRATION_ID = "curriculum_search_scope_v1"
+
+
+def document_key(document_name: str) -> str:
+    """Case-insensitive key for a KnowledgeNode document name (stored as `document_key`)."""
+    return (document_name or "").strip().lower()
+
+
+def search_scope(user_id: str, document_name: str) -> str:
+    """Single-token fulltext key for one user's document (stored as `search_scope`)."""
+    digest = hashlib.sha1(f"{user_id}\x1f{document_key(document_name)}".encode("utf-8")).hexdigest()
+    return f"scope{digest}"
+
+
+def course_search_scope(course: str) -> str:
+    """Single-token fulltext key for one course's Topic/Subtopic nodes (stored as `search_scope`)."""
+    digest = hashlib.sha1((course or "").strip().lower().encode("utf-8")).hexdigest()
+    return f"course{digest}"
+
+
+def _migrate_search_scope(session):
+    """Backfill `search_scope` (computed here, Cypher has no sha1) on KG nodes written before it existed."""
+    if session.run("MATCH (m:SchemaMigration {id: $id}) RETURN m", id=_SCOPE_MIGRATION_ID).single():
+        return
+    groups = session.run(
+        "MATCH (n:KnowledgeNode) WHERE n.search_scope IS NULL "
+        "RETURN DISTINCT n.userId AS userId, coalesce(n.document_key, toLower(trim(n.documentName))) AS documentKey"
+    ).data()
+    rows = [{"userId": g["userId"], "documentKey": g["documentKey"], "scope": search_scope(g["userId"], g["documentKey"])}
+            for g in groups if g["userId"] is not None and g["documentKey"] is not None]
+    for start in range(0, len(rows), 500):
+        session.run(
+            "UNWIND $rows AS row "
+            "MATCH (n:KnowledgeNode {userId: row.userId, document_key: row.documentKey}) WHERE n.search_scope IS NULL "
+            "SET n.search_scope = row.scope",
+            rows=rows[start:start + 500]
+        ).consume()
+    if rows:
+        logger.info(f"Neo4j: Backfilled search_scope for {len(rows)} KG documents.")
+    session.run("MERGE (m:SchemaMigration {id: $id}) SET m.appliedAt = datetime()", id=_SCOPE_MIGRATION_ID)
+
+
+def _migrate_course_search_scope(session):
+    """Backfill `search_scope` on Topic/Subtopic nodes written before the curriculum topic index."""
+    if session.run("MATCH (m:SchemaMigration {id: $id}) RETURN m", id=_COURSE_SCOPE_MIGRATION_ID).single():
+        return
+    keys = session.run(
+        "MATCH (n) WHERE (n:Topic OR n:Subtopic) AND n.search_scope IS NULL AND n.course_key IS NOT NULL "
+        "RETURN DISTINCT n.course_key AS courseKey"
+    ).data()
+    rows = [{"courseKey": k["courseKey"], "scope": course_search_scope(k["courseKey"])} for k in keys]
+    for label in ("Topic", "Subtopic"):
+        session.run(
+            f"UNWIND $rows AS row MATCH (n:{label} {{course_key: row.courseKey}}) WHERE n.search_scope IS NULL "
+            "SET n.search_scope = row.scope",
+            rows=rows
+        ).consume()
+    if rows:
+        logger.info(f"Neo4j: Backfilled search_scope for {len(rows)} curriculum courses.")
+    session.run("MERGE (m:SchemaMigration {id: $id}) SET m.appliedAt = datetime()", id=_COURSE_SCOPE_MIGRATION_ID)
+
+
+def _migrate_keys(session):
+    """Backfill course_key/document_key on nodes written before the keys existed."""
+    if session.run("MATCH (m:SchemaMigration {id: $id}) RETURN m", id=_KEY_MIGRATION_ID).single():
+        return
+    backfills = [
+        (label, f"MATCH (n:{label}) WHERE n.course_key IS NULL AND n.course IS NOT NULL "
+                f"WITH n LIMIT $batch SET n.course_key = toLower(trim(n.course)) RETURN count(n) AS updated")
+        for label in ("Module", "Topic", "Subtopic")
+    ] + [
+        ("KnowledgeNode", "MATCH (n:KnowledgeNode) WHERE n.document_key IS NULL AND n.documentName IS NOT NULL "
+                          "WITH n LIMIT $batch SET n.document_key = toLower(trim(n.documentName)) RETURN count(n) AS updated")
     ]
+    for label, query in backfills:
+        total = 0
+        while True:
+            updated = session.run(query, batch=_KEY_MIGRATION_BATCH_SIZE).single()['updated']
+            total += updated
+            if updated < _KEY_MIGRATION_BATCH_SIZE:
+                break
+        if total:
+            logger.info(f"Neo4j: Migrated {total} {label} nodes to pre-normalized keys.")
+    session.run("MERGE (m:SchemaMigration {id: $id}) SET m.appliedAt = datetime()", id=_KEY_MIGRATION_ID)
+
+
+def _bootstrap_schema(driver):
+    """Create constraints/indexes and run the key migration. Failures are logged, not raised."""
+    with driver.session(database=config.NEO4J_DATABASE) as session:
+        try:
+            _migrate_keys(session)
+        except Exception as e:
+            logger.error(f"Neo4j: Key migration '{_KEY_MIGRATION_ID}' failed: {e}", exc_info=True)
+        try:
+            _migrate_search_scope(session)
+        except Exception as e:
+            logger.error(f"Neo4j: Migration '{_SCOPE_MIGRATION_ID}' failed: {e}", exc_info=True)
+        try:
+            _migrate_course_search_scope(session)
+        except Exception as e:
+            logger.error(f"Neo4j: Migration '{_COURSE_SCOPE_MIGRATION_ID}' failed: {e}", exc_info=True)
+        # Schema statements cannot share a transaction with writes; run each in auto-commit
+        for statement in _SCHEMA_STATEMENTS:
+            try:
+                session.run(statement).consume()
+            except Exception as e:
+                # Typically pre-existing duplicates (e.g. the same course uploaded as "ML" and "ml")
+                logger.error(f"Neo4j: Could not apply schema statement '{statement}': {e}")
+    logger.info("Neo4j: Schema constraints and indexes verified.")
+
+
+# --- Batched deletion ---
+def delete_nodes_in_batches(label, properties, batch_size=None, progress=None):
+    """
+    DETACH DELETE every `label` node matching `properties` without one huge transaction.
+
+    Each round matches at most 10 batches of nodes through the property index
+    and deletes them with CALL { ... } IN TRANSACTIONS OF `batch_size` ROWS
+    (auto-commit), so heap use and lock time are bounded by the batch size.
+    `progress(label, deleted_so_far)` is called after every round.
+
+    Returns:
+        Number of nodes deleted
+    """
+    batch_size = max(1, batch_size or config.NEO4J_DELETE_BATCH_SIZE)
+    pattern = ", ".join(f"{key}: $props.{key}" for key in properties)
+    query = (
+        f"MATCH (n:{label} {{{pattern}}}) WITH n LIMIT $roundSize "
+        f"CALL {{ WITH n DETACH DELETE n }} IN TRANSACTIONS OF $batchSize ROWS "
+        f"RETURN count(*) AS deleted"
+    )
+    round_size = batch_size * 10
+    total = 0
+    with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
+        while True:
+            record = session.run(query, props=properties, roundSize=round_size, batchSize=batch_size).single()
+            deleted = record["deleted"] if record else 0
+            total += deleted
+            if deleted:
+                logger.info(f"Neo4j: Deleted {total} {label} nodes so far ({properties}).")
+                if progress:
+                    progress(label, total)
+            if deleted < round_size:
+                return total
+def _node_content_hash(node):
+    """Hash of a node's stored properties, kept as `content_hash` for incremental syncs."""
+    content = json.dumps([node["type"], node["description"], node["llm_parent_id"]], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+def _normalize_kg_nodes(nodes_param):
+    """Valid nodes keyed by trimmed id (later duplicates win), each with its content hash."""
+    nodes = {}
+    for n in nodes_param:
+        if isinstance(n.get("id"), str) and n.get("id").strip():
+            node_id = n["id"].strip()
+            node = {"id": node_id, "type": n.get("type", "concept"), "description": n.get("description", ""), "llm_parent_id": n.get("parent")}
+            node["content_hash"] = _node_content_hash(node)
+            nodes[node_id] = node
+    return list(nodes.values())
+def _normalize_kg_edges(edges_param):
+    """Valid edges with normalized relationship types, de-duplicated."""
+    edges = {}
+    for e in edges_param:
+        if isinstance(e.get("from"), str) and e["from"].strip() and isinstance(e.get("to"), str) and e["to"].strip() and isinstance(e.get("relationship"), str) and e["relationship"].strip():
+            edge = {"from": e["from"].strip(), "to": e["to"].strip(), "relationship": e["relationship"].strip().upper().replace(" ", "_")}
+            edges[(edge["from"], edge["to"], edge["relationship"])] = edge
+    return list(edges.values())
+def _add_nodes_transactional(tx, processed_nodes, user_id, document_name):
     if not processed_nodes: return 0
+    # MERGE keys match the knowledge_node_identity constraint, so each row is an index seek and
+    # "Notes.pdf" / "notes.pdf" write the same nodes that reads and deletes see
     query = """
-    UNWIND $nodes_data as props MERGE (n:KnowledgeNode {nodeId: props.id, userId: $userId, documentName: $documentName})
-    SET n += props, n.userId = $userId, n.documentName = $documentName RETURN count(n)
+    UNWIND $nodes_data as props MERGE (n:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: props.id})
+    SET n += props, n.documentName = $documentName, n.search_scope = $searchScope RETURN count(n)
     """
-    result = tx.run(query, nodes_data=processed_nodes, userId=user_id, documentName=document_name)
+    result = tx.run(query, nodes_data=processed_nodes, userId=user_id, documentName=document_name,
+                    documentKey=document_key(document_name), searchScope=search_scope(user_id, document_name))
     return result.single()[0] if result.peek() else 0
-def _add_edges_transactional(tx, edges_param, user_id, document_name):
-    valid_edges = [
-        {"from": e["from"].strip(), "to": e["to"].strip(), "relationship": e["relationship"].strip().upper().replace(" ", "_")}
-        for e in edges_param if isinstance(e.get("from"), str) and e["from"].strip() and isinstance(e.get("to"), str) and e["to"].strip() and isinstance(e.get("relationship"), str) and e["relationship"].strip()
-    ]
+def _add_edges_transactional(tx, valid_edges, user_id, document_name):
     if not valid_edges: return 0
     query = """
     UNWIND $edges_data as edge
-    MATCH (startNode:KnowledgeNode {nodeId: edge.from, userId: $userId, documentName: $documentName})
-    MATCH (endNode:KnowledgeNode {nodeId: edge.to, userId: $userId, documentName: $documentName})
+    MATCH (startNode:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: edge.from})
+    MATCH (endNode:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: edge.to})
     MERGE (startNode)-[r:RELATED_TO {type: edge.relationship}]->(endNode) RETURN count(r)
     """
-    result = tx.run(query, edges_data=valid_edges, userId=user_id, documentName=document_name)
+    result = tx.run(query, edges_data=valid_edges, userId=user_id, documentKey=document_key(document_name))
+    return result.single()[0] if result.peek() else 0
+
+def _get_kg_state_transactional(tx, user_id, document_name):
+    """Stored node hashes and edge keys of a document's KG."""
+    nodes_result = tx.run(
+        "MATCH (n:KnowledgeNode {userId: $userId, document_key: $documentKey}) RETURN n.nodeId AS id, n.content_hash AS hash",
+        userId=user_id, documentKey=document_key(document_name))
+    node_hashes = {record["id"]: record["hash"] for record in nodes_result}
+    edges_result = tx.run(
+        "MATCH (a:KnowledgeNode {userId: $userId, document_key: $documentKey})-[r:RELATED_TO]->(b:KnowledgeNode) "
+        "WHERE b.userId = $userId AND b.document_key = $documentKey "
+        "RETURN a.nodeId AS from, b.nodeId AS to, r.type AS relationship",
+        userId=user_id, documentKey=document_key(document_name))
+    edge_keys = {(record["from"], record["to"], record["relationship"]) for record in edges_result}
+    return node_hashes, edge_keys
+def _remove_nodes_transactional(tx, node_ids, user_id, document_name):
+    if not node_ids: return 0
+    query = """
+    UNWIND $nodeIds AS nodeId
+    MATCH (n:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: nodeId})
+    DETACH DELETE n RETURN count(*)
+    """
+    result = tx.run(query, nodeIds=node_ids, userId=user_id, documentKey=document_key(document_name))
+    return result.single()[0] if result.peek() else 0
+def _remove_edges_transactional(tx, edges, user_id, document_name):
+    if not edges: return 0
+    query = """
+    UNWIND $edges_data AS edge
+    MATCH (startNode:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: edge.from})
+          -[r:RELATED_TO {type: edge.relationship}]->
+          (endNode:KnowledgeNode {userId: $userId, document_key: $documentKey, nodeId: edge.to})
+    DELETE r RETURN count(*)
+    """
+    result = tx.run(query, edges_data=edges, userId=user_id, documentKey=document_key(document_name))
     return result.single()[0] if result.peek() else 0
 
+def _sync_kg_transactional(tx, processed_nodes, valid_edges, batch_size, user_id, document_name):
+    """
+    Diff the stored KG of a document against the incoming nodes/edges and
+    apply only the differences, all inside this one transaction. Writes are
+    still split into UNWIND statements of `batch_size` rows.
+    """
+    stored_hashes, stored_edges = _get_kg_state_transactional(tx, user_id, document_name)
+
+    incoming_ids = {node["id"] for node in processed_nodes}
+    added_nodes = [node for node in processed_nodes if node["id"] not in stored_hashes]
+    updated_nodes = [node for node in processed_nodes
+                     if node["id"] in stored_hashes and stored_hashes[node["id"]] != node["content_hash"]]
+    removed_node_ids = [node_id for node_id in stored_hashes if node_id not in incoming_ids]
+
+    incoming_edges = {(e["from"], e["to"], e["relationship"]): e for e in valid_edges}
+    added_edges = [edge for key, edge in incoming_edges.items() if key not in stored_edges]
+    # Edges on removed nodes go with their DETACH DELETE
+    removed_node_set = set(removed_node_ids)
+    removed_edges = [
+        {"from": start, "to": end, "relationship": rel}
+        for start, end, rel in stored_edges
+        if (start, end, rel) not in incoming_edges and start not in removed_node_set and end not in removed_node_set
+    ]
+
+    batches = 0
+    edges_written = 0
+    for tx_function, rows in ((_remove_edges_transactional, removed_edges),
+                              (_remove_nodes_transactional, removed_node_ids),
+                              (_add_nodes_transactional, added_nodes + updated_nodes),
+                              (_add_edges_transactional, added_edges)):
+        for start in range(0, len(rows), batch_size):
+            affected = tx_function(tx, rows[start:start + batch_size], user_id, document_name)
+            if tx_function is _add_edges_transactional:
+                edges_written += affected
+            batches += 1
+
+    return {
+        "nodes": {"added": len(added_nodes), "updated": len(updated_nodes), "removed": len(removed_node_ids),
+                  "unchanged": len(processed_nodes) - len(added_nodes) - len(updated_nodes)},
+        "edges": {"added": edges_written, "removed": sum(1 for key in stored_edges if key not in incoming_edges),
+                  "unchanged": len(incoming_edges) - len(added_edges)},
+        "batches": batches,
+    }
+
+# --- Bulk KG loading ---
+# Errors worth re-running a whole batch for (after the driver's own managed-transaction retries gave up)
+_RETRYABLE_ERRORS = (neo4j_exceptions.TransientError, neo4j_exceptions.ServiceUnavailable, neo4j_exceptions.SessionExpired)
+
+
+def _write_batches(session, tx_function, rows, batch_size, user_id, document_name, stats):
+    """Write rows in batches, one transaction per batch, re-running a failed batch on transient errors."""
+    affected = 0
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        attempt = 0
+        while True:
+            try:
+                affected += session.execute_write(tx_function, batch, user_id, document_name)
+                break
+            except _RETRYABLE_ERRORS as e:
+                attempt += 1
+                if attempt > config.KG_WRITE_MAX_RETRIES:
+                    raise
+                delay = config.KG_WRITE_RETRY_BACKOFF_SECONDS * (2 ** (attempt - 1))
+                logger.warning(f"Neo4j: KG batch {start}-{start + len(batch)} for '{document_name}' failed "
+                               f"(attempt {attempt}/{config.KG_WRITE_MAX_RETRIES}), retrying in {delay:.1f}s: {e}")
+                stats["retries"] += 1
+                time.sleep(delay)
+        stats["batches"] += 1
+    return affected
+
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def normalize_kg_query(query_text: str) -> str:
+    """Lower-cased, whitespace-collapsed query (also the cache key)."""
+    return " ".join((query_text or "").lower().split())
+
+
+def _scoped_lucene_query(user_id: str, document_name: str, query_text: str) -> Optional[str]:
+    """Fulltext query for one document's nodes, or None when the query has no terms."""
+    terms = _LUCENE_SPECIAL.sub(r"\\\1", normalize_kg_query(query_text))
+    if not terms:
+        return None
+    return f"search_scope:{search_scope(user_id, document_name)} AND ({terms})"
+
 
-def _search_kg_transactional(tx, user_id, document_name, query_text):
+def _search_kg_transactional(tx, user_id, document_name, query_text, hops=None, seed_limit=None, max_nodes=None, max_edges=None):
+    """
+    Scoped fulltext seeds plus a bounded 1-2 hop RELATED_TO neighbourhood.
+
+    Returns {"seeds": [...], "nodes": {nodeId: description}, "edges": [...]}
+    where each edge is {from, to, relationship, hop}.
+    """
+    hops = max(1, min(2, hops or config.KG_SEARCH_HOPS))
+    seed_limit = seed_limit or config.KG_SEARCH_SEED_LIMIT
+    max_nodes = max_nodes or config.KG_SEARCH_MAX_NODES
+    max_edges = max_edges or config.KG_SEARCH_MAX_EDGES
     logger.info(f"Neo4j TX: Searching KG for user '{user_id}', doc '{document_name}' with query: '{query_text[:50]}...'")
     
-    query = """
-    CALL db.index.fulltext.queryNodes("node_search_index", $query_text) YIELD node, score
-    WHERE node.userId = $userId AND toLower(node.documentName) = toLower($documentName)
-    WITH node, score ORDER BY score DESC LIMIT 5
-    MATCH (node)-[r:RELATED_TO]-(neighbor)
-    WHERE neighbor.userId = $userId AND toLower(neighbor.documentName) = toLower($documentName)
-    RETURN node.nodeId AS nodeId, node.description AS description, 
-           COLLECT(DISTINCT { relationship: r.type, neighborId: neighbor.nodeId }) AS relations
+    seeds_query = """
+    CALL db.index.fulltext.queryNodes($indexName, $luceneQuery, {limit: $limit}) YIELD node, score
+    WHERE node.userId = $userId AND node.document_key = $documentKey
+    RETURN node.nodeId AS nodeId, node.description AS description
+    ORDER BY score DESC LIMIT $limit
     """
+    lucene_query = _scoped_lucene_query(user_id, document_name, query_text)
+    if lucene_query is None:
+        return {"seeds": [], "nodes": {}, "edges": []}
+    doc_key = document_key(document_name)
+    seeds = tx.run(seeds_query, indexName=KG_SEARCH_INDEX_NAME, luceneQuery=lucene_query,
+                   limit=seed_limit, userId=user_id, documentKey=doc_key).data()
+    
+    nodes = {seed["nodeId"]: seed["description"] for seed in seeds}
+    edges, seen_edges = [], set()
+    frontier = list(nodes)
+    expand_query = """
+    MATCH (n:KnowledgeNode {userId: $userId, document_key: $documentKey}) WHERE n.nodeId IN $frontier
+    MATCH (n)-[r:RELATED_TO]-(m:KnowledgeNode)
+    WHERE m.userId = $userId AND m.document_key = $documentKey
+    RETURN startNode(r).nodeId AS from, endNode(r).nodeId AS to, r.type AS relationship,
+           m.nodeId AS neighborId, m.description AS neighborDescription
+    LIMIT $limit
+    """
+    for hop in range(1, hops + 1):
+        if not frontier or len(edges) >= max_edges:
+            break
+        next_frontier = []
+        for record in tx.run(expand_query, userId=user_id, documentKey=doc_key, frontier=frontier, limit=max_edges - len(edges)):
+            key = (record["from"], record["to"], record["relationship"])
+            if key in seen_edges:
+                continue
+            neighbor = record["neighborId"]
+            if neighbor not in nodes:
+                if len(nodes) >= max_nodes:
+                    continue
+                nodes[neighbor] = record["neighborDescription"]
+                next_frontier.append(neighbor)
+            seen_edges.add(key)
+            edges.append({"from": record["from"], "to": record["to"], "relationship": record["relationship"], "hop": hop})
+        frontier = next_frontier
+    
+    return {"seeds": [seed["nodeId"] for seed in seeds], "nodes": nodes, "edges": edges}
+
+
+def _format_kg_facts(result) -> str:
+    if not result["seeds"]:
+        return "No specific facts were found in the knowledge graph for this query."
     
-    results = tx.run(query, userId=user_id, documentName=document_name, query_text=query_text)
+    relations = {}
+    for edge in result["edges"]:
+        relations.setdefault(edge["from"], []).append(f"is '{edge['relationship']}' '{edge['to']}'")
     
     facts = []
-    for record in results:
-        fact = f"- Concept '{record['nodeId']}': {record['description']}"
-        relations = [f"is '{rel['relationship']}' '{rel['neighborId']}'" for rel in record['relations'] if rel.get('relationship') and rel.get('neighborId')]
-        if relations:
-            fact += f" | It {', '.join(relations)}."
+    seeds = set(result["seeds"])
+    ordered = result["seeds"] + [node_id for node_id in result["nodes"] if node_id not in seeds]
+    for node_id in ordered:
+        node_relations = [rel for rel in relations.get(node_id, []) if rel]
+        if node_id not in seeds and not node_relations:
+            continue
+        label = "Concept" if node_id in seeds else "Related concept"
+        fact = f"- {label} '{node_id}': {result['nodes'].get(node_id)}"
+        if node_relations:
+            fact += f" | It {', '.join(node_relations)}."
         facts.append(fact)
-    # --- END OF FIX ---
-        
-    if not facts:
-        return "No specific facts were found in the knowledge graph for this query."
-        
+    
     return "Facts from Knowledge Graph:\n" + "\n".join(facts)
 
 
+# --- KG search result cache: (userId, document_key, normalized query, hops) -> (expires_at, facts) ---
+_kg_search_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_kg_search_cache_lock = threading.Lock()
+
+
+def _invalidate_kg_search_cache(user_id: str, document_name: str) -> None:
+    doc_key = document_key(document_name)
+    with _kg_search_cache_lock:
+        for key in [k for k in _kg_search_cache if k[0] == user_id and k[1] == doc_key]:
+            del _kg_search_cache[key]
+
+
 def _get_kg_transactional(tx, user_id, document_name):
     logger.info(f"Neo4j TX: Retrieving FULL KG for visualization. User '{user_id}', Doc '{document_name}'")
     
     nodes_query = """
-    MATCH (n:KnowledgeNode {userId: $userId}) WHERE toLower(n.documentName) = toLower($documentName)
+    MATCH (n:KnowledgeNode {userId: $userId, document_key: $documentKey})
     RETURN n.nodeId AS id, n.type AS type, n.description AS description, n.llm_parent_id AS parent
     """
-    nodes_result = tx.run(nodes_query, userId=user_id, documentName=document_name)
+    nodes_result = tx.run(nodes_query, userId=user_id, documentKey=document_key(document_name))
     nodes_data = [dict(record) for record in nodes_result]
 
     edges_query = """
-    MATCH (startNode:KnowledgeNode {userId: $userId})-[r:RELATED_TO]->(endNode:KnowledgeNode {userId: $userId})
-    WHERE toLower(startNode.documentName) = toLower($documentName) AND toLower(endNode.documentName) = toLower($documentName)
+    MATCH (startNode:KnowledgeNode {userId: $userId, document_key: $documentKey})-[r:RELATED_TO]->(endNode:KnowledgeNode)
+    WHERE endNode.userId = $userId AND endNode.document_key = $documentKey
     RETURN startNode.nodeId AS from, endNode.nodeId AS to, r.type AS relationship
     """
-    edges_result = tx.run(edges_query, userId=user_id, documentName=document_name)
+    edges_result = tx.run(edges_query, userId=user_id, documentKey=document_key(document_name))
     edges_data = [dict(record) for record in edges_result]
 
     logger.info(f"Neo4j TX: Retrieved {len(nodes_data)} nodes and {len(edges_data)} edges for '{document_name}'.")
@@ -159,14 +664,81 @@ def _get_kg_transactional(tx, user_id, document_name):
 
 # --- Public Service Functions ---
 def ingest_knowledge_graph(user_id: str, document_name: str, nodes: list, edges: list) -> dict:
+    """
+    Bulk-load a document's KG: nodes first, then edges, each split into
+    KG_WRITE_BATCH_SIZE rows written as one UNWIND transaction per batch.
+    Returns counts plus throughput metrics.
+    """
     try:
-        nodes_affected = _execute_write_tx(_add_nodes_transactional, nodes, user_id, document_name) if nodes else 0
-        edges_affected = _execute_write_tx(_add_edges_transactional, edges, user_id, document_name) if edges else 0
-        return {"success": True, "message": "KG ingested.", "nodes_affected": nodes_affected, "edges_affected": edges_affected}
+        started = time.time()
+        processed_nodes = _normalize_kg_nodes(nodes or [])
+        valid_edges = _normalize_kg_edges(edges or [])
+        batch_size = max(1, config.KG_WRITE_BATCH_SIZE)
+        stats = {"batches": 0, "retries": 0}
+
+        with get_driver_instance().session(database=config.NEO4J_DATABASE) as session:
+            nodes_started = time.time()
+            nodes_affected = _write_batches(session, _add_nodes_transactional, processed_nodes, batch_size, user_id, document_name, stats)
+            nodes_seconds = time.time() - nodes_started
+            edges_started = time.time()
+            edges_affected = _write_batches(session, _add_edges_transactional, valid_edges, batch_size, user_id, document_name, stats)
+            edges_seconds = time.time() - edges_started
+        _invalidate_kg_search_cache(user_id, document_name)
+
+        metrics = {
+            "batch_size": batch_size,
+            "batches": stats["batches"],
+            "retries": stats["retries"],
+            "nodes_skipped": len(nodes or []) - len(processed_nodes),
+            "edges_skipped": len(edges or []) - len(valid_edges),
+            "nodes_per_second": round(nodes_affected / nodes_seconds, 1) if nodes_seconds > 0 else None,
+            "edges_per_second": round(edges_affected / edges_seconds, 1) if edges_seconds > 0 else None,
+            "seconds": round(time.time() - started, 3),
+        }
+        logger.info(f"Neo4j: KG for '{document_name}' loaded: {nodes_affected} nodes, {edges_affected} edges, {metrics}")
+        return {"success": True, "message": "KG ingested.", "nodes_affected": nodes_affected, "edges_affected": edges_affected,
+                "metrics": metrics}
     except Exception as e:
         logger.error(f"Error during KG ingestion for doc '{document_name}': {e}", exc_info=True)
         raise
 
+def sync_knowledge_graph(user_id: str, document_name: str, nodes: list, edges: list) -> dict:
+    """
+    Incrementally bring a document's stored KG in line with `nodes`/`edges`.
+
+    Incoming nodes are compared with each stored node's `content_hash` and
+    edges by (from, to, relationship). Only new/changed nodes and new edges
+    are written; nodes and edges missing from the incoming graph are
+    deleted. The state read, the diff and every write run in one transaction
+    (retried as a whole by the driver), so readers never see a half-applied
+    sync and a failure leaves the stored KG untouched.
+    """
+    try:
+        started = time.time()
+        processed_nodes = _normalize_kg_nodes(nodes or [])
+        valid_edges = _normalize_kg_edges(edges or [])
+        batch_size = max(1, config.KG_WRITE_BATCH_SIZE)
+
+        changes = _execute_write_tx(_sync_kg_transactional, processed_nodes, valid_edges, batch_size, user_id, document_name)
+        _invalidate_kg_search_cache(user_id, document_name)
+
+        result = {
+            "success": True,
+            "message": "KG synced.",
+            "mode": "incremental",
+            "nodes": changes["nodes"],
+            "edges": changes["edges"],
+            "nodes_affected": changes["nodes"]["added"] + changes["nodes"]["updated"],
+            "edges_affected": changes["edges"]["added"],
+            "metrics": {"batch_size": batch_size, "batches": changes["batches"],
+                        "seconds": round(time.time() - started, 3)},
+        }
+        logger.info(f"Neo4j: KG for '{document_name}' synced: nodes={result['nodes']}, edges={result['edges']}")
+        return result
+    except Exception as e:
+        logger.error(f"Error during incremental KG sync for doc '{document_name}': {e}", exc_info=True)
+        raise
+
 def get_knowledge_graph(user_id: str, document_name: str) -> dict:
     try:
         kg_data = _execute_read_tx(_get_kg_transactional, user_id, document_name)
@@ -180,14 +752,33 @@ def get_knowledge_graph(user_id: str, document_name: str) -> dict:
 
 def delete_knowledge_graph(user_id: str, document_name: str) -> bool:
     try:
-        return _execute_write_tx(_delete_kg_transactional, user_id, document_name)
+        delete_nodes_in_batches("KnowledgeNode", {"userId": user_id, "document_key": document_key(document_name)})
+        _invalidate_kg_search_cache(user_id, document_name)
+        return True
     except Exception as e:
         logger.error(f"Error deleting KG for doc '{document_name}': {e}", exc_info=True)
         raise
 
-def search_knowledge_graph(user_id: str, document_name: str, query_text: str) -> str:
+def search_knowledge_graph(user_id: str, document_name: str, query_text: str, hops: int = None) -> str:
+    hops = max(1, min(2, hops or config.KG_SEARCH_HOPS))
+    if not normalize_kg_query(query_text):
+        return _format_kg_facts({"seeds": [], "nodes": {}, "edges": []})
+    cache_key = (user_id, document_key(document_name), normalize_kg_query(query_text), hops)
+    if config.KG_SEARCH_CACHE_SIZE > 0:
+        with _kg_search_cache_lock:
+            cached = _kg_search_cache.get(cache_key)
+            if cached and cached[0] > time.time():
+                _kg_search_cache.move_to_end(cache_key)
+                return cached[1]
     try:
-        return _execute_read_tx(_search_kg_transactional, user_id, document_name, query_text)
+        facts = _format_kg_facts(_execute_read_tx(_search_kg_transactional, user_id, document_name, query_text, hops))
     except Exception as e:
         logger.error(f"Error searching KG for doc '{document_name}', user '{user_id}': {e}", exc_info=True)
-        return f"An error occurred while searching the knowledge graph: {e}"
\ No newline at end of file
+        return f"An error occurred while searching the knowledge graph: {e}"
+    if config.KG_SEARCH_CACHE_SIZE > 0:
+        with _kg_search_cache_lock:
+            _kg_search_cache[cache_key] = (time.time() + config.KG_SEARCH_CACHE_TTL_SECONDS, facts)
+            _kg_search_cache.move_to_end(cache_key)
+            while len(_kg_search_cache) > config.KG_SEARCH_CACHE_SIZE:
+                _kg_search_cache.popitem(last=False)
+    return facts
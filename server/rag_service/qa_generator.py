@@ -41,7 +41,7 @@ def register_qa_routes(app, llm_wrapper):
         
         try:
             prompt = QA_GENERATION_PROMPT.format(text=text[:15000]) # Limit input
-            response_text = llm_wrapper(prompt)
+            response_text = llm_wrapper(prompt, priority="batch")
             
             # Extract JSON from block if necessary
             json_match = re.search(r'\[.*\]', response_text, re.DOTALL)
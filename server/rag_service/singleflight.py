@@ -0,0 +1,117 @@
+# server/rag_service/singleflight.py
+"""
+Singleflight Request Coalescing
+
+When many requests ask for the same thing at once (a shared quiz link, the
+same /query from a whole class), only the first one - the leader - does the
+work; the others wait for its result instead of repeating the LLM or Qdrant
+round trip. Once the call finishes the key is forgotten, so this coalesces
+only concurrent calls; completed results are the caches' job.
+
+- Errors are shared too: followers re-raise the leader's exception, unless
+  the group is created with share_errors=False (errors that depend on the
+  caller, e.g. its API key), in which case they run the call themselves
+- A follower that waits longer than its timeout gives up on the leader and
+  runs the call itself
+- `share` lets callers hand each consumer its own copy of a mutable result
+"""
+
+import logging
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+# --- Coalescing metrics (exported on /metrics via the default Prometheus registry) ---
+try:
+    from prometheus_client import Counter
+    _CALLS = Counter("singleflight_calls_total", "Calls through a singleflight group by role", ["group", "role"])
+except ImportError:
+    _CALLS = None
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "followers")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """A group of coalesced calls; keys only need to be unique within the group."""
+
+    def __init__(self, name: str, timeout_seconds: Optional[float] = None, share_errors: bool = True):
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self.share_errors = share_errors
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {"leaders": 0, "coalesced": 0, "timeouts": 0, "leader_errors": 0}
+
+    def _record(self, role: str):
+        with self._lock:
+            self._stats[{"leader": "leaders", "coalesced": "coalesced", "timeout": "timeouts",
+                         "leader_error": "leader_errors"}[role]] += 1
+        if _CALLS is not None:
+            _CALLS.labels(group=self.name, role=role).inc()
+
+    def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Any],
+        timeout: Optional[float] = None,
+        share: Optional[Callable[[Any], Any]] = None
+    ) -> Any:
+        """
+        Run `fn()` once for all concurrent callers with the same key.
+
+        Args:
+            key: Identity of the call within this group
+            fn: The work; called by the leader (or by a follower that timed out)
+            timeout: Seconds a follower waits for the leader (default: the group's; None waits forever)
+            share: Applied to the result for every caller, e.g. a copy for mutable results
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.followers += 1
+        self._record("leader" if leader else "coalesced")
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+                if call.followers:
+                    logger.debug(f"Singleflight '{self.name}': {call.followers} calls coalesced into one")
+            return share(call.result) if share else call.result
+
+        wait = self.timeout_seconds if timeout is None else timeout
+        if not call.done.wait(wait):
+            self._record("timeout")
+            logger.warning(f"Singleflight '{self.name}': leader still running after {wait}s, running call separately")
+            result = fn()
+            return share(result) if share else result
+        if call.error is not None:
+            if self.share_errors:
+                raise call.error
+            self._record("leader_error")
+            logger.info(f"Singleflight '{self.name}': leader failed ({type(call.error).__name__}), running call separately")
+            result = fn()
+            return share(result) if share else result
+        return share(call.result) if share else call.result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._calls))
@@ -0,0 +1,94 @@
+# server/rag_service/tests/conftest.py
+"""
+Shared fixtures for the RAG service tests.
+
+The real config module loads server/.env and attaches log handlers at import
+time, so the modules under test are given a `config` module holding just the
+settings they read. Tests override individual settings with monkeypatch.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+RAG_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.join(os.path.dirname(RAG_SERVICE_DIR), "services")
+for path in (RAG_SERVICE_DIR, SERVICES_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+TEST_SETTINGS = {
+    "QDRANT_COLLECTION_NAME": "test_collection",
+    "QDRANT_DEFAULT_SEARCH_K": 5,
+    "QDRANT_DELETE_BATCH_SIZE": 2,
+    "MATRYOSHKA_ENABLED": False,
+    "MATRYOSHKA_DIM": 4,
+    "MATRYOSHKA_CANDIDATE_MULTIPLIER": 4,
+    "MATRYOSHKA_FULL_VECTOR_NAME": "full",
+    "MATRYOSHKA_SHORT_VECTOR_NAME": "short",
+    "SNAPSHOT_DIR": "",
+    "SNAPSHOT_CHUNK_SIZE": 3,
+    "SNAPSHOT_ZSTD_LEVEL": 3,
+    "SNAPSHOT_IMPORT_MAX_IN_FLIGHT": 2,
+    "LOCAL_VECTOR_STORE_DTYPE": "float32",
+    "LLM_RESPONSE_CACHE_ENABLED": True,
+    "LLM_RESPONSE_CACHE_PATH": "",
+    "LLM_RESPONSE_CACHE_TTL_SECONDS": 3600,
+    "LLM_RESPONSE_CACHE_MAX_BYTES": 10 ** 6,
+    "GEMINI_MODEL_NAME": "gemini-test",
+    "LLM_CLIENT_TRANSPORT": "rest",
+    "LLM_CLIENT_POOL_MAX_SIZE": 2,
+    "LLM_METRICS_MAX_KEY_LABELS": 20,
+    "NEO4J_URI": "bolt://localhost:7687",
+    "NEO4J_USERNAME": "neo4j",
+    "NEO4J_PASSWORD": "test",
+    "NEO4J_DATABASE": "neo4j",
+    "NEO4J_MAX_CONNECTION_POOL_SIZE": 10,
+    "NEO4J_CONNECTION_ACQUISITION_TIMEOUT": 5,
+    "NEO4J_MAX_CONNECTION_LIFETIME": 300,
+    "NEO4J_DELETE_BATCH_SIZE": 2,
+    "KG_SEARCH_SEED_LIMIT": 5,
+    "KG_SEARCH_HOPS": 1,
+    "KG_SEARCH_MAX_NODES": 25,
+    "KG_SEARCH_MAX_EDGES": 50,
+    "KG_SEARCH_CACHE_SIZE": 16,
+    "KG_SEARCH_CACHE_TTL_SECONDS": 300,
+    "KG_WRITE_BATCH_SIZE": 1000,
+    "KG_WRITE_MAX_RETRIES": 2,
+    "KG_WRITE_RETRY_BACKOFF_SECONDS": 0.5,
+    "CURRICULUM_WRITE_BATCH_SIZE": 2,
+    "CURRICULUM_CACHE_TTL_SECONDS": 300,
+    "CURRICULUM_RETRIEVAL_MODULE_RADIUS": 1,
+    "CURRICULUM_RETRIEVAL_OVERFETCH": 3,
+    "CURRICULUM_DISTANCE_PENALTY": 0.02,
+    "CURRICULUM_FORWARD_DISTANCE_WEIGHT": 2.0,
+}
+
+config = types.ModuleType("config")
+config.__dict__.update(TEST_SETTINGS)
+sys.modules["config"] = config
+
+
+@pytest.fixture
+def rag_config(monkeypatch, tmp_path):
+    """The test config module, with file locations pointed at a fresh tmp_path."""
+    monkeypatch.setattr(config, "SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+    monkeypatch.setattr(config, "LLM_RESPONSE_CACHE_PATH", str(tmp_path / "llm_cache" / "responses.sqlite3"))
+    return config
+
+
+@pytest.fixture
+def curriculum_modules():
+    """Traversal rows of a three-topic course: m1 (t1) precedes m2 (t2, t3); s1 is shared by t1 and t3."""
+    return [
+        {"id": "m1", "name": "Basics", "order": 1, "topics": [
+            {"id": "t1", "name": "Regression", "lecture_number": 1,
+             "subtopics": [{"id": "s2", "name": "Calculus"}, {"id": "s1", "name": "Algebra"}]},
+        ]},
+        {"id": "m2", "name": "Methods", "order": 2, "topics": [
+            {"id": "t2", "name": "Clustering", "lecture_number": 2, "subtopics": [{"id": "s3", "name": "Distances"}]},
+            {"id": "t3", "name": "Trees", "lecture_number": 3, "subtopics": [{"id": "s1", "name": "Algebra"}]},
+        ]},
+    ]
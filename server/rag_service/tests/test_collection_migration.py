@@ -0,0 +1,51 @@
+import pytest
+from qdrant_client import QdrantClient, models
+
+import collection_migration
+
+
+def _client_with_points(name, n=7):
+    client = QdrantClient(":memory:")
+    client.create_collection(name, vectors_config=models.VectorParams(size=8, distance=models.Distance.COSINE))
+    client.upsert(name, points=[
+        models.PointStruct(id=i, vector=[float(i + 1)] + [1.0] * 7, payload={"i": i}) for i in range(n)
+    ])
+    return client
+
+
+def test_plain_collection_requires_drop_source(rag_config, monkeypatch):
+    monkeypatch.setattr(rag_config, "MATRYOSHKA_ENABLED", True)
+    client = _client_with_points("docs")
+    with pytest.raises(ValueError, match="drop_source"):
+        collection_migration.migrate_collection_layout(client, "docs")
+    assert client.count("docs").count == 7
+
+
+def test_migrates_to_named_layout_behind_alias(rag_config, monkeypatch):
+    monkeypatch.setattr(rag_config, "MATRYOSHKA_ENABLED", True)
+    client = _client_with_points("docs")
+    summary = collection_migration.migrate_collection_layout(
+        client, "docs", target_collection="docs_v1", batch_size=3, drop_source=True
+    )
+    assert summary["migrated"] and summary["points"] == 7
+
+    vectors = client.get_collection("docs").config.params.vectors  # resolved through the alias
+    assert set(vectors) == {"full", "short"} and vectors["short"].size == 4
+    record = client.retrieve("docs", ids=[2], with_vectors=True, with_payload=True)[0]
+    assert record.payload == {"i": 2}
+    assert len(record.vector["short"]) == 4
+
+    # Switching back repoints the alias and keeps the previous copy for rollback
+    monkeypatch.setattr(rag_config, "MATRYOSHKA_ENABLED", False)
+    summary = collection_migration.migrate_collection_layout(client, "docs", target_collection="docs_v2")
+    assert summary["source_kept"] is True
+    assert client.collection_exists("docs_v1")
+    assert not isinstance(client.get_collection("docs").config.params.vectors, dict)
+    assert client.count("docs").count == 7
+
+
+def test_matching_layout_is_left_alone(rag_config):
+    client = _client_with_points("docs")
+    summary = collection_migration.migrate_collection_layout(client, "docs", drop_source=True)
+    assert summary["migrated"] is False
+    assert client.collection_exists("docs")
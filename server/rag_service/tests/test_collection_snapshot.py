@@ -0,0 +1,69 @@
+import os
+
+import pytest
+from qdrant_client import models
+
+import collection_snapshot
+from local_vector_store import LocalVectorStore
+
+
+def _store_with_points():
+    store = LocalVectorStore()
+    store.create_collection("src", vectors_config=models.VectorParams(size=8, distance=models.Distance.COSINE))
+    points = [
+        models.PointStruct(
+            id=i,
+            vector=[float(i + 1)] + [0.5] * 7,
+            payload={"course_name": "Machine Learning" if i < 5 else "Databases", "chunk_index": i},
+        )
+        for i in range(8)
+    ]
+    store.upsert("src", points)
+    return store
+
+
+def test_course_round_trip(rag_config):
+    store = _store_with_points()
+    path = collection_snapshot.resolve_snapshot_path(collection_snapshot.snapshot_id_for("Machine Learning"))
+    summary = collection_snapshot.export_course_snapshot(store, "src", "Machine Learning", path)
+    assert summary["points"] == 5
+    assert summary["chunks"] == 2  # SNAPSHOT_CHUNK_SIZE is 3 in tests
+
+    store.create_collection("dst", vectors_config=models.VectorParams(size=8, distance=models.Distance.COSINE))
+    result = collection_snapshot.import_snapshot(store, "dst", path)
+    assert result["points"] == 5
+    assert store.count("dst").count == 5
+
+    source = {r.id: r for r in store.scroll("src", limit=10, with_vectors=True)[0]}
+    records, _ = store.scroll("dst", limit=10, with_payload=True, with_vectors=True)
+    by_id = {r.id: r for r in records}
+    assert sorted(by_id) == [0, 1, 2, 3, 4]
+    assert by_id[3].payload == {"course_name": "Machine Learning", "chunk_index": 3}
+    # Vectors travel as float16
+    assert by_id[3].vector == pytest.approx(source[3].vector, rel=1e-3)
+
+
+def test_snapshot_ids_are_sanitized(rag_config):
+    assert collection_snapshot.snapshot_id_for("Machine Learning") == "Machine_Learning"
+    assert collection_snapshot.snapshot_id_for("../../etc/passwd") == "etc_passwd"
+    assert collection_snapshot.snapshot_id_for(None) == "collection"
+
+
+@pytest.mark.parametrize("snapshot_id", ["../secrets", "/etc/passwd", "a/b", "..", "", "x y", ".imsnap"])
+def test_resolve_rejects_paths_outside_snapshot_dir(rag_config, snapshot_id):
+    with pytest.raises(ValueError):
+        collection_snapshot.resolve_snapshot_path(snapshot_id)
+
+
+def test_resolve_rejects_symlink_escape(rag_config, tmp_path):
+    os.makedirs(rag_config.SNAPSHOT_DIR)
+    outside = tmp_path / "outside.imsnap"
+    outside.write_bytes(b"")
+    os.symlink(outside, os.path.join(rag_config.SNAPSHOT_DIR, "evil.imsnap"))
+    with pytest.raises(ValueError):
+        collection_snapshot.resolve_snapshot_path("evil")
+
+
+def test_resolve_accepts_exported_ids(rag_config):
+    path = collection_snapshot.resolve_snapshot_path("Machine_Learning.imsnap")
+    assert path == os.path.join(os.path.realpath(rag_config.SNAPSHOT_DIR), "Machine_Learning.imsnap")
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+import course_pipeline
+from curriculum_model import CurriculumModel
+from local_vector_store import LocalVectorStore
+
+
+def _points():
+    rows = [("ML", "Regression"), ("ML", "Regression"), ("ML", "Clustering"), ("Stats", "Regression"), ("ML", None)]
+    return [
+        models.PointStruct(id=i, vector=[1.0, 0.1 * i], payload={"course_name": course, "syllabus_topic": topic})
+        for i, (course, topic) in enumerate(rows)
+    ]
+
+
+@pytest.fixture(params=["local", "qdrant"])
+def vector_service(request):
+    client = LocalVectorStore() if request.param == "local" else QdrantClient(":memory:")
+    client.create_collection("docs", vectors_config=models.VectorParams(size=2, distance=models.Distance.COSINE))
+    client.upsert("docs", points=_points())
+    return SimpleNamespace(client=client, collection_name="docs")
+
+
+def test_topic_counts_come_from_one_course_scoped_facet(vector_service):
+    counts = course_pipeline.count_topic_documents(vector_service, "ML", ["Regression", "Clustering", "Unused", None])
+    assert counts == {"Regression": 2, "Clustering": 1, "Unused": 0}
+
+
+def test_topic_counts_issue_a_single_request():
+    calls = []
+
+    class Client:
+        def facet(self, **kwargs):
+            calls.append(kwargs)
+            return models.FacetResponse(hits=[models.FacetValueHit(value="A", count=3)])
+
+    service = SimpleNamespace(client=Client(), collection_name="docs")
+    assert course_pipeline.count_topic_documents(service, "ML", ["A", "B", "A"]) == {"A": 3, "B": 0}
+    assert len(calls) == 1 and calls[0]["key"] == "syllabus_topic" and calls[0]["limit"] == 2
+
+
+@pytest.fixture
+def curriculum(monkeypatch):
+    model = CurriculumModel(
+        course="ML",
+        version=1,
+        modules=[{"id": "m1", "name": "Module 1", "order": 1}],
+        module_topics={"m1": ["t1"]},
+        topics={"t1": {"id": "t1", "name": "Regression"}},
+        topic_order=["t1"],
+    )
+    monkeypatch.setattr(course_pipeline.curriculum_graph_handler, "get_curriculum_model", lambda course: model)
+    course_pipeline.invalidate_visualization()
+    yield model
+    course_pipeline.invalidate_visualization()
+
+
+def test_visualization_is_not_cached_when_counts_fail(curriculum):
+    class Failing:
+        def facet(self, **kwargs):
+            raise RuntimeError("qdrant down")
+
+    failing = SimpleNamespace(client=Failing(), collection_name="docs")
+    body, _ = course_pipeline.get_curriculum_visualization_blob("ML", failing)
+    assert b"qdrant_doc_count" not in body
+
+    class Working:
+        def facet(self, **kwargs):
+            return models.FacetResponse(hits=[models.FacetValueHit(value="Regression", count=4)])
+
+    body, _ = course_pipeline.get_curriculum_visualization_blob("ML", SimpleNamespace(client=Working(), collection_name="docs"))
+    assert b'"qdrant_doc_count":4' in body
+
+
+def test_visualization_is_cached_until_invalidated(curriculum, vector_service):
+    first, etag = course_pipeline.get_curriculum_visualization_blob("ML", vector_service)
+    vector_service.client.upsert("docs", points=[
+        models.PointStruct(id=99, vector=[1.0, 0.0], payload={"course_name": "ML", "syllabus_topic": "Regression"})
+    ])
+    assert course_pipeline.get_curriculum_visualization_blob("ML", vector_service) == (first, etag)
+
+    course_pipeline.invalidate_visualization()
+    body, new_etag = course_pipeline.get_curriculum_visualization_blob("ML", vector_service)
+    assert new_etag != etag and b'"qdrant_doc_count":3' in body
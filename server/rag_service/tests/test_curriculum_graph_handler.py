@@ -0,0 +1,162 @@
+import time
+
+import pytest
+
+import curriculum_graph_handler
+from curriculum_model import CurriculumModel
+
+@pytest.fixture
+def loads(monkeypatch, curriculum_modules):
+    """Serve the course from MODULES instead of Neo4j, recording every load."""
+    calls = []
+
+    def load(course, version):
+        calls.append((course, version))
+        return CurriculumModel.from_traversal(course, version, curriculum_modules)
+
+    monkeypatch.setattr(curriculum_graph_handler, "get_driver_instance", lambda: object())
+    monkeypatch.setattr(curriculum_graph_handler, "_load_curriculum_model", load)
+    monkeypatch.setattr(curriculum_graph_handler, "_curriculum_models", {})
+    monkeypatch.setattr(curriculum_graph_handler, "_course_versions", {})
+    return calls
+
+
+def test_model_is_loaded_once_per_course_key(loads):
+    first = curriculum_graph_handler.get_curriculum_model("ML")
+    assert curriculum_graph_handler.get_curriculum_model("  ml ") is first
+    assert loads == [("ML", 0)]
+
+
+def test_version_bump_reloads_the_model(loads):
+    first = curriculum_graph_handler.get_curriculum_model("ML")
+    curriculum_graph_handler._bump_course_version("ml")
+    second = curriculum_graph_handler.get_curriculum_model("ML")
+    assert second is not first and second.version == 1
+    assert loads == [("ML", 0), ("ML", 1)]
+
+
+def test_expired_model_is_reloaded(loads, monkeypatch):
+    first = curriculum_graph_handler.get_curriculum_model("ML")
+    first.loaded_at = time.time() - 301
+    assert curriculum_graph_handler.get_curriculum_model("ML") is not first
+    monkeypatch.setattr(curriculum_graph_handler.config, "CURRICULUM_CACHE_TTL_SECONDS", 0)
+    stale = curriculum_graph_handler.get_curriculum_model("ML")
+    stale.loaded_at = 0
+    assert curriculum_graph_handler.get_curriculum_model("ML") is stale
+    assert len(loads) == 2
+
+
+def test_reads_are_served_from_the_cached_model(loads):
+    assert curriculum_graph_handler.get_topic_prerequisites("ML", "T1") == [
+        {"id": "s1", "name": "Algebra"}, {"id": "s2", "name": "Calculus"}
+    ]
+    assert curriculum_graph_handler.get_next_module("ML", "m1")["id"] == "m2"
+    assert curriculum_graph_handler.get_next_module("ML", "m2") is None
+    structure = curriculum_graph_handler.traverse_curriculum("ML")
+    assert [[t["id"] for t in m["topics"]] for m in structure["modules"]] == [["t1"], ["t2", "t3"]]
+    assert len(loads) == 1
+
+
+def test_batch_gaps_normalize_ids_and_share_one_learner_state(loads):
+    gaps = curriculum_graph_handler.detect_missing_prerequisites_batch(
+        "ML", ["T2", "t 3", "nope"], completed_subtopic_ids=["S1"], completed_topic_ids=["T1"]
+    )
+    assert {tid: items and [i["id"] for i in items] for tid, items in gaps.items()} == {
+        "t2": ["s2", "s3"], "t_3": None, "nope": None
+    }
+    single = curriculum_graph_handler.detect_missing_prerequisites("ML", "T2", ["s1"])
+    assert [item["id"] for item in single] == ["s3"]
+    assert len(loads) == 1
+
+
+def test_cohort_analysis_streams_learners_then_a_summary(loads):
+    rows = list(curriculum_graph_handler.analyze_cohort_gaps("ML", [
+        {"learner_id": "a", "completed_subtopic_ids": ["S1"]},
+        {"learner_id": "b", "completed_subtopic_ids": ["s1", "s2"], "completed_topic_ids": ["t1"]},
+    ], ["T2", "t2", "ghost"], transitive=True))
+
+    assert [row["type"] for row in rows] == ["learner", "learner", "summary"]
+    assert rows[0]["gaps"] == {"t2": ["t1", "s2", "s3"]}
+    assert rows[1]["gaps"] == {"t2": ["s3"]}
+    summary = rows[-1]
+    assert summary["topics"] == ["t2"] and summary["unknown_topics"] == ["ghost"]
+    assert summary["learners"] == 2 and summary["learners_with_gaps"] == 2
+    assert summary["learners_missing_by_topic"] == {"t2": 2}
+    assert summary["most_missed_items"][0] == {"id": "s3", "learners": 2}
+    assert len(loads) == 1
+
+
+def test_learning_paths_for_several_targets(loads):
+    result = curriculum_graph_handler.get_learning_paths("ML", ["T1", "t1", "ghost"], combined=True)
+    assert list(result["paths"]) == ["t1", "ghost"]
+    assert result["paths"]["ghost"] == [] and result["unknown_topics"] == ["ghost"]
+    assert [step["id"] for step in result["paths"]["t1"]] == ["m1", "s1", "s2", "t1"]
+    assert result["combined_path"] == result["paths"]["t1"]
+    assert "combined_path" not in curriculum_graph_handler.get_learning_paths("ML", ["t1"])
+    assert len(loads) == 1
+
+
+def test_course_deletion_is_batched_per_label_and_drops_the_model(loads, monkeypatch):
+    calls = []
+
+    def delete(label, properties, progress=None):
+        calls.append((label, properties))
+        return {"Module": 2, "Topic": 3, "Subtopic": 4}[label]
+
+    monkeypatch.setattr(curriculum_graph_handler, "delete_nodes_in_batches", delete)
+    first = curriculum_graph_handler.get_curriculum_model("ML")
+    result = curriculum_graph_handler.delete_course_curriculum(" ML ")
+    assert calls == [(label, {"course_key": "ml"}) for label in curriculum_graph_handler.CURRICULUM_LABELS]
+    assert result["deleted_count"] == 9
+    assert curriculum_graph_handler.get_curriculum_model("ML") is not first
+
+
+class _UnwindTx:
+    """Records UNWIND statements; each reports one node (and relationship) per row."""
+
+    def __init__(self, statements):
+        self.statements = statements
+
+    def run(self, query, **params):
+        self.statements.append((query, params))
+        rows = len(params["rows"])
+        return type("Result", (), {"single": lambda self: {"nodes": rows, "rels": rows}})()
+
+
+class _UnwindSession:
+    def __init__(self):
+        self.statements, self.transactions = [], 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, tx_function, *args):
+        self.transactions += 1
+        return tx_function(_UnwindTx(self.statements), *args)
+
+
+def test_graph_build_writes_unwind_batches_in_separate_transactions(monkeypatch):
+    session = _UnwindSession()
+    monkeypatch.setattr(curriculum_graph_handler, "get_driver_instance",
+                        lambda: type("Driver", (), {"session": lambda self, database: session})())
+    monkeypatch.setattr(curriculum_graph_handler, "_course_versions", {})
+    modules = [{"id": f"m{i}", "name": f"Module {i}", "order": i} for i in range(5)]
+    topics = [{"id": f"t{i}", "name": f"Topic {i}", "module_id": "m0"} for i in range(3)]
+    subtopics = [{"id": f"s{i}", "name": f"Sub {i}", "topic_id": "t0"} for i in range(3)]
+
+    result = curriculum_graph_handler.build_curriculum_graph("ML", modules, topics, subtopics)
+
+    # CURRICULUM_WRITE_BATCH_SIZE is 2: one UNWIND statement and one transaction per batch
+    batches = [(query.split("MERGE")[0].split("MATCH")[0].strip(), len(params["rows"])) for query, params in session.statements]
+    assert all(statement == "UNWIND $rows AS row" for statement, _ in batches)
+    assert [rows for _, rows in batches] == [2, 2, 1, 2, 2, 2, 1, 2, 1]
+    assert session.transactions == len(session.statements) == 9
+    assert [r["id"] for _, p in session.statements[:3] for r in p["rows"]] == [m["id"] for m in modules]
+    assert session.statements[3][1]["rows"][0] == {"current_id": "m0", "next_id": "m1"}
+    assert result["modules_created"] == 5 and result["precedes_relationships"] == 4
+    assert result["topics_created"] == result["has_topic_relationships"] == 3
+    assert result["subtopics_created"] == result["prerequisite_of_relationships"] == 3
+    assert curriculum_graph_handler.get_course_version("ml") == 1
@@ -0,0 +1,76 @@
+import pytest
+
+from curriculum_model import CurriculumModel
+
+
+@pytest.fixture
+def model(curriculum_modules):
+    return CurriculumModel.from_traversal("ML", 1, curriculum_modules)
+
+
+def _ids(items):
+    return [item["id"] for item in items]
+
+
+def test_direct_and_transitive_closures(model):
+    completed = model.completed_mask(subtopic_ids=["s1"])
+    direct = model.missing_prerequisites(["t1", "t2", "t3"], completed, transitive=False)
+    assert {tid: _ids(items) for tid, items in direct.items()} == {"t1": ["s2"], "t2": ["s3"], "t3": []}
+
+    transitive = model.missing_prerequisites(["t2", "t3"], completed)
+    # Everything of the preceding module m1, then the topic's own subtopics, in item order
+    assert _ids(transitive["t2"]) == ["t1", "s2", "s3"]
+    assert _ids(transitive["t3"]) == ["t1", "s2"]
+    assert transitive["t2"][0]["type"] == "topic"
+
+
+def test_completed_topics_and_unknown_ids(model):
+    completed = model.completed_mask(subtopic_ids=["s1", "s2", "nope"], topic_ids=["t1", "missing"])
+    gaps = model.missing_prerequisites(["t2", "unknown"], completed)
+    assert _ids(gaps["t2"]) == ["s3"]
+    assert gaps["unknown"] is None
+
+
+def test_shared_subtopic_is_one_item(model):
+    model._ensure_closure()
+    assert sum(1 for item in model.items if item["id"] == "s1") == 1
+    assert model.direct_closure["t1"] & model.direct_closure["t3"] == 1 << model.item_index[("subtopic", "s1")]
+
+
+def test_empty_course_has_no_closure():
+    empty = CurriculumModel.from_traversal("Empty", 1, [])
+    assert empty.missing_prerequisites(["t1"], empty.completed_mask()) == {"t1": None}
+
+
+def test_cohort_gaps_match_per_learner_closures(model):
+    learners = [
+        ("a", model.item_indices(subtopic_ids=["s1"])),
+        ("b", model.item_indices(subtopic_ids=["s1", "s2", "s3"], topic_ids=["t1"])),
+        ("c", []),
+    ]
+    rows = list(model.cohort_gaps(["t2", "t3"], learners, chunk_size=2))
+    assert [row["learner_id"] for row in rows] == ["a", "b", "c"]
+    for (learner_id, indices), row in zip(learners, rows):
+        completed = sum(1 << index for index in indices)
+        expected = {tid: _ids(items) for tid, items in model.missing_prerequisites(["t2", "t3"], completed).items() if items}
+        assert row["gaps"] == expected
+        assert row["missing_count"] == sum(len(items) for items in expected.values())
+    assert rows[1] == {"learner_id": "b", "gaps": {}, "missing_count": 0}
+
+
+def test_learning_path_lists_preceding_modules_then_prerequisites(model):
+    path = model.learning_path("t3")
+    assert [(step["type"], step["id"]) for step in path] == [
+        ("module", "m1"), ("module", "m2"), ("subtopic", "s1"), ("topic", "t3")
+    ]
+    assert model.learning_path("ghost") == []
+
+
+def test_combined_learning_path_deduplicates_shared_prerequisites(model):
+    path = model.combined_learning_path(["t3", "t1", "ghost", "t1"])
+    assert [(step["type"], step["id"]) for step in path] == [
+        ("module", "m1"), ("module", "m2"),
+        ("subtopic", "s1"), ("subtopic", "s2"), ("topic", "t1"),
+        ("topic", "t3"),
+    ]
+    assert model.combined_learning_path(["ghost"]) == []
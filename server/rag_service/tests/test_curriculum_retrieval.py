@@ -0,0 +1,130 @@
+from types import SimpleNamespace
+
+import pytest
+
+import curriculum_graph_handler
+import curriculum_retrieval
+from curriculum_model import CurriculumModel
+
+
+@pytest.fixture
+def course(monkeypatch, curriculum_modules):
+    """Serve the fixture course as the cached model; `course.version` drives reloads."""
+    state = SimpleNamespace(version=0, loads=0)
+
+    def get_model(name):
+        state.loads += 1
+        return CurriculumModel.from_traversal(name, state.version, curriculum_modules)
+
+    monkeypatch.setattr(curriculum_graph_handler, "get_curriculum_model", get_model)
+    monkeypatch.setattr(curriculum_retrieval, "_distance_tables", {})
+    return state
+
+
+class FakeVectorService:
+    """Returns `neighbourhood` for filtered curriculum searches and `fallback` otherwise."""
+
+    def __init__(self, neighbourhood=(), fallback=()):
+        self.neighbourhood, self.fallback = list(neighbourhood), list(fallback)
+        self.calls = []
+
+    def search_documents(self, query, k, filter_conditions=None):
+        self.calls.append((k, filter_conditions))
+        curriculum = filter_conditions is not None and any(
+            getattr(c, "key", None) == "syllabus_module" for c in filter_conditions.must or []
+        )
+        return (self.neighbourhood if curriculum else self.fallback)[:k], "snippet", {}
+
+    def format_search_results(self, docs):
+        return "formatted", {i: doc.metadata["name"] for i, doc in enumerate(docs)}
+
+
+def _doc(name, score, **metadata):
+    return SimpleNamespace(metadata={"name": name, "score": score, **metadata})
+
+
+def _modules_in(filter_conditions):
+    return next(c.match.any for c in filter_conditions.must if c.key == "syllabus_module")
+
+
+@pytest.mark.parametrize("radius, modules", [(0, ["Basics"]), (1, ["Basics", "Methods"])])
+def test_search_is_filtered_to_the_module_neighbourhood(course, radius, modules):
+    service = FakeVectorService(neighbourhood=[_doc("a", 0.9, syllabus_topic="Regression")])
+    _, _, _, info = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "t1", k=2, module_radius=radius)
+    (k, filter_conditions), = service.calls
+    assert k == 6 and _modules_in(filter_conditions) == modules
+    assert info["mode"] == "curriculum" and info["modules"] == modules
+
+
+def test_topic_names_and_ids_resolve_to_the_same_topic(course):
+    table = curriculum_retrieval.get_distance_table("ML")
+    assert table.resolve_topic("Clustering") == table.resolve_topic("t2") == "t2"
+    assert table.resolve_module("Methods") == "m2"
+    assert table.resolve_topic("Unknown") is None
+
+
+def _candidates():
+    return [
+        _doc("ahead", 0.90, syllabus_topic="Trees"),
+        _doc("two_back", 0.85, syllabus_topic="Regression"),
+        _doc("prerequisite", 0.85, syllabus_topic="Regression", syllabus_subtopics=["Algebra"]),
+        _doc("module_only", 0.84, syllabus_module="Basics"),
+        _doc("current", 0.80, syllabus_topic="Clustering"),
+    ]
+
+
+def _ranked(docs):
+    return [(doc.metadata["name"], doc.metadata["curriculum_distance"]) for doc in docs]
+
+
+def test_candidates_are_rescored_by_sequence_distance(course):
+    service = FakeVectorService(neighbourhood=_candidates())
+    docs, _, _, _ = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "Clustering", k=5)
+    # Forward steps cost CURRICULUM_FORWARD_DISTANCE_WEIGHT, backward steps cost 1
+    assert _ranked(docs) == [
+        ("ahead", 2.0), ("two_back", 1.0), ("prerequisite", 1.0), ("module_only", 1.0), ("current", 0.0),
+    ]
+    assert docs[0].metadata["cosine_score"] == 0.90
+    assert docs[0].metadata["score"] == pytest.approx(0.86)
+
+
+def test_prerequisite_subtopics_are_one_hop_away(course):
+    service = FakeVectorService(neighbourhood=_candidates())
+    docs, _, _, _ = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "t3", k=5)
+    # t3 requires Algebra, so a chunk covering it is one hop back despite sitting two lectures earlier
+    assert _ranked(docs) == [
+        ("ahead", 0.0), ("prerequisite", 1.0), ("two_back", 2.0), ("module_only", 2.0), ("current", 1.0),
+    ]
+
+
+def test_unknown_topic_falls_back_to_cosine_search(course):
+    service = FakeVectorService(fallback=[_doc("plain", 0.5)])
+    docs, snippet, _, info = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "nope", k=3)
+    assert service.calls == [(3, None)]
+    assert [d.metadata["name"] for d in docs] == ["plain"] and snippet == "snippet"
+    assert info["mode"] == "cosine" and info["modules"] == []
+
+
+def test_empty_neighbourhood_falls_back_to_cosine_search(course):
+    service = FakeVectorService(fallback=[_doc("plain", 0.5)])
+    docs, _, _, info = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "t1", k=3)
+    assert len(service.calls) == 2 and service.calls[-1] == (3, None)
+    assert info["mode"] == "cosine" and info["candidates"] == 0
+
+
+def test_missing_curriculum_falls_back_to_cosine_search(monkeypatch):
+    def unavailable(course):
+        raise ConnectionError("Neo4j driver not available")
+
+    monkeypatch.setattr(curriculum_graph_handler, "get_curriculum_model", unavailable)
+    service = FakeVectorService(fallback=[_doc("plain", 0.5)])
+    _, _, _, info = curriculum_retrieval.search_with_curriculum(service, "q", "ML", "t1", k=3)
+    assert service.calls == [(3, None)] and info["mode"] == "cosine"
+
+
+def test_table_is_rebuilt_only_when_the_model_version_changes(course):
+    first = curriculum_retrieval.get_distance_table("ML")
+    assert curriculum_retrieval.get_distance_table(" ml ") is first
+    course.version = 1
+    second = curriculum_retrieval.get_distance_table("ML")
+    assert second is not first and second.version == 1
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+import deletion_jobs
+
+
+class _FakeVectorService:
+    """Stands in for VectorDBService: point IDs per (user, document), optionally blocking on scroll."""
+
+    def __init__(self, points, gate=None):
+        self.points = points
+        self.gate = gate
+        self.deleted = []
+        self.l1_cache = None
+
+    def get_document_point_ids(self, user_id, document_name):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if document_name == "broken.pdf":
+            raise RuntimeError("scroll timed out")
+        return list(self.points.get((user_id, document_name), []))
+
+    def delete_points_batched(self, point_ids, batch_size=1000):
+        self.deleted.extend(point_ids)
+        return len(point_ids)
+
+
+class _FakeGraph:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_knowledge_graph(self, user_id, document_name):
+        self.deleted.append((user_id, document_name))
+
+
+@pytest.fixture(autouse=True)
+def isolated_jobs(monkeypatch):
+    monkeypatch.setattr(deletion_jobs, "_jobs", deletion_jobs.OrderedDict())
+    graph = _FakeGraph()
+    monkeypatch.setattr(deletion_jobs, "neo4j_handler", graph)
+    return graph
+
+
+def _wait_for(job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = deletion_jobs.get_job(job_id)
+        if job and job["status"] in deletion_jobs._TERMINAL_STATUSES:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_bulk_deletion_removes_points_and_graphs(isolated_jobs):
+    service = _FakeVectorService({("u1", "a.pdf"): [1, 2], ("u1", "b.pdf"): [3]})
+    job_id = deletion_jobs.start_bulk_deletion(service, [
+        {"user_id": "u1", "document_name": "a.pdf"},
+        {"user_id": "u1", "document_name": "b.pdf"},
+        {"user_id": "u1", "document_name": "a.pdf"},   # duplicates are collapsed
+    ])
+    job = _wait_for(job_id)
+    assert job["status"] == "completed"
+    assert job["total_documents"] == 2 and job["processed_documents"] == 2
+    assert job["qdrant_points_deleted"] == 3 and sorted(service.deleted) == [1, 2, 3]
+    assert isolated_jobs.deleted == [("u1", "a.pdf"), ("u1", "b.pdf")]
+
+
+def test_per_document_errors_are_recorded(isolated_jobs):
+    service = _FakeVectorService({("u1", "a.pdf"): [1]})
+    job_id = deletion_jobs.start_bulk_deletion(service, [
+        {"user_id": "u1", "document_name": "a.pdf"},
+        {"user_id": "u1", "document_name": "broken.pdf"},
+    ])
+    job = _wait_for(job_id)
+    assert job["status"] == "completed_with_errors"
+    errors = {d["document_name"]: d["error"] for d in job["documents"]}
+    assert errors["a.pdf"] is None and "scroll timed out" in errors["broken.pdf"]
+    # broken.pdf's points are still in Qdrant, so its graph is kept
+    assert isolated_jobs.deleted == [("u1", "a.pdf")]
+    assert {d["document_name"]: d["kg_deleted"] for d in job["documents"]} == {"a.pdf": True, "broken.pdf": None}
+
+
+@pytest.mark.parametrize("documents", [[{"user_id": "u1"}], ["a.pdf"], [None]])
+def test_invalid_documents_are_rejected(documents):
+    with pytest.raises(ValueError):
+        deletion_jobs.start_bulk_deletion(_FakeVectorService({}), documents)
+
+
+def test_eviction_keeps_unfinished_jobs(monkeypatch):
+    monkeypatch.setattr(deletion_jobs, "_MAX_TRACKED_JOBS", 2)
+    gate = threading.Event()
+    blocked = _FakeVectorService({("u1", "a.pdf"): [1]}, gate=gate)
+    running_id = deletion_jobs.start_bulk_deletion(blocked, [{"user_id": "u1", "document_name": "a.pdf"}])
+
+    finished = []
+    for i in range(3):
+        finished.append(deletion_jobs.start_bulk_deletion(
+            _FakeVectorService({}), [{"user_id": "u2", "document_name": f"{i}.pdf"}]))
+        _wait_for(finished[-1])
+
+    # The oldest job is still running, so finished ones were evicted instead
+    assert deletion_jobs.get_job(running_id)["status"] == "running"
+    assert deletion_jobs.get_job(finished[0]) is None
+
+    gate.set()
+    job = _wait_for(running_id)
+    assert job["status"] == "completed" and job["qdrant_points_deleted"] == 1
+
+
+def test_worker_survives_its_job_being_dropped():
+    gate = threading.Event()
+    service = _FakeVectorService({("u1", "a.pdf"): [1, 2]}, gate=gate)
+    job_id = deletion_jobs.start_bulk_deletion(service, [{"user_id": "u1", "document_name": "a.pdf"}])
+    with deletion_jobs._jobs_lock:
+        job = deletion_jobs._jobs.pop(job_id)
+    gate.set()
+    deadline = time.monotonic() + 5
+    while job["status"] not in deletion_jobs._TERMINAL_STATUSES and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job["status"] == "completed"
+    assert service.deleted == [1, 2]
+
+
+def test_on_finished_runs_after_the_job_even_when_it_fails():
+    class Exploding(_FakeVectorService):
+        def delete_points_batched(self, point_ids, batch_size=1000):
+            raise RuntimeError("qdrant down")
+
+    finished = threading.Event()
+    job_id = deletion_jobs.start_bulk_deletion(
+        Exploding({("u1", "a.pdf"): [1]}), [{"user_id": "u1", "document_name": "a.pdf"}], on_finished=finished.set
+    )
+    assert finished.wait(5)
+    assert _wait_for(job_id)["status"] == "failed"
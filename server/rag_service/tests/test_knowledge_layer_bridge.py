@@ -0,0 +1,267 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import knowledge_layer_bridge
+from knowledge_layer_bridge import CurriculumTopic, KnowledgeLayerBridge, TopicEmbeddingIndex
+
+
+def _bridge(monkeypatch, topic_names):
+    bridge = KnowledgeLayerBridge(neo4j_driver=object(), qdrant_client=object(), alignment_ttl_seconds=0)
+    loads = []
+
+    async def get_all_topics(subject):
+        loads.append(subject)
+        return [CurriculumTopic(topic_id=name, name=name, module="M", subtopics=[], prerequisites=[], course=subject)
+                for name in topic_names]
+
+    monkeypatch.setattr(bridge, "get_all_topics", get_all_topics)
+    monkeypatch.setattr(knowledge_layer_bridge, "get_course_version", None)
+    return bridge, loads
+
+
+def test_invalidated_alignment_reloads_topics_and_keeps_counts(monkeypatch):
+    topic_names = ["Regression"]
+    bridge, loads = _bridge(monkeypatch, topic_names)
+    first = asyncio.run(bridge.assess_data_alignment("ML", {"Regression": 20}))
+    assert asyncio.run(bridge.assess_data_alignment("ML")) == first
+    assert loads == ["ML"]
+
+    topic_names.append("Clustering")
+    bridge.invalidate_alignment()
+    report = asyncio.run(bridge.assess_data_alignment("ML"))
+    assert loads == ["ML", "ML"]
+    assert report["total_topics"] == 2
+    assert report["missing_topics"] == ["Clustering"]
+    assert report["version"] == first["version"] + 1
+
+
+def test_invalidating_one_subject_leaves_the_others(monkeypatch):
+    bridge, loads = _bridge(monkeypatch, ["Regression"])
+    asyncio.run(bridge.assess_data_alignment("ML", {}))
+    asyncio.run(bridge.assess_data_alignment("Stats", {}))
+    bridge.invalidate_alignment(" ml ")
+    asyncio.run(bridge.assess_data_alignment("ML"))
+    asyncio.run(bridge.assess_data_alignment("Stats"))
+    assert loads == ["ML", "Stats", "ML"]
+
+
+def test_topics_come_from_the_cached_curriculum_model(monkeypatch):
+    from curriculum_model import CurriculumModel
+
+    model = CurriculumModel.from_traversal("ML", 3, [
+        {"id": "m1", "name": "Basics", "order": 1, "topics": [
+            {"id": "t1", "name": "Regression", "subtopics": [{"id": "s2", "name": "Calculus"}, {"id": "s1", "name": "Algebra"}]},
+        ]},
+        {"id": "m2", "name": "Advanced", "order": 2, "topics": [{"id": "t2", "name": "Clustering", "subtopics": []}]},
+    ])
+    requested = []
+
+    async def get_curriculum_model_async(course):
+        requested.append(course)
+        return model
+
+    monkeypatch.setattr(knowledge_layer_bridge, "get_curriculum_model_async", get_curriculum_model_async)
+    bridge = KnowledgeLayerBridge(qdrant_client=object())
+    assert bridge.use_shared_driver
+
+    async def no_query(*args, **kwargs):
+        raise AssertionError("topics should come from the cached model")
+
+    monkeypatch.setattr(bridge, "_read", no_query)
+    topics = asyncio.run(bridge.get_all_topics("ML"))
+    assert requested == ["ML"]
+    assert [(t.topic_id, t.name, t.module, t.subtopics) for t in topics] == [
+        ("t1", "Regression", "Basics", ["Algebra", "Calculus"]),
+        ("t2", "Clustering", "Advanced", []),
+    ]
+
+
+class _CountingModel:
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, text):
+        self.calls.append(text)
+        return [1.0, 0.0]
+
+
+class _Hit:
+    def __init__(self, point_id, topic):
+        self.id, self.score = point_id, 0.9
+        self.payload = {"chunk_text_content": f"chunk {point_id}", "original_name": "a.pdf", "syllabus_topic": topic}
+
+
+def _fan_out_bridge(monkeypatch, topics_delay=0.0, chunks_delay=0.0, deadline=1.0):
+    """Bridge whose topic match and Qdrant search are stubs that record the vector they got after a delay."""
+    model = _CountingModel()
+    bridge = KnowledgeLayerBridge(qdrant_client=object(), embedding_model=model, deadline_seconds=deadline)
+    seen = {}
+
+    async def get_curriculum_topics(query, limit=5, course=None, query_vector=None):
+        seen["topics"] = query_vector
+        await asyncio.sleep(topics_delay)
+        return [CurriculumTopic(topic_id="t1", name="Regression", module="Basics", subtopics=["Algebra"],
+                                prerequisites=["Algebra"], course=course)]
+
+    async def search(query_vector, limit, query_filter):
+        seen["chunks"] = query_vector
+        await asyncio.sleep(chunks_delay)
+        return [_Hit(1, "Clustering")]
+
+    monkeypatch.setattr(bridge, "get_curriculum_topics", get_curriculum_topics)
+    monkeypatch.setattr(bridge, "_search", search)
+    return bridge, model, seen
+
+
+def test_enhanced_context_embeds_once_and_fans_out(monkeypatch):
+    bridge, model, seen = _fan_out_bridge(monkeypatch)
+    context = asyncio.run(bridge.get_enhanced_context("what is regression", course="ML"))
+    assert model.calls == ["what is regression"]
+    assert seen == {"topics": [1.0, 0.0], "chunks": [1.0, 0.0]}
+    assert [t.topic_id for t in context.curriculum_context] == ["t1"]
+    assert [c.chunk_id for c in context.document_chunks] == ["1"]
+    assert sorted(context.related_topics) == ["Algebra", "Clustering"] and context.prerequisite_chain == ["Algebra"]
+
+
+def test_fulltext_topic_match_does_not_wait_for_the_embedding(monkeypatch):
+    bridge, model, seen = _fan_out_bridge(monkeypatch)
+    asyncio.run(bridge.get_enhanced_context("what is regression"))
+    assert seen["topics"] is None and seen["chunks"] == [1.0, 0.0]
+    assert len(model.calls) == 1
+
+
+def test_slow_chunk_search_is_dropped_at_the_deadline(monkeypatch):
+    bridge, _, _ = _fan_out_bridge(monkeypatch, chunks_delay=5, deadline=0.1)
+    context, elapsed = asyncio.run(_timed(bridge.get_enhanced_context("q", course="ML")))
+    assert elapsed < 1
+    assert [t.topic_id for t in context.curriculum_context] == ["t1"] and context.document_chunks == []
+
+
+def test_slow_topic_match_is_dropped_at_the_deadline(monkeypatch):
+    bridge, _, _ = _fan_out_bridge(monkeypatch, topics_delay=5, deadline=0.1)
+    context, elapsed = asyncio.run(_timed(bridge.get_enhanced_context("q", course="ML")))
+    assert elapsed < 1
+    assert context.curriculum_context == [] and [c.chunk_id for c in context.document_chunks] == ["1"]
+
+
+def test_slow_embedding_is_cancelled_at_the_deadline(monkeypatch):
+    bridge, _, seen = _fan_out_bridge(monkeypatch, deadline=0.1)
+    cancelled = []
+
+    async def embed_query(query):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(query)
+            raise
+
+    monkeypatch.setattr(bridge, "embed_query", embed_query)
+    context, elapsed = asyncio.run(_timed(bridge.get_enhanced_context("q", course="ML")))
+    assert elapsed < 1 and cancelled == ["q"]
+    assert context.curriculum_context == [] and context.document_chunks == [] and seen == {}
+
+
+async def _timed(coro):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await coro
+    return result, loop.time() - started
+
+
+# Unit vectors per name: Algebra and Regression point the same way, so a query
+# about algebra should surface Regression through its subtopic
+_NAME_VECTORS = {
+    "Regression": [1.0, 0.0, 0.0], "Algebra": [0.6, 0.8, 0.0], "Calculus": [0.0, 0.0, 1.0],
+    "Clustering": [0.0, 1.0, 0.0], "Distances": [0.0, 0.6, 0.8],
+}
+
+
+class _NameModel:
+    def encode(self, texts):
+        return np.asarray([_NAME_VECTORS[text] for text in texts], dtype=np.float32)
+
+
+def _topic(topic_id, name, subtopics):
+    return CurriculumTopic(topic_id=topic_id, name=name, module="M", subtopics=subtopics, prerequisites=subtopics,
+                           course="ML")
+
+
+def _topic_index(monkeypatch, topics):
+    bridge = KnowledgeLayerBridge(neo4j_driver=object(), qdrant_client=object(), embedding_model=_NameModel())
+
+    async def get_all_topics(subject):
+        return topics
+
+    monkeypatch.setattr(bridge, "get_all_topics", get_all_topics)
+    monkeypatch.setattr(knowledge_layer_bridge, "get_course_version", None)
+    return bridge, asyncio.run(bridge.get_topic_index("ML"))
+
+
+def test_topic_index_rows_are_grouped_by_topic(monkeypatch):
+    _, index = _topic_index(monkeypatch, [_topic("t1", "Regression", ["Calculus", "Algebra"]),
+                                          _topic("t2", "Clustering", ["Distances"])])
+    assert index.starts.tolist() == [0, 3]
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+
+
+def test_topic_index_scores_a_topic_by_its_best_name(monkeypatch):
+    _, index = _topic_index(monkeypatch, [_topic("t1", "Regression", ["Calculus", "Algebra"]),
+                                          _topic("t2", "Clustering", ["Distances"])])
+    # Closest to Distances (t2's subtopic), then Calculus (t1's subtopic)
+    matched = index.match([0.0, 0.6, 0.8], limit=2)
+    assert [t.topic_id for t in matched] == ["t2", "t1"]
+    assert matched[0].score == pytest.approx(1.0) and matched[1].score == pytest.approx(0.8)
+    assert matched[0].subtopics == ["Distances"] and matched[0].course == "ML"
+    # Unnormalized queries score the same, and limit caps the result
+    assert [t.topic_id for t in index.match([0.0, 3.0, 4.0], limit=1)] == ["t2"]
+
+
+def test_topic_index_match_edge_cases(monkeypatch):
+    _, index = _topic_index(monkeypatch, [_topic("t1", "Regression", [])])
+    assert index.match([1.0, 0.0, 0.0], limit=0) == []
+    assert [t.topic_id for t in index.match([1.0, 0.0, 0.0], limit=5)] == ["t1"]
+    empty = TopicEmbeddingIndex(course="ML", version=0, built_at=0.0, topics=[],
+                                matrix=np.zeros((0, 0), dtype=np.float32), starts=np.zeros(0, dtype=np.intp))
+    assert empty.match([1.0, 0.0, 0.0], limit=3) == []
+
+
+def test_semantic_topic_match_uses_the_course_index(monkeypatch):
+    bridge, _ = _topic_index(monkeypatch, [_topic("t1", "Regression", ["Algebra"]),
+                                           _topic("t2", "Clustering", [])])
+
+    async def no_query(*args, **kwargs):
+        raise AssertionError("semantic matches should not query Neo4j")
+
+    monkeypatch.setattr(bridge, "_read", no_query)
+    matched = asyncio.run(bridge.get_curriculum_topics("algebra", limit=1, course="ML", query_vector=[0.6, 0.8, 0.0]))
+    assert [t.topic_id for t in matched] == ["t1"]
+
+
+def test_fulltext_topic_match_ranks_subtopic_hits_through_their_parent(monkeypatch):
+    bridge = KnowledgeLayerBridge(neo4j_driver=object(), qdrant_client=object())
+    reads = []
+
+    async def read(cypher, **params):
+        reads.append((cypher, params))
+        return [
+            {"topic_id": "t1", "name": "Regression", "course": "ML", "module": "Basics",
+             "subtopics": ["Algebra", "Calculus"], "score": 2.5},
+            {"topic_id": "t3", "name": "Trees", "course": "ML", "module": None, "subtopics": [], "score": None},
+        ]
+
+    monkeypatch.setattr(bridge, "_read", read)
+    matched = asyncio.run(bridge.get_curriculum_topics("Algebra basics", limit=2, course="ML"))
+
+    (cypher, params), = reads
+    # A Subtopic hit is credited to the Topic it is PREREQUISITE_OF, keeping that topic's best score
+    assert "OPTIONAL MATCH (node)-[:PREREQUISITE_OF]->(parent:Topic)" in cypher
+    assert "WITH coalesce(parent, node) AS t, score" in cypher and "WITH t, max(score) AS score" in cypher
+    assert cypher.index("max(score)") < cypher.index("ORDER BY score DESC LIMIT $limit")
+    assert params["luceneQuery"] == f"search_scope:{knowledge_layer_bridge.course_search_scope('ML')} AND name:(algebra basics)"
+    assert params["seedLimit"] == 10 and params["limit"] == 2
+    assert [(t.topic_id, t.module, t.prerequisites, t.score) for t in matched] == [
+        ("t1", "Basics", ["Algebra", "Calculus"], 2.5),
+        ("t3", "General", [], 0.0),
+    ]
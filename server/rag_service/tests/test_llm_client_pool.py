@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+import llm_client_pool
+import llm_rate_limiter
+
+
+class _FakeTransport:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeClient:
+    def __init__(self):
+        self.transport = _FakeTransport()
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """Build entries from fake clients instead of the SDK, recording each (api_key, model) created."""
+    calls = []
+
+    def create(api_key, model_name):
+        calls.append((api_key, model_name))
+        return llm_client_pool._PoolEntry(object(), _FakeClient(), llm_client_pool.key_fingerprint(api_key), model_name)
+
+    monkeypatch.setattr(llm_client_pool, "_create_entry", create)
+    monkeypatch.setattr(llm_client_pool, "_pool", llm_client_pool.OrderedDict())
+    return calls
+
+
+def test_model_is_reused_per_key_and_model(created):
+    with llm_client_pool.pooled_model("key-a", "flash") as first:
+        pass
+    with llm_client_pool.pooled_model("key-a", "flash") as again:
+        pass
+    with llm_client_pool.pooled_model("key-a", "pro") as other_model:
+        pass
+    assert again is first and other_model is not first
+    assert created == [("key-a", "flash"), ("key-a", "pro")]
+    assert {c["model"]: c["calls"] for c in llm_client_pool.pool_stats()["clients"]} == {"flash": 2, "pro": 1}
+
+
+def test_keys_never_share_a_client_and_idle_entries_are_evicted(created):
+    with llm_client_pool.pooled_model("key-a", "flash") as a:
+        pass
+    oldest = llm_client_pool._pool[("key-a", "flash")]
+    with llm_client_pool.pooled_model("key-b", "flash") as b:
+        pass
+    with llm_client_pool.pooled_model("key-c", "flash"):
+        pass
+    assert a is not b
+    # LLM_CLIENT_POOL_MAX_SIZE is 2: the least recently used idle entry is closed
+    assert ("key-a", "flash") not in llm_client_pool._pool and oldest.client.transport.closed
+
+
+def test_fingerprint_matches_the_rate_limiter():
+    assert llm_client_pool.key_fingerprint("secret") == llm_rate_limiter.key_fingerprint("secret")
+    assert "secret" not in llm_client_pool.key_fingerprint("secret")
@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+from llm_rate_limiter import (
+    LLMRateLimiter, RateLimitExceeded, is_retryable_error, key_fingerprint, retry_after_seconds
+)
+
+
+def _limiter(**kwargs):
+    options = dict(requests_per_minute=600, burst=1, backoff_base_seconds=0.01, backoff_max_seconds=0.2)
+    options.update(kwargs)
+    return LLMRateLimiter(**options)
+
+
+def test_token_bucket_paces_admissions():
+    limiter = _limiter(requests_per_minute=1200, burst=2)   # 20/s after a burst of 2
+    started = time.monotonic()
+    for _ in range(6):
+        limiter.acquire("key")
+    elapsed = time.monotonic() - started
+    assert 0.15 <= elapsed < 0.6
+
+
+def test_buckets_are_per_key():
+    limiter = _limiter(requests_per_minute=6)
+    limiter.acquire("key-a")
+    limiter.acquire("key-b", timeout=0.05)   # a fresh bucket
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire("key-a", timeout=0.05)
+
+
+def test_interactive_calls_are_admitted_before_queued_batch_calls():
+    limiter = _limiter(requests_per_minute=1200)
+    limiter.acquire("key")   # drain the burst so later callers queue
+    order = []
+
+    def call(priority, i):
+        limiter.acquire("key", priority)
+        order.append(f"{priority}{i}")
+
+    batch = [threading.Thread(target=call, args=("batch", i)) for i in range(3)]
+    for t in batch:
+        t.start()
+    time.sleep(0.02)
+    interactive = [threading.Thread(target=call, args=("interactive", i)) for i in range(2)]
+    for t in interactive:
+        t.start()
+    for t in batch + interactive:
+        t.join()
+    assert [o[:5] for o in order[:2]] == ["inter", "inter"]
+    assert sorted(order[2:]) == ["batch0", "batch1", "batch2"]
+
+
+def test_queue_timeout_raises_a_429():
+    limiter = _limiter()
+    limiter.penalize("key", 5)
+    with pytest.raises(RateLimitExceeded, match="429") as exc:
+        limiter.acquire("key", "interactive", timeout=0.05)
+    assert is_retryable_error(exc.value)
+    assert limiter.stats()["priorities"]["interactive"]["rejected"] == 1
+
+
+def test_rate_limited_calls_back_off_and_retry():
+    limiter = _limiter()
+    attempts = []
+
+    def flaky():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise Exception("429 Resource has been exhausted. Please retry in 0.05s")
+        return "ok"
+
+    assert limiter.call("key", flaky) == "ok"
+    assert len(attempts) == 3
+    assert attempts[1] - attempts[0] >= 0.05          # the server's hint is a floor
+    assert limiter.stats()["upstream_rate_limited"] == 2
+
+
+def test_non_retryable_errors_fail_fast():
+    limiter = _limiter()
+    attempts = []
+
+    def bad_key():
+        attempts.append(1)
+        raise Exception("400 API key not valid. Please pass a valid API key.")
+
+    with pytest.raises(Exception, match="API key not valid"):
+        limiter.call("key", bad_key, retryable=is_retryable_error)
+    assert attempts == [1]
+
+
+def test_transient_errors_retry_up_to_max_attempts():
+    limiter = _limiter(max_attempts=3)
+    attempts = []
+
+    def overloaded():
+        attempts.append(1)
+        raise Exception("503 The model is overloaded")
+
+    with pytest.raises(Exception, match="503"):
+        limiter.call("key", overloaded, retryable=is_retryable_error)
+    assert len(attempts) == 3
+
+
+@pytest.mark.parametrize("message, retryable", [
+    ("503 The model is overloaded", True),
+    ("Gemini call failed: 503 Service Unavailable", True),
+    ("upstream returned 504 Gateway Timeout", True),
+    ("400 API key not valid", False),
+    ("Gemini call failed: 5030 tokens requested", False),
+])
+def test_transient_status_is_found_anywhere_in_the_message(message, retryable):
+    assert is_retryable_error(Exception(message)) is retryable
+
+
+def test_backoff_is_jittered_and_capped():
+    limiter = _limiter(backoff_base_seconds=1, backoff_max_seconds=4)
+    delays = [limiter.backoff_delay(attempt) for attempt in range(1, 8) for _ in range(20)]
+    assert all(0 <= d <= 4 for d in delays)
+    assert len({round(d, 6) for d in delays}) > 1
+    assert limiter.backoff_delay(1, retry_after=2.5) >= 2.5
+
+
+def test_retry_after_hint_parsing():
+    assert retry_after_seconds(Exception("Please retry in 13.5s.")) == 13.5
+    assert retry_after_seconds(Exception("retry_delay {\n  seconds: 7\n}")) == 7
+    assert retry_after_seconds(Exception("quota exceeded")) is None
+
+
+def test_penalty_and_adaptive_rate_are_shared_across_processes(tmp_path):
+    path = str(tmp_path / "limits.sqlite3")
+    first = _limiter(requests_per_minute=60, burst=1, state_path=path)
+    second = _limiter(requests_per_minute=60, burst=1, state_path=path)
+    first.acquire("key")
+    with pytest.raises(RateLimitExceeded):
+        second.acquire("key", timeout=0.05)   # the bucket the first limiter drained
+
+    first.penalize("key", 0.3)
+    state = second._store.update(key_fingerprint("key"), second.burst, lambda s, now: dict(s))
+    assert state["factor"] == 0.5 and state["blocked_until"] > time.time()
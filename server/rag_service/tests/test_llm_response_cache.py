@@ -0,0 +1,79 @@
+import sqlite3
+import time
+
+import llm_response_cache
+
+
+class _Generator:
+    def __init__(self, response="answer"):
+        self.response = response
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.response
+
+
+def test_cache_key_covers_model_prompt_and_params():
+    key = llm_response_cache.cache_key("gemini", "prompt", {"temperature": 0})
+    assert key == llm_response_cache.cache_key("gemini", "prompt", {"temperature": 0})
+    assert key != llm_response_cache.cache_key("other", "prompt", {"temperature": 0})
+    assert key != llm_response_cache.cache_key("gemini", "prompt!", {"temperature": 0})
+    assert key != llm_response_cache.cache_key("gemini", "prompt", {"temperature": 1})
+
+
+def test_second_identical_request_is_a_hit(rag_config):
+    generate = _Generator()
+    before = llm_response_cache.cache_stats()
+    assert llm_response_cache.cached_generate("gemini", "p", generate, params={"a": 1}) == "answer"
+    assert llm_response_cache.cached_generate("gemini", "p", generate, params={"a": 1}) == "answer"
+    assert generate.calls == 1
+    after = llm_response_cache.cache_stats()
+    assert after["hits"] - before["hits"] == 1 and after["misses"] - before["misses"] == 1
+    assert after["entries"] == 1
+
+
+def test_bypass_and_disabled_cache_always_generate(rag_config, monkeypatch):
+    generate = _Generator()
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    llm_response_cache.cached_generate("gemini", "p", generate, use_cache=False)
+    monkeypatch.setattr(rag_config, "LLM_RESPONSE_CACHE_ENABLED", False)
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    assert generate.calls == 3
+
+
+def test_empty_responses_are_not_cached(rag_config):
+    generate = _Generator(response="")
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    assert generate.calls == 2
+
+
+def test_expired_entries_are_regenerated(rag_config, monkeypatch):
+    generate = _Generator()
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    real_time = time.time
+    monkeypatch.setattr(llm_response_cache.time, "time", lambda: real_time() + rag_config.LLM_RESPONSE_CACHE_TTL_SECONDS + 1)
+    llm_response_cache.cached_generate("gemini", "p", generate)
+    assert generate.calls == 2
+
+
+def test_evict_drops_least_recently_used_entries_over_budget(rag_config, monkeypatch):
+    monkeypatch.setattr(rag_config, "LLM_RESPONSE_CACHE_MAX_BYTES", 25)
+    keys = [llm_response_cache.cache_key("gemini", f"p{i}") for i in range(3)]
+    for key in keys:
+        llm_response_cache.put(key, "gemini", "x" * 10, 0.1)
+        time.sleep(0.01)
+    assert llm_response_cache.get(keys[0]) is not None  # touch: keys[1] is now the oldest
+    assert llm_response_cache.evict() == 1
+    assert llm_response_cache.get(keys[1]) is None
+    assert llm_response_cache.get(keys[0]) is not None and llm_response_cache.get(keys[2]) is not None
+
+
+def test_cache_errors_never_fail_generation(rag_config, monkeypatch):
+    def broken(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(llm_response_cache, "get", broken)
+    monkeypatch.setattr(llm_response_cache, "put", broken)
+    assert llm_response_cache.cached_generate("gemini", "p", _Generator()) == "answer"
@@ -0,0 +1,256 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+from qdrant_client import QdrantClient, models
+
+import local_vector_store
+from local_vector_store import DocumentSearchCache, LocalVectorStore, VectorStoreBackend
+
+DIM = 4
+
+
+def _point(i, **payload):
+    vector = [0.0] * DIM
+    vector[i % DIM] = 1.0
+    vector[(i + 1) % DIM] = 0.1 * (i + 1)
+    return models.PointStruct(id=i, vector=vector, payload=payload or {"i": i})
+
+
+def _store(path=None):
+    store = LocalVectorStore(path=str(path) if path else None)
+    store.create_collection("docs", models.VectorParams(size=DIM, distance=models.Distance.COSINE))
+    return store
+
+
+def _ids(records):
+    return sorted(r.id for r in records)
+
+
+def _scroll_all(store, page=3, **kwargs):
+    ids, offset = [], None
+    while True:
+        records, offset = store.scroll("docs", limit=page, offset=offset, **kwargs)
+        ids.extend(r.id for r in records)
+        if offset is None:
+            return ids
+
+
+# --- persistence -------------------------------------------------------------
+
+def test_writes_append_to_the_log_not_the_sidecar(tmp_path):
+    store = _store(tmp_path)
+    store.upsert("docs", [_point(i) for i in range(10)])
+    sidecar = tmp_path / "docs" / "payload.json"
+    log = tmp_path / "docs" / "payload.log"
+    sidecar_before = sidecar.read_bytes()
+
+    store.upsert("docs", [_point(10)])
+    store.delete("docs", models.PointIdsList(points=[3]))
+    assert sidecar.read_bytes() == sidecar_before
+    assert len(log.read_text().splitlines()) == 3
+
+
+def test_reopen_replays_the_log(tmp_path):
+    store = _store(tmp_path)
+    store.upsert("docs", [_point(i) for i in range(6)])
+    store.upsert("docs", [_point(2, tag="updated")])
+    store.delete("docs", models.PointIdsList(points=[4]))
+
+    reopened = LocalVectorStore(path=str(tmp_path))
+    assert reopened.count("docs").count == 5
+    records, _ = reopened.scroll("docs", limit=10, with_vectors=True)
+    by_id = {r.id: r for r in records}
+    assert 4 not in by_id
+    assert by_id[2].payload == {"tag": "updated"}
+    original = {r.id: r for r in store.scroll("docs", limit=10, with_vectors=True)[0]}
+    assert by_id[5].vector == pytest.approx(original[5].vector)
+
+
+def test_torn_log_tail_is_ignored(tmp_path):
+    store = _store(tmp_path)
+    store.upsert("docs", [_point(i) for i in range(3)])
+    with open(tmp_path / "docs" / "payload.log", "a") as f:
+        f.write('{"gen":0,"op":"upsert","rows":[[3,')
+    assert LocalVectorStore(path=str(tmp_path)).count("docs").count == 3
+
+
+def test_log_is_folded_into_the_sidecar_once_it_outgrows_it(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_vector_store, "_COMPACT_MIN_LOG_BYTES", 0)
+    store = _store(tmp_path)
+    for i in range(20):
+        store.upsert("docs", [_point(i)])
+    log_size = os.path.getsize(tmp_path / "docs" / "payload.log")
+    assert log_size <= os.path.getsize(tmp_path / "docs" / "payload.json")
+    assert LocalVectorStore(path=str(tmp_path)).count("docs").count == 20
+
+
+def test_deleted_rows_are_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_vector_store, "_COMPACT_MIN_DEAD_ROWS", 4)
+    store = _store(tmp_path)
+    store.upsert("docs", [_point(i) for i in range(10)])
+    store.delete("docs", models.PointIdsList(points=[0, 1, 2, 3, 4, 5]))
+
+    collection = store._collections["docs"]
+    assert collection.count == 4 and collection.generation == 1
+    hits = store.search("docs", query_vector=_point(7).vector, limit=1)
+    assert hits[0].id == 7
+
+    reopened = LocalVectorStore(path=str(tmp_path))
+    assert _ids(reopened.scroll("docs", limit=10)[0]) == [6, 7, 8, 9]
+    reopened.upsert("docs", [_point(11)])
+    assert _ids(LocalVectorStore(path=str(tmp_path)).scroll("docs", limit=10)[0]) == [6, 7, 8, 9, 11]
+
+
+def test_scroll_offsets_survive_compaction(monkeypatch):
+    monkeypatch.setattr(local_vector_store, "_COMPACT_MIN_DEAD_ROWS", 2)
+    store = _store()
+    store.upsert("docs", [_point(i) for i in range(8)])
+    first, offset = store.scroll("docs", limit=4)
+    assert _ids(first) == [0, 1, 2, 3]
+    store.delete("docs", models.PointIdsList(points=[0, 1, 2, 3, 4]))   # triggers compaction
+    rest, offset = store.scroll("docs", limit=10, offset=offset)
+    assert _ids(rest) == [5, 6, 7] and offset is None
+
+
+# --- filters -----------------------------------------------------------------
+
+@pytest.fixture
+def filtered_store():
+    store = _store()
+    store.upsert("docs", [
+        _point(0, title="Intro to graphs", tags=["a", "b"], meta={"page": 1}, at="2024-01-05T10:00:00Z"),
+        _point(1, title="Trees", tags=["c"], meta={"page": 7}, at="2024-03-01T00:00:00+00:00"),
+        _point(2, title="Graph search", tags=[], sections=[{"name": "bfs"}, {"name": "dfs"}]),
+    ])
+    return store
+
+
+def _matching(store, **filter_kwargs):
+    return _ids(store.scroll("docs", scroll_filter=models.Filter(**filter_kwargs), limit=10)[0])
+
+
+def test_nested_keys_and_text_match(filtered_store):
+    fc = models.FieldCondition
+    assert _matching(filtered_store, must=[fc(key="meta.page", range=models.Range(gte=5))]) == [1]
+    assert _matching(filtered_store, must=[fc(key="sections[].name", match=models.MatchValue(value="dfs"))]) == [2]
+    assert _matching(filtered_store, must=[fc(key="title", match=models.MatchText(text="raph"))]) == [0, 2]
+
+
+def test_values_count_datetime_range_and_min_should(filtered_store):
+    fc = models.FieldCondition
+    assert _matching(filtered_store, must=[fc(key="tags", values_count=models.ValuesCount(gte=1))]) == [0, 1]
+    since = models.DatetimeRange(gte=datetime(2024, 2, 1, tzinfo=timezone.utc))
+    assert _matching(filtered_store, must=[fc(key="at", range=since)]) == [1]
+    min_should = models.MinShould(min_count=2, conditions=[
+        fc(key="tags", match=models.MatchAny(any=["a", "c"])),
+        fc(key="title", match=models.MatchText(text="Intro")),
+        models.IsNullCondition(is_null=models.PayloadField(key="sections")),
+    ])
+    assert _matching(filtered_store, min_should=min_should) == [0, 1]
+
+
+def test_unsupported_conditions_raise_value_error(filtered_store):
+    geo = models.FieldCondition(key="loc", geo_radius=models.GeoRadius(
+        center=models.GeoPoint(lat=0, lon=0), radius=10))
+    with pytest.raises(ValueError):
+        _matching(filtered_store, must=[geo])
+
+
+# --- interface ---------------------------------------------------------------
+
+def test_backend_interface():
+    assert isinstance(QdrantClient(":memory:"), VectorStoreBackend)
+    assert isinstance(LocalVectorStore(), VectorStoreBackend)
+
+    class Partial(VectorStoreBackend):
+        def search(self, *args, **kwargs):
+            return []
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+# --- L1 cache ----------------------------------------------------------------
+
+class _SlowSource:
+    """Scrolls a backing store, blocking on one document until released."""
+
+    def __init__(self, store, slow_file):
+        self.store, self.slow_file = store, slow_file
+        self.entered, self.release = threading.Event(), threading.Event()
+        self.scrolls = 0
+
+    def scroll(self, collection_name, scroll_filter, **kwargs):
+        self.scrolls += 1
+        if scroll_filter.must[0].match.value == self.slow_file:
+            self.entered.set()
+            self.release.wait(5)
+        return self.store.scroll(collection_name, scroll_filter=scroll_filter, **kwargs)
+
+
+@pytest.fixture
+def two_documents():
+    store = _store()
+    store.upsert("docs", [_point(i, file_name="a.pdf" if i < 3 else "b.pdf") for i in range(6)])
+    return store
+
+
+def test_slow_load_does_not_block_other_documents(two_documents):
+    cache = DocumentSearchCache(vector_dim=DIM, max_docs=4, max_points=100, ttl_seconds=60)
+    source = _SlowSource(two_documents, slow_file="a.pdf")
+    assert cache.search(source, "docs", "b.pdf", _point(4).vector, 2, None)   # b.pdf now cached
+
+    results = {}
+    slow = threading.Thread(target=lambda: results.setdefault(
+        "a", cache.search(source, "docs", "a.pdf", _point(1).vector, 2, None)))
+    slow.start()
+    assert source.entered.wait(2)
+    started = time.monotonic()
+    hits = cache.search(source, "docs", "b.pdf", _point(4).vector, 2, None)
+    assert time.monotonic() - started < 0.5
+    assert hits[0].id == 4
+    source.release.set()
+    slow.join()
+    assert results["a"][0].id == 1
+
+
+def test_concurrent_misses_share_one_load(two_documents):
+    cache = DocumentSearchCache(vector_dim=DIM, max_docs=4, max_points=100, ttl_seconds=60)
+    source = _SlowSource(two_documents, slow_file="a.pdf")
+    threads = [threading.Thread(target=cache.search, args=(source, "docs", "a.pdf", _point(1).vector, 2, None))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    assert source.entered.wait(2)
+    time.sleep(0.1)
+    source.release.set()
+    for t in threads:
+        t.join()
+    assert source.scrolls == 1
+
+
+def test_invalidation_during_load_discards_the_load(two_documents):
+    cache = DocumentSearchCache(vector_dim=DIM, max_docs=4, max_points=100, ttl_seconds=60)
+    source = _SlowSource(two_documents, slow_file="a.pdf")
+    results = {}
+    t = threading.Thread(target=lambda: results.setdefault(
+        "a", cache.search(source, "docs", "a.pdf", _point(1).vector, 2, None)))
+    t.start()
+    assert source.entered.wait(2)
+    cache.invalidate("a.pdf")
+    source.release.set()
+    t.join()
+    assert results["a"] is None          # caller falls back to Qdrant
+    assert "a.pdf" not in cache._entries
+
+
+def test_facet_counts_array_elements_once_per_point():
+    store = _store()
+    store.upsert("docs", [_point(0, tags=["a", "b", "a"]), _point(1, tags="a"), _point(2, tags=None), _point(3, other=1)])
+    response = store.facet("docs", "tags", limit=5, exact=True)
+    assert [(hit.value, hit.count) for hit in response.hits] == [("a", 2), ("b", 1)]
+    scoped = store.facet("docs", "tags", facet_filter=models.Filter(must=[models.HasIdCondition(has_id=[1])]))
+    assert [(hit.value, hit.count) for hit in scoped.hits] == [("a", 1)]
@@ -0,0 +1,374 @@
+import asyncio
+import threading
+
+import pytest
+from neo4j import exceptions as neo4j_exceptions
+
+import neo4j_handler
+
+
+class _RecordingTx:
+    """Records Cypher runs; returns no rows."""
+
+    def __init__(self):
+        self.runs = []
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+        return _Result()
+
+
+class _Result:
+    def data(self):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+    def single(self):
+        return None
+
+
+@pytest.mark.parametrize("query", ["", "   ", "\n\t", None])
+def test_empty_queries_have_no_lucene_query(query):
+    assert neo4j_handler._scoped_lucene_query("u1", "Notes.pdf", query) is None
+
+
+def test_lucene_query_is_scoped_and_escaped():
+    lucene = neo4j_handler._scoped_lucene_query("u1", "Notes.pdf", "  What is O(n)?  ")
+    assert lucene == f"search_scope:{neo4j_handler.search_scope('u1', 'Notes.pdf')} AND (what is o\\(n\\)\\?)"
+
+
+def test_empty_query_returns_no_seeds_without_querying():
+    tx = _RecordingTx()
+    result = neo4j_handler._search_kg_transactional(tx, "u1", "Notes.pdf", "  ")
+    assert result == {"seeds": [], "nodes": {}, "edges": []}
+    assert tx.runs == []
+
+
+def test_search_knowledge_graph_skips_the_database_for_empty_queries(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("Neo4j should not be queried")
+
+    monkeypatch.setattr(neo4j_handler, "_execute_read_tx", fail)
+    facts = neo4j_handler.search_knowledge_graph("u1", "Notes.pdf", " ")
+    assert "error" not in facts.lower()
+    assert facts == neo4j_handler._format_kg_facts({"seeds": [], "nodes": {}, "edges": []})
+
+
+class _StoredKgTx(_RecordingTx):
+    """Serves a stored KG to the state reads and counts write rows."""
+
+    def __init__(self, node_hashes, edges):
+        super().__init__()
+        self.node_hashes = node_hashes
+        self.edges = edges
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+        if "content_hash AS hash" in query:
+            return _Rows([{"id": node_id, "hash": h} for node_id, h in self.node_hashes.items()])
+        if "r.type AS relationship" in query:
+            return _Rows([{"from": a, "to": b, "relationship": r} for a, b, r in self.edges])
+        rows = params.get("nodes_data") or params.get("edges_data") or params.get("nodeIds") or []
+        return _Rows([[len(rows)]])
+
+
+class _Rows(_Result):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def peek(self):
+        return self.rows[0] if self.rows else None
+
+    def single(self):
+        return self.rows[0] if self.rows else None
+
+
+def _node(node_id, description):
+    return {"id": node_id, "type": "concept", "description": description, "parent": None}
+
+
+def test_node_writes_merge_on_document_key_and_keep_display_name():
+    tx = _StoredKgTx({}, set())
+    nodes = neo4j_handler._normalize_kg_nodes([_node("a", "A")])
+    neo4j_handler._add_nodes_transactional(tx, nodes, "u1", "  Notes.PDF ")
+    query, params = tx.runs[0]
+    assert "document_key: $documentKey, nodeId: props.id" in query
+    assert "documentName: $documentName" not in query.split("SET")[0]
+    assert params["documentKey"] == "notes.pdf"
+    assert params["documentName"] == "  Notes.PDF "
+
+
+def test_sync_diffs_and_writes_in_one_transaction():
+    stored_nodes = neo4j_handler._normalize_kg_nodes([_node("a", "A"), _node("b", "B"), _node("c", "C")])
+    tx = _StoredKgTx({n["id"]: n["content_hash"] for n in stored_nodes},
+                     {("a", "b", "RELATES"), ("a", "c", "RELATES")})
+    incoming = neo4j_handler._normalize_kg_nodes([_node("a", "A"), _node("b", "B changed"), _node("d", "D")])
+    edges = neo4j_handler._normalize_kg_edges([{"from": "a", "to": "d", "relationship": "relates"}])
+
+    changes = neo4j_handler._sync_kg_transactional(tx, incoming, edges, 100, "u1", "Notes.pdf")
+
+    assert changes["nodes"] == {"added": 1, "updated": 1, "removed": 1, "unchanged": 1}
+    assert changes["edges"] == {"added": 1, "removed": 2, "unchanged": 0}
+    writes = [params for query, params in tx.runs if "UNWIND" in query]
+    assert [p.get("nodeIds") for p in writes if "nodeIds" in p] == [["c"]]
+    # a->b is dropped explicitly; a->c goes with c's DETACH DELETE
+    assert [p["edges_data"] for p in writes if "edges_data" in p][0] == [{"from": "a", "to": "b", "relationship": "RELATES"}]
+    assert all(p.get("documentKey") == "notes.pdf" for query, p in tx.runs)
+
+
+def test_sync_knowledge_graph_uses_a_single_write_transaction(monkeypatch):
+    calls = []
+
+    def execute_write(tx_function, *args):
+        calls.append(tx_function)
+        return tx_function(_StoredKgTx({}, set()), *args)
+
+    monkeypatch.setattr(neo4j_handler, "_execute_write_tx", execute_write)
+    monkeypatch.setattr(neo4j_handler, "_execute_read_tx", lambda *a, **k: pytest.fail("separate read transaction"))
+    result = neo4j_handler.sync_knowledge_graph("u1", "Notes.pdf", [_node("a", "A")], [])
+    assert calls == [neo4j_handler._sync_kg_transactional]
+    assert result["nodes"]["added"] == 1 and result["nodes_affected"] == 1
+
+
+class _FakeSession:
+    """execute_write runs the function on a recording tx; `failures` holds one error (or None) per attempt."""
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.tx = _StoredKgTx({}, set())
+        self.attempts = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute_write(self, tx_function, *args):
+        self.attempts += 1
+        error = self.failures.pop(0) if self.failures else None
+        if error is not None:
+            raise error
+        return tx_function(self.tx, *args)
+
+    def batches(self, key):
+        return [len(params[key]) for query, params in self.tx.runs if key in params]
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(neo4j_handler.time, "sleep", delays.append)
+    return delays
+
+
+def _nodes(count):
+    return neo4j_handler._normalize_kg_nodes([_node(f"n{i}", str(i)) for i in range(count)])
+
+
+def test_write_batches_splits_rows_into_one_transaction_per_batch(sleeps):
+    session, stats = _FakeSession(), {"batches": 0, "retries": 0}
+    affected = neo4j_handler._write_batches(session, neo4j_handler._add_nodes_transactional, _nodes(5), 2, "u1", "Notes.pdf", stats)
+    assert affected == 5
+    assert session.batches("nodes_data") == [2, 2, 1]
+    assert stats == {"batches": 3, "retries": 0} and sleeps == []
+
+
+def test_write_batches_retries_only_the_failed_batch(sleeps):
+    session = _FakeSession([None, neo4j_exceptions.TransientError("deadlock"), neo4j_exceptions.ServiceUnavailable("gone")])
+    stats = {"batches": 0, "retries": 0}
+    affected = neo4j_handler._write_batches(session, neo4j_handler._add_nodes_transactional, _nodes(5), 2, "u1", "Notes.pdf", stats)
+    assert affected == 5 and session.attempts == 5
+    assert session.batches("nodes_data") == [2, 2, 1]
+    assert stats == {"batches": 3, "retries": 2}
+    assert sleeps == [0.5, 1.0]            # exponential backoff per batch
+
+
+def test_write_batches_gives_up_after_max_retries(sleeps):
+    session = _FakeSession([neo4j_exceptions.TransientError("busy")] * 3)
+    with pytest.raises(neo4j_exceptions.TransientError):
+        neo4j_handler._write_batches(session, neo4j_handler._add_nodes_transactional, _nodes(1), 2, "u1", "Notes.pdf",
+                                     {"batches": 0, "retries": 0})
+    assert session.attempts == 3           # first attempt + KG_WRITE_MAX_RETRIES
+
+
+def test_write_batches_does_not_retry_client_errors(sleeps):
+    session = _FakeSession([neo4j_exceptions.ClientError("syntax")])
+    with pytest.raises(neo4j_exceptions.ClientError):
+        neo4j_handler._write_batches(session, neo4j_handler._add_nodes_transactional, _nodes(3), 2, "u1", "Notes.pdf",
+                                     {"batches": 0, "retries": 0})
+    assert session.attempts == 1 and sleeps == []
+
+
+def test_ingest_reports_batch_metrics(monkeypatch, sleeps):
+    session = _FakeSession([None, neo4j_exceptions.TransientError("deadlock")])
+    monkeypatch.setattr(neo4j_handler, "get_driver_instance", lambda: type("Driver", (), {"session": lambda self, database: session})())
+    monkeypatch.setattr(neo4j_handler.config, "KG_WRITE_BATCH_SIZE", 2)
+    nodes = [_node(f"n{i}", str(i)) for i in range(3)] + [{"id": "  "}]
+    edges = [{"from": "n0", "to": "n1", "relationship": "rel"}, {"from": "n0", "to": "n1", "relationship": "rel"}]
+
+    result = neo4j_handler.ingest_knowledge_graph("u1", "Notes.pdf", nodes, edges)
+
+    assert result["nodes_affected"] == 3 and result["edges_affected"] == 1
+    metrics = result["metrics"]
+    assert (metrics["batch_size"], metrics["batches"], metrics["retries"]) == (2, 3, 1)
+    assert metrics["nodes_skipped"] == 1 and metrics["edges_skipped"] == 1
+
+
+class _DeletingSession:
+    """Answers each batched-delete round with the next count from `rounds`."""
+
+    def __init__(self, rounds):
+        self.rounds = list(rounds)
+        self.runs = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query, **params):
+        self.runs.append((query, params))
+        return _Rows([{"deleted": self.rounds.pop(0)}])
+
+
+@pytest.fixture
+def deleting_session(monkeypatch):
+    def install(rounds):
+        session = _DeletingSession(rounds)
+        monkeypatch.setattr(neo4j_handler, "get_driver_instance",
+                            lambda: type("Driver", (), {"session": lambda self, database: session})())
+        return session
+    return install
+
+
+def test_batched_delete_runs_rounds_until_one_comes_back_short(deleting_session):
+    session = deleting_session([20, 20, 3])
+    progress = []
+    deleted = neo4j_handler.delete_nodes_in_batches("Topic", {"course_key": "ml"}, progress=lambda *a: progress.append(a))
+    assert deleted == 43
+    assert progress == [("Topic", 20), ("Topic", 40), ("Topic", 43)]
+    query, params = session.runs[0]
+    assert query.startswith("MATCH (n:Topic {course_key: $props.course_key}) WITH n LIMIT $roundSize")
+    assert "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF $batchSize ROWS" in query
+    # NEO4J_DELETE_BATCH_SIZE rows per transaction, ten transactions per round
+    assert params == {"props": {"course_key": "ml"}, "roundSize": 20, "batchSize": 2}
+    assert len(session.runs) == 3
+
+
+def test_batched_delete_of_nothing_is_one_round(deleting_session):
+    session = deleting_session([0])
+    progress = []
+    assert neo4j_handler.delete_nodes_in_batches("Topic", {"course_key": "ml"}, batch_size=500,
+                                                 progress=lambda *a: progress.append(a)) == 0
+    assert len(session.runs) == 1 and progress == []
+    assert session.runs[0][1]["roundSize"] == 5000
+
+
+def test_knowledge_graph_deletion_is_batched_on_the_document_key(deleting_session):
+    session = deleting_session([1])
+    assert neo4j_handler.delete_knowledge_graph("u1", " Notes.PDF ") is True
+    query, params = session.runs[0]
+    assert query.startswith("MATCH (n:KnowledgeNode {userId: $props.userId, document_key: $props.document_key})")
+    assert params["props"] == {"userId": "u1", "document_key": "notes.pdf"}
+
+
+class _FakeAsyncDriver:
+    """Records the loop and thread each read runs on; returns the query's params as its one row."""
+
+    def __init__(self, uri, auth, **pool):
+        self.uri, self.auth, self.pool = uri, auth, pool
+        self.created_on = asyncio.get_running_loop()
+        self.reads = []
+        self.closed = False
+
+    def session(self, database):
+        driver = self
+
+        class Session:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def execute_read(self, work):
+                return await work(Tx())
+
+        class Tx:
+            async def run(self, cypher, params):
+                driver.reads.append((cypher, params, database, asyncio.get_running_loop(), threading.current_thread()))
+
+                class Result:
+                    async def data(self):
+                        return [dict(params)]
+                return Result()
+
+        return Session()
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def async_driver(monkeypatch):
+    drivers = []
+
+    class FakeAsyncGraphDatabase:
+        @staticmethod
+        def driver(uri, auth, **pool):
+            drivers.append(_FakeAsyncDriver(uri, auth, **pool))
+            return drivers[-1]
+
+    monkeypatch.setattr(neo4j_handler, "AsyncGraphDatabase", FakeAsyncGraphDatabase)
+    monkeypatch.setattr(neo4j_handler, "_async_loop", None)
+    monkeypatch.setattr(neo4j_handler, "_async_driver", None)
+    yield drivers
+    neo4j_handler.close_async_driver()
+
+
+def test_run_read_uses_one_driver_on_the_background_loop(async_driver):
+    assert neo4j_handler.run_read("RETURN $x AS x", x=1) == [{"x": 1}]
+    assert neo4j_handler.run_read("RETURN $x AS x", x=2) == [{"x": 2}]
+    driver, = async_driver
+    assert driver.pool == neo4j_handler._pool_config()
+    loops = {read[3] for read in driver.reads}
+    assert loops == {driver.created_on} and {read[4].name for read in driver.reads} == {"neo4j-async-driver"}
+    assert {read[2] for read in driver.reads} == {"neo4j"}
+
+
+def test_async_read_can_be_awaited_from_other_event_loops(async_driver):
+    async def read(value):
+        return await neo4j_handler.async_read("RETURN $x AS x", x=value)
+
+    # Flask runs each async view on a fresh loop; both reads must share the driver's own loop
+    assert asyncio.run(read(1)) == [{"x": 1}]
+    assert asyncio.run(read(2)) == [{"x": 2}]
+    driver, = async_driver
+    assert {read[3] for read in driver.reads} == {driver.created_on}
+
+
+def test_async_reads_run_concurrently_on_the_shared_loop(async_driver):
+    async def both():
+        return await asyncio.gather(*(neo4j_handler.async_read("RETURN $x AS x", x=i) for i in range(5)))
+
+    assert asyncio.run(both()) == [[{"x": i}] for i in range(5)]
+    assert len(async_driver) == 1
+
+
+def test_close_async_driver_stops_the_loop(async_driver):
+    neo4j_handler.run_read("RETURN 1")
+    loop = neo4j_handler._async_loop
+    neo4j_handler.close_async_driver()
+    assert async_driver[0].closed and neo4j_handler._async_loop is None
+    for _ in range(100):
+        if not loop.is_running():
+            break
+        threading.Event().wait(0.01)
+    assert not loop.is_running()
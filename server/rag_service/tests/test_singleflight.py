@@ -0,0 +1,101 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def _run_concurrently(n, target):
+    results, errors = [None] * n, [None] * n
+
+    def worker(i):
+        try:
+            results[i] = target(i)
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_concurrent_calls_are_coalesced():
+    group = SingleFlight("test", timeout_seconds=5)
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait(2)
+        return {"answer": 42}
+
+    timer = threading.Timer(0.2, release.set)
+    timer.start()
+    results, errors = _run_concurrently(8, lambda i: group.do("k", work, share=dict))
+    timer.join()
+
+    assert errors == [None] * 8
+    assert len(calls) == 1
+    assert all(r == {"answer": 42} for r in results)
+    assert len({id(r) for r in results}) == 8  # share= gives each caller its own copy
+    stats = group.stats()
+    assert stats["leaders"] == 1 and stats["coalesced"] == 7 and stats["in_flight"] == 0
+
+
+def test_distinct_keys_run_separately():
+    group = SingleFlight("test", timeout_seconds=5)
+    results, _ = _run_concurrently(4, lambda i: group.do(i, lambda: i * 10))
+    assert results == [0, 10, 20, 30]
+    assert group.stats()["leaders"] == 4
+
+
+def _leader_fails_while_followers_wait(group, follower_fn):
+    started = threading.Event()
+
+    def leader():
+        started.set()
+        time.sleep(0.2)
+        raise ValueError("leader key rejected")
+
+    out = {}
+    t = threading.Thread(target=lambda: _capture(out, "leader", lambda: group.do("k", leader)))
+    t.start()
+    started.wait(1)
+    _capture(out, "follower", lambda: group.do("k", follower_fn))
+    t.join()
+    return out
+
+
+def _capture(out, name, fn):
+    try:
+        out[name] = fn()
+    except Exception as e:
+        out[name] = e
+
+
+def test_errors_are_shared_by_default():
+    out = _leader_fails_while_followers_wait(SingleFlight("test", timeout_seconds=5), lambda: "own result")
+    assert isinstance(out["leader"], ValueError)
+    assert isinstance(out["follower"], ValueError)
+
+
+def test_caller_specific_errors_are_not_shared():
+    group = SingleFlight("test", timeout_seconds=5, share_errors=False)
+    out = _leader_fails_while_followers_wait(group, lambda: "own result")
+    assert isinstance(out["leader"], ValueError)
+    assert out["follower"] == "own result"
+    assert group.stats()["leader_errors"] == 1
+
+
+def test_follower_runs_itself_after_timeout():
+    group = SingleFlight("test", timeout_seconds=0.05)
+    release = threading.Event()
+    t = threading.Thread(target=lambda: group.do("k", lambda: release.wait(2) and "leader"))
+    t.start()
+    time.sleep(0.02)
+    assert group.do("k", lambda: "follower") == "follower"
+    release.set()
+    t.join()
+    assert group.stats()["timeouts"] == 1
@@ -2,18 +2,28 @@ import uuid
 import logging
 from typing import List, Dict, Tuple, Optional, Any
 
-from qdrant_client import QdrantClient, models
+from qdrant_client import models
 from sentence_transformers import SentenceTransformer
 
 # Assuming vector_db_service.py and config.py are in the same package directory (e.g., rag_service/)
 # and you run your application as a module (e.g., python -m rag_service.main_app)
 # or have otherwise correctly set up the Python path.
 import config # Changed to relative import
+from local_vector_store import create_vector_store_client, DocumentSearchCache
+import matryoshka
+from singleflight import SingleFlight
 
 # Configure basic logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Payload keys that get a keyword index (required by Qdrant for facet counts)
+_KEYWORD_INDEX_FIELDS = ("syllabus_topic",)
+
+class CollectionLayoutMismatch(RuntimeError):
+    """The existing collection's vector layout does not match MATRYOSHKA_ENABLED."""
+
+
 class Document: # For search result formatting
     def __init__(self, page_content: str, metadata: dict):
         self.page_content = page_content
@@ -22,6 +32,25 @@ class Document: # For search result formatting
     def to_dict(self):
         return {"page_content": self.page_content, "metadata": self.metadata}
 
+def _filter_key(filter_conditions: Optional[models.Filter]) -> Optional[str]:
+    if filter_conditions is None:
+        return None
+    try:
+        return filter_conditions.model_dump_json(exclude_none=True)
+    except AttributeError: # For older Pydantic versions
+        return filter_conditions.json(exclude_none=True)
+
+
+def _copy_search_result(result: Tuple[List[Document], str, Dict]) -> Tuple[List[Document], str, Dict]:
+    """Per-caller copy of a coalesced search (callers re-rank docs and edit their metadata)."""
+    docs, formatted_context_text, context_docs_map = result
+    return (
+        [Document(page_content=doc.page_content, metadata=dict(doc.metadata)) for doc in docs],
+        formatted_context_text,
+        {key: dict(value) if isinstance(value, dict) else value for key, value in context_docs_map.items()}
+    )
+
+
 class VectorDBService:
     def __init__(self):
         logger.info("Initializing VectorDBService...")
@@ -34,19 +63,22 @@ class VectorDBService:
         self.vector_dim = config.QDRANT_COLLECTION_VECTOR_DIM
         logger.info(f"  Service expects Vector Dim for Qdrant collection: {self.vector_dim} (from document model config)")
 
-        if config.QDRANT_URL:
-            self.client = QdrantClient(
-                url=config.QDRANT_URL,
-                api_key=config.QDRANT_API_KEY,
-                timeout=30
-            )
-        else:
-            self.client = QdrantClient(
-                host=config.QDRANT_HOST,
-                port=config.QDRANT_PORT,
-                api_key=config.QDRANT_API_KEY,
-                timeout=30
+        # QdrantClient, or the in-process LocalVectorStore when VECTOR_STORE_BACKEND=local
+        logger.info(f"  Vector store backend: {config.VECTOR_STORE_BACKEND}")
+        self.client = create_vector_store_client()
+
+        # Identical concurrent searches share one embedding + Qdrant round trip
+        self.search_flights = SingleFlight("vector_search", config.SINGLEFLIGHT_SEARCH_TIMEOUT_SECONDS)
+
+        self.l1_cache = None
+        if config.VECTOR_L1_CACHE_MAX_DOCS > 0:
+            self.l1_cache = DocumentSearchCache(
+                vector_dim=self.vector_dim,
+                max_docs=config.VECTOR_L1_CACHE_MAX_DOCS,
+                max_points=config.VECTOR_L1_CACHE_MAX_POINTS,
+                ttl_seconds=config.VECTOR_L1_CACHE_TTL_SECONDS
             )
+            logger.info(f"  L1 per-document search cache enabled (max {config.VECTOR_L1_CACHE_MAX_DOCS} documents)")
 
         try:
             # This model is for encoding search queries.
@@ -76,6 +108,10 @@ class VectorDBService:
             raise # Re-raise to prevent service startup with a non-functional query encoder
 
         self.collection_name = config.QDRANT_COLLECTION_NAME
+        self.two_stage_search = config.MATRYOSHKA_ENABLED
+        if self.two_stage_search:
+            logger.info(f"  Matryoshka two-stage search enabled ({config.MATRYOSHKA_DIM}-dim candidates, "
+                        f"x{config.MATRYOSHKA_CANDIDATE_MULTIPLIER} overfetch, full-vector rescoring)")
         # No ThreadPoolExecutor needed here if document encoding is external
 
     def _recreate_qdrant_collection(self):
@@ -83,10 +119,7 @@ class VectorDBService:
         try:
             self.client.recreate_collection(
                 collection_name=self.collection_name,
-                vectors_config=models.VectorParams(
-                    size=self.vector_dim,
-                    distance=models.Distance.COSINE,
-                ),
+                vectors_config=matryoshka.vectors_config(self.vector_dim),
             )
             logger.info(f"Collection '{self.collection_name}' (re)created successfully.")
         except Exception as e_recreate:
@@ -108,12 +141,22 @@ class VectorDBService:
                     default_vector_name = '' # Common for single vector setup
                     if default_vector_name in collection_info.config.params.vectors:
                         current_vectors_config = collection_info.config.params.vectors[default_vector_name]
+                    elif config.MATRYOSHKA_FULL_VECTOR_NAME in collection_info.config.params.vectors:
+                        current_vectors_config = collection_info.config.params.vectors[config.MATRYOSHKA_FULL_VECTOR_NAME]
                     elif collection_info.config.params.vectors: # Get first one if default not found
                         current_vectors_config = next(iter(collection_info.config.params.vectors.values()))
 
             if not current_vectors_config:
                  logger.error(f"Could not determine vector configuration for existing collection '{self.collection_name}'. Recreating.")
                  self._recreate_qdrant_collection()
+            elif not matryoshka.layout_matches(collection_info.config.params.vectors):
+                # Never drop stored vectors over a config flag; migration is an explicit operator step
+                message = (f"Collection '{self.collection_name}' vector layout does not match "
+                           f"MATRYOSHKA_ENABLED={config.MATRYOSHKA_ENABLED}. Refusing to start the vector service. "
+                           f"Revert MATRYOSHKA_ENABLED, or migrate with `python collection_migration.py --drop-source` "
+                           f"(first run) or `python collection_migration.py` (when the name is already an alias).")
+                logger.error(message)
+                raise CollectionLayoutMismatch(message)
             elif current_vectors_config.size != self.vector_dim:
                 logger.warning(f"Collection '{self.collection_name}' vector size {current_vectors_config.size} "
                                f"differs from service's expected {self.vector_dim}. Recreating.")
@@ -125,6 +168,8 @@ class VectorDBService:
             else:
                 logger.info(f"Collection '{self.collection_name}' configuration is compatible (Size: {current_vectors_config.size}, Distance: {current_vectors_config.distance}).")
 
+        except CollectionLayoutMismatch:
+            raise
         except Exception as e: # Broad exception for Qdrant client errors
             # More specific check for "Not found" type errors
             if "not found" in str(e).lower() or \
@@ -134,6 +179,19 @@ class VectorDBService:
             else:
                  logger.warning(f"Error checking collection '{self.collection_name}': {type(e).__name__} - {e}. Attempting to (re)create anyway...")
             self._recreate_qdrant_collection()
+        self._ensure_payload_indexes()
+
+    def _ensure_payload_indexes(self):
+        # Faceted counts (e.g. per syllabus_topic for course visualizations) need a keyword index
+        for field_name in _KEYWORD_INDEX_FIELDS:
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection_name,
+                    field_name=field_name,
+                    field_schema=models.PayloadSchemaType.KEYWORD
+                )
+            except Exception as e:
+                logger.warning(f"Could not create payload index '{field_name}' on '{self.collection_name}': {e}")
 
     def add_processed_chunks(self, processed_chunks: List[Dict[str, Any]]) -> int:
         if not processed_chunks:
@@ -168,7 +226,7 @@ class VectorDBService:
 
             points_to_upsert.append(models.PointStruct(
                 id=point_id,
-                vector=[float(v) for v in vector], # Ensure all are floats for Qdrant
+                vector=matryoshka.point_vector([float(v) for v in vector]), # Ensure all are floats for Qdrant
                 payload=payload
             ))
 
@@ -176,6 +234,10 @@ class VectorDBService:
             logger.warning(f"No valid points constructed from processed_chunks for document: {doc_name_for_logging}.")
             return 0
 
+        if self.l1_cache:
+            for file_name in {p.payload.get('file_name') for p in points_to_upsert}:
+                self.l1_cache.invalidate(file_name)
+
         # --- BATCH UPSERT TO AVOID PAYLOAD SIZE LIMIT ---
         # Qdrant has a 32MB payload limit per request
         # Upsert in batches to handle large documents
@@ -198,6 +260,34 @@ class VectorDBService:
             logger.error(f"Error upserting processed chunks to Qdrant for document: {doc_name_for_logging}: {e}", exc_info=True)
             raise
 
+    def search_by_vector(self, query_embedding: List[float], k: int, filter_conditions: Optional[models.Filter] = None) -> List[models.ScoredPoint]:
+        """
+        Search with an already-encoded query, routed through the L1 cache and
+        the Matryoshka two-stage search the same way search_documents is.
+        """
+        search_results = None
+        cached_doc = self.l1_cache.document_scope(filter_conditions) if self.l1_cache else None
+        if cached_doc:
+            search_results = self.l1_cache.search(
+                self.client, self.collection_name, cached_doc, query_embedding,
+                limit=k, score_threshold=config.QDRANT_SEARCH_MIN_RELEVANCE_SCORE
+            )
+        if search_results is None and self.two_stage_search:
+            search_results = matryoshka.two_stage_search(
+                self.client, self.collection_name, query_embedding, filter_conditions,
+                limit=k, score_threshold=config.QDRANT_SEARCH_MIN_RELEVANCE_SCORE
+            )
+        if search_results is None:
+            search_results = self.client.search(
+                collection_name=self.collection_name,
+                query_vector=query_embedding,
+                query_filter=filter_conditions,
+                limit=k,
+                with_payload=True,
+                score_threshold=config.QDRANT_SEARCH_MIN_RELEVANCE_SCORE # Apply score threshold directly in search
+            )
+        return search_results
+
     def search_documents(self, query: str, k: int = -1, filter_conditions: Optional[models.Filter] = None) -> Tuple[List[Document], str, Dict]:
         # Use default k from config if not provided or invalid
         if k <= 0:
@@ -205,6 +295,13 @@ class VectorDBService:
         else:
             k_to_use = k
 
+        return self.search_flights.do(
+            (query, k_to_use, _filter_key(filter_conditions)),
+            lambda: self._search_documents(query, k_to_use, filter_conditions),
+            share=_copy_search_result
+        )
+
+    def _search_documents(self, query: str, k_to_use: int, filter_conditions: Optional[models.Filter]) -> Tuple[List[Document], str, Dict]:
         context_docs = []
         formatted_context_text = "No relevant context was found in the available documents."
         context_docs_map = {}
@@ -223,14 +320,7 @@ class VectorDBService:
             query_embedding = self.model.encode(query).tolist()
             logger.debug(f"Generated query_embedding (length: {len(query_embedding)}, first 5 dims: {query_embedding[:5]})")
 
-            search_results = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                query_filter=filter_conditions,
-                limit=k_to_use,
-                with_payload=True,
-                score_threshold=config.QDRANT_SEARCH_MIN_RELEVANCE_SCORE # Apply score threshold directly in search
-            )
+            search_results = self.search_by_vector(query_embedding, k_to_use, filter_conditions)
             logger.info(f"Qdrant client.search returned {len(search_results)} results (after score threshold).")
 
             if not search_results:
@@ -253,51 +343,7 @@ class VectorDBService:
                 doc = Document(page_content=content, metadata=retrieved_metadata)
                 context_docs.append(doc)
 
-            # Format context and citations
-            formatted_context_parts = []
-            for i, doc_obj in enumerate(context_docs):
-                citation_index = i + 1
-                doc_meta = doc_obj.metadata
-                # Use more robust fetching of metadata keys
-                display_subject = doc_meta.get("title", doc_meta.get("subject", "Unknown Subject")) # Prefer title for subject
-                doc_name = doc_meta.get("original_name", doc_meta.get("file_name", "N/A"))
-                page_num_info = f" (Page: {doc_meta.get('page_number', 'N/A')})" if doc_meta.get('page_number') else "" # Add page number if available
-                
-                # --- SYLLABUS CONTEXT FOR RAG RESULTS ---
-                syllabus_info = ""
-                if doc_meta.get('syllabus_module'):
-                    syllabus_info = f" | 📚 {doc_meta['syllabus_module']}"
-                    if doc_meta.get('syllabus_topic'):
-                        syllabus_info += f" → {doc_meta['syllabus_topic']}"
-                    if doc_meta.get('syllabus_lecture_number'):
-                        syllabus_info += f" (Lecture {doc_meta['syllabus_lecture_number']})"
-                
-                content_preview = doc_obj.page_content[:200] + "..." if len(doc_obj.page_content) > 200 else doc_obj.page_content
-
-                formatted = (f"[{citation_index}] Score: {doc_meta.get('score', 0.0):.4f} | "
-                             f"Source: {doc_name}{page_num_info}{syllabus_info}\n"
-                             f"Content: {content_preview}") # Show content preview
-                formatted_context_parts.append(formatted)
-
-                context_docs_map[str(citation_index)] = {
-                    "subject": display_subject,
-                    "document_name": doc_name,
-                    "page_number": doc_meta.get("page_number"),
-                    "content_preview": content_preview, # Store preview
-                    "full_content": doc_obj.page_content, # Store full content for potential later use
-                    "score": doc_meta.get("score", 0.0),
-                    "qdrant_id": doc_meta.get("qdrant_id"),
-                    # --- SYLLABUS FIELDS ---
-                    "syllabus_module": doc_meta.get("syllabus_module"),
-                    "syllabus_topic": doc_meta.get("syllabus_topic"),
-                    "syllabus_lecture_number": doc_meta.get("syllabus_lecture_number"),
-                    "syllabus_context": doc_meta.get("syllabus_context"),
-                    "original_metadata": doc_meta # Store all original metadata from payload
-                }
-            if formatted_context_parts:
-                formatted_context_text = "\n\n---\n\n".join(formatted_context_parts)
-            else:
-                formatted_context_text = "No sufficiently relevant context was found after filtering."
+            formatted_context_text, context_docs_map = self.format_search_results(context_docs)
 
         except Exception as e:
             logger.error(f"Qdrant search/RAG error: {e}", exc_info=True)
@@ -305,15 +351,68 @@ class VectorDBService:
 
         return context_docs, formatted_context_text, context_docs_map
     
+    def format_search_results(self, context_docs: List[Document]) -> Tuple[str, Dict]:
+        """Builds the numbered context snippet and citation map for a ranked list of documents."""
+        formatted_context_text = "No relevant context was found in the available documents."
+        context_docs_map = {}
+        if not context_docs:
+            return formatted_context_text, context_docs_map
+
+        # Format context and citations
+        formatted_context_parts = []
+        for i, doc_obj in enumerate(context_docs):
+            citation_index = i + 1
+            doc_meta = doc_obj.metadata
+            # Use more robust fetching of metadata keys
+            display_subject = doc_meta.get("title", doc_meta.get("subject", "Unknown Subject")) # Prefer title for subject
+            doc_name = doc_meta.get("original_name", doc_meta.get("file_name", "N/A"))
+            page_num_info = f" (Page: {doc_meta.get('page_number', 'N/A')})" if doc_meta.get('page_number') else "" # Add page number if available
+            
+            # --- SYLLABUS CONTEXT FOR RAG RESULTS ---
+            syllabus_info = ""
+            if doc_meta.get('syllabus_module'):
+                syllabus_info = f" | 📚 {doc_meta['syllabus_module']}"
+                if doc_meta.get('syllabus_topic'):
+                    syllabus_info += f" → {doc_meta['syllabus_topic']}"
+                if doc_meta.get('syllabus_lecture_number'):
+                    syllabus_info += f" (Lecture {doc_meta['syllabus_lecture_number']})"
+            
+            content_preview = doc_obj.page_content[:200] + "..." if len(doc_obj.page_content) > 200 else doc_obj.page_content
+
+            formatted = (f"[{citation_index}] Score: {doc_meta.get('score', 0.0):.4f} | "
+                         f"Source: {doc_name}{page_num_info}{syllabus_info}\n"
+                         f"Content: {content_preview}") # Show content preview
+            formatted_context_parts.append(formatted)
+
+            context_docs_map[str(citation_index)] = {
+                "subject": display_subject,
+                "document_name": doc_name,
+                "page_number": doc_meta.get("page_number"),
+                "content_preview": content_preview, # Store preview
+                "full_content": doc_obj.page_content, # Store full content for potential later use
+                "score": doc_meta.get("score", 0.0),
+                "qdrant_id": doc_meta.get("qdrant_id"),
+                # --- SYLLABUS FIELDS ---
+                "syllabus_module": doc_meta.get("syllabus_module"),
+                "syllabus_topic": doc_meta.get("syllabus_topic"),
+                "syllabus_lecture_number": doc_meta.get("syllabus_lecture_number"),
+                "syllabus_context": doc_meta.get("syllabus_context"),
+                "original_metadata": doc_meta # Store all original metadata from payload
+            }
+        if formatted_context_parts:
+            formatted_context_text = "\n\n---\n\n".join(formatted_context_parts)
+        else:
+            formatted_context_text = "No sufficiently relevant context was found after filtering."
+
+        return formatted_context_text, context_docs_map
+
     # Add this method to the VectorDBService class in vector_db_service.py
 
-    def delete_document_vectors(self, user_id: str, document_name: str) -> Dict[str, Any]:
-        logger.info(f"Attempting to delete vectors for document: '{document_name}', user: '{user_id}' from Qdrant collection '{self.collection_name}'.")
-        
+    @staticmethod
+    def _document_filter(user_id: str, document_name: str) -> models.Filter:
         # These metadata keys must match what's stored during ingestion from ai_core.py
-        # 'processing_user' was the user_id passed to ai_core
-        # 'file_name' was the original_name passed to ai_core
-        qdrant_filter = models.Filter(
+        # 'user_id' is the user_id passed to ai_core, 'file_name' the original_name
+        return models.Filter(
             must=[
                 models.FieldCondition(
                     key="user_id",
@@ -325,31 +424,58 @@ class VectorDBService:
                 )
             ]
         )
+
+    def count_document_vectors(self, user_id: str, document_name: str) -> int:
+        count_response = self.client.count(
+            collection_name=self.collection_name,
+            count_filter=self._document_filter(user_id, document_name),
+            exact=True
+        )
+        return count_response.count
+
+    def get_document_point_ids(self, user_id: str, document_name: str, page_size: int = 1000) -> List[Any]:
+        """Scrolls the IDs of every point belonging to a document (no payloads or vectors)."""
+        point_ids, offset = [], None
+        qdrant_filter = self._document_filter(user_id, document_name)
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=qdrant_filter,
+                limit=page_size,
+                offset=offset,
+                with_payload=False,
+                with_vectors=False
+            )
+            point_ids.extend(record.id for record in records)
+            if offset is None:
+                return point_ids
+
+    def delete_document_vectors(self, user_id: str, document_name: str) -> Dict[str, Any]:
+        logger.info(f"Attempting to delete vectors for document: '{document_name}', user: '{user_id}' from Qdrant collection '{self.collection_name}'.")
+        
+        qdrant_filter = self._document_filter(user_id, document_name)
         
         try:
-            # Optional: Count points before deleting for logging/confirmation
-            # count_response = self.client.count(collection_name=self.collection_name, count_filter=qdrant_filter)
-            # num_to_delete = count_response.count
-            # logger.info(f"Qdrant: Found {num_to_delete} points matching criteria for document '{document_name}', user '{user_id}'.")
+            num_to_delete = self.count_document_vectors(user_id, document_name)
+            logger.info(f"Qdrant: Found {num_to_delete} points matching criteria for document '{document_name}', user '{user_id}'.")
 
-            # if num_to_delete == 0:
-            #     logger.info(f"Qdrant: No points found to delete for document '{document_name}', user '{user_id}'.")
-            #     return {"success": True, "message": "No matching vectors found in Qdrant to delete.", "deleted_count": 0}
+            if num_to_delete == 0:
+                logger.info(f"Qdrant: No points found to delete for document '{document_name}', user '{user_id}'.")
+                return {"success": True, "message": "No matching vectors found in Qdrant to delete.", "deleted_count": 0}
 
             delete_result = self.client.delete(
                 collection_name=self.collection_name,
                 points_selector=models.FilterSelector(filter=qdrant_filter),
                 wait=True # Make it synchronous
             )
+            if self.l1_cache:
+                self.l1_cache.invalidate(document_name)
             
             # Check the status of the delete operation
             # delete_result should be an UpdateResult object
             if delete_result.status == models.UpdateStatus.COMPLETED or delete_result.status == models.UpdateStatus.ACKNOWLEDGED:
-                # The actual number of deleted points isn't directly returned by filter-based delete.
-                # We can infer it was successful if no error.
-                # For a precise count, you'd need to list IDs by filter, then delete by IDs.
                 logger.info(f"Qdrant delete operation for document '{document_name}', user '{user_id}' acknowledged/completed. Status: {delete_result.status}")
-                return {"success": True, "message": f"Qdrant vector deletion for document '{document_name}' completed. Status: {delete_result.status}."}
+                return {"success": True, "message": f"Qdrant vector deletion for document '{document_name}' completed. Status: {delete_result.status}.", "deleted_count": num_to_delete}
             else:
                 logger.warning(f"Qdrant delete operation for document '{document_name}', user '{user_id}' returned status: {delete_result.status}")
                 return {"success": False, "message": f"Qdrant delete operation status: {delete_result.status}"}
@@ -359,6 +485,24 @@ class VectorDBService:
             # Check for specific Qdrant client errors if possible, e.g., if the collection doesn't exist.
             return {"success": False, "message": f"Failed to delete Qdrant vectors: {str(e)}"}
 
+    def delete_points_batched(self, point_ids: List[Any], batch_size: int = 1000) -> int:
+        """
+        Deletes points by ID in batches without waiting on each batch.
+        Qdrant applies updates to a collection in order, so only the final
+        batch waits; when it returns, every earlier batch has been applied.
+        """
+        total = 0
+        for i in range(0, len(point_ids), batch_size):
+            batch = point_ids[i:i + batch_size]
+            is_last = i + batch_size >= len(point_ids)
+            self.client.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=batch),
+                wait=is_last
+            )
+            total += len(batch)
+        return total
+
     def close(self):
         logger.info("VectorDBService close called.")
         # No specific resources like ThreadPoolExecutor to release in this version.
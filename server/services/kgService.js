@@ -225,7 +225,9 @@ async function generateAndStoreKg(chunksForKg, userId, originalName, llmProvider
             userId: userId,
             originalName: originalName,
             nodes: finalKg.nodes,
-            edges: finalKg.edges
+            edges: finalKg.edges,
+            // The merged graph is the document's complete KG, so let the service diff it
+            mode: "incremental"
         };
 
         const serviceResponse = await axios.post(kgIngestionApiUrl, payload, {
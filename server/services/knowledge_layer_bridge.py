@@ -25,14 +25,81 @@ Architecture:
 """
 
 import os
+import re
+import time
+import asyncio
+import hashlib
 import logging
+import threading
+from datetime import datetime, timezone
 from typing import Dict, List, Optional, Any
 from dataclasses import dataclass, field
 
+import numpy as np
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared async Neo4j driver (pooled, instrumented) when running inside the RAG service
+try:
+    import neo4j_handler
+except ImportError:
+    neo4j_handler = None
+
+try:
+    from curriculum_graph_handler import get_course_version, get_curriculum_model_async
+except ImportError:
+    get_course_version = None
+    get_curriculum_model_async = None
+
+try:
+    from neo4j import AsyncDriver
+except ImportError:
+    AsyncDriver = None
+
+try:
+    from qdrant_client import AsyncQdrantClient, models as qdrant_models
+except ImportError:
+    AsyncQdrantClient, qdrant_models = None, None
+
+if neo4j_handler is not None:
+    CURRICULUM_TOPIC_INDEX_NAME = neo4j_handler.CURRICULUM_TOPIC_INDEX_NAME
+    course_search_scope = neo4j_handler.course_search_scope
+else:
+    # Standalone copies of neo4j_handler's index name and scope token
+    CURRICULUM_TOPIC_INDEX_NAME = "curriculum_topic_search_index"
+
+    def course_search_scope(course: str) -> str:
+        digest = hashlib.sha1((course or "").strip().lower().encode("utf-8")).hexdigest()
+        return f"course{digest}"
+
+_LUCENE_SPECIAL = re.compile(r'([+\-&|!(){}\[\]^"~*?:\\/])')
+
+
+def _topic_lucene_query(query: str, course: Optional[str] = None) -> Optional[str]:
+    """Lucene query over topic/subtopic names, restricted to one course when given."""
+    terms = _LUCENE_SPECIAL.sub(r"\\\1", " ".join((query or "").lower().split()))
+    if not terms:
+        return None
+    if course:
+        return f"search_scope:{course_search_scope(course)} AND name:({terms})"
+    return f"name:({terms})"
+
+
+# Topics of one course with their module and subtopic names
+_COURSE_TOPICS_QUERY = """
+MATCH (t:Topic {course_key: $courseKey})
+OPTIONAL MATCH (m:Module {course_key: $courseKey})-[:HAS_TOPIC]->(t)
+OPTIONAL MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t)
+WITH t, head(collect(DISTINCT m.name)) AS module, collect(DISTINCT s.name) AS subtopics
+RETURN t.id AS topic_id, t.name AS name, t.course AS course, module, subtopics
+ORDER BY t.id
+"""
+
+# Topics with fewer training examples than this are reported as low coverage
+LOW_COVERAGE_THRESHOLD = 10
+
 
 @dataclass
 class CurriculumTopic:
@@ -43,6 +110,8 @@ class CurriculumTopic:
     subtopics: List[str] = field(default_factory=list)
     prerequisites: List[str] = field(default_factory=list)
     mastery_required: bool = False
+    course: Optional[str] = None
+    score: float = 0.0
 
 
 @dataclass
@@ -67,12 +136,120 @@ class EnhancedContext:
     prerequisite_chain: List[str]
 
 
+@dataclass
+class TopicEmbeddingIndex:
+    """
+    Precomputed, L2-normalized embeddings of one course's topic and subtopic
+    names. Rows are grouped by topic (name first, then its subtopics), so a
+    lookup is one matrix-vector product plus a per-topic max.
+    """
+    course: str
+    version: int
+    built_at: float
+    topics: List[CurriculumTopic]
+    matrix: np.ndarray
+    starts: np.ndarray
+    
+    def match(self, query_vector: List[float], limit: int) -> List[CurriculumTopic]:
+        if not self.topics or limit <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        best = np.maximum.reduceat(self.matrix @ query, self.starts)
+        k = min(limit, len(best))
+        top = np.argpartition(-best, k - 1)[:k]
+        top = top[np.argsort(-best[top], kind='stable')]
+        matched = []
+        for idx in top.tolist():
+            topic = self.topics[idx]
+            matched.append(CurriculumTopic(
+                topic_id=topic.topic_id, name=topic.name, module=topic.module,
+                subtopics=topic.subtopics, prerequisites=topic.prerequisites,
+                course=topic.course, score=float(best[idx])
+            ))
+        return matched
+
+
+@dataclass
+class AlignmentState:
+    """
+    Materialized data-alignment report for one subject. Count updates are
+    diffed against the stored counts and only the touched topics are
+    re-classified; the report body is rebuilt only when something changed.
+    """
+    subject: str
+    curriculum_version: int
+    built_at: float
+    topics: List[str]
+    counts: Dict[str, int]
+    status: Dict[str, str]
+    missing_count: int = 0
+    version: int = 1
+    updated_at: str = ""
+    # Set by invalidate_alignment: reload the topic list on the next assessment
+    stale: bool = False
+    _report: Optional[Dict[str, Any]] = None
+    
+    @staticmethod
+    def classify(count: int) -> str:
+        if count <= 0:
+            return "missing"
+        return "low" if count < LOW_COVERAGE_THRESHOLD else "covered"
+    
+    @classmethod
+    def build(cls, subject: str, curriculum_version: int, topics: List[str], counts: Dict[str, int], version: int = 1):
+        status = {name: cls.classify(counts.get(name, 0)) for name in topics}
+        return cls(
+            subject=subject, curriculum_version=curriculum_version, built_at=time.time(),
+            topics=topics, counts=counts, status=status,
+            missing_count=sum(1 for value in status.values() if value == "missing"),
+            version=version, updated_at=datetime.now(timezone.utc).isoformat()
+        )
+    
+    def apply_counts(self, counts: Dict[str, int]) -> int:
+        """Replace the stored counts, re-classifying only changed topics. Returns how many were touched."""
+        changed = {name for name, count in counts.items() if self.counts.get(name, 0) != count}
+        changed.update(name for name, count in self.counts.items() if counts.get(name, 0) != count)
+        self.counts = counts
+        touched = 0
+        for name in changed:
+            previous = self.status.get(name)
+            if previous is None:
+                continue
+            current = self.classify(counts.get(name, 0))
+            self.status[name] = current
+            self.missing_count += (current == "missing") - (previous == "missing")
+            touched += 1
+        if touched:
+            self.version += 1
+            self.updated_at = datetime.now(timezone.utc).isoformat()
+            self._report = None
+        return touched
+    
+    def report(self) -> Dict[str, Any]:
+        if self._report is None:
+            total = len(self.topics)
+            self._report = {
+                "subject": self.subject,
+                "total_topics": total,
+                "missing_topics": [name for name in self.topics if self.status[name] == "missing"],
+                "low_coverage_topics": [
+                    {"topic": name, "count": self.counts.get(name, 0)}
+                    for name in self.topics if self.status[name] == "low"
+                ],
+                "coverage_percentage": (total - self.missing_count) / total * 100 if total else 0,
+                "version": self.version,
+                "updated_at": self.updated_at
+            }
+        return dict(self._report)
+
+
 class KnowledgeLayerBridge:
     """
     Bridges Neo4j curriculum graph with Qdrant vector store.
     
     Usage:
-        bridge = KnowledgeLayerBridge(neo4j_driver, qdrant_client)
+        bridge = KnowledgeLayerBridge(neo4j_driver, qdrant_client, embedding_model=model)
         context = await bridge.get_enhanced_context("What is backpropagation?")
     """
     
@@ -80,83 +257,239 @@ class KnowledgeLayerBridge:
         self,
         neo4j_driver: Optional[Any] = None,
         qdrant_client: Optional[Any] = None,
-        collection_name: str = "course_materials"
+        collection_name: Optional[str] = None,
+        embedding_model: Optional[Any] = None,
+        vector_service: Optional[Any] = None,
+        deadline_seconds: float = 5.0,
+        topic_index_ttl_seconds: float = 600.0,
+        alignment_ttl_seconds: float = 600.0
     ):
         """
         Initialize the bridge with Neo4j and Qdrant connections.
         
         Args:
-            neo4j_driver: Neo4j driver instance (optional, will try to create)
-            qdrant_client: Qdrant client instance (optional, will try to create)
+            neo4j_driver: Neo4j driver instance, or None to use the shared
+                async driver from neo4j_handler when it is importable
+            qdrant_client: Qdrant client instance, sync or AsyncQdrantClient
             collection_name: Name of the Qdrant collection
+            embedding_model: SentenceTransformer used to encode queries
+            vector_service: The RAG service's VectorDBService; when given, its
+                client, collection and query model are reused and searches go
+                through its cache / two-stage search path
+            deadline_seconds: Budget for the whole get_enhanced_context fan-out
+            topic_index_ttl_seconds: Max age of a course's topic-embedding
+                index (0 = until the course version changes)
+            alignment_ttl_seconds: Max age of a materialized alignment report's
+                topic list (0 = until the course version changes)
         """
         self.neo4j_driver = neo4j_driver
-        self.qdrant_client = qdrant_client
-        self.collection_name = collection_name
+        self.vector_service = vector_service
+        self.qdrant_client = qdrant_client or getattr(vector_service, 'client', None)
+        self.collection_name = (
+            collection_name
+            or getattr(vector_service, 'collection_name', None)
+            or os.getenv("QDRANT_COLLECTION_NAME", "my_qdrant_rag_collection")
+        )
+        self.embedding_model = embedding_model or getattr(vector_service, 'model', None)
+        self.deadline_seconds = deadline_seconds
+        self.topic_index_ttl_seconds = topic_index_ttl_seconds
+        self._topic_indexes: Dict[str, TopicEmbeddingIndex] = {}
+        self.alignment_ttl_seconds = alignment_ttl_seconds
+        self._alignment: Dict[str, AlignmentState] = {}
+        self._alignment_lock = threading.Lock()
+        self.use_shared_driver = neo4j_driver is None and neo4j_handler is not None
         
         logger.info("KnowledgeLayerBridge initialized")
     
-    async def get_curriculum_topics(self, query: str, limit: int = 5) -> List[CurriculumTopic]:
+    @property
+    def neo4j_available(self) -> bool:
+        return self.use_shared_driver or self.neo4j_driver is not None
+    
+    async def _read(self, cypher: str, /, **params) -> List[Dict[str, Any]]:
+        """
+        Run a read query without blocking the event loop.
+        
+        Uses the shared async driver when available; an injected async driver
+        is awaited directly and a sync driver runs in a worker thread.
         """
-        Find relevant curriculum topics from Neo4j based on query.
+        if self.use_shared_driver:
+            return await neo4j_handler.async_read(cypher, **params)
+        if AsyncDriver is not None and isinstance(self.neo4j_driver, AsyncDriver):
+            async with self.neo4j_driver.session() as session:
+                result = await session.run(cypher, **params)
+                return await result.data()
+        
+        def run_sync():
+            with self.neo4j_driver.session() as session:
+                return session.run(cypher, **params).data()
+        return await asyncio.to_thread(run_sync)
+    
+    async def embed_query(self, query: str) -> Optional[List[float]]:
+        """Encode a query with the shared embedding model off the event loop."""
+        if self.embedding_model is None:
+            logger.warning("Embedding model not configured")
+            return None
+        try:
+            vector = await asyncio.to_thread(self.embedding_model.encode, query)
+        except Exception as e:
+            logger.error(f"Error embedding query: {e}")
+            return None
+        return vector.tolist() if hasattr(vector, "tolist") else list(vector)
+    
+    async def _search(self, query_vector: List[float], limit: int, query_filter: Optional[Any]) -> List[Any]:
+        """Run a Qdrant search without blocking the event loop."""
+        if self.vector_service is not None:
+            return await asyncio.to_thread(
+                self.vector_service.search_by_vector, query_vector, limit, query_filter
+            )
+        search_kwargs = dict(
+            collection_name=self.collection_name,
+            query_vector=query_vector,
+            query_filter=query_filter,
+            limit=limit,
+            with_payload=True
+        )
+        if AsyncQdrantClient is not None and isinstance(self.qdrant_client, AsyncQdrantClient):
+            return await self.qdrant_client.search(**search_kwargs)
+        return await asyncio.to_thread(self.qdrant_client.search, **search_kwargs)
+    
+    async def get_curriculum_topics(
+        self,
+        query: str,
+        limit: int = 5,
+        course: Optional[str] = None,
+        query_vector: Optional[List[float]] = None
+    ) -> List[CurriculumTopic]:
+        """
+        Find relevant curriculum topics for a query.
+        
+        With a course and a query embedding, topics are ranked by cosine
+        similarity against the course's topic-embedding index (built once,
+        then matched in memory). Otherwise the curriculum fulltext index is
+        queried, scoped to the course when one is given.
         
         Args:
             query: Search query
             limit: Maximum number of topics to return
+            course: Optional course to restrict matches to
+            query_vector: Precomputed embedding of the query
             
         Returns:
-            List of matching CurriculumTopic objects
+            List of matching CurriculumTopic objects, best first
         """
-        if not self.neo4j_driver:
+        if not self.neo4j_available:
             logger.warning("Neo4j driver not configured")
             return []
         
         try:
-            # Cypher query to find matching topics
+            if course and query_vector is not None and self.embedding_model is not None:
+                index = await self.get_topic_index(course)
+                if index is not None and index.topics:
+                    return index.match(query_vector, limit)
+            
+            lucene_query = _topic_lucene_query(query, course)
+            if lucene_query is None:
+                return []
+            
+            # Subtopic hits count towards their parent topic
             cypher = """
-            MATCH (t:Topic)
-            WHERE toLower(t.name) CONTAINS toLower($query)
-               OR ANY(sub IN t.subtopics WHERE toLower(sub) CONTAINS toLower($query))
-            OPTIONAL MATCH (t)-[:PREREQUISITE_OF]->(prereq:Topic)
-            OPTIONAL MATCH (m:Module)-[:CONTAINS]->(t)
-            RETURN t.id as topic_id, 
-                   t.name as name, 
-                   m.name as module,
-                   t.subtopics as subtopics,
-                   collect(prereq.name) as prerequisites
-            LIMIT $limit
+            CALL db.index.fulltext.queryNodes($indexName, $luceneQuery, {limit: $seedLimit}) YIELD node, score
+            OPTIONAL MATCH (node)-[:PREREQUISITE_OF]->(parent:Topic)
+            WITH coalesce(parent, node) AS t, score
+            WHERE t:Topic
+            WITH t, max(score) AS score
+            ORDER BY score DESC LIMIT $limit
+            OPTIONAL MATCH (m:Module {course_key: t.course_key})-[:HAS_TOPIC]->(t)
+            OPTIONAL MATCH (s:Subtopic)-[:PREREQUISITE_OF]->(t)
+            WITH t, score, head(collect(DISTINCT m.name)) AS module, collect(DISTINCT s.name) AS subtopics
+            RETURN t.id AS topic_id, t.name AS name, t.course AS course, module, subtopics, score
+            ORDER BY score DESC
             """
             
-            with self.neo4j_driver.session() as session:
-                result = session.run(cypher, query=query, limit=limit)
-                topics = []
-                for record in result:
-                    topics.append(CurriculumTopic(
-                        topic_id=record["topic_id"] or "",
-                        name=record["name"] or "",
-                        module=record["module"] or "General",
-                        subtopics=record["subtopics"] or [],
-                        prerequisites=record["prerequisites"] or []
-                    ))
-                return topics
+            records = await self._read(
+                cypher, indexName=CURRICULUM_TOPIC_INDEX_NAME, luceneQuery=lucene_query,
+                seedLimit=limit * 5, limit=limit
+            )
+            # A subtopic must be learned before its topic, so subtopics double as prerequisites
+            return [
+                CurriculumTopic(
+                    topic_id=record["topic_id"] or "",
+                    name=record["name"] or "",
+                    module=record["module"] or "General",
+                    subtopics=record["subtopics"] or [],
+                    prerequisites=record["subtopics"] or [],
+                    course=record["course"],
+                    score=record["score"] or 0.0
+                )
+                for record in records
+            ]
                 
         except Exception as e:
             logger.error(f"Error querying Neo4j: {e}")
             return []
     
+    def _topic_index_is_fresh(self, index: TopicEmbeddingIndex) -> bool:
+        if get_course_version is not None and index.version != get_course_version(index.course):
+            return False
+        ttl = self.topic_index_ttl_seconds
+        return ttl <= 0 or time.time() - index.built_at < ttl
+    
+    async def get_topic_index(self, course: str) -> Optional[TopicEmbeddingIndex]:
+        """
+        Topic-embedding index for a course, built on first use and rebuilt when
+        the course is re-ingested (or the TTL expires).
+        """
+        key = (course or "").strip().lower()
+        index = self._topic_indexes.get(key)
+        if index is not None and self._topic_index_is_fresh(index):
+            return index
+        if self.embedding_model is None:
+            return None
+        
+        version = get_course_version(course) if get_course_version is not None else 0
+        topics = await self.get_all_topics(course)
+        
+        texts, starts = [], []
+        for topic in topics:
+            starts.append(len(texts))
+            texts.append(topic.name or topic.topic_id)
+            texts.extend(topic.subtopics)
+        
+        if texts:
+            matrix = np.asarray(await asyncio.to_thread(self.embedding_model.encode, texts), dtype=np.float32)
+            matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        index = TopicEmbeddingIndex(
+            course=course, version=version, built_at=time.time(), topics=topics,
+            matrix=matrix, starts=np.asarray(starts, dtype=np.intp)
+        )
+        self._topic_indexes[key] = index
+        logger.info(f"Built topic-embedding index for '{course}': {len(topics)} topics, {len(texts)} names")
+        return index
+    
+    def invalidate_topic_index(self, course: Optional[str] = None):
+        """Drop one course's topic-embedding index, or all of them."""
+        if course is None:
+            self._topic_indexes.clear()
+        else:
+            self._topic_indexes.pop((course or "").strip().lower(), None)
+    
     async def get_document_chunks(
         self, 
         query: str, 
         limit: int = 5,
-        filter_module: Optional[str] = None
+        filter_module: Optional[str] = None,
+        query_vector: Optional[List[float]] = None
     ) -> List[DocumentChunk]:
         """
         Find relevant document chunks from Qdrant via semantic search.
         
         Args:
-            query: Search query (will be embedded)
+            query: Search query (embedded unless query_vector is given)
             limit: Maximum number of chunks to return
             filter_module: Optional filter by syllabus module
+            query_vector: Precomputed embedding of the query
             
         Returns:
             List of matching DocumentChunk objects
@@ -166,32 +499,30 @@ class KnowledgeLayerBridge:
             return []
         
         try:
+            if query_vector is None:
+                query_vector = await self.embed_query(query)
+                if query_vector is None:
+                    return []
+            
             # Build filter if module specified
-            filter_dict = None
+            query_filter = None
             if filter_module:
-                filter_dict = {
-                    "must": [
-                        {"key": "syllabus_module", "match": {"value": filter_module}}
-                    ]
-                }
+                query_filter = qdrant_models.Filter(must=[
+                    qdrant_models.FieldCondition(
+                        key="syllabus_module", match=qdrant_models.MatchValue(value=filter_module)
+                    )
+                ])
             
-            # Note: In production, you'd embed the query first
-            # This is a placeholder showing the structure
-            results = self.qdrant_client.search(
-                collection_name=self.collection_name,
-                query_vector=[0.0] * 384,  # Placeholder - use actual embedding
-                limit=limit,
-                query_filter=filter_dict
-            )
+            results = await self._search(query_vector, limit, query_filter)
             
             chunks = []
             for hit in results:
                 payload = hit.payload or {}
                 chunks.append(DocumentChunk(
                     chunk_id=str(hit.id),
-                    content=payload.get("text", ""),
-                    source_file=payload.get("source_file", "Unknown"),
-                    page_number=payload.get("page_number", 0),
+                    content=payload.get("chunk_text_content", payload.get("text", "")),
+                    source_file=payload.get("original_name", payload.get("file_name", "Unknown")),
+                    page_number=payload.get("page_number") or 0,
                     score=hit.score,
                     syllabus_module=payload.get("syllabus_module"),
                     syllabus_topic=payload.get("syllabus_topic")
@@ -207,7 +538,8 @@ class KnowledgeLayerBridge:
         self, 
         query: str,
         max_topics: int = 3,
-        max_chunks: int = 5
+        max_chunks: int = 5,
+        course: Optional[str] = None
     ) -> EnhancedContext:
         """
         Get enhanced context by combining Neo4j curriculum and Qdrant chunks.
@@ -218,15 +550,39 @@ class KnowledgeLayerBridge:
             query: User's question
             max_topics: Maximum curriculum topics to retrieve
             max_chunks: Maximum document chunks to retrieve
+            course: Optional course; enables semantic topic matching
             
         Returns:
             EnhancedContext with combined information
         """
-        # 1. Get curriculum topics from Neo4j
-        topics = await self.get_curriculum_topics(query, limit=max_topics)
+        # 1-2. The query is encoded once; topic matching (semantic when a course
+        # is given, fulltext otherwise) and the Qdrant search run concurrently
+        # under one deadline, and a side that misses it is dropped
+        embedding = asyncio.create_task(self.embed_query(query))
+        
+        async def match_topics():
+            semantic = course and self.embedding_model is not None
+            query_vector = await asyncio.shield(embedding) if semantic else None
+            return await self.get_curriculum_topics(query, limit=max_topics, course=course, query_vector=query_vector)
+        
+        async def search_chunks():
+            query_vector = await asyncio.shield(embedding)
+            if query_vector is None:
+                return []
+            return await self.get_document_chunks(query, limit=max_chunks, query_vector=query_vector)
         
-        # 2. Get document chunks from Qdrant
-        chunks = await self.get_document_chunks(query, limit=max_chunks)
+        topics_task = asyncio.create_task(match_topics())
+        chunks_task = asyncio.create_task(search_chunks())
+        done, pending = await asyncio.wait({topics_task, chunks_task}, timeout=self.deadline_seconds)
+        if not embedding.done():
+            embedding.cancel()
+        for task in pending:
+            task.cancel()
+        if pending:
+            dropped = [name for name, task in (("topics", topics_task), ("chunks", chunks_task)) if task in pending]
+            logger.warning(f"Enhanced context deadline ({self.deadline_seconds}s) exceeded; dropped {', '.join(dropped)}")
+        topics = topics_task.result() if topics_task in done else []
+        chunks = chunks_task.result() if chunks_task in done else []
         
         # 3. Build prerequisite chain from matched topics
         prerequisite_chain = []
@@ -287,81 +643,174 @@ class KnowledgeLayerBridge:
         return "\n".join(parts)
 
     async def get_all_topics(self, subject: str) -> List[CurriculumTopic]:
-        """Fetches all topics for a syllabus subject."""
-        if not self.neo4j_driver: return []
-        cypher = """
-        MATCH (s:Syllabus {name: $subject})-[:HAS_MODULE]->(m:Module)-[:CONTAINS]->(t:Topic)
-        RETURN t.id as topic_id, t.name as name, m.name as module, t.subtopics as subtopics
         """
-        with self.neo4j_driver.session() as session:
-            result = session.run(cypher, subject=subject)
-            return [CurriculumTopic(topic_id=r["topic_id"], name=r["name"], module=r["module"]) for r in result]
+        Fetches all topics for a course (subject), with their module and subtopics.
+        
+        Inside the RAG service this reads the process-wide cached curriculum
+        model (loaded without blocking the event loop on a miss) instead of
+        querying Neo4j on every call.
+        """
+        if not self.neo4j_available: return []
+        if self.use_shared_driver and get_curriculum_model_async is not None:
+            model = await get_curriculum_model_async(subject)
+            topics = []
+            for topic_id in model.topic_order:
+                topic = model.topic(topic_id)
+                subtopics = [st['name'] for st in model.prerequisites(topic_id) if st.get('name')]
+                topics.append(CurriculumTopic(
+                    topic_id=topic_id, name=topic.get('name') or "", module=topic.get('module_name') or "General",
+                    subtopics=subtopics, prerequisites=subtopics, course=model.course
+                ))
+            return topics
+        records = await self._read(_COURSE_TOPICS_QUERY, courseKey=(subject or "").strip().lower())
+        topics = []
+        for r in records:
+            subtopics = [name for name in r["subtopics"] or [] if name]
+            topics.append(CurriculumTopic(
+                topic_id=r["topic_id"] or "", name=r["name"] or "", module=r["module"] or "General",
+                subtopics=subtopics, prerequisites=subtopics, course=r["course"]
+            ))
+        return topics
 
-    async def assess_data_alignment(self, subject: str, existing_counts: Dict[str, int]) -> Dict[str, Any]:
+    def _alignment_is_fresh(self, state: AlignmentState) -> bool:
+        if state.stale:
+            return False
+        if get_course_version is not None and state.curriculum_version != get_course_version(state.subject):
+            return False
+        ttl = self.alignment_ttl_seconds
+        return ttl <= 0 or time.time() - state.built_at < ttl
+
+    async def assess_data_alignment(self, subject: str, existing_counts: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
         """
         Assesses which curriculum topics are under-represented in the training data.
+        
+        The report is materialized per subject. The topic list is reloaded only
+        when the curriculum changes (or the TTL expires); otherwise new
+        `existing_counts` are diffed against the stored ones and only the
+        touched topics are re-classified. Without counts the cached report is
+        returned as is. Reports carry a `version` and `updated_at`.
         """
-        topics = await self.get_all_topics(subject)
-        missing_coverage = []
-        low_coverage = []
+        key = (subject or "").strip().lower()
+        counts = None if existing_counts is None else {name: int(count) for name, count in existing_counts.items()}
         
-        for topic in topics:
-            count = existing_counts.get(topic.name, 0)
-            if count == 0:
-                missing_coverage.append(topic.name)
-            elif count < 10:
-                low_coverage.append({"topic": topic.name, "count": count})
-                
-        return {
-            "subject": subject,
-            "total_topics": len(topics),
-            "missing_topics": missing_coverage,
-            "low_coverage_topics": low_coverage,
-            "coverage_percentage": (len(topics) - len(missing_coverage)) / len(topics) * 100 if topics else 0
-        }
+        state = self._alignment.get(key)
+        if state is None or not self._alignment_is_fresh(state):
+            curriculum_version = get_course_version(subject) if get_course_version is not None else 0
+            names = list(dict.fromkeys(topic.name for topic in await self.get_all_topics(subject)))
+            with self._alignment_lock:
+                previous = self._alignment.get(key)
+                if counts is None:
+                    counts = previous.counts if previous is not None else {}
+                state = AlignmentState.build(
+                    subject, curriculum_version, names, counts,
+                    version=previous.version + 1 if previous is not None else 1
+                )
+                self._alignment[key] = state
+                return state.report()
+        
+        with self._alignment_lock:
+            if counts is not None:
+                touched = state.apply_counts(counts)
+                if touched:
+                    logger.info(f"Alignment for '{subject}': re-classified {touched} topics (v{state.version})")
+            return state.report()
 
+    def invalidate_alignment(self, subject: Optional[str] = None):
+        """
+        Mark one subject's materialized alignment report (or all of them) stale.
+        
+        The next assess_data_alignment reloads the topic list and rebuilds the
+        report under a new version; the stored counts are kept, since only
+        callers supply them.
+        """
+        with self._alignment_lock:
+            if subject is None:
+                states = list(self._alignment.values())
+            else:
+                state = self._alignment.get((subject or "").strip().lower())
+                states = [state] if state is not None else []
+            for state in states:
+                state.stale = True
 
 # Factory function
-def create_knowledge_bridge() -> KnowledgeLayerBridge:
+def create_knowledge_bridge(vector_service: Optional[Any] = None) -> KnowledgeLayerBridge:
     """
     Create a KnowledgeLayerBridge with connections from environment.
     
-    Environment variables:
+    Inside the RAG service pass its VectorDBService so the bridge reuses the
+    loaded query model and Qdrant client instead of opening its own.
+    
+    Environment variables (Neo4j ones only when neo4j_handler is not importable,
+    Qdrant / embedding ones only without a vector_service):
         - NEO4J_URI: Neo4j connection URI
         - NEO4J_USER: Neo4j username  
         - NEO4J_PASSWORD: Neo4j password
         - QDRANT_HOST: Qdrant host
         - QDRANT_PORT: Qdrant port
+        - QUERY_EMBEDDING_MODEL_NAME: SentenceTransformer for queries
+        - KNOWLEDGE_BRIDGE_DEADLINE_SECONDS: Budget for get_enhanced_context
+        - KNOWLEDGE_BRIDGE_TOPIC_INDEX_TTL_SECONDS: Max age of a topic-embedding index
+        - KNOWLEDGE_BRIDGE_ALIGNMENT_TTL_SECONDS: Max age of a materialized alignment report
     """
     neo4j_driver = None
     qdrant_client = None
     
-    # Try to connect to Neo4j
-    neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:2002")
-    neo4j_user = os.getenv("NEO4J_USER", "neo4j")
-    neo4j_password = os.getenv("NEO4J_PASSWORD", "password")
+    # Inside the RAG service the bridge shares neo4j_handler's pooled async driver
+    if neo4j_handler is None:
+        neo4j_uri = os.getenv("NEO4J_URI", "bolt://localhost:2002")
+        neo4j_user = os.getenv("NEO4J_USER", "neo4j")
+        neo4j_password = os.getenv("NEO4J_PASSWORD", "password")
+        
+        try:
+            from neo4j import GraphDatabase
+            neo4j_driver = GraphDatabase.driver(
+                neo4j_uri, auth=(neo4j_user, neo4j_password),
+                max_connection_pool_size=int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "50")),
+                connection_acquisition_timeout=float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "30")),
+                max_connection_lifetime=float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+            )
+            logger.info(f"Connected to Neo4j at {neo4j_uri}")
+        except Exception as e:
+            logger.warning(f"Could not connect to Neo4j: {e}")
     
-    try:
-        from neo4j import GraphDatabase
-        neo4j_driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
-        logger.info(f"Connected to Neo4j at {neo4j_uri}")
-    except Exception as e:
-        logger.warning(f"Could not connect to Neo4j: {e}")
+    deadline_seconds = float(os.getenv("KNOWLEDGE_BRIDGE_DEADLINE_SECONDS", "5.0"))
+    topic_index_ttl_seconds = float(os.getenv("KNOWLEDGE_BRIDGE_TOPIC_INDEX_TTL_SECONDS", "600"))
+    alignment_ttl_seconds = float(os.getenv("KNOWLEDGE_BRIDGE_ALIGNMENT_TTL_SECONDS", "600"))
+    if vector_service is not None:
+        return KnowledgeLayerBridge(
+            neo4j_driver=neo4j_driver,
+            vector_service=vector_service,
+            deadline_seconds=deadline_seconds,
+            topic_index_ttl_seconds=topic_index_ttl_seconds,
+            alignment_ttl_seconds=alignment_ttl_seconds
+        )
     
-    # Try to connect to Qdrant
+    # Standalone: async Qdrant client and our own query model
     qdrant_host = os.getenv("QDRANT_HOST", "localhost")
     qdrant_port = int(os.getenv("QDRANT_PORT", "2003"))
+    embedding_model = None
     
     try:
-        from qdrant_client import QdrantClient
-        qdrant_client = QdrantClient(host=qdrant_host, port=qdrant_port)
+        qdrant_client = AsyncQdrantClient(host=qdrant_host, port=qdrant_port)
         logger.info(f"Connected to Qdrant at {qdrant_host}:{qdrant_port}")
     except Exception as e:
         logger.warning(f"Could not connect to Qdrant: {e}")
     
+    model_name = os.getenv("QUERY_EMBEDDING_MODEL_NAME", os.getenv("DOCUMENT_EMBEDDING_MODEL_NAME", "mixedbread-ai/mxbai-embed-large-v1"))
+    try:
+        from sentence_transformers import SentenceTransformer
+        embedding_model = SentenceTransformer(model_name)
+        logger.info(f"Loaded query embedding model {model_name}")
+    except Exception as e:
+        logger.warning(f"Could not load embedding model '{model_name}': {e}")
+    
     return KnowledgeLayerBridge(
         neo4j_driver=neo4j_driver,
-        qdrant_client=qdrant_client
+        qdrant_client=qdrant_client,
+        embedding_model=embedding_model,
+        deadline_seconds=deadline_seconds,
+        topic_index_ttl_seconds=topic_index_ttl_seconds,
+        alignment_ttl_seconds=alignment_ttl_seconds
     )
 
 
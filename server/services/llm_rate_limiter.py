@@ -0,0 +1,388 @@
+# server/services/llm_rate_limiter.py
+"""
+LLM Rate Limiter and Scheduler - Shared admission control for Gemini calls
+
+Used by both the RAG service (llm_wrapper) and the Socratic service
+(generate_with_retry) so they stop retrying blindly against the same key:
+
+1. Token-bucket admission per API key (LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_BURST)
+2. Priority classes: queued "interactive" calls (chat, code help) are always
+   admitted before queued "batch" calls (summaries, quizzes, documents)
+3. Jittered exponential backoff on failures; a 429 also pauses every caller
+   of that key and halves its admission rate, which then recovers additively
+4. Per-class queue deadlines: a call that cannot be admitted in time fails
+   with RateLimitExceeded instead of sleeping a request thread for minutes
+
+Bucket state is in process by default. Set LLM_RATE_LIMIT_STATE_PATH to a
+SQLite file shared by the services on the host to make the buckets (and
+the 429 pauses) cross-process; priority ordering stays per process.
+
+Keys are identified by a short SHA-256 fingerprint, never stored raw.
+"""
+
+import os
+import re
+import time
+import heapq
+import random
+import sqlite3
+import hashlib
+import logging
+import itertools
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# --- Scheduler metrics (exported on /metrics via the default Prometheus registry) ---
+try:
+    from prometheus_client import Counter, Gauge, Histogram
+    _QUEUE_DEPTH = Gauge("llm_scheduler_queue_depth", "LLM calls waiting for admission", ["priority"])
+    _WAIT_SECONDS = Histogram(
+        "llm_scheduler_wait_seconds", "Time an LLM call waited for admission", ["priority"],
+        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+    _THROTTLED = Counter("llm_scheduler_throttled_total", "LLM calls rejected or rate limited", ["reason"])
+except ImportError:
+    _QUEUE_DEPTH = _WAIT_SECONDS = _THROTTLED = None
+
+# Share of the configured rate kept after repeated 429s, and per-success recovery
+_MIN_RATE_FACTOR = 0.1
+_RATE_RECOVERY_STEP = 0.05
+
+_RETRY_AFTER_PATTERNS = (
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+)
+
+
+class RateLimitExceeded(Exception):
+    """A call could not be admitted before its queue deadline (reported as a 429)."""
+
+
+def key_fingerprint(api_key: str) -> str:
+    """Stable, non-reversible label for an API key (llm_client_pool labels keys the same way)."""
+    return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    text = str(error)
+    return (
+        "429" in text
+        or "quota" in text.lower()
+        or "resource exhausted" in text.lower()
+        or type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+    )
+
+
+_TRANSIENT_ERROR_NAMES = ("ServiceUnavailable", "InternalServerError", "DeadlineExceeded", "GatewayTimeout",
+                         "ConnectionError", "TimeoutError")
+_TRANSIENT_STATUS = re.compile(r"\b(500|502|503|504)\b")
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Rate limits and transient upstream failures (5xx, timeouts), not bad keys, requests or safety blocks."""
+    return (
+        is_rate_limit_error(error)
+        or type(error).__name__ in _TRANSIENT_ERROR_NAMES
+        or bool(_TRANSIENT_STATUS.search(str(error)))
+    )
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-suggested delay from a Gemini 429 message, if present."""
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+    return None
+
+
+# ============================================================================
+# BUCKET STATE
+# ============================================================================
+
+def _new_state(burst: float, now: float) -> Dict[str, float]:
+    return {"tokens": burst, "updated": now, "factor": 1.0, "blocked_until": 0.0}
+
+
+class _MemoryStore:
+    """Bucket state for one process."""
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, key: str, burst: float, fn: Callable[[Dict[str, float], float], Any]) -> Any:
+        with self._lock:
+            now = time.time()
+            state = self._states.setdefault(key, _new_state(burst, now))
+            return fn(state, now)
+
+
+class _SqliteStore:
+    """Bucket state shared by every process that points at the same file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL,"
+                " factor REAL NOT NULL, blocked_until REAL NOT NULL)"
+            )
+            self._local.conn = conn
+        return conn
+
+    def update(self, key: str, burst: float, fn: Callable[[Dict[str, float], float], Any]) -> Any:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated, factor, blocked_until FROM buckets WHERE key = ?", (key,)).fetchone()
+            state = _new_state(burst, now) if row is None else dict(zip(("tokens", "updated", "factor", "blocked_until"), row))
+            result = fn(state, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, factor, blocked_until) VALUES (?, ?, ?, ?, ?)",
+                (key, state["tokens"], state["updated"], state["factor"], state["blocked_until"])
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+# ============================================================================
+# SCHEDULER
+# ============================================================================
+
+class LLMRateLimiter:
+    """
+    Admission control for LLM calls.
+
+    Usage:
+        limiter = get_rate_limiter()
+        text = limiter.call(api_key, lambda: model.generate_content(prompt), priority="interactive")
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 60.0,
+        burst: float = 10.0,
+        state_path: Optional[str] = None,
+        max_attempts: int = 5,
+        backoff_base_seconds: float = 1.0,
+        backoff_max_seconds: float = 60.0,
+        queue_timeouts: Optional[Dict[str, float]] = None
+    ):
+        """
+        Args:
+            requests_per_minute: Sustained admissions per API key
+            burst: Bucket capacity (calls admitted back to back after idling)
+            state_path: SQLite file for cross-process buckets (None = in process)
+            max_attempts: Attempts per call, including the first
+            backoff_base_seconds: First retry's backoff ceiling (doubles per attempt)
+            backoff_max_seconds: Cap on any single backoff
+            queue_timeouts: Max admission wait per priority class
+        """
+        self.rate = max(requests_per_minute, 0.001) / 60.0
+        self.burst = max(burst, 1.0)
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.queue_timeouts = dict({"interactive": 30.0, "batch": 300.0}, **(queue_timeouts or {}))
+        self._store = _SqliteStore(state_path) if state_path else _MemoryStore()
+        self._cond = threading.Condition()
+        self._waiting: Dict[str, List[Tuple[int, int]]] = {}
+        self._tickets = itertools.count()
+        self._stats = {
+            name: {"queued": 0, "admitted": 0, "rejected": 0, "wait_seconds": 0.0} for name in PRIORITIES
+        }
+        self._rate_limited = 0
+
+    # --- bucket operations (run inside the store's lock / transaction) ---
+
+    def _take(self, state: Dict[str, float], now: float) -> float:
+        """Consume a token; returns 0 when admitted, else seconds until one may be available."""
+        rate = self.rate * state["factor"]
+        state["tokens"] = min(self.burst, state["tokens"] + max(0.0, now - state["updated"]) * rate)
+        state["updated"] = now
+        if now < state["blocked_until"]:
+            return state["blocked_until"] - now
+        if state["tokens"] >= 1.0:
+            state["tokens"] -= 1.0
+            return 0.0
+        return (1.0 - state["tokens"]) / rate
+
+    def penalize(self, api_key: str, delay: float):
+        """Pause every caller of this key for `delay` seconds and halve its rate."""
+        def apply(state, now):
+            state["blocked_until"] = max(state["blocked_until"], now + delay)
+            state["factor"] = max(_MIN_RATE_FACTOR, state["factor"] / 2)
+        self._store.update(key_fingerprint(api_key), self.burst, apply)
+
+    def reward(self, api_key: str):
+        def apply(state, now):
+            if state["factor"] < 1.0:
+                state["factor"] = min(1.0, state["factor"] + _RATE_RECOVERY_STEP)
+        self._store.update(key_fingerprint(api_key), self.burst, apply)
+
+    # --- admission ---
+
+    def acquire(self, api_key: str, priority: str = "interactive", timeout: Optional[float] = None) -> float:
+        """
+        Block until the call may run. Within a process, queued interactive
+        calls are always admitted before queued batch calls on the same key.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            RateLimitExceeded: not admitted within the priority's queue timeout
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown LLM priority '{priority}'. Expected one of {list(PRIORITIES)}")
+        key = key_fingerprint(api_key)
+        started = time.monotonic()
+        deadline = started + (self.queue_timeouts[priority] if timeout is None else timeout)
+        ticket = (PRIORITIES[priority], next(self._tickets))
+
+        with self._cond:
+            heapq.heappush(self._waiting.setdefault(key, []), ticket)
+            self._stats[priority]["queued"] += 1
+        if _QUEUE_DEPTH is not None:
+            _QUEUE_DEPTH.labels(priority=priority).inc()
+        admitted = False
+        try:
+            while True:
+                with self._cond:
+                    is_head = self._waiting[key][0] == ticket
+                wait = self._store.update(key, self.burst, self._take) if is_head else None
+                if wait is not None and wait <= 0:
+                    admitted = True
+                    return time.monotonic() - started
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RateLimitExceeded(
+                        f"429 LLM rate limit: {priority} call not admitted within "
+                        f"{self.queue_timeouts[priority] if timeout is None else timeout:g}s"
+                    )
+                with self._cond:
+                    self._cond.wait(min(wait, remaining) if wait is not None else remaining)
+        finally:
+            waited = time.monotonic() - started
+            with self._cond:
+                queue = self._waiting[key]
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                if not queue:
+                    del self._waiting[key]
+                stats = self._stats[priority]
+                stats["queued"] -= 1
+                stats["admitted" if admitted else "rejected"] += 1
+                stats["wait_seconds"] += waited
+                self._cond.notify_all()
+            if _QUEUE_DEPTH is not None:
+                _QUEUE_DEPTH.labels(priority=priority).dec()
+                _WAIT_SECONDS.labels(priority=priority).observe(waited)
+                if not admitted:
+                    _THROTTLED.labels(reason="queue_timeout").inc()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff; a server-suggested delay is a floor."""
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** (attempt - 1)))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max_seconds) + random.uniform(0, self.backoff_base_seconds))
+        return delay
+
+    def call(
+        self,
+        api_key: str,
+        fn: Callable[[], Any],
+        priority: str = "interactive",
+        timeout: Optional[float] = None,
+        retryable: Optional[Callable[[Exception], bool]] = None
+    ) -> Any:
+        """
+        Run `fn()` once admitted, retrying failures with jittered backoff.
+
+        A rate-limit error pauses the whole key (so other callers back off
+        too) and the retry waits in the queue; other errors back off in place.
+        `retryable` restricts which errors are retried (default: all).
+        """
+        for attempt in range(1, self.max_attempts + 1):
+            self.acquire(api_key, priority, timeout)
+            try:
+                result = fn()
+            except Exception as e:
+                if attempt == self.max_attempts or (retryable is not None and not retryable(e)):
+                    raise
+                rate_limited = is_rate_limit_error(e)
+                delay = self.backoff_delay(attempt, retry_after_seconds(e) if rate_limited else None)
+                logger.warning(
+                    f"LLM call failed ({'rate limited' if rate_limited else type(e).__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt}/{self.max_attempts}): {e}"
+                )
+                if rate_limited:
+                    with self._cond:
+                        self._rate_limited += 1
+                    if _THROTTLED is not None:
+                        _THROTTLED.labels(reason="upstream_429").inc()
+                    self.penalize(api_key, delay)
+                else:
+                    time.sleep(delay)
+                continue
+            self.reward(api_key)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "requests_per_minute": round(self.rate * 60, 3),
+                "burst": self.burst,
+                "upstream_rate_limited": self._rate_limited,
+                "priorities": {name: dict(values, wait_seconds=round(values["wait_seconds"], 3))
+                               for name, values in self._stats.items()},
+            }
+
+
+_limiter: Optional[LLMRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> LLMRateLimiter:
+    """
+    Process-wide limiter configured from environment:
+        - LLM_RATE_LIMIT_RPM: Sustained calls per minute per API key
+        - LLM_RATE_LIMIT_BURST: Calls admitted back to back after idling
+        - LLM_RATE_LIMIT_STATE_PATH: Shared SQLite file for cross-process buckets
+        - LLM_MAX_ATTEMPTS: Attempts per call
+        - LLM_BACKOFF_BASE_SECONDS / LLM_BACKOFF_MAX_SECONDS: Backoff shape
+        - LLM_QUEUE_TIMEOUT_INTERACTIVE_SECONDS / LLM_QUEUE_TIMEOUT_BATCH_SECONDS
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = LLMRateLimiter(
+                requests_per_minute=float(os.getenv("LLM_RATE_LIMIT_RPM", "60")),
+                burst=float(os.getenv("LLM_RATE_LIMIT_BURST", "10")),
+                state_path=os.getenv("LLM_RATE_LIMIT_STATE_PATH") or None,
+                max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "5")),
+                backoff_base_seconds=float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0")),
+                backoff_max_seconds=float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "60")),
+                queue_timeouts={
+                    "interactive": float(os.getenv("LLM_QUEUE_TIMEOUT_INTERACTIVE_SECONDS", "30")),
+                    "batch": float(os.getenv("LLM_QUEUE_TIMEOUT_BATCH_SECONDS", "300")),
+                }
+            )
+        return _limiter
@@ -1,5 +1,5 @@
 import os
-import time
+import sys
 import logging
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -10,6 +10,10 @@ from werkzeug.utils import secure_filename
 from pypdf import PdfReader
 from dotenv import load_dotenv
 
+# Shared modules used by more than one service (server/services)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services'))
+import llm_rate_limiter
+
 # Load Environment Variables from parent directory (or local .env)
 # Ideally, we should source the same keys.
 load_dotenv(os.path.join(os.path.dirname(__file__), '../.env'))
@@ -63,24 +67,19 @@ USER QUERY:
 YOUR RESPONSE:
 """
 
-def generate_with_retry(model_instance, prompt, **kwargs):
+def generate_with_retry(model_instance, prompt, priority="batch", **kwargs):
     """
-    Wraps model.generate_content with exponential backoff for 429 Rate Limit errors.
+    Wraps model.generate_content with the shared LLM rate limiter: token-bucket
+    admission (interactive calls ahead of batch ones) and jittered backoff on
+    429 Rate Limit errors. Raises llm_rate_limiter.RateLimitExceeded if the
+    call is not admitted within the priority's queue timeout.
     """
-    base_delay = 10
-    max_retries = 5
-    for attempt in range(max_retries):
-        try:
-            return model_instance.generate_content(prompt, **kwargs)
-        except Exception as e:
-            err_str = str(e)
-            if "429" in err_str or "quota" in err_str.lower():
-                wait_time = base_delay * (2 ** attempt)
-                logger.warning(f"Quota exceeded/Rate limit hit. Retrying in {wait_time}s... (Attempt {attempt+1}/{max_retries})")
-                time.sleep(wait_time)
-            else:
-                raise e
-    return model_instance.generate_content(prompt, **kwargs)
+    return llm_rate_limiter.get_rate_limiter().call(
+        GEMINI_API_KEY,
+        lambda: model_instance.generate_content(prompt, **kwargs),
+        priority=priority,
+        retryable=llm_rate_limiter.is_rate_limit_error
+    )
 
 def extract_text_from_pdf(filepath):
     reader = PdfReader(filepath)
@@ -260,7 +259,7 @@ def chat():
             
             try:
                 # Use a lightweight call (or same model)
-                summary_response = generate_with_retry(model, summary_prompt)
+                summary_response = generate_with_retry(model, summary_prompt, priority="interactive")
                 summary_text = f"PREVIOUS CONVERSATION SUMMARY: {summary_response.text}\n"
             except Exception as ex:
                 logger.error(f"Summarization failed: {ex}")
@@ -307,7 +306,7 @@ def chat():
         """
 
         # Use temperature=0.0 to ensure deterministic responses for the same input
-        response = generate_with_retry(model, prompt, generation_config={'response_mime_type': 'application/json', 'temperature': 0.0})
+        response = generate_with_retry(model, prompt, priority="interactive", generation_config={'response_mime_type': 'application/json', 'temperature': 0.0})
         
         try:
              import json